@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# Copyright (C) 2021 BlueDrink9
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark of loading a large phrase and script library: the scandir and thread pool based load_folders against the
+previous sequential loading, which listed each directory using glob and called os.path.isdir/isfile/exists per entry,
+and loading from the configuration snapshot, with no or some changed files.
+
+Cold start times are measured after evicting the library files from the page cache using posix_fadvise, which does
+not need root permissions. Directory entries may stay cached, so the cold numbers are a lower bound. For a realistic
+cold start on a network file system, point LIBRARY_DIR to a directory on it.
+
+Run from the repository root:
+    PYTHONPATH=lib python3 benchmarks/config_load.py [items]
+"""
+
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+
+import autokey.common
+autokey.common.USING_QT = True  # Avoid importing GTK, the benchmark does not need a GUI toolkit
+
+from autokey.configmanager import snapshot
+from autokey.model.folder import Folder, load_folders
+from autokey.model.helpers import TriggerMode
+from autokey.model.phrase import Phrase
+from autokey.model.script import Script
+
+ITEMS = 20000
+ITEMS_PER_FOLDER = 500
+# Share of the phrases changed before the "snapshot, changed" measurement
+CHANGED_SHARE = 0.01
+REPETITIONS = 3
+
+
+def create_library(directory: str, items: int):
+    for folder_index in range(0, items, ITEMS_PER_FOLDER):
+        folder_path = os.path.join(directory, "folder{}".format(folder_index // ITEMS_PER_FOLDER))
+        os.mkdir(folder_path)
+        folder = Folder("Folder {}".format(folder_index), path=folder_path)
+        with open(folder.get_json_path(), "w") as json_file:
+            json.dump(folder.get_serializable(), json_file, indent=4)
+        for index in range(folder_index, min(items, folder_index + ITEMS_PER_FOLDER)):
+            if index % 10:
+                item = Phrase("Phrase {}".format(index), "Expansion text {}\n".format(index) * 5,
+                              path="{}/phrase{}.txt".format(folder_path, index))
+                item.set_modes([TriggerMode.ABBREVIATION])
+                item.add_abbreviation("abbr{}".format(index))
+                body = item.phrase
+            else:
+                item = Script("Script {}".format(index), "", path="{}/script{}.py".format(folder_path, index))
+                body = "keyboard.send_keys('{}')\n".format(index)
+            with open(item.get_json_path(), "w") as json_file:
+                json.dump(item.get_serializable(), json_file, indent=4)
+            with open(item.path, "w") as body_file:
+                body_file.write(body)
+
+
+def read_previous(path: str, encoding: str=None, is_json: bool=False):
+    with open(path, "r", encoding=encoding) as in_file:
+        return json.load(in_file) if is_json else in_file.read()
+
+
+def sequential_load(folder: Folder, parent=None):
+    """The loading algorithm used before load_folders, kept as the baseline."""
+    folder.parent = parent
+    if os.path.exists(folder.get_json_path()):
+        folder.inject_json_data(read_previous(folder.get_json_path(), is_json=True))
+    else:
+        folder.title = os.path.basename(folder.path)
+    folder.folders = []
+    folder.items = []
+    for entryPath in glob.glob(folder.path + "/*"):
+        if os.path.isdir(entryPath):
+            f = Folder("", path=entryPath)
+            sequential_load(f, folder)
+            folder.folders.append(f)
+        if os.path.isfile(entryPath):
+            i = None
+            if entryPath.endswith(".txt"):
+                i = Phrase("", "", path=entryPath)
+                i.phrase = read_previous(entryPath)
+            elif entryPath.endswith(".py"):
+                i = Script("", "", path=entryPath)
+                i.code = read_previous(entryPath, "UTF-8")
+            if i is not None:
+                i.parent = folder
+                if os.path.exists(i.get_json_path()):
+                    i.inject_json_data(read_previous(i.get_json_path(), is_json=True))
+                else:
+                    i.description = os.path.basename(entryPath).rsplit(".", 1)[0]
+                folder.items.append(i)
+
+
+def new_load(folders):
+    load_folders(folders)
+
+
+def old_load(folders):
+    for folder in folders:
+        sequential_load(folder)
+
+
+def touch_phrases(directory: str, share: float):
+    phrases = sorted(glob.glob(directory + "/*/*.txt"))
+    for path in phrases[::int(1 / share)]:
+        with open(path, "a") as phrase_file:
+            phrase_file.write("changed")
+
+
+def drop_page_cache(directory: str):
+    for dir_path, dir_names, file_names in os.walk(directory):
+        for name in file_names:
+            fd = os.open(os.path.join(dir_path, name), os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+
+
+def top_level_folders(directory: str):
+    return [Folder("", path=os.path.join(directory, name)) for name in sorted(os.listdir(directory))]
+
+
+def describe(folders) -> list:
+    result = []
+    for folder in folders:
+        result.append((folder.title, folder.get_serializable()))
+        for item in folder.items:
+            result.append((item.path, item.get_serializable(), getattr(item, "phrase", None),
+                           getattr(item, "code", None), item.parent.path))
+        result.extend(describe(folder.folders))
+    return result
+
+
+def measure(directory: str, load, cold: bool) -> float:
+    best = float("inf")
+    for _ in range(REPETITIONS):
+        folders = top_level_folders(directory)
+        if cold:
+            drop_page_cache(directory)
+        start = time.perf_counter()
+        load(folders)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    items = int(sys.argv[1]) if len(sys.argv) > 1 else ITEMS
+    with tempfile.TemporaryDirectory(dir=os.environ.get("LIBRARY_DIR")) as directory:
+        library = os.path.join(directory, "library")
+        os.mkdir(library)
+        create_library(library, items)
+        old_folders, new_folders = top_level_folders(library), top_level_folders(library)
+        old_load(old_folders)
+        new_load(new_folders)
+        assert describe(old_folders) == describe(new_folders), "load_folders built a different model"
+
+        snapshot_path = os.path.join(directory, "snapshot.pickle")
+        paths = [folder.path for folder in top_level_folders(library)]
+
+        def snapshot_load(folders):
+            snapshot.load_folders(paths, snapshot_path)
+
+        snapshot_load(None)
+        assert describe(snapshot.load_folders(paths, snapshot_path)) == describe(new_folders), \
+            "The snapshot differs from the files"
+
+        print("Library of {} items in {} folders".format(items, len(old_folders)))
+        for name, load in (("sequential glob", old_load), ("scandir + thread pool", new_load),
+                           ("snapshot, unchanged", snapshot_load)):
+            for cold in (True, False):
+                print("{:<24} {:<5} {:9.1f} ms".format(
+                    name, "cold" if cold else "warm", measure(library, load, cold) * 1000))
+
+        # Every measurement of the changed library reads the changed files again and rewrites the snapshot.
+        best = float("inf")
+        for _ in range(REPETITIONS):
+            touch_phrases(library, CHANGED_SHARE)
+            start = time.perf_counter()
+            snapshot_load(None)
+            best = min(best, time.perf_counter() - start)
+        print("{:<24} {:<5} {:9.1f} ms".format("snapshot, {:.0%} changed".format(CHANGED_SHARE), "warm", best * 1000))
+
+
+if __name__ == "__main__":
+    main()
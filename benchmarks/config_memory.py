@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# Copyright (C) 2021 BlueDrink9
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark of the resident memory used by a loaded phrase and script library: with all phrase texts and script sources
+kept in memory, like before they were loaded on first use, against lazy loading, before and after every item was
+used once.
+
+Each case runs in a new process, and reports the growth of VmRSS while loading, so that memory freed by an earlier
+case does not distort the next one. A tenth of the phrases are large, like phrases pasting whole documents.
+
+Run from the repository root:
+    PYTHONPATH=lib python3 benchmarks/config_memory.py [items]
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+import autokey.common
+autokey.common.USING_QT = True  # Avoid importing GTK, the benchmark does not need a GUI toolkit
+
+from autokey.model.content_cache import content_cache
+from autokey.model.folder import load_folders
+from autokey.model.phrase import Phrase
+
+from config_load import create_library, top_level_folders
+
+ITEMS = 20000
+LARGE_PHRASE_SIZE = 16 << 10
+CASES = ("all resident", "lazy", "lazy, all used once")
+
+
+def add_large_phrases(directory: str):
+    for dir_path, dir_names, file_names in os.walk(directory):
+        for name in sorted(file_names)[::10]:
+            if name.endswith(".txt"):
+                with open(os.path.join(dir_path, name), "a") as phrase_file:
+                    phrase_file.write("Lorem ipsum dolor sit amet. " * (LARGE_PHRASE_SIZE // 28))
+
+
+def resident_kib() -> int:
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    raise RuntimeError("VmRSS not found")
+
+
+def use_all(folders, keep: bool):
+    for folder in folders:
+        for item in folder.items:
+            if isinstance(item, Phrase):
+                item.keep_phrase() if keep else item.phrase
+            else:
+                item.keep_code() if keep else item.code
+        use_all(folder.folders, keep)
+
+
+def measure(library: str, case: str):
+    folders = top_level_folders(library)
+    before = resident_kib()
+    load_folders(folders)
+    if case != "lazy":
+        use_all(folders, keep=case == "all resident")
+    if case == "all resident":
+        # Count the texts only once, like before they were cached
+        content_cache.clear()
+    print("{:<22} {:9.1f} MiB  ({} cached texts)".format(case, (resident_kib() - before) / 1024, len(content_cache)))
+
+
+def main():
+    if sys.argv[1:2] == ["--measure"]:
+        measure(sys.argv[2], sys.argv[3])
+        return
+    items = sys.argv[1] if len(sys.argv) > 1 else str(ITEMS)
+    with tempfile.TemporaryDirectory() as directory:
+        create_library(directory, int(items))
+        add_large_phrases(directory)
+        print("Library of {} items, {:.1f} MiB of texts".format(items, sum(
+            os.path.getsize(os.path.join(dir_path, name))
+            for dir_path, dir_names, file_names in os.walk(directory)
+            for name in file_names if not name.endswith(".json")) / (1 << 20)))
+        for case in CASES:
+            subprocess.check_call([sys.executable, __file__, "--measure", directory, case])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# Copyright (C) 2021 BlueDrink9
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark of the pattern search used by highlevel.visgrep and move_to_pat: the in-process NumPy search, with the
+options of find_template, against the png2pat + visgrep subprocesses of xautomation.
+
+The screen is synthetic: flat coloured panels with some noise, similar to a desktop with a few windows, plus a button
+like pattern placed once. The subprocess path is only measured if xautomation is installed. No X server is needed.
+
+Run from the repository root:
+    PYTHONPATH=lib python3 benchmarks/pattern_search.py
+"""
+
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import timeit
+import zlib
+
+import numpy
+
+import autokey.common
+autokey.common.USING_QT = True  # Avoid importing GTK, the benchmark does not need a GUI toolkit
+
+from autokey.scripting import imagesearch
+
+SCREEN_SIZE = (800, 1280)
+PATTERN_SIZE = (24, 64)
+PATTERN_POSITION = (613, 1011)
+REPETITIONS = 5
+FUZZY_TOLERANCE = 2000
+
+
+def synthetic_screen() -> numpy.ndarray:
+    random = numpy.random.RandomState(42)
+    height, width = SCREEN_SIZE
+    screen = numpy.empty((height, width, 3), numpy.uint8)
+    screen[:] = (220, 220, 220)
+    for _ in range(12):
+        top, left = random.randint(0, height - 100), random.randint(0, width - 100)
+        screen[top:top + random.randint(50, 400), left:left + random.randint(50, 600)] = random.randint(0, 256, 3)
+    noise = random.randint(0, 256, (height // 8, width // 8, 3)).astype(numpy.uint8)
+    screen[::8, ::8] = noise
+    pattern = random.randint(0, 256, PATTERN_SIZE + (3,)).astype(numpy.uint8)
+    y, x = PATTERN_POSITION
+    screen[y:y + PATTERN_SIZE[0], x:x + PATTERN_SIZE[1]] = pattern
+    return screen
+
+
+def write_png(path: str, image: numpy.ndarray):
+    height, width = image.shape[:2]
+    raw = b"".join(b"\0" + row.tobytes() for row in image)
+
+    def chunk(chunk_type: bytes, data: bytes) -> bytes:
+        return struct.pack("!I", len(data)) + chunk_type + data + struct.pack("!I", zlib.crc32(chunk_type + data))
+
+    with open(path, "wb") as png_file:
+        png_file.write(b"\x89PNG\r\n\x1a\n")
+        png_file.write(chunk(b"IHDR", struct.pack("!IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        png_file.write(chunk(b"IDAT", zlib.compress(raw, 1)))
+        png_file.write(chunk(b"IEND", b""))
+
+
+def visgrep_subprocess(screen_path: str, pattern_path: str):
+    with tempfile.NamedTemporaryFile() as pat_file:
+        subprocess.call(["png2pat", pattern_path], stdout=pat_file)
+        pat_file.flush()
+        subprocess.run(["visgrep", "-t0", screen_path, pat_file.name], stdout=subprocess.PIPE)
+
+
+def report(name: str, function):
+    best = min(timeit.repeat(function, number=1, repeat=REPETITIONS))
+    print("{:<30} {:9.2f} ms".format(name, best * 1000))
+
+
+def main():
+    screen = synthetic_screen()
+    y, x = PATTERN_POSITION
+    pattern = screen[y:y + PATTERN_SIZE[0], x:x + PATTERN_SIZE[1]].copy()
+    assert imagesearch.find_template(screen, pattern) == [(x, y)]
+    with tempfile.TemporaryDirectory() as directory:
+        screen_path = os.path.join(directory, "screen.png")
+        pattern_path = os.path.join(directory, "pattern.png")
+        write_png(screen_path, screen)
+        write_png(pattern_path, pattern)
+
+        report("search in memory", lambda: imagesearch.find_template(screen, pattern))
+        report("in-process, from files", lambda: imagesearch.find_template(
+            imagesearch.read_png(screen_path), imagesearch.read_png(pattern_path)))
+        report("cached pattern, first only", lambda: imagesearch.find_template(
+            screen, imagesearch.load_pattern(pattern_path), first_only=True))
+        report("cached pattern, region", lambda: imagesearch.find_template(
+            screen, imagesearch.load_pattern(pattern_path), region=(x - 50, y - 50, 200, 150)))
+        report("fuzzy", lambda: imagesearch.find_template(screen, pattern, FUZZY_TOLERANCE))
+        report("fuzzy, pyramid", lambda: imagesearch.find_template(
+            screen, pattern, FUZZY_TOLERANCE, pyramid_levels=2))
+        if shutil.which("visgrep") and shutil.which("png2pat"):
+            report("png2pat + visgrep", lambda: visgrep_subprocess(screen_path, pattern_path))
+        else:
+            print("png2pat + visgrep              not installed, install xautomation to compare")
+
+
+if __name__ == "__main__":
+    main()
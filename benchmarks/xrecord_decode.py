@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# Copyright (C) 2021 BlueDrink9
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Micro-benchmark of decoding XRecord replies: the specialised struct based decoder against python-xlib event parsing.
+
+The payloads mirror what the XRecord context of the XRecordInterface delivers while typing and clicking: mostly one
+device event per reply, sometimes several, when the server batches them. No X server is needed.
+
+Run from the repository root:
+    PYTHONPATH=lib python3 benchmarks/xrecord_decode.py
+"""
+
+import timeit
+import types
+
+import autokey.common
+autokey.common.USING_QT = True  # Avoid importing GTK, the benchmark does not need a GUI toolkit
+
+from Xlib import X
+from Xlib.protocol import event, rq
+
+from autokey.interface import decode_record_events
+
+ROOT = 0x2a3
+WINDOW = 0x3c00007
+REPETITIONS = 20
+
+
+def key_event(event_class, keycode: int, time: int) -> bytes:
+    return event_class(
+        detail=keycode, time=time, root=ROOT, window=WINDOW, child=X.NONE,
+        root_x=640, root_y=400, event_x=12, event_y=30, state=0, same_screen=1
+    )._binary
+
+
+def button_event(button: int, time: int, x: int, y: int) -> bytes:
+    return event.ButtonPress(
+        detail=button, time=time, root=ROOT, window=WINDOW, child=X.NONE,
+        root_x=x, root_y=y, event_x=x - 100, event_y=y - 50, state=0, same_screen=1
+    )._binary
+
+
+def recorded_payloads() -> list:
+    """Payloads of a session typing "hello world" and clicking twice, as delivered by XRecord."""
+    payloads = []
+    time = 1000
+    for keycode in (43, 26, 46, 46, 32, 65, 25, 32, 27, 46, 40):
+        payloads.append(key_event(event.KeyPress, keycode, time))
+        payloads.append(key_event(event.KeyRelease, keycode, time + 60))
+        time += 120
+    payloads.append(button_event(1, time, 300, 200))
+    # Batched replies, as seen under load
+    payloads.append(b"".join(key_event(event.KeyPress, 38, time + n) for n in range(4)))
+    payloads.append(button_event(3, time + 500, 10, 700) + key_event(event.KeyPress, 36, time + 600))
+    return payloads
+
+
+def decode_with_python_xlib(data, display):
+    while len(data):
+        event_object, data = rq.EventField(None).parse_binary_value(data, display, None, None)
+        if event_object.type in (X.KeyPress, X.KeyRelease):
+            event_object.detail
+        elif event_object.type == X.ButtonPress:
+            event_object.detail, event_object.root_x, event_object.root_y
+
+
+def decode_with_struct(data, display):
+    for _ in decode_record_events(data, display):
+        pass
+
+
+def main():
+    payloads = recorded_payloads()
+    event_count = sum(len(payload) // 32 for payload in payloads)
+    # Parsing the events only needs the event class table and resource class lookup of the protocol display.
+    display = types.SimpleNamespace(
+        event_classes=event.event_class,
+        get_resource_class=lambda class_name, default=None: default,
+    )
+
+    def run(decoder):
+        for payload in payloads:
+            decoder(payload, display)
+
+    for name, decoder in (("python-xlib", decode_with_python_xlib), ("struct", decode_with_struct)):
+        number = 200
+        best = min(timeit.repeat(lambda: run(decoder), number=number, repeat=REPETITIONS))
+        per_event = best / (number * event_count)
+        print("{:<12} {:8.2f} µs per event".format(name, per_event * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -19,12 +19,10 @@
 import os
 import os.path
 import shutil
-import glob
 import threading
 import typing
 import re
 import json
-import itertools
 
 import autokey.model.abstract_hotkey
 import autokey.model.folder
@@ -37,14 +35,56 @@ from autokey.configmanager.configmanager_constants import CONFIG_FILE, CONFIG_DE
     RECENT_ENTRIES_FOLDER, IS_FIRST_RUN, SERVICE_RUNNING, MENU_TAKES_FOCUS, SHOW_TRAY_ICON, SORT_BY_USAGE_COUNT, \
     PROMPT_TO_SAVE, ENABLE_QT4_WORKAROUND, UNDO_USING_BACKSPACE, WINDOW_DEFAULT_SIZE, HPANE_POSITION, COLUMN_WIDTHS, \
     SHOW_TOOLBAR, NOTIFICATION_ICON, WORKAROUND_APP_REGEX, TRIGGER_BY_INITIAL, SCRIPT_GLOBALS, INTERFACE_TYPE, \
-    DISABLED_MODIFIERS, GTK_THEME
+    DISABLED_MODIFIERS, GTK_THEME, SEND_MODE_RULES
 import autokey.configmanager.version_upgrading
+import autokey.configmanager.snapshot
 import autokey.configmanager.predefined_user_files
+from autokey.configmanager.indexes import ItemList, KeyIndex, MultiKeyIndex
 from autokey.iomediator.constants import X_RECORD_INTERFACE
+import autokey.monitor
+from autokey.model.file_writer import file_writer
 from autokey.model.key import MODIFIERS
 
 logger = __import__("autokey.logger").logger.get_logger(__name__)
 
+# Lists of phrases/folders kept by the ConfigManager, rebuilt by config_altered and updated by the incremental changes
+INDEX_NAMES = ("hotKeyFolders", "hotKeys", "abbreviations", "allFolders", "allItems")
+# Lookups of phrases/folders, maintained together with the lists
+KEY_INDEX_NAMES = ("itemsByPath", "itemsByJsonPath", "itemsByDescription", "foldersByPath", "foldersByTitle",
+                   "triggersByAbbreviation", "triggersByHotkey")
+
+# A pair of conflicting abbreviations, found by ConfigManager.find_abbreviation_conflicts
+AbbreviationConflict = typing.NamedTuple("AbbreviationConflict", [
+    ("kind", str),  # "duplicate", "prefix" or "suffix"
+    ("item", typing.Any),  # The shadowing phrase/script/folder
+    ("abbreviation", str),
+    ("other_item", typing.Any),  # The shadowed phrase/script/folder
+    ("other_abbreviation", str),
+])
+
+
+def _folded_abbreviations(model_object) -> typing.List[str]:
+    # Folded like the case insensitive matching of AbstractAbbreviation
+    if autokey.model.helpers.TriggerMode.ABBREVIATION in model_object.modes:
+        return [abbreviation.lower() for abbreviation in model_object.abbreviations]
+    return []
+
+
+def _hotkey(model_object) -> typing.Optional[tuple]:
+    if autokey.model.helpers.TriggerMode.HOTKEY in model_object.modes:
+        return tuple(model_object.modifiers or ()), model_object.hotKey
+    return None
+
+
+def _folders_first(model_objects: list) -> list:
+    # The conflict checks report folders before phrases/scripts
+    return sorted(model_objects, key=lambda model_object: not isinstance(model_object, autokey.model.folder.Folder))
+
+
+def _filter_pattern(model_object) -> typing.Optional[str]:
+    regex = model_object.get_applicable_regex()
+    return None if regex is None else regex.pattern
+
 
 def create_config_manager_instance(auto_key_app, had_error=False):
     if not os.path.exists(CONFIG_DEFAULT_FOLDER):
@@ -66,28 +106,22 @@ def create_config_manager_instance(auto_key_app, had_error=False):
 
 
 def save_config(config_manager):
+    """
+    Queue the configuration for writing by the background file writer. The settings are serialized in the calling
+    thread, the file is replaced atomically later. The previous configuration file is kept as the backup.
+    """
     logger.info("Persisting configuration")
-    config_manager.app.monitor.suspend()
-    # Back up configuration if it exists
-    # TODO: maybe use with-statement instead of try-except?
-    if os.path.exists(CONFIG_FILE):
-        logger.info("Backing up existing config file")
-        shutil.copy2(CONFIG_FILE, CONFIG_FILE_BACKUP)
     try:
-        _persist_settings(config_manager)
-        logger.info("Finished persisting configuration - no errors")
-    except Exception as e:
-        if os.path.exists(CONFIG_FILE_BACKUP):
-            shutil.copy2(CONFIG_FILE_BACKUP, CONFIG_FILE)
-        logger.exception("Error while saving configuration. Backup has been restored (if found).")
-        raise Exception("Error while saving configuration. Backup has been restored (if found).")
-    finally:
-        config_manager.app.monitor.unsuspend()
+        text = _serialize_settings(config_manager)
+    except Exception:
+        logger.exception("Error while saving configuration. The configuration file was not changed.")
+        raise Exception("Error while saving configuration. The configuration file was not changed.")
+    file_writer.write(CONFIG_FILE, text, backup_path=CONFIG_FILE_BACKUP)
 
 
-def _persist_settings(config_manager):
+def _serialize_settings(config_manager) -> str:
     """
-    Write the settings, including the persistent global script Store.
+    Serialize the settings, including the persistent global script Store.
     The Store instance might contain arbitrary user data, like function objects, OpenCL contexts, or whatever other
     non-serializable objects, both as keys or values.
     Try to serialize the data, and if it fails, fall back to checking the store and removing all non-serializable
@@ -95,21 +129,20 @@ def _persist_settings(config_manager):
     """
     serializable_data = config_manager.get_serializable()
     try:
-        _try_persist_settings(serializable_data)
+        return _try_serialize_settings(serializable_data)
     except (TypeError, ValueError):
         # The user added non-serializable data to the store, so remove all non-serializable keys or values.
         _remove_non_serializable_store_entries(serializable_data["settings"][SCRIPT_GLOBALS])
-        _try_persist_settings(serializable_data)
+        return _try_serialize_settings(serializable_data)
 
 
-def _try_persist_settings(serializable_data: dict):
+def _try_serialize_settings(serializable_data: dict) -> str:
     """
-    Write the settings as JSON to the configuration file
+    Serialize the settings as JSON for the configuration file
     :raises TypeError: If the user tries to store non-serializable types
     :raises ValueError: If the user tries to store circular referenced (recursive) structures.
     """
-    with open(CONFIG_FILE, "w") as json_file:
-            json.dump(serializable_data, json_file, indent=4)
+    return json.dumps(serializable_data, indent=4)
 
 
 def _remove_non_serializable_store_entries(store: dict):
@@ -159,6 +192,10 @@ class ConfigManager:
 
     CLASS_VERSION = common.VERSION
 
+    # Set by the tests: compare the indexes with a full rebuild after every incremental change, which defeats its
+    # purpose outside of tests.
+    CHECK_INDEXES_AFTER_CHANGES = False
+
     SETTINGS = {
                 IS_FIRST_RUN: True,
                 SERVICE_RUNNING: True,
@@ -185,7 +222,13 @@ class ConfigManager:
                 #RECENT_ENTRY_MINLENGTH: 10,
                 #RECENT_ENTRY_SUGGEST: True
                 SCRIPT_GLOBALS: {},
-                GTK_THEME: "classic"
+                GTK_THEME: "classic",
+                # Pairs of [WM_CLASS regex, send mode value] used by the automatic send mode.
+                # See autokey.iomediator.sendmode
+                SEND_MODE_RULES: [
+                    [".*([Tt]erminal|[Xx]term|[Kk]onsole|[Aa]lacritty|kitty|[Tt]ilix|[Tt]erminator).*",
+                     autokey.model.phrase.SendMode.CB_CTRL_SHIFT_V.value],
+                ],
                 }
 
     def __init__(self, app):
@@ -207,6 +250,11 @@ class ConfigManager:
         self.toggleServiceHotkey.set_hotkey(["<super>", "<shift>"], "k")
         self.toggleServiceHotkey.enabled = True
 
+        # Stops streamed sends of large phrases and keyboard.stream_keys()
+        self.cancelSendHotkey = GlobalHotkey()
+        self.cancelSendHotkey.set_hotkey(["<super>", "<shift>"], key.Key.ESCAPE)
+        self.cancelSendHotkey.enabled = True
+
         # Set the attribute to the default first. Without this, AK breaks, if started for the first time. See #274
         self.workAroundApps = re.compile(self.SETTINGS[WORKAROUND_APP_REGEX])
 
@@ -235,7 +283,8 @@ class ConfigManager:
     def get_serializable(self):
         extraFolders = []
         for folder in self.folders:
-            if not folder.path.startswith(CONFIG_DEFAULT_FOLDER):
+            # Temporary folders created by scripts have no path
+            if folder.path is not None and not folder.path.startswith(CONFIG_DEFAULT_FOLDER):
                 extraFolders.append(folder.path)
 
         d = {
@@ -244,7 +293,8 @@ class ConfigManager:
             "settings": ConfigManager.SETTINGS,
             "folders": extraFolders,
             "toggleServiceHotkey": self.toggleServiceHotkey.get_serializable(),
-            "configHotkey": self.configHotkey.get_serializable()
+            "configHotkey": self.configHotkey.get_serializable(),
+            "cancelSendHotkey": self.cancelSendHotkey.get_serializable()
             }
         return d
 
@@ -266,20 +316,20 @@ class ConfigManager:
 
             self.workAroundApps = re.compile(self.SETTINGS[WORKAROUND_APP_REGEX])
 
-            for entryPath in glob.glob(CONFIG_DEFAULT_FOLDER + "/*"):
-                if os.path.isdir(entryPath):
-                    logger.debug("Loading folder at '%s'", entryPath)
-                    f = autokey.model.folder.Folder("", path=entryPath)
-                    f.load(None)
-                    self.folders.append(f)
+            folderPaths = []
+            with os.scandir(CONFIG_DEFAULT_FOLDER) as entries:
+                for entry in entries:
+                    if not entry.name.startswith(".") and entry.is_dir():
+                        logger.debug("Loading folder at '%s'", entry.path)
+                        folderPaths.append(entry.path)
 
-            for folderPath in data["folders"]:
-                f = autokey.model.folder.Folder("", path=folderPath)
-                f.load()
-                self.folders.append(f)
+            folderPaths.extend(data["folders"])
+            self.folders.extend(autokey.configmanager.snapshot.load_folders(folderPaths))
 
             self.toggleServiceHotkey.load_from_serialized(data["toggleServiceHotkey"])
             self.configHotkey.load_from_serialized(data["configHotkey"])
+            if "cancelSendHotkey" in data:
+                self.cancelSendHotkey.load_from_serialized(data["cancelSendHotkey"])
 
             if self.VERSION < self.CLASS_VERSION:
                 self.upgrade()
@@ -289,18 +339,26 @@ class ConfigManager:
 
     def __checkExisting(self, path):
         # Check if we already know about the path, and return object if found
-        for item in self.allItems:
-            if item.path == path:
-                return item
-
-        return None
+        return self.itemsByPath.get(path)
 
     def __checkExistingFolder(self, path):
-        for folder in self.allFolders:
-            if folder.path == path:
-                return folder
+        return self.foldersByPath.get(path)
 
-        return None
+    def paths_changed(self, changes: typing.List[typing.Tuple[str, str]]) -> bool:
+        """
+        Applies a batch of file changes, reported by the file monitor.
+
+        @param changes: (path, change) pairs in the order of the file events, the change being monitor.MODIFIED or
+        monitor.REMOVED
+        @return: True, if any phrase, script or folder changed
+        """
+        changed = False
+        for path, change in changes:
+            if change == autokey.monitor.REMOVED:
+                changed = bool(self.path_removed(path)) or changed
+            else:
+                changed = bool(self.path_created_or_modified(path)) or changed
+        return changed
 
     def path_created_or_modified(self, path):
         directory, baseName = os.path.split(path)
@@ -316,15 +374,20 @@ class ConfigManager:
             if os.path.isdir(path):
                 f = autokey.model.folder.Folder("", path=path)
 
-                if directory == CONFIG_DEFAULT_FOLDER:
+                if self.__checkExistingFolder(path) is not None:
+                    # Already added, for example by a script using engine.create_folder()
+                    loaded = True
+                elif directory == CONFIG_DEFAULT_FOLDER:
                     self.folders.append(f)
                     f.load()
+                    self.folder_added(f)
                     loaded = True
                 else:
                     folder = self.__checkExistingFolder(directory)
                     if folder is not None:
                         f.load(folder)
                         folder.add_folder(f)
+                        self.folder_added(f)
                         loaded = True
 
             # -- handle txt or py files added or modified
@@ -344,7 +407,11 @@ class ConfigManager:
                     folder = self.__checkExistingFolder(directory)
                     if folder is not None:
                         i.load(folder)
-                        if isNew: folder.add_item(i)
+                        if isNew:
+                            folder.add_item(i)
+                            self.item_added(i)
+                        else:
+                            self.item_changed(i)
                         loaded = True
 
                 # --- handle changes to folder settings
@@ -353,20 +420,19 @@ class ConfigManager:
                     folder = self.__checkExistingFolder(directory)
                     if folder is not None:
                         folder.load_from_serialized()
+                        self.folder_changed(folder)
                         loaded = True
 
                 # --- handle changes to item settings
 
                 if baseName.endswith(".json"):
-                    for item in self.allItems:
-                        if item.get_json_path() == path:
-                            item.load_from_serialized()
-                            loaded = True
+                    for item in self.itemsByJsonPath.get_all(path):
+                        item.load_from_serialized()
+                        self.item_changed(item)
+                        loaded = True
 
             if not loaded:
                 logger.warning("No action taken for create/update event at %s", path)
-            else:
-                self.config_altered(False)
             return loaded
 
     def path_removed(self, path):
@@ -384,17 +450,17 @@ class ConfigManager:
                 self.folders.remove(folder)
             else:
                 folder.parent.remove_folder(folder)
+            self.folder_removed(folder)
             deleted = True
 
         elif item is not None:
             item.parent.remove_item(item)
             #item.remove_data()
+            self.item_removed(item)
             deleted = True
 
         if not deleted:
             logger.warning("No action taken for delete event at %s", path)
-        else:
-            self.config_altered(False)
         return deleted
 
 
@@ -477,7 +543,8 @@ class ConfigManager:
 
         existingPaths = []
         for folder in self.folders:
-            if folder.parent is None and not folder.path.startswith(CONFIG_DEFAULT_FOLDER):
+            if folder.parent is None and folder.path is not None and \
+                    not folder.path.startswith(CONFIG_DEFAULT_FOLDER):
                 existingPaths.append(folder.path)
 
         for folderPath in data["folders"]:
@@ -488,6 +555,8 @@ class ConfigManager:
 
         self.toggleServiceHotkey.load_from_serialized(data["toggleServiceHotkey"])
         self.configHotkey.load_from_serialized(data["configHotkey"])
+        if "cancelSendHotkey" in data:
+            self.cancelSendHotkey.load_from_serialized(data["cancelSendHotkey"])
 
         self.config_altered(False)
         logger.info("Successfully reloaded global configuration")
@@ -515,74 +584,186 @@ class ConfigManager:
 
     def config_altered(self, persistGlobal):
         """
-        Called when some element of configuration has been altered, to update
-        the lists of phrases/folders.
+        Called when some element of configuration has been altered, to rebuild
+        the lists of phrases/folders from the folder tree. Changes of single
+        items or folders use the incremental operations below instead.
 
         @param persistGlobal: save the global configuration at the end of the process
         """
         logger.info("Configuration changed - rebuilding in-memory structures")
 
         self.lock.acquire()
-        # Rebuild root folder list
-        #rootFolders = self.folders
-        #self.folders = []
-        #for folder in rootFolders:
-        #    self.folders.append(folder)
-
-        self.hotKeyFolders = []
-        self.hotKeys = []
-
-        self.abbreviations = []
-
-        self.allFolders = []
-        self.allItems = []
-
-        for folder in self.folders:
-            if autokey.model.helpers.TriggerMode.HOTKEY in folder.modes:
-                self.hotKeyFolders.append(folder)
-            self.allFolders.append(folder)
-
-            if not self.app.monitor.has_watch(folder.path):
-                self.app.monitor.add_watch(folder.path)
-
-            self.__processFolder(folder)
+        self.__rebuild_indexes()
 
         self.globalHotkeys = []
         self.globalHotkeys.append(self.configHotkey)
         self.globalHotkeys.append(self.toggleServiceHotkey)
+        self.globalHotkeys.append(self.cancelSendHotkey)
         #_logger.debug("Global hotkeys: %s", self.globalHotkeys)
 
-        #_logger.debug("Hotkey folders: %s", self.hotKeyFolders)
-        #_logger.debug("Hotkey phrases: %s", self.hotKeys)
-        #_logger.debug("Abbreviation phrases: %s", self.abbreviations)
-        #_logger.debug("All folders: %s", self.allFolders)
-        #_logger.debug("All phrases: %s", self.allItems)
-
         if persistGlobal:
             save_config(self)
 
         self.lock.release()
 
-    def __processFolder(self, parentFolder):
-        if not self.app.monitor.has_watch(parentFolder.path):
-            self.app.monitor.add_watch(parentFolder.path)
-
-        for folder in parentFolder.folders:
-            if autokey.model.helpers.TriggerMode.HOTKEY in folder.modes:
-                self.hotKeyFolders.append(folder)
-            self.allFolders.append(folder)
-
-            if not self.app.monitor.has_watch(folder.path):
-                self.app.monitor.add_watch(folder.path)
+    # Incremental changes ----
+    # Called after the folder tree was changed, to update the lists of phrases/folders. The caller changes the tree,
+    # for example using Folder.add_item or self.folders.remove, these operations only update the indexes.
+
+    def item_added(self, item):
+        """Called after a phrase or script was added to its folder."""
+        with self.lock:
+            self.__index_item(item)
+            self.__check_indexes_after_change()
+
+    def item_removed(self, item):
+        """Called after a phrase or script was removed from its folder."""
+        with self.lock:
+            self.__unindex_item(item)
+            self.__check_indexes_after_change()
+
+    def item_changed(self, item):
+        """Called after the trigger modes, path or description of a phrase or script changed."""
+        with self.lock:
+            self.__index_item(item)
+            self.__check_indexes_after_change()
+
+    def folder_added(self, folder):
+        """Called after a folder was added to its parent or to the top level folders, with all its contents."""
+        with self.lock:
+            self.__index_folder_tree(folder)
+            self.__check_indexes_after_change()
+
+    def folder_removed(self, folder):
+        """Called after a folder was removed from its parent or from the top level folders, with all its contents."""
+        with self.lock:
+            self.__unindex_folder_tree(folder)
+            self.__check_indexes_after_change()
+
+    def folder_moved(self, folder):
+        """Called after a folder was renamed or moved, which changed the paths of all its contents."""
+        with self.lock:
+            self.__unindex_folder_tree(folder)
+            self.__index_folder_tree(folder)
+            self.__check_indexes_after_change()
+
+    def folder_changed(self, folder):
+        """Called after the trigger modes or title of a folder changed. Its contents did not change."""
+        with self.lock:
+            self.__index_folder(folder)
+            self.__check_indexes_after_change()
+
+    def check_indexes(self) -> bool:
+        """
+        Debugging aid: Compare the lists of phrases/folders with a full rebuild from the folder tree. Differences are
+        logged, and the rebuilt lists are used from then on.
 
-            self.__processFolder(folder)
+        @return: True, if the lists were consistent with the folder tree
+        """
+        with self.lock:
+            return self.__check_indexes()
+
+    def __check_indexes_after_change(self):
+        # A full rebuild after every change, only when enabled by the tests
+        if ConfigManager.CHECK_INDEXES_AFTER_CHANGES and not self.__check_indexes():
+            raise AssertionError("The incremental change left the indexes inconsistent with the folder tree")
+
+    def __check_indexes(self) -> bool:
+        current = {name: getattr(self, name) for name in INDEX_NAMES + KEY_INDEX_NAMES}
+        self.__rebuild_indexes()
+        consistent = True
+        for name in INDEX_NAMES:
+            expected = getattr(self, name)
+            if set(map(id, current[name])) != set(map(id, expected)):
+                logger.error("Index {} is inconsistent with the folder tree. Missing: {}, unexpected: {}".format(
+                    name, [model_object for model_object in expected if model_object not in current[name]],
+                    [model_object for model_object in current[name] if model_object not in expected]))
+                consistent = False
+        for name in KEY_INDEX_NAMES:
+            expected = getattr(self, name).as_sets()
+            actual = current[name].as_sets()
+            if actual != expected:
+                logger.error("Index {} is inconsistent with the folder tree. Differing keys: {}".format(
+                    name, sorted(str(key) for key in set(expected) | set(actual)
+                                 if expected.get(key) != actual.get(key))))
+                consistent = False
+        return consistent
+
+    def __rebuild_indexes(self):
+        self.hotKeyFolders = ItemList()
+        self.hotKeys = ItemList()
+        self.abbreviations = ItemList()
+        self.allFolders = ItemList()
+        self.allItems = ItemList()
+        self.itemsByPath = KeyIndex(lambda item: item.path)
+        self.itemsByJsonPath = KeyIndex(lambda item: None if item.path is None else item.get_json_path())
+        self.itemsByDescription = KeyIndex(lambda item: item.description)
+        self.foldersByPath = KeyIndex(lambda folder: folder.path)
+        self.foldersByTitle = KeyIndex(lambda folder: folder.title)
+        self.triggersByAbbreviation = MultiKeyIndex(_folded_abbreviations)
+        self.triggersByHotkey = KeyIndex(_hotkey)
+        for folder in self.folders:
+            self.__index_folder_tree(folder)
 
+    def __index_folder_tree(self, parentFolder):
+        self.__index_folder(parentFolder)
+        for folder in parentFolder.folders:
+            self.__index_folder_tree(folder)
+        for item in parentFolder.items:
+            self.__index_item(item)
+
+    def __unindex_folder_tree(self, parentFolder):
+        self.hotKeyFolders.discard(parentFolder)
+        self.allFolders.discard(parentFolder)
+        self.foldersByPath.discard(parentFolder)
+        self.foldersByTitle.discard(parentFolder)
+        self.triggersByAbbreviation.discard(parentFolder)
+        self.triggersByHotkey.discard(parentFolder)
+        for folder in parentFolder.folders:
+            self.__unindex_folder_tree(folder)
         for item in parentFolder.items:
-            if autokey.model.helpers.TriggerMode.HOTKEY in item.modes:
-                self.hotKeys.append(item)
-            if autokey.model.helpers.TriggerMode.ABBREVIATION in item.modes:
-                self.abbreviations.append(item)
-            self.allItems.append(item)
+            self.__unindex_item(item)
+
+    def __index_folder(self, folder):
+        if autokey.model.helpers.TriggerMode.HOTKEY in folder.modes:
+            self.hotKeyFolders.add(folder)
+        else:
+            self.hotKeyFolders.discard(folder)
+        self.allFolders.add(folder)
+        self.foldersByPath.update(folder)
+        self.foldersByTitle.update(folder)
+        self.triggersByAbbreviation.update(folder)
+        self.triggersByHotkey.update(folder)
+
+        # Temporary folders created by scripts have no path
+        if folder.path is not None and not self.app.monitor.has_watch(folder.path):
+            self.app.monitor.add_watch(folder.path)
+
+    def __index_item(self, item):
+        if autokey.model.helpers.TriggerMode.HOTKEY in item.modes:
+            self.hotKeys.add(item)
+        else:
+            self.hotKeys.discard(item)
+        if autokey.model.helpers.TriggerMode.ABBREVIATION in item.modes:
+            self.abbreviations.add(item)
+        else:
+            self.abbreviations.discard(item)
+        self.allItems.add(item)
+        self.itemsByPath.update(item)
+        self.itemsByJsonPath.update(item)
+        self.itemsByDescription.update(item)
+        self.triggersByAbbreviation.update(item)
+        self.triggersByHotkey.update(item)
+
+    def __unindex_item(self, item):
+        self.hotKeys.discard(item)
+        self.abbreviations.discard(item)
+        self.allItems.discard(item)
+        self.itemsByPath.discard(item)
+        self.itemsByJsonPath.discard(item)
+        self.itemsByDescription.discard(item)
+        self.triggersByAbbreviation.discard(item)
+        self.triggersByHotkey.discard(item)
 
     # TODO Future functionality
     def add_recent_entry(self, entry):
@@ -624,7 +805,7 @@ class ConfigManager:
         @param filterPattern: The filter pattern associated with the abbreviation
         @param targetItem: the phrase for which the abbreviation to be used
         """
-        for item in itertools.chain(self.allFolders, self.allItems):
+        for item in _folders_first(self.triggersByAbbreviation.get_all(abbreviation.lower())):
             if ConfigManager.item_has_abbreviation(item, abbreviation) and \
                     item.filter_matches(filterPattern):
                     return item is targetItem, item
@@ -636,36 +817,63 @@ class ConfigManager:
         return autokey.model.helpers.TriggerMode.ABBREVIATION in item.modes and \
                abbreviation in item.abbreviations
 
-    """def check_abbreviation_substring(self, abbreviation, targetItem):
-        for item in self.allFolders:
-            if model.TriggerMode.ABBREVIATION in item.modes:
-                if abbreviation in item.abbreviation or item.abbreviation in abbreviation:
-                    return item is targetItem, item.title
+    def find_abbreviation_conflicts(self) -> typing.List[AbbreviationConflict]:
+        """
+        Finds all pairs of abbreviations, where typing one of them triggers the other one instead or as well:
+          - duplicate: Both abbreviations match the same input
+          - prefix: The shorter abbreviation triggers while the longer one is typed, because it is expanded
+            immediately or is followed by a non-word character in the longer one
+          - suffix: The longer abbreviation ends with the shorter one, which triggers inside words or follows a
+            space in the longer one, and does not wait for a trigger character while the longer one expands immediately
 
-        for item in self.allItems:
-            if model.TriggerMode.ABBREVIATION in item.modes:
-                if abbreviation in item.abbreviation or item.abbreviation in abbreviation:
-                    return item is targetItem, item.description
+        Only abbreviations with overlapping window filters conflict. Each abbreviation is looked up by its folded
+        prefixes and suffixes in the abbreviation index, so this takes a single pass over the abbreviations.
 
-        return True, ""
+        @return: The conflicts, item being the shadowing one for prefix and suffix conflicts
+        """
+        conflicts = []
+        with self.lock:
+            index = self.triggersByAbbreviation
+            for folded in index.keys():
+                for other_item in index.get_all(folded):
+                    for other_abbreviation in other_item.abbreviations:
+                        if other_abbreviation.lower() != folded:
+                            continue
+                        for item in index.get_all(folded):
+                            if id(item) < id(other_item):
+                                conflicts.extend(self.__abbreviation_conflicts(
+                                    "duplicate", item, folded, other_item, other_abbreviation))
+                        for length in range(1, len(folded)):
+                            for kind, part in (("prefix", folded[:length]), ("suffix", folded[-length:])):
+                                for item in index.get_all(part):
+                                    conflicts.extend(self.__abbreviation_conflicts(
+                                        kind, item, part, other_item, other_abbreviation))
+        return conflicts
 
-    def __checkSubstringAbbr(self, item1, item2, abbr):
-        # Check if the given abbreviation is a substring match for the given item
-        # If it is, check a few other rules to see if it matters
-        print ("substring check {} against {}".format(item.abbreviation, abbr))
-        try:
-            index = item.abbreviation.index(abbr)
-            print (index)
-            if index == 0 and len(abbr) < len(item.abbreviation):
-                return item.immediate
-            elif (index + len(abbr)) == len(item.abbreviation):
-                return item.triggerInside
-            elif len(abbr) != len(item.abbreviation):
-                return item.triggerInside and item.immediate
-            else:
-                return False
-        except ValueError:
-            return False"""
+    @staticmethod
+    def __abbreviation_conflicts(kind, item, folded, other_item, other_abbreviation):
+        # The abbreviations of item, which fold to the given part of other_abbreviation and trigger when it is typed
+        if item is other_item or not item.filter_matches(_filter_pattern(other_item)):
+            return
+        for abbreviation in item.abbreviations:
+            if abbreviation.lower() != folded:
+                continue
+            if kind == "duplicate":
+                if not (item.ignoreCase or other_item.ignoreCase or abbreviation == other_abbreviation):
+                    continue
+            elif not item.ignoreCase and abbreviation != (
+                    other_abbreviation[:len(abbreviation)] if kind == "prefix" else
+                    other_abbreviation[-len(abbreviation):]):
+                continue
+            elif kind == "prefix":
+                following = other_abbreviation[len(abbreviation)]
+                if not item.immediate and item.wordChars.match(following):
+                    continue
+            elif kind == "suffix":
+                preceding = other_abbreviation[-len(abbreviation) - 1]
+                if not (item.triggerInside or preceding.isspace()) or (other_item.immediate and not item.immediate):
+                    continue
+            yield AbbreviationConflict(kind, item, abbreviation, other_item, other_abbreviation)
 
     def check_hotkey_unique(self, modifiers, hotKey, newFilterPattern, targetItem):
         """
@@ -693,12 +901,8 @@ class ConfigManager:
         @param hotKey: the hotkey to check
         @param newFilterPattern:
         """
-        for item in itertools.chain(self.allFolders, self.allItems):
-            if autokey.model.helpers.TriggerMode.HOTKEY in item.modes and \
-                    ConfigManager.item_has_same_hotkey(item,
-                                              modifiers,
-                                              hotKey,
-                                              newFilterPattern):
+        for item in _folders_first(self.triggersByHotkey.get_all((tuple(modifiers or ()), hotKey))):
+            if ConfigManager.item_has_same_hotkey(item, modifiers, hotKey, newFilterPattern):
                 return item
 
         for item in self.globalHotkeys:
@@ -718,36 +922,35 @@ class ConfigManager:
         """
         Removes all temporary folders and phrases, as well as any within temporary folders.
         Useful for rc-style scripts that want to change a set of keys.
+
+        @param folder: The folder to search, None to search all top level folders
+        @param in_temp_parent: Remove all contents of the folder, temporary or not
         """
         if folder is None:
-            searchFolders = self.allFolders
-            searchItems = self.allItems
+            subfolders = list(self.folders)
+            items = []
         else:
-            searchFolders = folder.folders
-            searchItems = folder.items
-
-        for item in searchItems:
-            try:
-                if item.temporary or in_temp_parent:
-                    self.__deleteHotkeys(item)
-                    searchItems.remove(item)
-            # Items created before this update don't have a 'temporary' field.
-            except AttributeError:
-                pass
-
-        for subfolder in searchFolders:
-            self.__deleteHotkeys(subfolder)
-            try:
-                if subfolder.temporary or in_temp_parent:
-                    in_temp_parent = True
-                    if folder is not None:
-                        folder.remove_folder(subfolder)
-                    else:
-                        searchFolders.remove(subfolder)
+            subfolders = list(folder.folders)
+            items = list(folder.items)
+
+        for item in items:
             # Items created before this update don't have a 'temporary' field.
-            except AttributeError:
-                pass
-            self.remove_all_temporary(subfolder, in_temp_parent)
+            if getattr(item, "temporary", False) or in_temp_parent:
+                self.__deleteHotkeys(item)
+                folder.remove_item(item)
+                self.item_removed(item)
+
+        for subfolder in subfolders:
+            if getattr(subfolder, "temporary", False) or in_temp_parent:
+                # Removes the hotkeys of all contents, which are removed together with the folder
+                self.__deleteHotkeys(subfolder)
+                if folder is None:
+                    self.folders.remove(subfolder)
+                else:
+                    folder.remove_folder(subfolder)
+                self.folder_removed(subfolder)
+            else:
+                self.remove_all_temporary(subfolder)
 
     def __deleteHotkeys(self, removed_item):
         removed_item.unset_hotkey()
@@ -24,6 +24,8 @@ from autokey import common
 CONFIG_FILE = os.path.join(common.CONFIG_DIR, "autokey.json")
 CONFIG_DEFAULT_FOLDER = os.path.join(common.CONFIG_DIR, "data")
 CONFIG_FILE_BACKUP = CONFIG_FILE + '~'
+# Snapshot of the loaded folders, phrases and scripts, see autokey.configmanager.snapshot
+CONFIG_SNAPSHOT_FILE = os.path.join(common.XDG_CACHE_HOME, "autokey", "config-snapshot.pickle")
 
 DEFAULT_ABBR_FOLDER = "Imported Abbreviations"
 RECENT_ENTRIES_FOLDER = "Recently Typed"
@@ -49,3 +51,4 @@ DISABLED_MODIFIERS = "disabledModifiers"
 TRIGGER_BY_INITIAL = "triggerItemByInitial"
 SCRIPT_GLOBALS = "scriptGlobals"
 GTK_THEME = "gtkTheme"
+SEND_MODE_RULES = "sendModeRules"
@@ -0,0 +1,171 @@
+# Copyright (C) 2021 BlueDrink9
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Containers used by the ConfigManager to index the folder tree: lists of phrases/folders, and lookups by path,
+description, title, abbreviation and hotkey. They are updated in place by the incremental change operations of the ConfigManager, in time
+proportional to the size of the change.
+"""
+
+import bisect
+import typing
+
+# Removed positions remembered by an ItemList before it renumbers its objects
+COMPACT_THRESHOLD = 32
+
+
+class ItemList(list):
+    """
+    A list of model objects without duplicates, with constant time membership tests, additions and removals.
+
+    Removals keep the order of the list, so the first matching object stays the same, as when the list is built from
+    the folder tree. Added objects are appended. Objects are compared by identity. Only add, discard, append, remove and
+    clear keep the list and its index consistent, the other list methods must not be used to change it.
+    """
+
+    def __init__(self, iterable: typing.Iterable=()):
+        super().__init__()
+        # Position of each object, counting the objects removed since the last renumbering
+        self._positions = {}  # type: typing.Dict[int, int]
+        # Sorted positions of the objects removed since the last renumbering. Subtracting the removed positions in front
+        # of an object gives its index in the list, so a removal does not renumber the objects behind it.
+        self._removed = []  # type: typing.List[int]
+        for model_object in iterable:
+            self.add(model_object)
+
+    def add(self, model_object):
+        """Append the object, if it is not in the list."""
+        if id(model_object) not in self._positions:
+            self._positions[id(model_object)] = len(self) + len(self._removed)
+            super().append(model_object)
+
+    def discard(self, model_object):
+        """Remove the object, if it is in the list."""
+        position = self._positions.pop(id(model_object), None)
+        if position is None:
+            return
+        del self[position - bisect.bisect_left(self._removed, position)]
+        bisect.insort(self._removed, position)
+        if len(self._removed) > max(COMPACT_THRESHOLD, len(self)):
+            self._renumber()
+
+    def _renumber(self):
+        self._positions = {id(model_object): index for index, model_object in enumerate(self)}
+        self._removed.clear()
+
+    def append(self, model_object):
+        self.add(model_object)
+
+    def remove(self, model_object):
+        if id(model_object) not in self._positions:
+            raise ValueError("{!r} is not in the list".format(model_object))
+        self.discard(model_object)
+
+    def clear(self):
+        super().clear()
+        self._positions.clear()
+        self._removed.clear()
+
+    def __contains__(self, model_object) -> bool:
+        return id(model_object) in self._positions
+
+
+class KeyIndex:
+    """
+    Index of model objects by a key computed from the object, like its path or title. Several objects can have the same
+    key. Objects with the key None are not indexed.
+
+    The key of each object is remembered, so that update can move an object to its new key after the key attribute
+    changed.
+
+    @param key: Returns the key of a model object
+    """
+
+    def __init__(self, key: typing.Callable[[typing.Any], typing.Optional[typing.Hashable]]):
+        self._key = key
+        self._buckets = {}  # type: typing.Dict[typing.Hashable, ItemList]
+        self._keys = {}  # type: typing.Dict[int, typing.Hashable]
+
+    def update(self, model_object):
+        """Add the object, or move it to its current key."""
+        key = self._key(model_object)
+        if id(model_object) in self._keys:
+            if self._keys[id(model_object)] == key:
+                return
+            self.discard(model_object)
+        if key is not None:
+            self._keys[id(model_object)] = key
+            self._buckets.setdefault(key, ItemList()).add(model_object)
+
+    def discard(self, model_object):
+        key = self._keys.pop(id(model_object), None)
+        if key is None:
+            return
+        bucket = self._buckets[key]
+        bucket.discard(model_object)
+        if not bucket:
+            del self._buckets[key]
+
+    def get(self, key):
+        """Returns an object with the given key, any one of them if there are several, or None."""
+        for model_object in self._buckets.get(key, ()):
+            return model_object
+        return None
+
+    def get_all(self, key) -> list:
+        """Returns all objects with the given key."""
+        return list(self._buckets.get(key, ()))
+
+    def as_sets(self) -> typing.Dict[typing.Hashable, typing.Set[int]]:
+        """The ids of the indexed objects by key, used to compare indexes."""
+        return {key: set(map(id, bucket)) for key, bucket in self._buckets.items()}
+
+
+class MultiKeyIndex(KeyIndex):
+    """
+    Index of model objects by several keys computed from the object, like its abbreviations. The object is found under
+    each of its keys.
+
+    @param key: Returns the keys of a model object, an empty iterable if it should not be indexed
+    """
+
+    def __init__(self, key: typing.Callable[[typing.Any], typing.Iterable[typing.Hashable]]):
+        super().__init__(key)
+
+    def update(self, model_object):
+        """Add the object, or move it to its current keys."""
+        keys = frozenset(self._key(model_object))
+        if id(model_object) in self._keys:
+            if self._keys[id(model_object)] == keys:
+                return
+            self.discard(model_object)
+        if keys:
+            self._keys[id(model_object)] = keys
+            for key in keys:
+                self._buckets.setdefault(key, ItemList()).add(model_object)
+
+    def discard(self, model_object):
+        keys = self._keys.pop(id(model_object), None)
+        if keys is None:
+            return
+        for key in keys:
+            bucket = self._buckets[key]
+            bucket.discard(model_object)
+            if not bucket:
+                del self._buckets[key]
+
+    def keys(self) -> typing.KeysView:
+        """All keys having at least one object."""
+        return self._buckets.keys()
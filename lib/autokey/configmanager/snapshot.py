@@ -0,0 +1,213 @@
+# Copyright (C) 2021 BlueDrink9
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Snapshot of the loaded folder tree, used to start without reading and parsing every phrase, script and metadata file.
+
+The snapshot is a single file in the cache directory, containing two pickles: a header with the manifest, which maps
+every file read while loading to its modification time and size, and the folders with all their contents. At startup,
+the folder directories are scanned using stat calls only, and compared to the manifest:
+
+ - If nothing changed, the folders are taken from the snapshot.
+ - If only the contents of some files changed, the folders are taken from the snapshot, and the changed phrases, scripts
+   and folders are loaded again from their files.
+ - If files were added or removed, or the snapshot is missing, outdated or unreadable, the folders are loaded from the
+   files as usual.
+
+In the last two cases, a new snapshot is written. The snapshot is only a cache, all errors while using it are logged and
+cause a full load.
+"""
+
+import io
+import os
+import pickle
+import typing
+
+from autokey import common
+from autokey.configmanager.configmanager_constants import CONFIG_SNAPSHOT_FILE
+import autokey.model.folder
+from autokey.model.helpers import JSON_FILE_PATTERN, read_file
+
+logger = __import__("autokey.logger").logger.get_logger(__name__)
+
+# Increment, whenever the pickled model classes change in an incompatible way
+SNAPSHOT_FORMAT = 2
+
+# Maps the paths of the files read while loading folders to (modification time in ns, size). Directories are included
+# with (0, 0), so that added or removed folders are noticed.
+Manifest = typing.Dict[str, typing.Tuple[int, int]]
+
+
+def scan_manifest(paths: typing.List[str]) -> Manifest:
+    """
+    Build the manifest of the given folder directories, using the same rules as L{autokey.model.folder.load_folders}
+    to decide which files are read. Only lists the directories and stats the files, nothing is read.
+    """
+    manifest = {}  # type: Manifest
+    for path in paths:
+        _scan_directory(path, manifest)
+    return manifest
+
+
+def _scan_directory(path: str, manifest: Manifest):
+    manifest[path] = (0, 0)
+    try:
+        with os.scandir(path) as directory:
+            entries = {entry.name: entry for entry in directory}
+    except OSError:
+        return
+    metadata_names = ["folder.json"]
+    for name, entry in entries.items():
+        if name.startswith("."):
+            continue
+        entry_path = path + "/" + name
+        if entry.is_dir():
+            _scan_directory(entry_path, manifest)
+        elif entry.is_file() and name.endswith((".txt", ".py")):
+            _add_file(manifest, entry_path, entry)
+            metadata_names.append(os.path.basename(JSON_FILE_PATTERN.format(path, os.path.splitext(name)[0])))
+    for name in metadata_names:
+        entry = entries.get(name)
+        if entry is not None and (entry.is_file() or entry.is_dir()):
+            _add_file(manifest, path + "/" + name, entry)
+
+
+def _add_file(manifest: Manifest, path: str, entry: os.DirEntry):
+    try:
+        stat = entry.stat()
+    except OSError:
+        # Removed meanwhile. Recording it as changed causes it to be read again, which reports the error as usual.
+        manifest[path] = (-1, -1)
+    else:
+        manifest[path] = (stat.st_mtime_ns, stat.st_size)
+
+
+def load_folders(paths: typing.List[str], snapshot_path: str=CONFIG_SNAPSHOT_FILE
+                 ) -> typing.List[autokey.model.folder.Folder]:
+    """
+    Load the folders at the given paths, using the snapshot if it is up to date, and update the snapshot.
+    The result is the same as loading the folders using L{autokey.model.folder.load_folders}.
+
+    @param paths: Paths of the top level folders
+    @param snapshot_path: Location of the snapshot file
+    @raise OSError: If a phrase or script file cannot be read
+    """
+    # Scanned before reading anything: files changing while loading have a newer time than recorded and are read
+    # again at the next start.
+    manifest = scan_manifest(paths)
+    folders, changed = _read_snapshot(snapshot_path, paths, manifest)
+    if folders is not None and changed and not _reload_changed(folders, changed):
+        folders = None
+    if folders is None:
+        folders = [autokey.model.folder.Folder("", path=path) for path in paths]
+        autokey.model.folder.load_folders(folders)
+        logger.info("Loaded {} folders from files, snapshot not usable".format(len(folders)))
+    elif changed:
+        logger.info("Loaded {} folders from the snapshot, {} changed files read again".format(
+            len(folders), len(changed)))
+    else:
+        logger.info("Loaded {} folders from the snapshot".format(len(folders)))
+        return folders
+    write_snapshot(snapshot_path, paths, manifest, folders)
+    return folders
+
+
+def _read_snapshot(snapshot_path: str, paths: typing.List[str], manifest: Manifest
+                   ) -> typing.Tuple[typing.Optional[list], typing.List[str]]:
+    """
+    Returns the folders of the snapshot and the paths of changed files, or (None, []) if the snapshot is not usable.
+    """
+    try:
+        data = read_file(snapshot_path)
+    except FileNotFoundError:
+        return None, []
+    except OSError:
+        logger.exception("Cannot read the configuration snapshot")
+        return None, []
+    try:
+        unpickler = pickle.Unpickler(io.BytesIO(data))
+        header = unpickler.load()
+        if header.get("format") != SNAPSHOT_FORMAT or header.get("version") != common.VERSION:
+            logger.debug("Configuration snapshot written by another version")
+            return None, []
+        if header["paths"] != paths or header["manifest"].keys() != manifest.keys():
+            logger.debug("Folders, phrases or scripts were added or removed since the snapshot was written")
+            return None, []
+        changed = [path for path, stat in manifest.items() if header["manifest"][path] != stat]
+        return unpickler.load(), changed
+    except Exception:
+        logger.exception("Cannot load the configuration snapshot")
+        return None, []
+
+
+def _reload_changed(folders: typing.List[autokey.model.folder.Folder], changed: typing.List[str]) -> bool:
+    """
+    Read the changed files again, into the objects loaded from the snapshot.
+
+    @return: False, if a changed file does not belong to any object of the snapshot. The folders must be loaded from
+    the files then, as the snapshot does not describe the files on disk.
+    """
+    by_path = {}
+    for folder in _all_folders(folders):
+        by_path[folder.get_json_path()] = folder
+        for item in folder.items:
+            by_path[item.path] = item
+            by_path[item.get_json_path()] = item
+    reloaded = set()
+    for path in changed:
+        model_object = by_path.get(path)
+        if model_object is None:
+            logger.debug("Changed file {} is not part of the snapshot".format(path))
+            return False
+        if id(model_object) in reloaded:
+            continue
+        reloaded.add(id(model_object))
+        logger.debug("Reading changed file {}".format(path))
+        if isinstance(model_object, autokey.model.folder.Folder):
+            model_object.load_from_serialized()
+        else:
+            model_object.load(model_object.parent)
+    return True
+
+
+def _all_folders(folders: typing.List[autokey.model.folder.Folder]) -> typing.Iterator[autokey.model.folder.Folder]:
+    for folder in folders:
+        yield folder
+        yield from _all_folders(folder.folders)
+
+
+def write_snapshot(snapshot_path: str, paths: typing.List[str], manifest: Manifest,
+                   folders: typing.List[autokey.model.folder.Folder]):
+    """
+    Write the snapshot atomically, readable by the user only. Errors are logged, as the snapshot is only a cache.
+
+    @param manifest: The manifest scanned before the folders were loaded
+    """
+    header = {"format": SNAPSHOT_FORMAT, "version": common.VERSION, "paths": paths, "manifest": manifest}
+    temporary_path = snapshot_path + ".tmp"
+    try:
+        os.makedirs(os.path.dirname(snapshot_path), mode=0o700, exist_ok=True)
+        fd = os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with open(fd, "wb") as snapshot_file:
+            pickler = pickle.Pickler(snapshot_file, pickle.HIGHEST_PROTOCOL)
+            pickler.dump(header)
+            pickler.dump(folders)
+        os.replace(temporary_path, snapshot_path)
+    except Exception:
+        logger.exception("Cannot write the configuration snapshot")
+        try:
+            os.remove(temporary_path)
+        except OSError:
+            pass
@@ -0,0 +1,301 @@
+# Copyright (C) 2021 BlueDrink9
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Window management using the Extended Window Manager Hints (EWMH), implemented directly on an Xlib connection.
+
+The scripting API used to run wmctrl for every window operation, which costs a process start and a scan of all client
+windows per call. The WindowManager sends the same client messages as wmctrl to the window manager, and keeps an
+index of the title and class of the client windows, which is invalidated by the X interface when _NET_CLIENT_LIST or
+a window property changes.
+
+Window matching follows wmctrl: titles and classes are matched case-insensitively as substrings, the first matching
+client wins. Classes are given as "instance.Class", like WindowInfo.wm_class.
+"""
+
+import threading
+import typing
+
+from Xlib import X, Xatom, error
+from Xlib.protocol import event
+
+logger = __import__("autokey.logger").logger.get_logger(__name__)
+
+# Source indication of client messages: 2 means a pager or other direct user action, which window managers honour
+# without applying focus stealing prevention.
+SOURCE_PAGER = 2
+# Actions of _NET_WM_STATE client messages
+STATE_ACTIONS = {"remove": 0, "add": 1, "toggle": 2}
+# Window states accepted by set_state. These are the names used by wmctrl.
+STATE_NAMES = (
+    "modal", "sticky", "maximized_vert", "maximized_horz", "shaded", "skip_taskbar", "skip_pager", "hidden",
+    "fullscreen", "above", "below", "demands_attention",
+)
+# _NET_MOVERESIZE_WINDOW flags, telling which of x, y, width and height are given
+MOVERESIZE_X = 1 << 8
+MOVERESIZE_Y = 1 << 9
+MOVERESIZE_WIDTH = 1 << 10
+MOVERESIZE_HEIGHT = 1 << 11
+MOVERESIZE_SOURCE_PAGER = SOURCE_PAGER << 12
+CLIENT_MESSAGE_MASK = X.SubstructureRedirectMask | X.SubstructureNotifyMask
+
+
+class WindowManagerUnavailable(Exception):
+    """No EWMH compliant window manager is running. The caller can fall back to wmctrl."""
+
+
+ClientWindow = typing.NamedTuple("ClientWindow", [
+    ("id", int),
+    ("title", str),
+    ("wm_class", str),
+    ("desktop", int),
+    ("x", int),
+    ("y", int),
+    ("width", int),
+    ("height", int),
+])
+ClientWindow.__doc__ = """A client window and its geometry. The desktop is -1 for windows shown on all desktops."""
+
+
+def moveresize_data(x: int, y: int, width: int, height: int) -> typing.List[int]:
+    """
+    Data of a _NET_MOVERESIZE_WINDOW client message. Values of -1 are left unchanged, like in wmctrl.
+    """
+    flags = MOVERESIZE_SOURCE_PAGER  # Gravity 0: use the gravity of the window
+    for value, flag in ((x, MOVERESIZE_X), (y, MOVERESIZE_Y), (width, MOVERESIZE_WIDTH), (height, MOVERESIZE_HEIGHT)):
+        if value != -1:
+            flags |= flag
+    return [flags, max(x, 0), max(y, 0), max(width, 0), max(height, 0)]
+
+
+def parse_state_names(prop: str) -> typing.List[str]:
+    """
+    Split a wmctrl style property string (one or two comma separated names) into _NET_WM_STATE atom names.
+
+    @raise ValueError: If a name is unknown, or more than two are given
+    """
+    names = [name.strip().lower() for name in prop.split(",")]
+    if not 1 <= len(names) <= 2:
+        raise ValueError("One or two window states can be changed at once, got {!r}".format(prop))
+    for name in names:
+        if name not in STATE_NAMES:
+            raise ValueError("Unknown window state {!r}. Allowed: {}".format(name, ", ".join(STATE_NAMES)))
+    return ["_NET_WM_STATE_" + name.upper() for name in names]
+
+
+class WindowManager:
+    """
+    Finds client windows and sends EWMH requests to the window manager. Thread-safe.
+
+    @param display: The X connection used for all requests
+    @param watch_windows: Called with the ids of indexed windows, before their properties are read, so that changes
+    are reported by calling invalidate_window
+    """
+
+    def __init__(self, display, watch_windows: typing.Callable[[typing.List[int]], typing.Any]=None):
+        self._display = display
+        self._root = display.screen().root
+        self._watch_windows = watch_windows
+        self._lock = threading.Lock()
+        # Client window ids in _NET_CLIENT_LIST order, or None if the list has to be read again
+        self._clients = None  # type: typing.Optional[typing.List[int]]
+        # Index of (title, wm_class) by window id
+        self._entries = {}  # type: typing.Dict[int, typing.Tuple[str, str]]
+        self._available = False
+        self._atoms = {}  # type: typing.Dict[str, int]
+
+    # Index maintenance ----
+
+    def invalidate_client_list(self):
+        """Called when _NET_CLIENT_LIST changed."""
+        with self._lock:
+            self._clients = None
+
+    def invalidate_window(self, window_id: int):
+        """Called when the title or class of a window changed, or the window was destroyed."""
+        with self._lock:
+            self._entries.pop(window_id, None)
+
+    def clients(self) -> typing.List[typing.Tuple[int, str, str]]:
+        """
+        Returns (window id, title, wm_class) of all client windows, in _NET_CLIENT_LIST order.
+
+        @raise WindowManagerUnavailable: If no EWMH window manager is running
+        """
+        with self._lock:
+            clients = self._clients
+            entries = dict(self._entries)
+        if clients is None:
+            clients = self._read_client_list()
+        missing = [window_id for window_id in clients if window_id not in entries]
+        if missing and self._watch_windows is not None:
+            # Watch first, so that changes made while reading the properties are reported.
+            self._watch_windows(missing)
+        for window_id in missing:
+            entries[window_id] = self._read_entry(window_id)
+        with self._lock:
+            if self._clients is None:
+                self._clients = clients
+            for window_id in missing:
+                self._entries[window_id] = entries[window_id]
+            # Forget closed windows
+            for window_id in set(self._entries) - set(clients):
+                del self._entries[window_id]
+        return [(window_id,) + entries[window_id] for window_id in clients]
+
+    def find_window(self, title: str, match_class: bool=False) -> typing.Optional[int]:
+        """
+        Returns the id of the first client window, whose title (or class) contains the given string, ignoring case.
+        The special title ":ACTIVE:" returns the active window.
+
+        @raise WindowManagerUnavailable: If no EWMH window manager is running
+        """
+        if title == ":ACTIVE:":
+            return self.active_window()
+        needle = title.lower()
+        for window_id, window_title, wm_class in self.clients():
+            if needle in (wm_class if match_class else window_title).lower():
+                return window_id
+        return None
+
+    def list_windows(self) -> typing.List[ClientWindow]:
+        """
+        Returns all client windows with their desktop and geometry.
+
+        @raise WindowManagerUnavailable: If no EWMH window manager is running
+        """
+        windows = []
+        for window_id, title, wm_class in self.clients():
+            try:
+                geometry = self.geometry(window_id)
+                desktop = self._read_cardinal(self._window(window_id), "_NET_WM_DESKTOP")
+            except (error.BadWindow, error.BadDrawable):
+                # Closed meanwhile
+                continue
+            windows.append(ClientWindow(window_id, title, wm_class, -1 if desktop in (None, 0xFFFFFFFF) else desktop,
+                                        *geometry))
+        return windows
+
+    # Requests ----
+
+    def active_window(self) -> typing.Optional[int]:
+        return self._read_cardinal(self._root, "_NET_ACTIVE_WINDOW", Xatom.WINDOW) or None
+
+    def current_desktop(self) -> int:
+        self._require()
+        return self._read_cardinal(self._root, "_NET_CURRENT_DESKTOP") or 0
+
+    def geometry(self, window_id: int) -> typing.Tuple[int, int, int, int]:
+        """Returns x, y, width and height of the window, with the position relative to the root window."""
+        window = self._window(window_id)
+        geometry = window.get_geometry()
+        position = self._root.translate_coords(window, 0, 0)
+        return position.x, position.y, geometry.width, geometry.height
+
+    def activate(self, window_id: int, switch_desktop: bool=False):
+        """
+        Activate the window. If switch_desktop is True, switch to the desktop of the window, otherwise move the window
+        to the current desktop first.
+        """
+        window = self._window(window_id)
+        if switch_desktop:
+            desktop = self._read_cardinal(window, "_NET_WM_DESKTOP")
+            if desktop is not None and desktop != 0xFFFFFFFF:
+                self.switch_desktop(desktop)
+        else:
+            self.move_to_desktop(window_id, self.current_desktop())
+        self._send(window, "_NET_ACTIVE_WINDOW", [SOURCE_PAGER, X.CurrentTime, 0])
+
+    def close(self, window_id: int):
+        self._send(self._window(window_id), "_NET_CLOSE_WINDOW", [X.CurrentTime, SOURCE_PAGER])
+
+    def move_resize(self, window_id: int, x: int=-1, y: int=-1, width: int=-1, height: int=-1):
+        """Move and resize the window. Values of -1 are left unchanged."""
+        self._send(self._window(window_id), "_NET_MOVERESIZE_WINDOW", moveresize_data(x, y, width, height))
+
+    def move_to_desktop(self, window_id: int, desktop: int):
+        self._send(self._window(window_id), "_NET_WM_DESKTOP", [desktop, SOURCE_PAGER])
+
+    def switch_desktop(self, desktop: int):
+        self._send(self._root, "_NET_CURRENT_DESKTOP", [desktop, X.CurrentTime])
+
+    def set_state(self, window_id: int, action: str, prop: str):
+        """
+        Change the _NET_WM_STATE of the window.
+
+        @param action: One of add, remove, toggle
+        @param prop: One or two comma separated state names, see STATE_NAMES
+        @raise ValueError: If the action or a state name is unknown
+        """
+        if action not in STATE_ACTIONS:
+            raise ValueError("Unknown action {!r}. Allowed: {}".format(action, ", ".join(STATE_ACTIONS)))
+        states = [self._atom(name) for name in parse_state_names(prop)]
+        states += [0] * (2 - len(states))
+        self._send(self._window(window_id), "_NET_WM_STATE", [STATE_ACTIONS[action]] + states + [SOURCE_PAGER])
+
+    # Helpers ----
+
+    def _require(self):
+        """
+        @raise WindowManagerUnavailable: If no EWMH window manager is running
+        """
+        if self._available:
+            return
+        check = self._read_cardinal(self._root, "_NET_SUPPORTING_WM_CHECK", Xatom.WINDOW)
+        if not check:
+            raise WindowManagerUnavailable("No EWMH compliant window manager found")
+        self._available = True
+
+    def _read_client_list(self) -> typing.List[int]:
+        self._require()
+        prop = self._root.get_full_property(self._atom("_NET_CLIENT_LIST"), Xatom.WINDOW)
+        return [] if prop is None else list(prop.value)
+
+    def _read_entry(self, window_id: int) -> typing.Tuple[str, str]:
+        window = self._window(window_id)
+        try:
+            prop = window.get_full_property(self._atom("_NET_WM_NAME"), self._atom("UTF8_STRING"))
+            if prop is not None:
+                title = prop.value
+            else:
+                title = window.get_wm_name() or ""
+            wm_class = window.get_wm_class()
+        except error.BadWindow:
+            return "", ""
+        if isinstance(title, bytes):
+            title = title.decode("utf-8", "replace")
+        return title, "{}.{}".format(*wm_class) if wm_class else ""
+
+    def _read_cardinal(self, window, name: str, property_type: int=Xatom.CARDINAL) -> typing.Optional[int]:
+        prop = window.get_full_property(self._atom(name), property_type)
+        if prop is None or not len(prop.value):
+            return None
+        return prop.value[0]
+
+    def _send(self, window, message_type: str, data: typing.List[int]):
+        self._require()
+        message = event.ClientMessage(
+            window=window, client_type=self._atom(message_type), data=(32, (data + [0] * 5)[:5]))
+        self._root.send_event(message, event_mask=CLIENT_MESSAGE_MASK)
+        self._display.flush()
+
+    def _window(self, window_id: int):
+        return self._display.create_resource_object("window", window_id)
+
+    def _atom(self, name: str) -> int:
+        atom = self._atoms.get(name)
+        if atom is None:
+            atom = self._atoms[name] = self._display.intern_atom(name)
+        return atom
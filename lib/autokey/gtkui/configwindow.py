@@ -964,13 +964,12 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
 
     def on_save(self, widget, data=None):
         if self.__getCurrentPage().validate():
-            self.app.monitor.suspend()
             persistGlobal = self.__getCurrentPage().save()
+            self.__model_changed(self.selectedObject)
             self.save_completed(persistGlobal)
             self.set_dirty(False)
 
             self.refresh_tree()
-            self.app.monitor.unsuspend()
             return False
 
         return True
@@ -1044,13 +1043,12 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
             self.app.config_altered(False)
 
     def __createFolder(self, title, parentIter, path=None):
-        self.app.monitor.suspend()
         theModel = self.treeView.get_model()
         newFolder = autokey.model.folder.Folder(title, path=path)
 
         newIter = theModel.append_item(newFolder, parentIter)
         newFolder.persist()
-        self.app.monitor.unsuspend()
+        self.app.configManager.folder_added(newFolder)
 
         self.treeView.expand_to_path(theModel.get_path(newIter))
         self.treeView.get_selection().unselect_all()
@@ -1077,13 +1075,12 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
     def on_new_phrase(self, widget, data=None):
         name = self.__getNewItemName("Phrase")
         if name is not None:
-            self.app.monitor.suspend()
             theModel, selectedPaths = self.treeView.get_selection().get_selected_rows()
             parentIter = self.__getRealParent(theModel[selectedPaths[0]].iter)
             newPhrase = autokey.model.phrase.Phrase(name, "Enter phrase contents")
             newIter = theModel.append_item(newPhrase, parentIter)
             newPhrase.persist()
-            self.app.monitor.unsuspend()
+            self.app.configManager.item_added(newPhrase)
             self.treeView.expand_to_path(theModel.get_path(newIter))
             self.treeView.get_selection().unselect_all()
             self.treeView.get_selection().select_iter(newIter)
@@ -1093,13 +1090,12 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
     def on_new_script(self, widget, data=None):
         name = self.__getNewItemName("Script")
         if name is not None:
-            self.app.monitor.suspend()
             theModel, selectedPaths = self.treeView.get_selection().get_selected_rows()
             parentIter = self.__getRealParent(theModel[selectedPaths[0]].iter)
             newScript = autokey.model.script.Script(name, "# Enter script code")
             newIter = theModel.append_item(newScript, parentIter)
             newScript.persist()
-            self.app.monitor.unsuspend()
+            self.app.configManager.item_added(newScript)
             self.treeView.expand_to_path(theModel.get_path(newIter))
             self.treeView.get_selection().unselect_all()
             self.treeView.get_selection().select_iter(newIter)
@@ -1141,7 +1137,6 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
     def on_paste_item(self, widget, data=None):
         theModel, selectedPaths = self.treeView.get_selection().get_selected_rows()
         parentIter = self.__getRealParent(theModel[selectedPaths[0]].iter)
-        self.app.monitor.suspend()
 
         newIters = []
         for item in self.cutCopiedItems:
@@ -1151,8 +1146,7 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
             newIters.append(newIter)
             item.path = None
             item.persist()
-
-        self.app.monitor.unsuspend()
+            self.__model_added(item)
 
         self.treeView.expand_to_path(theModel.get_path(newIters[-1]))
         self.treeView.get_selection().unselect_all()
@@ -1168,7 +1162,6 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
         theModel, selectedPaths = self.treeView.get_selection().get_selected_rows()
         sourceIter = theModel[selectedPaths[0]].iter
         parentIter = theModel.iter_parent(sourceIter)
-        self.app.monitor.suspend()
 
         if isinstance(source, autokey.model.phrase.Phrase):
             newObj = autokey.model.phrase.Phrase('', '')
@@ -1177,8 +1170,8 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
         newObj.copy(source)
         newObj.persist()
 
-        self.app.monitor.unsuspend()
         newIter = theModel.append_item(newObj, parentIter)
+        self.app.configManager.item_added(newObj)
         self.app.config_altered(False)
 
     def on_delete_item(self, widget, data=None):
@@ -1203,14 +1196,12 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
         dlg = Gtk.MessageDialog(self.ui, Gtk.DialogFlags.MODAL, Gtk.MessageType.QUESTION, Gtk.ButtonsType.YES_NO, msg)
         dlg.set_title(_("Delete"))
         if dlg.run() == Gtk.ResponseType.YES:
-            self.app.monitor.suspend()
             for ref in refs:
                 if ref.valid():
                     item = theModel[ref.get_path()].iter
                     modelItem = theModel.get_value(item, AkTreeModel.OBJECT_COLUMN)
                     self.__removeItem(theModel, item)
                     modified = True
-            self.app.monitor.unsuspend()
 
         dlg.destroy()
 
@@ -1233,6 +1224,7 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
         self.__deleteHotkeys(data)
 
         model.remove_item(item)
+        self.__model_removed(data)
 
         if nextIter is not None:
             self.treeView.get_selection().select_iter(nextIter)
@@ -1256,6 +1248,24 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
                 if autokey.model.helpers.TriggerMode.HOTKEY in item.modes:
                     self.app.hotkey_removed(item)
 
+    def __model_added(self, model_item):
+        if isinstance(model_item, autokey.model.folder.Folder):
+            self.app.configManager.folder_added(model_item)
+        else:
+            self.app.configManager.item_added(model_item)
+
+    def __model_removed(self, model_item):
+        if isinstance(model_item, autokey.model.folder.Folder):
+            self.app.configManager.folder_removed(model_item)
+        else:
+            self.app.configManager.item_removed(model_item)
+
+    def __model_changed(self, model_item):
+        if isinstance(model_item, autokey.model.folder.Folder):
+            self.app.configManager.folder_changed(model_item)
+        else:
+            self.app.configManager.item_changed(model_item)
+
     def on_undo(self, widget, data=None):
         self.__getCurrentPage().undo()
 
@@ -1347,14 +1357,15 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
                              None, self.ui):
                 self.__getCurrentPage().set_item_title(newText)
 
-                self.app.monitor.suspend()
-
                 if dlg.get_update_fs():
                     self.__getCurrentPage().rebuild_item_path()
 
                 persistGlobal = self.__getCurrentPage().save()
                 self.refresh_tree()
-                self.app.monitor.unsuspend()
+                if isinstance(self.selectedObject, autokey.model.folder.Folder):
+                    self.app.configManager.folder_moved(self.selectedObject)
+                else:
+                    self.app.configManager.item_changed(self.selectedObject)
                 self.app.config_altered(persistGlobal)
 
         dlg.destroy()
@@ -1436,7 +1447,6 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
             targetIter = None
 
         #targetModelItem = theModel.get_value(targetIter, AkTreeModel.OBJECT_COLUMN)
-        self.app.monitor.suspend()
 
         for path in self.__sourceRows:
             self.__removeItem(theModel, theModel[path].iter)
@@ -1450,9 +1460,9 @@ close and reopen the AutoKey window.\nThis message is only shown once per sessio
             else:
                 item.path = None
                 item.persist()
+            self.__model_added(item)
             newIters.append(newIter)
 
-        self.app.monitor.unsuspend()
         self.treeView.expand_to_path(theModel.get_path(newIters[-1]))
         selection.unselect_all()
         for iterator in newIters:
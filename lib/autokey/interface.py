@@ -21,16 +21,22 @@ from abc import abstractmethod
 import logging
 import typing
 import threading
+import collections
+import concurrent.futures
+import math
 import select
 import queue
 import subprocess
 import time
+import os
+import struct
 
 import autokey.model.phrase
 
 if typing.TYPE_CHECKING:
     from autokey.iomediator.iomediator import IoMediator
 import autokey.configmanager.configmanager_constants as cm_constants
+from autokey import stats
 
 
 # Imported to enable threading in Xlib. See module description. Not an unused import statement.
@@ -46,6 +52,9 @@ from Xlib.error import ConnectionClosedError
 
 from . import common
 from autokey.model.button import Button
+from autokey.iomediator.grabregistry import GrabRegistry, GrabSet
+from autokey.ewmh import WindowManager
+from autokey.xselection import XSelectionOwner, SelectionUnavailable
 
 if common.USING_QT:
     from PyQt5.QtGui import QClipboard
@@ -66,7 +75,7 @@ else:
     except SyntaxError:  # pyatspi 2.26 fails when used with Python 3.7
         HAS_ATSPI = False
 
-from Xlib import X, XK, display, error
+from Xlib import X, XK, Xatom, display, error
 try:
     from Xlib.ext import record, xtest
     HAS_RECORD = True
@@ -91,6 +100,32 @@ MASK_INDEXES = [
 CAPSLOCK_LEDMASK = 1<<0
 NUMLOCK_LEDMASK = 1<<1
 
+# Windows are usually created in bursts (toplevel, frame, toolkit helper windows, menus). After the first
+# CreateNotify/MapNotify arrives, keep collecting events for this long, so that a single grab pass handles the burst.
+WINDOW_BURST_COALESCE_TIME = 0.02
+
+# When pasting through a selection owned by AutoKey, the previous content is restored as soon as the target application
+# fetched the pasted text. If it does not fetch it within this time, restore anyway. Pasting using the middle mouse
+# button is much slower.
+CLIPBOARD_RESTORE_TIMEOUT = 1.0
+SELECTION_RESTORE_TIMEOUT = 2.0
+
+# Keys typed by the user while a send holds the keyboard grab are buffered and replayed after the send. Key presses
+# beyond this limit are dropped.
+TYPE_AHEAD_LIMIT = 512
+
+# Key events typed using XTEST are recorded by XRecord like physical ones. They are expected for this many seconds, and
+# recognised as AutoKey's own events while they are.
+INJECTED_KEY_LIFETIME = 5.0
+
+# Time between the motion events of a mouse path, in seconds
+MOUSE_PATH_INTERVAL = 0.01
+
+# Events selected on windows whose title and class are cached
+WINDOW_INFO_EVENT_MASK = X.PropertyChangeMask | X.StructureNotifyMask
+# Estimated X round-trips per window visited while reading a WindowInfo: title, class and the parent query
+WINDOW_INFO_ROUND_TRIPS_PER_WINDOW = 3
+
 
 def str_or_bytes_to_bytes(x: typing.Union[str, bytes, memoryview]) -> bytes:
     if type(x) == bytes:
@@ -105,10 +140,269 @@ def str_or_bytes_to_bytes(x: typing.Union[str, bytes, memoryview]) -> bytes:
     raise RuntimeError("x must be str or bytes or memoryview object, type(x)={}, repr(x)={}".format(type(x), repr(x)))
 
 
+# Core X events are always 32 bytes long. KeyPress, KeyRelease and ButtonPress share this layout: type, detail,
+# sequence number, time, root, event and child window (skipped), root x, root y, followed by fields not used here.
+# XRecord delivers events in the byte order of the recording client, which is the native one.
+CORE_EVENT_SIZE = 32
+CORE_INPUT_EVENT = struct.Struct("=BB18xhh")
+CORE_INPUT_EVENT_TYPES = frozenset((X.KeyPress, X.KeyRelease, X.ButtonPress))
+
+
+def decode_record_events(data: typing.Union[str, bytes, memoryview], display
+                         ) -> typing.Iterator[typing.Tuple[int, int, int, int]]:
+    """
+    Decode the device events contained in the data of an XRecord reply.
+
+    KeyPress, KeyRelease and ButtonPress events are read directly from the buffer, without building python-xlib
+    event objects or copying the data. Other events are parsed by python-xlib.
+
+    @param data: The data of the XRecord reply, containing one or more events
+    @param display: The python-xlib display (the protocol level one) used to parse other events
+    @return: Iterator over (event type, detail, root x, root y) tuples. For events without these fields, 0 is used.
+    """
+    if isinstance(data, str):
+        data = str_or_bytes_to_bytes(data)
+    view = memoryview(data)
+    for offset in range(0, len(view) - CORE_EVENT_SIZE + 1, CORE_EVENT_SIZE):
+        event_type = view[offset] & 0x7f  # The high bit marks events sent using SendEvent
+        if event_type in CORE_INPUT_EVENT_TYPES:
+            code, detail, root_x, root_y = CORE_INPUT_EVENT.unpack_from(view, offset)
+            yield event_type, detail, root_x, root_y
+        else:
+            event_object, _ = rq.EventField(None).parse_binary_value(
+                view[offset:offset + CORE_EVENT_SIZE].tobytes(), display, None, None)
+            yield (event_object.type, getattr(event_object, "detail", 0),
+                   getattr(event_object, "root_x", 0), getattr(event_object, "root_y", 0))
+
+
+def interpolate_path(points: typing.Sequence[typing.Tuple[float, float]], duration: float,
+                     interval: float=MOUSE_PATH_INTERVAL) -> typing.List[typing.Tuple[float, int, int]]:
+    """
+    Plan the pointer motion along a path of line segments, at constant speed.
+
+    Every point of the path is visited, so that corners of a drawn shape are kept. Between them, a position is added
+    every interval seconds. Consecutive positions that round to the same pixel are merged.
+
+    @param points: The (x, y) points of the path. The pointer is moved to the first one at time 0.
+    @param duration: Time in seconds to travel the path. If 0, only the points themselves are visited.
+    @param interval: Time in seconds between interpolated positions
+    @return: List of (time offset in seconds, x, y) tuples, ordered by time
+    """
+    points = [(float(x), float(y)) for x, y in points]
+    if not points:
+        return []
+    lengths = [math.hypot(x1 - x0, y1 - y0) for (x0, y0), (x1, y1) in zip(points, points[1:])]
+    total = sum(lengths)
+    if duration > 0 and total > 0:
+        steps = max(1, int(math.ceil(duration / interval)))
+        samples = iter([total * step / steps for step in range(1, steps)])
+    else:
+        samples = iter([])
+    sample = next(samples, None)
+    # (distance travelled, x, y)
+    positions = [(0.0, points[0][0], points[0][1])]
+    travelled = 0.0
+    for (x0, y0), (x1, y1), length in zip(points, points[1:], lengths):
+        while sample is not None and sample < travelled + length:
+            fraction = (sample - travelled) / length
+            positions.append((sample, x0 + (x1 - x0) * fraction, y0 + (y1 - y0) * fraction))
+            sample = next(samples, None)
+        travelled += length
+        positions.append((travelled, x1, y1))
+
+    path = []
+    for distance, x, y in positions:
+        x, y = int(round(x)), int(round(y))
+        if path and path[-1][1:] == (x, y):
+            continue
+        path.append((duration * distance / total if duration > 0 and total > 0 else 0.0, x, y))
+    return path
+
+
 # This tuple is used to return requested window properties.
 WindowInfo = typing.NamedTuple("WindowInfo", [("wm_title", str), ("wm_class", str)])
 
 
+class _Lazy:
+    """
+    A value that is computed on first use, at most once. Used to defer X round-trips until the result is needed.
+    """
+
+    _UNSET = object()
+
+    def __init__(self, compute: typing.Callable[[], typing.Any]):
+        self._compute = compute
+        self._lock = threading.Lock()
+        self._value = _Lazy._UNSET
+
+    def get(self):
+        value = self._value
+        if value is _Lazy._UNSET:
+            with self._lock:
+                if self._value is _Lazy._UNSET:
+                    self._value = self._compute()
+                    self._compute = None
+                value = self._value
+        return value
+
+
+class LazyWindowInfo:
+    """
+    Stands in for a WindowInfo. The window information is only read from the X server, when it is accessed.
+    Supports the same read access as the WindowInfo named tuple.
+    """
+
+    __slots__ = ("_lazy",)
+
+    def __init__(self, compute: typing.Callable[[], WindowInfo]):
+        self._lazy = _Lazy(compute)
+
+    def resolve(self) -> WindowInfo:
+        return self._lazy.get()
+
+    @property
+    def wm_title(self) -> str:
+        return self.resolve().wm_title
+
+    @property
+    def wm_class(self) -> str:
+        return self.resolve().wm_class
+
+    def __getitem__(self, item):
+        return self.resolve()[item]
+
+    def __iter__(self):
+        return iter(self.resolve())
+
+    def __len__(self):
+        return len(WindowInfo._fields)
+
+    def __eq__(self, other):
+        return self.resolve() == other
+
+    def __hash__(self):
+        return hash(self.resolve())
+
+    def __repr__(self):
+        return repr(self.resolve())
+
+
+class LazyCoordinate:
+    """
+    Stands in for an integer coordinate, that is only computed when it is used.
+
+    @param point: Lazily computed tuple of coordinates, shared by all coordinates computed by the same request
+    @param index: Index of this coordinate in the point tuple
+    """
+
+    __slots__ = ("_point", "_index")
+
+    def __init__(self, point: _Lazy, index: int):
+        self._point = point
+        self._index = index
+
+    def __int__(self):
+        return self._point.get()[self._index]
+
+    __index__ = __int__
+
+    def __float__(self):
+        return float(int(self))
+
+    def __eq__(self, other):
+        return int(self) == other
+
+    def __hash__(self):
+        return hash(int(self))
+
+    # Ordering, like the integer returned before
+    def __lt__(self, other):
+        return int(self) < other
+
+    def __le__(self, other):
+        return int(self) <= other
+
+    def __gt__(self, other):
+        return int(self) > other
+
+    def __ge__(self, other):
+        return int(self) >= other
+
+    def __add__(self, other):
+        return int(self) + other
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return int(self) - other
+
+    def __rsub__(self, other):
+        return other - int(self)
+
+    def __mul__(self, other):
+        return int(self) * other
+
+    __rmul__ = __mul__
+
+    def __floordiv__(self, other):
+        return int(self) // other
+
+    def __truediv__(self, other):
+        return int(self) / other
+
+    def __neg__(self):
+        return -int(self)
+
+    def __abs__(self):
+        return abs(int(self))
+
+    def __format__(self, format_spec):
+        return format(int(self), format_spec)
+
+    def __repr__(self):
+        return repr(int(self))
+
+
+class InjectedKeys:
+    """
+    The key events typed by AutoKey using XTEST, which XRecord did not report yet. XRecord reports them like keys typed
+    by the user, possibly after the send finished. Recognising them keeps AutoKey's own output out of abbreviation
+    matching and the modifier state. Thread-safe.
+
+    @param lifetime: Seconds after which an expected event is forgotten, if it was not reported
+    """
+
+    def __init__(self, lifetime: float=INJECTED_KEY_LIFETIME, clock: typing.Callable[[], float]=time.monotonic):
+        self.lifetime = lifetime
+        self.clock = clock
+        self._lock = threading.Lock()
+        # (time injected, event type, key code), oldest first
+        self._events = collections.deque()  # type: typing.Deque[typing.Tuple[float, int, int]]
+
+    def injected(self, event_type: int, key_code: int):
+        """Called before the key event is injected."""
+        with self._lock:
+            self._events.append((self.clock(), event_type, key_code))
+
+    def is_injected(self, event_type: int, key_code: int) -> bool:
+        """
+        Returns True, if the recorded key event is one injected by AutoKey. The expected event is consumed. Events are
+        reported in the order they were injected, but keys typed by the user can be recorded in between.
+        """
+        with self._lock:
+            expired = self.clock() - self.lifetime
+            while self._events and self._events[0][0] <= expired:
+                self._events.popleft()
+            for index, (injected, expected_type, expected_code) in enumerate(self._events):
+                if expected_type == event_type and expected_code == key_code:
+                    del self._events[index]
+                    return True
+        return False
+
+    def __len__(self):
+        return len(self._events)
+
+
 class AbstractClipboard:
     """
     Abstract interface for clipboard interactions.
@@ -209,9 +503,23 @@ class XInterfaceBase(threading.Thread):
         self.eventThread = threading.Thread(target=self.__eventLoop)
         self.queue = queue.Queue()
         
-        # Event listener
+        # Event listener. It uses a dedicated X connection, so that it can block on the socket without racing against
+        # the event thread, which reads replies (and possibly queues events) on localDisplay. The pipe is used to wake
+        # the listener up for shutdown.
         self.listenerThread = threading.Thread(target=self.__flushEvents)
+        self.__eventDisplay = display.Display()
+        self.__eventDisplay.screen().root.change_attributes(
+            event_mask=X.SubstructureNotifyMask | X.PropertyChangeMask)
+        self.__eventDisplay.flush()
+        self.__wakeupRead, self.__wakeupWrite = os.pipe()
         self.clipboard = Clipboard()
+        self.selectionOwner = XSelectionOwner(on_delivered=self.__pasteDelivered)
+        self.__keyboardGrabbed = False
+        self.injectedKeys = InjectedKeys()
+        # Type-ahead buffer of (keycode, state) key presses, while a send is running. Guarded by __typeAheadLock.
+        self.__typeAheadLock = threading.Lock()
+        self.__typeAhead = None  # type: typing.Optional[typing.List[typing.Tuple[int, int]]]
+        self.__sendDepth = 0
 
         self.__initMappings()
 
@@ -223,6 +531,27 @@ class XInterfaceBase(threading.Thread):
         # Window name atoms
         self.__NameAtom = self.localDisplay.intern_atom("_NET_WM_NAME", True)
         self.__VisibleNameAtom = self.localDisplay.intern_atom("_NET_WM_VISIBLE_NAME", True)
+        self.__ActiveWindowAtom = self.localDisplay.intern_atom("_NET_ACTIVE_WINDOW", True)
+        self.__ClientListAtom = self.localDisplay.intern_atom("_NET_CLIENT_LIST", True)
+        # WM_NAME is not used for WindowInfo, but by the client index of the window manager.
+        self.__windowInfoAtoms = {self.__NameAtom, self.__VisibleNameAtom, Xatom.WM_CLASS, Xatom.WM_NAME} - {X.NONE}
+
+        # WindowInfo cache, keyed by window id. Entries are dropped when the listener sees a change of the title or
+        # class of any window the info was read from. The active window is tracked using _NET_ACTIVE_WINDOW.
+        # Every invalidation bumps the generation, so that a lookup racing with an invalidation does not store stale
+        # data.
+        self.__windowInfoLock = threading.Lock()
+        self.__windowInfoCache = {}  # type: typing.Dict[int, typing.Tuple[WindowInfo, int]]
+        self.__windowInfoSources = {}  # type: typing.Dict[int, typing.Set[int]]
+        self.__watchedWindows = set()  # type: typing.Set[int]
+        self.__windowInfoGeneration = 0
+        self.__activeWindowId = None  # type: typing.Optional[int]
+        # Notified by the listener after each batch of window events, to wake up threads in wait_for_window().
+        # __windowChangeCount counts the batches, __watchCount the calls of __watchWindows that watched new windows.
+        self.__windowChanged = threading.Condition(self.__windowInfoLock)
+        self.__windowChangeCount = 0
+        self.__watchCount = 0
+        self.windowManager = WindowManager(self.localDisplay, self.__watchWindows)
         
         #move detection of key map changes to X event thread in order to have QT and GTK detection
         # if not common.USING_QT:
@@ -236,41 +565,96 @@ class XInterfaceBase(threading.Thread):
         
     def __eventLoop(self):
         while True:
-            method, args = self.queue.get()
+            method, args, future = self.queue.get()
             
             if method is None and args is None:
                 break
             elif method is not None and args is None:
                 logger.debug("__eventLoop: Got method {} with None arguments!".format(method))
+            if not future.set_running_or_notify_cancel():
+                # Cancelled by the caller, before it ran.
+                self.queue.task_done()
+                continue
             try:
-                method(*args)
+                result = method(*args)
+                # Resolve the future only once the requests made by the operation reached the server.
+                self.localDisplay.flush()
             except Exception as e:
                 logger.exception("Error in X event loop thread")
+                future.set_exception(e)
+            else:
+                future.set_result(result)
 
             self.queue.task_done()
 
-    def __enqueue(self, method: typing.Callable, *args):
-        self.queue.put_nowait((method, args))
+    def __enqueue(self, method: typing.Callable, *args) -> concurrent.futures.Future:
+        """
+        Run method in the event thread, after all operations queued before.
+
+        @return: Future resolving to the return value of method, once it ran and its requests were flushed to the X
+        server. Callers not interested in the completion can ignore it.
+        """
+        future = concurrent.futures.Future()
+        self.queue.put_nowait((method, args, future))
+        return future
+
+    def barrier(self) -> concurrent.futures.Future:
+        """
+        Synchronisation point with the event thread. The returned future resolves once all operations queued before
+        this call were run and flushed to the X server, for example before reading the mouse position after moving it.
+        """
+        return self.__enqueue(self.__flush)
 
     def on_keys_changed(self, data=None):
         if not self.__ignoreRemap:
             logger.debug("Recorded keymap change event")
             self.__ignoreRemap = True
             time.sleep(0.2)
-            self.__enqueue(self.__ungrabAllHotkeys)
-            self.__enqueue(self.__delayedInitMappings)
+            self.__enqueue(self.__refreshMappings)
         else:
             logger.debug("Ignored keymap change event")
 
-    def __delayedInitMappings(self):        
-        self.__initMappings()
+    def __refreshMappings(self):
+        """
+        Reload the keyboard and modifier mapping after a keymap change and move the hotkey grabs to the new keycodes.
+
+        The keymap cache of the existing connection is refreshed in place, so the grabs made on it stay valid and only
+        the grabs that actually change are touched.
+        """
+        info = self.localDisplay.display.info
+        mapping_event = event.MappingNotify(
+            request=X.MappingKeyboard,
+            first_keycode=info.min_keycode,
+            count=info.max_keycode - info.min_keycode + 1
+        )
+        self.localDisplay.refresh_keyboard_mapping(mapping_event)
+        self.__loadKeymapState()
+        self.__reconcileAllHotkeys()
         self.__ignoreRemap = False
 
     def __initMappings(self):
         self.localDisplay = display.Display()
         self.rootWindow = self.localDisplay.screen().root
-        self.rootWindow.change_attributes(event_mask=X.SubstructureNotifyMask|X.StructureNotifyMask)
-        
+
+        # Hotkey grab state. Only accessed from the event thread.
+        self.__grabRegistry = GrabRegistry()
+        self.__windowParents = {}  # type: typing.Dict[int, int]
+        self.__windowChildren = {}  # type: typing.Dict[int, typing.Set[int]]
+        self.__windowInfos = {}  # type: typing.Dict[int, WindowInfo]
+        self.__mutterSession = None  # type: typing.Optional[bool]
+        self.__ignoreBadWindow = error.CatchError(error.BadWindow)
+
+        self.__loadKeymapState()
+        self.__enqueue(self.__scanWindowTree)
+        self.__enqueue(self.__reconcileAllHotkeys)
+
+        if logger.getEffectiveLevel() == logging.DEBUG:
+            self.keymap_test()
+
+    def __loadKeymapState(self):
+        """
+        Read the modifier masks, the usable keysym offsets and the unused keycodes from the current keyboard mapping.
+        """
         altList = self.localDisplay.keysym_to_keycodes(XK.XK_ISO_Level3_Shift)
         self.__usableOffsets = (0, 1)
         for code, offset in altList:
@@ -299,9 +683,6 @@ class XInterfaceBase(threading.Thread):
 
         logger.debug("Modifier masks: %r", self.modMasks)
 
-        self.__grabHotkeys()
-        self.localDisplay.flush()
-
         # --- get list of keycodes that are unused in the current keyboard mapping
 
         keyCode = 8
@@ -321,9 +702,6 @@ class XInterfaceBase(threading.Thread):
         self.__availableKeycodes = avail
         self.remappedChars = {}
 
-        if logger.getEffectiveLevel() == logging.DEBUG:
-            self.keymap_test()
-
     def keymap_test(self):
         code = self.localDisplay.keycode_to_keysym(108, 0)
         for attr in XK.__dict__.items():
@@ -340,240 +718,267 @@ class XInterfaceBase(threading.Thread):
     def __needsMutterWorkaround(self, item):
         if Key.SUPER not in item.modifiers:
             return False
-    
-        try:
-            output = subprocess.check_output(["ps", "-eo", "command"]).decode()
-        except subprocess.CalledProcessError:
-            pass # since this is just a nasty workaround, if anything goes wrong just disable it 
-        else:
-            lines = output.splitlines()
-            
-            for line in lines:
-                if "gnome-shell" in line or "cinnamon" in line or "unity" in line:
-                    return True
-                
-        return False
 
-    def __grabHotkeys(self):
-        """
-        Run during startup to grab global and specific hotkeys in all open windows
-        """
-        c = self.app.configManager
-        hotkeys = c.hotKeys + c.hotKeyFolders
-
-        # Grab global hotkeys in root window
-        for item in c.globalHotkeys:
-            if item.enabled:
-                self.__enqueue(self.__grabHotkey, item.hotKey, item.modifiers, self.rootWindow)
-                if self.__needsMutterWorkaround(item):
-                    self.__enqueue(self.__grabRecurse, item, self.rootWindow, False)
-
-        # Grab hotkeys without a filter in root window
-        for item in hotkeys:
-            if item.get_applicable_regex() is None:
-                self.__enqueue(self.__grabHotkey, item.hotKey, item.modifiers, self.rootWindow)
-                if self.__needsMutterWorkaround(item):
-                    self.__enqueue(self.__grabRecurse, item, self.rootWindow, False)
-
-        self.__enqueue(self.__recurseTree, self.rootWindow, hotkeys)
-
-    def __recurseTree(self, parent, hotkeys):
-        # Grab matching hotkeys in all open child windows
-        try:
-            children = parent.query_tree().children
-        except:
-            return # window has been destroyed
-            
-        for window in children:
+        if self.__mutterSession is None:
+            # The running desktop does not change during the session, so only look at the process list once.
+            self.__mutterSession = False
             try:
-                window_info = self.get_window_info(window, False)
-                
-                if window_info.wm_title or window_info.wm_class:
-                    for item in hotkeys:
-                        if item.get_applicable_regex() is not None and item._should_trigger_window_title(window_info):
-                            self.__grabHotkey(item.hotKey, item.modifiers, window)
-                            self.__grabRecurse(item, window, False)
-                        
-                self.__enqueue(self.__recurseTree, window, hotkeys)
-            except:
-                logger.exception("grab on window failed")
-                
-    def __ungrabAllHotkeys(self):
+                output = subprocess.check_output(["ps", "-eo", "command"]).decode()
+            except (subprocess.CalledProcessError, OSError):
+                pass # since this is just a nasty workaround, if anything goes wrong just disable it
+            else:
+                lines = output.splitlines()
+
+                for line in lines:
+                    if "gnome-shell" in line or "cinnamon" in line or "unity" in line:
+                        self.__mutterSession = True
+                        break
+
+        return self.__mutterSession
+
+    def __hotkeyItems(self) -> list:
         """
-        Ungrab all hotkeys in preparation for keymap change
+        All items that currently need their hotkey grabbed, according to the configuration.
         """
         c = self.app.configManager
-        hotkeys = c.hotKeys + c.hotKeyFolders
-
-        # Ungrab global hotkeys in root window, recursively
-        for item in c.globalHotkeys:
-            if item.enabled:
-                self.__ungrabHotkey(item.hotKey, item.modifiers, self.rootWindow)
-                if self.__needsMutterWorkaround(item):
-                    self.__ungrabRecurse(item, self.rootWindow, False)
-        
-        # Ungrab hotkeys without a filter in root window, recursively
-        for item in hotkeys:
-            if item.get_applicable_regex() is None:
-                self.__ungrabHotkey(item.hotKey, item.modifiers, self.rootWindow)
-                if self.__needsMutterWorkaround(item):
-                    self.__ungrabRecurse(item, self.rootWindow, False)
-                
-        self.__recurseTreeUngrab(self.rootWindow, hotkeys)
-                
-    def __recurseTreeUngrab(self, parent, hotkeys):
-        # Ungrab matching hotkeys in all open child windows
-        try:
-            children = parent.query_tree().children
-        except:
-            return # window has been destroyed
-            
-        for window in children:
-            try:
-                window_info = self.get_window_info(window, False)
-                
-                if window_info.wm_title or window_info.wm_class:
-                    for item in hotkeys:
-                        if item.get_applicable_regex() is not None and item._should_trigger_window_title(window_info):
-                            self.__ungrabHotkey(item.hotKey, item.modifiers, window)
-                            self.__ungrabRecurse(item, window, False)
-                        
-                self.__enqueue(self.__recurseTreeUngrab, window, hotkeys)
-            except:
-                logger.exception("ungrab on window failed")
+        return [item for item in c.globalHotkeys if item.enabled] + c.hotKeys + c.hotKeyFolders
 
-    def __grabHotkeysForWindow(self, window):
-        """
-        Grab all hotkeys relevant to the window
+    # --- Window tree cache, used to compute hotkey grabs without walking the tree on the X server
+
+    def __windowResource(self, window_id: int):
+        return self.localDisplay.create_resource_object("window", window_id)
 
-        Used when a new window is created
+    def __scanWindowTree(self):
         """
-        c = self.app.configManager
-        hotkeys = c.hotKeys + c.hotKeyFolders
-        window_info = self.get_window_info(window)
-        for item in hotkeys:
-            if item.get_applicable_regex() is not None and item._should_trigger_window_title(window_info):
-                self.__enqueue(self.__grabHotkey, item.hotKey, item.modifiers, window)
-            elif self.__needsMutterWorkaround(item):
-                self.__enqueue(self.__grabHotkey, item.hotKey, item.modifiers, window)
+        Run during startup to read the complete window tree from the X server.
+        """
+        self.__windowParents.clear()
+        self.__windowChildren.clear()
+        self.__windowInfos.clear()
+        self.__scanSubtree(self.rootWindow.id)
 
-    def __grabHotkey(self, key, modifiers, window):
+    def __scanSubtree(self, window_id: int) -> typing.Set[int]:
         """
-        Grab a specific hotkey in the given window
+        Query the window tree below the given window and store it in the window tree cache, replacing the cached
+        subtree.
+
+        @return: The ids of all windows in the subtree, including the given window
         """
-        logger.debug("Grabbing hotkey: %r %r", modifiers, key)
+        found = {window_id}
+        pending = [window_id]
+        while pending:
+            parent_id = pending.pop()
+            try:
+                children = [child.id for child in self.__windowResource(parent_id).query_tree().children]
+            except error.BadWindow:
+                continue  # Destroyed in the meantime
+            for stale_id in self.__windowChildren.get(parent_id, set()).difference(children):
+                self.__forgetSubtree(stale_id)
+            for child_id in children:
+                self.__linkWindow(child_id, parent_id)
+                self.__windowInfos[child_id] = self.__readOwnWindowInfo(child_id)
+            found.update(children)
+            pending.extend(children)
+        return found
+
+    def __readOwnWindowInfo(self, window_id: int) -> WindowInfo:
         try:
-            keycode = self.__lookupKeyCode(key)
-            mask = 0
-            for mod in modifiers:
-                mask |= self.modMasks[mod]
-
-            window.grab_key(keycode, mask, True, X.GrabModeAsync, X.GrabModeAsync)
+            return self._get_window_info(self.__windowResource(window_id), False)
+        except error.BadWindow:
+            return WindowInfo(wm_title="", wm_class="")
 
-            if Key.NUMLOCK in self.modMasks:
-                window.grab_key(keycode, mask|self.modMasks[Key.NUMLOCK], True, X.GrabModeAsync, X.GrabModeAsync)
+    def __linkWindow(self, window_id: int, parent_id: int):
+        old_parent_id = self.__windowParents.get(window_id)
+        if old_parent_id is not None and old_parent_id != parent_id:
+            self.__windowChildren.get(old_parent_id, set()).discard(window_id)
+        self.__windowParents[window_id] = parent_id
+        self.__windowChildren.setdefault(parent_id, set()).add(window_id)
 
-            if Key.CAPSLOCK in self.modMasks:
-                window.grab_key(keycode, mask|self.modMasks[Key.CAPSLOCK], True, X.GrabModeAsync, X.GrabModeAsync)
+    def __forgetSubtree(self, window_id: int) -> typing.Set[int]:
+        """
+        Remove the window and all its descendants from the window tree cache.
 
-            if Key.CAPSLOCK in self.modMasks and Key.NUMLOCK in self.modMasks:
-                window.grab_key(keycode, mask|self.modMasks[Key.CAPSLOCK]|self.modMasks[Key.NUMLOCK], True, X.GrabModeAsync, X.GrabModeAsync)
+        @return: The ids of all removed windows
+        """
+        parent_id = self.__windowParents.pop(window_id, None)
+        if parent_id is not None:
+            self.__windowChildren.get(parent_id, set()).discard(window_id)
+        removed = set()
+        pending = [window_id]
+        while pending:
+            current = pending.pop()
+            removed.add(current)
+            self.__windowInfos.pop(current, None)
+            children = self.__windowChildren.pop(current, ())
+            for child_id in children:
+                self.__windowParents.pop(child_id, None)
+            pending.extend(children)
+        self.__grabRegistry.forget_windows(removed)
+        return removed
+
+    def __subtree(self, window_id: int) -> typing.Set[int]:
+        found = set()
+        pending = [window_id]
+        while pending:
+            current = pending.pop()
+            found.add(current)
+            pending.extend(self.__windowChildren.get(current, ()))
+        return found
+
+    def __applyWindowEvents(self, window_events: list):
+        """
+        Update the window tree cache from a burst of window events and grab or ungrab hotkeys in the affected windows.
 
-        except Exception as e:
-            logger.warning("Failed to grab hotkey %r %r: %s", modifiers, key, str(e))
+        @param window_events: List of (event type, window id, parent window id) tuples, in the order received
+        """
+        changed = set()
+        for event_type, window_id, parent_id in window_events:
+            if event_type == X.DestroyNotify:
+                changed -= self.__forgetSubtree(window_id)
+            elif event_type == X.CreateNotify:
+                self.__linkWindow(window_id, parent_id)
+                changed.add(window_id)
+            elif event_type == X.ReparentNotify:
+                if parent_id == self.rootWindow.id or parent_id in self.__windowParents:
+                    self.__linkWindow(window_id, parent_id)
+                    changed.add(window_id)
+                else:
+                    # Moved below a window this client does not know, so it can no longer be tracked
+                    changed -= self.__forgetSubtree(window_id)
+            elif event_type == X.MapNotify:
+                if window_id not in self.__windowParents:
+                    self.__linkWindow(window_id, parent_id)
+                changed.add(window_id)
+
+        # Most toolkits set WM_CLASS and the title between creating and mapping a window, and reparenting window
+        # managers create a frame and move the client window into it. So re-read the affected subtrees.
+        affected = set()
+        for window_id in changed:
+            if window_id not in affected and window_id in self.__windowParents:
+                affected.update(self.__scanSubtree(window_id))
+                self.__windowInfos[window_id] = self.__readOwnWindowInfo(window_id)
+        if affected:
+            self.__reconcileAllHotkeys(affected)
+
+    # --- Hotkey grabs
+
+    def __windowMatches(self, item, window_id: int) -> bool:
+        """
+        A filtered hotkey is grabbed in every window that matches the filter, and in all descendants of those.
+        """
+        while window_id in self.__windowParents:
+            window_info = self.__windowInfos.get(window_id)
+            if window_info is not None and (window_info.wm_title or window_info.wm_class) \
+                    and item._should_trigger_window_title(window_info):
+                return True
+            window_id = self.__windowParents[window_id]
+        return False
 
-    def grab_hotkey(self, item):
+    def __grabMasks(self, modifiers) -> typing.List[int]:
         """
-        Grab a hotkey.
+        The modifier masks to grab for the given modifiers. The hotkey has to work regardless of the lock keys, so
+        grab all combinations of NumLock and CapsLock.
+        """
+        mask = 0
+        for mod in modifiers:
+            mask |= self.modMasks[mod]
+
+        masks = [mask]
+        if Key.NUMLOCK in self.modMasks:
+            masks.append(mask | self.modMasks[Key.NUMLOCK])
+        if Key.CAPSLOCK in self.modMasks:
+            masks.append(mask | self.modMasks[Key.CAPSLOCK])
+        if Key.CAPSLOCK in self.modMasks and Key.NUMLOCK in self.modMasks:
+            masks.append(mask | self.modMasks[Key.CAPSLOCK] | self.modMasks[Key.NUMLOCK])
+        return masks
+
+    def __desiredGrabs(self, item, windows: typing.Optional[typing.Set[int]]=None) -> GrabSet:
+        """
+        Compute the grabs the item needs.
 
-        If the hotkey has no filter regex, it is global and is grabbed recursively from the root window
-        If it has a filter regex, iterate over all children of the root and grab from matching windows
+        Hotkeys without a filter regex are global and grabbed in the root window. Hotkeys with a filter regex are
+        grabbed in all matching windows.
+        @param windows: If given, only compute the grabs in these windows
         """
+        try:
+            keycode = self.__lookupKeyCode(item.hotKey)
+            masks = self.__grabMasks(item.modifiers)
+        except Exception as e:
+            logger.warning("Failed to grab hotkey %r %r: %s", item.modifiers, item.hotKey, str(e))
+            return set()
+
+        candidates = self.__windowParents.keys() if windows is None else windows
         if item.get_applicable_regex() is None:
-            self.__enqueue(self.__grabHotkey, item.hotKey, item.modifiers, self.rootWindow)
+            targets = {self.rootWindow.id} if windows is None or self.rootWindow.id in windows else set()
             if self.__needsMutterWorkaround(item):
-                self.__enqueue(self.__grabRecurse, item, self.rootWindow, False)
+                targets.update(window_id for window_id in candidates if window_id in self.__windowParents)
         else:
-            self.__enqueue(self.__grabRecurse, item, self.rootWindow)
+            targets = {window_id for window_id in candidates if self.__windowMatches(item, window_id)}
 
-    def __grabRecurse(self, item, parent, checkWinInfo=True):
-        try:
-            children = parent.query_tree().children
-        except:
-            return # window has been destroyed
-                     
-        for window in children:
-            shouldTrigger = False
-            
-            if checkWinInfo:
-                window_info = self.get_window_info(window, False)
-                shouldTrigger = item._should_trigger_window_title(window_info)
+        return {(window_id, keycode, mask) for window_id in targets for mask in masks}
 
-            if shouldTrigger or not checkWinInfo:
-                self.__grabHotkey(item.hotKey, item.modifiers, window)
-                self.__grabRecurse(item, window, False)
-            else:
-                self.__grabRecurse(item, window)
+    def __reconcileHotkey(self, item):
+        to_grab, to_ungrab = self.__grabRegistry.update(item, self.__desiredGrabs(item))
+        self.__applyGrabs(to_grab, to_ungrab)
 
-    def ungrab_hotkey(self, item):
+    def __reconcileAllHotkeys(self, windows: typing.Optional[typing.Set[int]]=None):
         """
-        Ungrab a hotkey.
+        Bring the hotkey grabs of all items in line with the configuration, the keymap and the window tree.
 
-        If the hotkey has no filter regex, it is global and is grabbed recursively from the root window
-        If it has a filter regex, iterate over all children of the root and ungrab from matching windows
+        @param windows: If given, only update the grabs in these windows
         """
-        import copy
-        newItem = copy.copy(item)
-        
-        if item.get_applicable_regex() is None:
-            self.__enqueue(self.__ungrabHotkey, newItem.hotKey, newItem.modifiers, self.rootWindow)
-            if self.__needsMutterWorkaround(item):
-                self.__enqueue(self.__ungrabRecurse, newItem, self.rootWindow, False)
+        items = self.__hotkeyItems()
+        to_grab, to_ungrab = set(), set()
+        if windows is None:
+            # Drop items that are no longer configured
+            for item in set(self.__grabRegistry.owners()).difference(items):
+                to_ungrab |= self.__grabRegistry.release(item)
         else:
-            self.__enqueue(self.__ungrabRecurse, newItem, self.rootWindow)
-
-    def __ungrabRecurse(self, item, parent, checkWinInfo=True):
-        try:
-            children = parent.query_tree().children
-        except:
-            return # window has been destroyed
-                     
-        for window in children:
-            shouldTrigger = False
-            
-            if checkWinInfo:
-                window_info = self.get_window_info(window, False)
-                shouldTrigger = item._should_trigger_window_title(window_info)
+            # Also keep items up-to-date that were grabbed explicitly, but are not (yet) part of the configuration
+            items = items + [item for item in self.__grabRegistry.owners() if item not in items]
 
-            if shouldTrigger or not checkWinInfo:
-                self.__ungrabHotkey(item.hotKey, item.modifiers, window)
-                self.__ungrabRecurse(item, window, False)
-            else:
-                self.__ungrabRecurse(item, window)
+        for item in items:
+            added, removed = self.__grabRegistry.update(item, self.__desiredGrabs(item, windows), windows)
+            to_grab |= added
+            to_ungrab |= removed
+        # A grab can move between items, for example when two phrases use the same hotkey
+        self.__applyGrabs(to_grab - to_ungrab, to_ungrab - to_grab)
 
-    def __ungrabHotkey(self, key, modifiers, window):
+    def __applyGrabs(self, to_grab: GrabSet, to_ungrab: GrabSet):
         """
-        Ungrab a specific hotkey in the given window
+        Send the given grab changes to the X server.
         """
-        logger.debug("Ungrabbing hotkey: %r %r", modifiers, key)
-        try:
-            keycode = self.__lookupKeyCode(key)
-            mask = 0
-            for mod in modifiers:
-                mask |= self.modMasks[mod]
+        if to_grab or to_ungrab:
+            logger.debug("Updating hotkey grabs: %d added, %d removed, %d active",
+                         len(to_grab), len(to_ungrab), len(self.__grabRegistry))
+        for window_id, keycode, mask in to_ungrab:
+            self.__windowResource(window_id).ungrab_key(keycode, mask, onerror=self.__ignoreBadWindow)
+        for window_id, keycode, mask in to_grab:
+            # The window may be destroyed before the request reaches the server. Its DestroyNotify cleans up.
+            self.__windowResource(window_id).grab_key(
+                keycode, mask, True, X.GrabModeAsync, X.GrabModeAsync, onerror=self.__ignoreBadWindow)
+        self.localDisplay.flush()
 
-            window.ungrab_key(keycode, mask)
+    def grab_hotkey(self, item):
+        """
+        Grab a hotkey.
+
+        If the hotkey has no filter regex, it is global and is grabbed in the root window
+        If it has a filter regex, it is grabbed in all matching windows. Grabs that already exist are kept.
+        """
+        return self.__enqueue(self.__reconcileHotkey, item)
 
-            if Key.NUMLOCK in self.modMasks:
-                window.ungrab_key(keycode, mask|self.modMasks[Key.NUMLOCK])
+    def ungrab_hotkey(self, item):
+        """
+        Ungrab a hotkey.
 
-            if Key.CAPSLOCK in self.modMasks:
-                window.ungrab_key(keycode, mask|self.modMasks[Key.CAPSLOCK])
+        Removes all grabs made for the item. The grabs are recorded when they are made, so this is independent of
+        later changes to the item.
+        """
+        return self.__enqueue(self.__releaseHotkey, item)
 
-            if Key.CAPSLOCK in self.modMasks and Key.NUMLOCK in self.modMasks:
-                window.ungrab_key(keycode, mask|self.modMasks[Key.CAPSLOCK]|self.modMasks[Key.NUMLOCK])
-        except Exception as e:
-            logger.warning("Failed to ungrab hotkey %r %r: %s", modifiers, key, str(e))
+    def __releaseHotkey(self, item):
+        self.__applyGrabs(set(), self.__grabRegistry.release(item))
 
     def lookup_string(self, keyCode, shifted, numlock, altGrid):
         if keyCode == 0:
@@ -604,17 +1009,76 @@ class XInterfaceBase(threading.Thread):
          causing a paste operation to happen.
         """
         logger.debug("Sending string via clipboard: " + string)
-        if common.USING_QT:
-            if paste_command in (None, autokey.model.phrase.SendMode.SELECTION):
-                self.__enqueue(self.app.exec_in_main, self._send_string_selection, string)
-            else:
-                self.__enqueue(self.app.exec_in_main, self._send_string_clipboard, string, paste_command)
+        if paste_command in (None, autokey.model.phrase.SendMode.SELECTION):
+            future = self.__enqueue(self.__sendStringSelection, string)
         else:
-            if paste_command in (None, autokey.model.phrase.SendMode.SELECTION):
-                self.__enqueue(self._send_string_selection, string)
-            else:
-                self.__enqueue(self._send_string_clipboard, string, paste_command)
+            future = self.__enqueue(self.__sendStringClipboard, string, paste_command)
         logger.debug("Sending via clipboard enqueued.")
+        return future
+
+    def __sendStringClipboard(self, string: str, paste_command: autokey.model.phrase.SendMode):
+        """
+        Serve the string from the CLIPBOARD selection owned by AutoKey and send the paste command. The previous
+        content is restored by the selection owner, as soon as the target application fetched the string.
+        """
+        try:
+            self.selectionOwner.paste_from(self.selectionOwner.clipboard, string, CLIPBOARD_RESTORE_TIMEOUT)
+        except SelectionUnavailable as e:
+            logger.info("Pasting using the toolkit clipboard: %s", e)
+            self.__enqueueToolkitClipboard(self._send_string_clipboard, string, paste_command)
+            return
+        try:
+            self.mediator.send_string(paste_command.value)
+        finally:
+            self.ungrab_keyboard()
+        # Runs after the queued keys of the paste command were sent
+        self.__enqueue(self.__pasteSent, self.selectionOwner.clipboard, self.localDisplay.get_input_focus().focus)
+
+    def __sendStringSelection(self, string: str):
+        """
+        Serve the string from the PRIMARY selection owned by AutoKey and paste it using the middle mouse button.
+        """
+        try:
+            self.selectionOwner.paste_from(self.selectionOwner.primary, string, SELECTION_RESTORE_TIMEOUT)
+        except SelectionUnavailable as e:
+            logger.info("Pasting using the toolkit selection: %s", e)
+            self.__enqueueToolkitClipboard(self._send_string_selection, string)
+            return
+        target = self.__windowUnderPointer()
+        self._paste_using_mouse_button_2()
+        self.__pasteSent(self.selectionOwner.primary, target)
+
+    def __pasteSent(self, selection: int, target):
+        self.localDisplay.flush()
+        # Without a real target window, like PointerRoot focus, any client fetching the content ends the paste
+        targetId = getattr(target, "id", None)
+        if targetId == self.rootWindow.id:
+            targetId = None
+        self.selectionOwner.paste_sent(selection, targetId)
+
+    def __windowUnderPointer(self):
+        # The innermost window, which belongs to the application and not to the frame of the window manager
+        window = self.rootWindow
+        child = window.query_pointer().child
+        while child != X.NONE:
+            window = child
+            child = window.query_pointer().child
+        return window
+
+    def __pasteDelivered(self, selection: int, length: int, seconds: float):
+        """Called by the selection owner, when the target application fetched pasted content."""
+        if selection == self.selectionOwner.primary:
+            sendMode = autokey.model.phrase.SendMode.SELECTION
+        else:
+            sendMode = autokey.model.phrase.SendMode.CB_CTRL_V
+        self.mediator.send_mode_selector.record(sendMode, length, seconds)
+
+    def __enqueueToolkitClipboard(self, method: typing.Callable, *args):
+        # The Qt clipboard can only be used from the main thread.
+        if common.USING_QT:
+            return self.__enqueue(self.app.exec_in_main, method, *args)
+        else:
+            return self.__enqueue(method, *args)
 
     def _send_string_clipboard(self, string: str, paste_command: autokey.model.phrase.SendMode):
         """
@@ -665,25 +1129,79 @@ class XInterfaceBase(threading.Thread):
         logger.debug("Mouse Button2 event sent.")
 
     def begin_send(self):
-        self.__enqueue(self.__grab_keyboard)
+        return self.__enqueue(self.__beginSend)
 
     def finish_send(self):
-        self.__enqueue(self.__ungrabKeyboard)
+        return self.__enqueue(self.__finishSend)
+
+    def __beginSend(self):
+        """
+        Grab the keyboard, so that keys typed by the user do not mix with the sent keys. Keys typed meanwhile are
+        delivered to AutoKey, which buffers them until the send is finished.
+        """
+        with self.__typeAheadLock:
+            self.__sendDepth += 1
+            if self.__typeAhead is None:
+                self.__typeAhead = []
+        self.__grab_keyboard()
+
+    def __finishSend(self):
+        with self.__typeAheadLock:
+            self.__sendDepth = max(0, self.__sendDepth - 1)
+            if self.__sendDepth:
+                # A nested send, like a streamed phrase, finished. The outer one still holds the keyboard.
+                return
+        self.__ungrabKeyboard()
+        # Receive all key events delivered before the grab was released.
+        self.localDisplay.sync()
+        self.__drainLocalEvents()
+        with self.__typeAheadLock:
+            typedAhead = self.__typeAhead
+            self.__typeAhead = None
+        if typedAhead:
+            self.__replayTypeAhead(typedAhead)
+
+    def __replayTypeAhead(self, typedAhead: typing.List[typing.Tuple[int, int]]):
+        """
+        Type the keys the user typed during a send. They are sent as synthetic events, so they are not recorded and do
+        not take part in abbreviation matching. Keys typed with modifiers like Ctrl or Super held are shortcuts, which
+        were handled already (for example the global hotkey cancelling the send), so they are not replayed.
+        """
+        textMask = X.ShiftMask | X.LockMask | self.modMasks.get(Key.NUMLOCK, 0) | self.modMasks.get(Key.ALT_GR, 0)
+        focus = self.localDisplay.get_input_focus().focus
+        replayed = 0
+        for keyCode, state in typedAhead:
+            if state & ~textMask or self.__decodeModifier(keyCode) is not None:
+                continue
+            self.__sendKeyCode(keyCode, state, focus)
+            replayed += 1
+        self.localDisplay.flush()
+        logger.debug("Replayed %d keys typed during the send", replayed)
+        stats.increment("typeahead.replayed", replayed)
+        stats.increment("typeahead.skipped", len(typedAhead) - replayed)
 
     def grab_keyboard(self):
-        self.__enqueue(self.__grab_keyboard)
+        return self.__enqueue(self.__grab_keyboard)
 
     def __grab_keyboard(self):
         focus = self.localDisplay.get_input_focus().focus
         focus.grab_keyboard(True, X.GrabModeAsync, X.GrabModeAsync, X.CurrentTime)
         self.localDisplay.flush()
+        self.__keyboardGrabbed = True
 
     def ungrab_keyboard(self):
-        self.__enqueue(self.__ungrabKeyboard)
+        return self.__enqueue(self.__ungrabKeyboard)
+
+    def release_keyboard_grab(self):
+        """
+        Release the keyboard grab right away, without waiting for the queued operations. Used to cancel sends.
+        """
+        self.__ungrabKeyboard()
         
     def __ungrabKeyboard(self):
         self.localDisplay.ungrab_keyboard(X.CurrentTime)
         self.localDisplay.flush()
+        self.__keyboardGrabbed = False
 
     def __findUsableKeycode(self, codeList):
         for code, offset in codeList:
@@ -692,14 +1210,18 @@ class XInterfaceBase(threading.Thread):
 
         return None, None
 
-    def send_string(self, string):
-        self.__enqueue(self.__sendString, string)
+    def send_string(self, string, use_xtest: bool=False):
+        return self.__enqueue(self.__sendString, string, use_xtest)
         
-    def __sendString(self, string):
+    def __sendString(self, string, useXTest: bool=False):
         """
         Send a string of printable characters.
+
+        @param useXTest: Inject the key events using the XTEST extension, instead of sending synthetic key events to
+        the focused window. Some applications ignore synthetic events.
         """
         logger.debug("Sending string: %r", string)
+        start = time.perf_counter()
         # Determine if workaround is needed
         if not cm.ConfigManager.SETTINGS[cm_constants.ENABLE_QT4_WORKAROUND]:
             self.__checkWorkaroundNeeded()
@@ -754,57 +1276,95 @@ class XInterfaceBase(threading.Thread):
             self.localDisplay.flush()
 
         focus = self.localDisplay.get_input_focus().focus
+        # Key events injected using XTEST go through the keyboard grab, so they would be delivered to AutoKey itself.
+        regrab = useXTest and self.__keyboardGrabbed
+        if regrab:
+            self.__ungrabKeyboard()
 
         for char in string:
             try:
                 keyCodeList = self.localDisplay.keysym_to_keycodes(ord(char))
                 keyCode, offset = self.__findUsableKeycode(keyCodeList)
-                if keyCode is not None:
-                    if offset == 0:
-                        self.__sendKeyCode(keyCode, theWindow=focus)
-                    if offset == 1:
-                        self.__pressKey(Key.SHIFT)
-                        self.__sendKeyCode(keyCode, self.modMasks[Key.SHIFT], focus)
-                        self.__releaseKey(Key.SHIFT)
-                    if offset == 4:
-                        self.__pressKey(Key.ALT_GR)
-                        self.__sendKeyCode(keyCode, self.modMasks[Key.ALT_GR], focus)
-                        self.__releaseKey(Key.ALT_GR)
-                    if offset == 5:
-                        self.__pressKey(Key.ALT_GR)
-                        self.__pressKey(Key.SHIFT)
-                        self.__sendKeyCode(keyCode, self.modMasks[Key.ALT_GR]|self.modMasks[Key.SHIFT], focus)
-                        self.__releaseKey(Key.SHIFT)
-                        self.__releaseKey(Key.ALT_GR)
-
-                elif char in self.remappedChars:
+                if keyCode is None and char in self.remappedChars:
                     keyCode, offset = self.remappedChars[char]
-                    if offset == 0:
-                        self.__sendKeyCode(keyCode, theWindow=focus)
-                    if offset == 1:
-                        self.__pressKey(Key.SHIFT)
-                        self.__sendKeyCode(keyCode, self.modMasks[Key.SHIFT], focus)
-                        self.__releaseKey(Key.SHIFT)
+                if keyCode is not None:
+                    self.__typeKeyCode(keyCode, OFFSET_MODIFIERS[offset], focus, useXTest)
                 else:
                     logger.warning("Unable to send character %r", char)
             except Exception as e:
                 logger.exception("Error sending char %r: %s", char, str(e))
 
+        if regrab:
+            self.__grab_keyboard()
         self.__ignoreRemap = False
+        sendMode = autokey.model.phrase.SendMode.XTEST if useXTest else autokey.model.phrase.SendMode.KEYBOARD
+        self.mediator.send_mode_selector.record(sendMode, len(string), time.perf_counter() - start)
+
+    def __typeKeyCode(self, keyCode, modifierKeys, focus, useXTest: bool):
+        """
+        Type a key, holding the given modifier keys while doing so.
+        """
+        if useXTest:
+            for modifier in modifierKeys:
+                self.__injectKey(X.KeyPress, self.__lookupKeyCode(modifier))
+            self.__injectKey(X.KeyPress, keyCode)
+            self.__injectKey(X.KeyRelease, keyCode)
+            for modifier in reversed(modifierKeys):
+                self.__injectKey(X.KeyRelease, self.__lookupKeyCode(modifier))
+        else:
+            mask = 0
+            for modifier in modifierKeys:
+                self.__pressKey(modifier)
+                mask |= self.modMasks[modifier]
+            self.__sendKeyCode(keyCode, mask, focus)
+            for modifier in reversed(modifierKeys):
+                self.__releaseKey(modifier)
+
 
+    def __injectKey(self, eventType: int, keyCode: int):
+        # Recorded by XRecord, which may report it after the send finished. See InjectedKeys.
+        self.injectedKeys.injected(eventType, keyCode)
+        xtest.fake_input(self.rootWindow, eventType, keyCode)
+
+    def send_operations(self, operations: typing.List[typing.Tuple[str, tuple]], isCancelled: typing.Callable[[], bool],
+                        onDone: typing.Callable[[], None]):
+        """
+        Run a list of send operations as a single queue item. Used to type a chunk of a streamed send.
+
+        @param operations: List of (method name, arguments) tuples. The method names are send_string, send_key and
+        send_modified_key. They take the same arguments as these methods.
+        @param isCancelled: Checked before each operation. Once it returns True, the remaining operations are skipped.
+        @param onDone: Called from the event thread after the operations ran or were skipped.
+        """
+        return self.__enqueue(self.__sendOperations, operations, isCancelled, onDone)
+
+    def __sendOperations(self, operations, isCancelled, onDone):
+        methods = {
+            "send_string": self.__sendString,
+            "send_key": self.__sendKey,
+            "send_modified_key": self.__sendModifiedKey,
+        }
+        try:
+            for methodName, args in operations:
+                if isCancelled():
+                    break
+                methods[methodName](*args)
+            self.localDisplay.flush()
+        finally:
+            onDone()
 
     def send_key(self, keyName):
         """
         Send a specific non-printing key, eg Up, Left, etc
         """
-        self.__enqueue(self.__sendKey, keyName)
+        return self.__enqueue(self.__sendKey, keyName)
         
     def __sendKey(self, keyName):
         logger.debug("Send special key: [%r]", keyName)
         self.__sendKeyCode(self.__lookupKeyCode(keyName))
 
     def fake_keypress(self, keyName):
-         self.__enqueue(self.__fakeKeypress, keyName)
+        return self.__enqueue(self.__fakeKeypress, keyName)
          
     def __fakeKeypress(self, keyName):        
         keyCode = self.__lookupKeyCode(keyName)
@@ -812,14 +1372,14 @@ class XInterfaceBase(threading.Thread):
         xtest.fake_input(self.rootWindow, X.KeyRelease, keyCode)
 
     def fake_keydown(self, keyName):
-        self.__enqueue(self.__fakeKeydown, keyName)
+        return self.__enqueue(self.__fakeKeydown, keyName)
         
     def __fakeKeydown(self, keyName):
         keyCode = self.__lookupKeyCode(keyName)
         xtest.fake_input(self.rootWindow, X.KeyPress, keyCode)
 
     def fake_keyup(self, keyName):
-        self.__enqueue(self.__fakeKeyup, keyName)
+        return self.__enqueue(self.__fakeKeyup, keyName)
         
     def __fakeKeyup(self, keyName):
         keyCode = self.__lookupKeyCode(keyName)
@@ -829,7 +1389,7 @@ class XInterfaceBase(threading.Thread):
         """
         Send a modified key (e.g. when emulating a hotkey)
         """
-        self.__enqueue(self.__sendModifiedKey, keyName, modifiers)
+        return self.__enqueue(self.__sendModifiedKey, keyName, modifiers)
 
     def __sendModifiedKey(self, keyName, modifiers):
         logger.debug("Send modified key: modifiers: %s key: %s", modifiers, keyName)
@@ -845,7 +1405,7 @@ class XInterfaceBase(threading.Thread):
             logger.warning("Error sending modified key %r %r: %s", modifiers, keyName, str(e))
 
     def send_mouse_click(self, xCoord, yCoord, button, relative):
-        self.__enqueue(self.__sendMouseClick, xCoord, yCoord, button, relative)
+        return self.__enqueue(self.__sendMouseClick, xCoord, yCoord, button, relative)
         
     def __sendMouseClick(self, xCoord, yCoord, button, relative):    
         # Get current pointer position so we can return it there
@@ -866,7 +1426,7 @@ class XInterfaceBase(threading.Thread):
         self.__flush()
 
     def mouse_press(self, xCoord, yCoord, button):
-        self.__enqueue(self.__mousePress, xCoord, yCoord, button)
+        return self.__enqueue(self.__mousePress, xCoord, yCoord, button)
 
     def __mousePress(self, xCoord, yCoord, button):
         focus = self.localDisplay.get_input_focus().focus
@@ -874,7 +1434,7 @@ class XInterfaceBase(threading.Thread):
         self.__flush()
 
     def mouse_release(self, xCoord, yCoord, button):
-        self.__enqueue(self.__mouseRelease, xCoord, yCoord, button)
+        return self.__enqueue(self.__mouseRelease, xCoord, yCoord, button)
 
     def __mouseRelease(self, xCoord, yCoord, button):
         focus = self.localDisplay.get_input_focus().focus
@@ -893,12 +1453,16 @@ class XInterfaceBase(threading.Thread):
         return (pos.win_x, pos.win_y)
 
     def scroll_down(self, number):
+        future = None
         for i in range(0, number):
-            self.__enqueue(self.__scroll, Button.SCROLL_DOWN)
+            future = self.__enqueue(self.__scroll, Button.SCROLL_DOWN)
+        return future if future is not None else self.barrier()
 
     def scroll_up(self, number):
+        future = None
         for i in range(0, number):
-            self.__enqueue(self.__scroll, Button.SCROLL_UP)
+            future = self.__enqueue(self.__scroll, Button.SCROLL_UP)
+        return future if future is not None else self.barrier()
 
     def __scroll(self, button):
         focus = self.localDisplay.get_input_focus().focus
@@ -908,7 +1472,7 @@ class XInterfaceBase(threading.Thread):
         self.__flush()
 
     def move_cursor(self, xCoord, yCoord, relative=False, relative_self=False):
-        self.__enqueue(self.__moveCursor, xCoord, yCoord, relative, relative_self)
+        return self.__enqueue(self.__moveCursor, xCoord, yCoord, relative, relative_self)
 
     def __moveCursor(self, xCoord, yCoord, relative=False, relative_self=False):
         if relative:
@@ -925,8 +1489,29 @@ class XInterfaceBase(threading.Thread):
         self.rootWindow.warp_pointer(xCoord,yCoord)
         self.__flush()
 
+    def move_path(self, points: typing.Sequence[typing.Tuple[float, float]], duration: float,
+                  interval: float=MOUSE_PATH_INTERVAL) -> concurrent.futures.Future:
+        """
+        Move the pointer along a path, using XTest motion events, so that applications see a real mouse movement.
+        The whole path is sent as a single queued operation. See L{interpolate_path} for the parameters.
+        """
+        return self.__enqueue(self.__movePath, interpolate_path(points, duration, interval))
+
+    def __movePath(self, path: typing.List[typing.Tuple[float, int, int]]):
+        start = time.monotonic()
+        for offset, xCoord, yCoord in path:
+            if self.shutdown:
+                break
+            delay = start + offset - time.monotonic()
+            if delay > 0:
+                # Send the motion so far before waiting, so that each event reaches the server on time.
+                self.localDisplay.flush()
+                time.sleep(delay)
+            xtest.fake_input(self.rootWindow, X.MotionNotify, x=xCoord, y=yCoord)
+        self.__flush()
+
     def send_mouse_click_relative(self, xoff, yoff, button):
-        self.__enqueue(self.__sendMouseClickRelative, xoff, yoff, button)
+        return self.__enqueue(self.__sendMouseClickRelative, xoff, yoff, button)
         
     def __sendMouseClickRelative(self, xoff, yoff, button):
         # Get current pointer position
@@ -944,50 +1529,51 @@ class XInterfaceBase(threading.Thread):
         self.__flush()
 
     def flush(self):
-        self.__enqueue(self.__flush)
+        return self.__enqueue(self.__flush)
         
     def __flush(self):
         self.localDisplay.flush()
         self.lastChars = []
 
     def press_key(self, keyName):
-        self.__enqueue(self.__pressKey, keyName)
+        return self.__enqueue(self.__pressKey, keyName)
         
     def __pressKey(self, keyName):
         self.__sendKeyPressEvent(self.__lookupKeyCode(keyName), 0)
 
     def release_key(self, keyName):
-        self.__enqueue(self.__releaseKey, keyName)
+        return self.__enqueue(self.__releaseKey, keyName)
         
     def __releaseKey(self, keyName):
         self.__sendKeyReleaseEvent(self.__lookupKeyCode(keyName), 0)
 
     def __flushEvents(self):
         logger.debug("__flushEvents: Entering event loop.")
-        while True:
+        while not self.shutdown:
             try:
-                readable, w, e = select.select([self.localDisplay], [], [], 1)
-                time.sleep(1)
-                if self.localDisplay in readable:
-                    createdWindows = []
-                    destroyedWindows = []
-                    
-                    for x in range(self.localDisplay.pending_events()):
-                        event = self.localDisplay.next_event()
-                        if event.type == X.CreateNotify:
-                            createdWindows.append(event.window)
-                        if event.type == X.DestroyNotify:
-                            destroyedWindows.append(event.window)
-                        if event.type == X.MappingNotify:
-                            logger.debug("X Mapping Event Detected")
-                            self.on_keys_changed()
-                            
-                    for window in createdWindows:
-                        if window not in destroyedWindows:
-                            self.__enqueue(self.__grabHotkeysForWindow, window)
-
+                readable, w, e = select.select([self.__eventDisplay, self.__wakeupRead], [], [])
+                if self.__wakeupRead in readable:
+                    os.read(self.__wakeupRead, 512)
                 if self.shutdown:
                     break
+
+                windowEvents = []
+                self.__readWindowEvents(windowEvents)
+
+                if windowEvents:
+                    deadline = time.monotonic() + WINDOW_BURST_COALESCE_TIME
+                    remaining = WINDOW_BURST_COALESCE_TIME
+                    while remaining > 0:
+                        readable, w, e = select.select([self.__eventDisplay], [], [], remaining)
+                        if not readable:
+                            break
+                        self.__readWindowEvents(windowEvents)
+                        remaining = deadline - time.monotonic()
+
+                    self.__enqueue(self.__applyWindowEvents, windowEvents)
+
+                self.__drainLocalEvents()
+
             except ConnectionClosedError:
                 # Autokey does not properly exit on logout. It causes an infinite exception loop, accumulating stack
                 # traces along. This acts like a memory leak, filling the system RAM until it hits an OOM condition.
@@ -996,25 +1582,79 @@ class XInterfaceBase(threading.Thread):
                 # the connection.
                 # See https://github.com/autokey/autokey/issues/198 for details
                 logger.exception("__flushEvents: Connection to the X server closed. Forcefully exiting Autokey now.")
-                import os
                 os._exit(1)
             except Exception:
                 logger.exception("__flushEvents: Some exception occured:")
                 pass
         logger.debug("__flushEvents: Left event loop.")
 
+    def __readWindowEvents(self, windowEvents: list):
+        """
+        Read all events currently available on the listener connection.
+        Window tree changes are appended to windowEvents as (event type, window id, parent window id) tuples.
+        """
+        count = self.__eventDisplay.pending_events()
+        for x in range(count):
+            event = self.__eventDisplay.next_event()
+            if event.type == X.PropertyNotify:
+                if event.atom == self.__ActiveWindowAtom and event.window.id == self.rootWindow.id:
+                    self.__invalidateActiveWindow()
+                elif event.atom == self.__ClientListAtom and event.window.id == self.rootWindow.id:
+                    self.windowManager.invalidate_client_list()
+                elif event.atom in self.__windowInfoAtoms:
+                    self.__invalidateWindowInfo(event.window.id)
+            elif event.type == X.CreateNotify:
+                windowEvents.append((event.type, event.window.id, event.parent.id))
+            elif event.type in (X.MapNotify, X.ReparentNotify, X.DestroyNotify):
+                if event.type != X.MapNotify:
+                    self.__invalidateWindowInfo(event.window.id, destroyed=event.type == X.DestroyNotify)
+                # Events of windows watched for the WindowInfo cache are reported as well. Only the ones selected
+                # on the root window describe changes of the window tree.
+                if event.event.id == self.rootWindow.id:
+                    if event.type == X.ReparentNotify:
+                        parent_id = event.parent.id
+                    elif event.type == X.MapNotify:
+                        parent_id = self.rootWindow.id
+                    else:
+                        parent_id = None
+                    windowEvents.append((event.type, event.window.id, parent_id))
+            elif event.type == X.MappingNotify:
+                logger.debug("X Mapping Event Detected")
+                self.on_keys_changed()
+        if count:
+            # Includes changes of _NET_CLIENT_LIST, which need no further handling here.
+            with self.__windowChanged:
+                self.__windowChangeCount += 1
+                self.__windowChanged.notify_all()
+
+    def __drainLocalEvents(self):
+        """
+        The local display does not select any events, but the X server sends MappingNotify to all clients. Drop those,
+        so that they do not pile up in the queue of the local connection. Key presses delivered through the keyboard
+        grab of a running send are stored in the type-ahead buffer.
+        """
+        with self.__typeAheadLock:
+            for x in range(self.localDisplay.pending_events()):
+                localEvent = self.localDisplay.next_event()
+                if localEvent.type != X.KeyPress or self.__typeAhead is None:
+                    continue
+                if len(self.__typeAhead) < TYPE_AHEAD_LIMIT:
+                    self.__typeAhead.append((localEvent.detail, localEvent.state))
+                    stats.increment("typeahead.buffered")
+                else:
+                    stats.increment("typeahead.dropped")
+
     def handle_keypress(self, keyCode):
         self.__enqueue(self.__handleKeyPress, keyCode)
     
     def __handleKeyPress(self, keyCode):
-        focus = self.localDisplay.get_input_focus().focus
-
         modifier = self.__decodeModifier(keyCode)
         if modifier is not None:
             self.mediator.handle_modifier_down(modifier)
         else:
-            window_info = self.get_window_info(focus)
-            self.mediator.handle_keypress(keyCode, window_info)
+            window_info, round_trips_saved = self.__lookupWindowInfo()
+            stats.record("keypress.x_round_trips_saved", round_trips_saved)
+            self.mediator.handle_keypress(keyCode, window_info, during_send=self.__sendDepth > 0)
 
     def handle_keyrelease(self, keyCode):
         self.__enqueue(self.__handleKeyrelease, keyCode)
@@ -1028,22 +1668,46 @@ class XInterfaceBase(threading.Thread):
         self.__enqueue(self.__handleMouseclick, button, x, y)
         
     def __handleMouseclick(self, button, x, y):
+        # Most of the time, the only listener is the Service, which just resets the input buffer on clicks. So the
+        # window information and the relative coordinates are only queried, if a listener actually reads them.
+        stats.increment("mouseclick.handled")
         # Sleep a bit to timing issues. A mouse click might change the active application.
-        # If so, the switch happens asynchronously somewhere during the execution of the first two queries below,
+        # If so, the switch happens asynchronously somewhere during the execution of the queries below,
         # causing the queried window title (and maybe the window class or even none of those) to be invalid.
-        time.sleep(0.005)  # TODO: may need some tweaking
-        window_info = self.get_window_info()
-        
+        settled = _Lazy(lambda: time.sleep(0.005))  # TODO: may need some tweaking
+        window_info = LazyWindowInfo(lambda: self.__readClickedWindowInfo(settled))
+
         if x is None and y is None:
-            ret = self.localDisplay.get_input_focus().focus.query_pointer()
-            self.mediator.handle_mouse_click(ret.root_x, ret.root_y, ret.win_x, ret.win_y, button, window_info)
+            pointer = _Lazy(lambda: self.__queryPointer(settled))
+            self.mediator.handle_mouse_click(
+                LazyCoordinate(pointer, 0), LazyCoordinate(pointer, 1),
+                LazyCoordinate(pointer, 2), LazyCoordinate(pointer, 3),
+                button, window_info)
         else:
-            focus = self.localDisplay.get_input_focus().focus
-            try:
-                rel = focus.translate_coords(self.rootWindow, x, y)
-                self.mediator.handle_mouse_click(x, y, rel.x, rel.y, button, window_info)
-            except:
-                self.mediator.handle_mouse_click(x, y, 0, 0, button, window_info)
+            relative = _Lazy(lambda: self.__translateToFocus(settled, x, y))
+            self.mediator.handle_mouse_click(
+                x, y, LazyCoordinate(relative, 0), LazyCoordinate(relative, 1), button, window_info)
+
+    def __readClickedWindowInfo(self, settled: _Lazy) -> WindowInfo:
+        settled.get()
+        stats.increment("mouseclick.window_info_resolved")
+        return self.__lookupWindowInfo()[0]
+
+    def __queryPointer(self, settled: _Lazy) -> typing.Tuple[int, int, int, int]:
+        settled.get()
+        stats.increment("mouseclick.position_resolved")
+        ret = self.localDisplay.get_input_focus().focus.query_pointer()
+        return ret.root_x, ret.root_y, ret.win_x, ret.win_y
+
+    def __translateToFocus(self, settled: _Lazy, x: int, y: int) -> typing.Tuple[int, int]:
+        settled.get()
+        stats.increment("mouseclick.position_resolved")
+        focus = self.localDisplay.get_input_focus().focus
+        try:
+            rel = focus.translate_coords(self.rootWindow, x, y)
+            return rel.x, rel.y
+        except:
+            return 0, 0
 
     def __decodeModifier(self, keyCode):
         """
@@ -1135,6 +1799,8 @@ class XInterfaceBase(threading.Thread):
                 raise
 
     def get_window_info(self, window=None, traverse: bool=True) -> WindowInfo:
+        if traverse:
+            return self.__lookupWindowInfo(window)[0]
         try:
             if window is None:
                 window = self.localDisplay.get_input_focus().focus
@@ -1143,7 +1809,123 @@ class XInterfaceBase(threading.Thread):
             logger.warning("Got BadWindow error while requesting window information.")
             return self._create_window_info(window, "", "")
 
-    def _get_window_info(self, window, traverse: bool, wm_title: str=None, wm_class: str=None) -> WindowInfo:
+    def __lookupWindowInfo(self, window=None) -> typing.Tuple[WindowInfo, int]:
+        """
+        Get the WindowInfo of the given window, or the focused window, using the cache if possible.
+
+        @return: Tuple (window info, estimated number of X round-trips saved by the cache)
+        """
+        round_trips_saved = 0
+        if window is None:
+            window, round_trips_saved = self.__getFocusedWindow()
+        if isinstance(window, int):
+            # PointerRoot or None, if no window has the focus
+            return WindowInfo(wm_title="", wm_class=""), round_trips_saved
+        window_id = window.id
+
+        with self.__windowInfoLock:
+            cached = self.__windowInfoCache.get(window_id)
+            generation = self.__windowInfoGeneration
+        if cached is not None:
+            stats.increment("window_info.cache_hits")
+            return cached[0], round_trips_saved + cached[1]
+
+        stats.increment("window_info.cache_misses")
+        visited = []
+        try:
+            window_info = self._get_window_info(window, True, visited=visited)
+        except error.BadWindow:
+            logger.warning("Got BadWindow error while requesting window information.")
+            return WindowInfo(wm_title="", wm_class=""), round_trips_saved
+
+        # Ask for change notifications before caching. Windows seen for the first time are only cached on the next
+        # lookup, as changes made before the server processed the selection are not reported.
+        if self.__watchWindows(visited):
+            return window_info, round_trips_saved
+        with self.__windowInfoLock:
+            if generation == self.__windowInfoGeneration:
+                self.__windowInfoCache[window_id] = (
+                    window_info, len(visited) * WINDOW_INFO_ROUND_TRIPS_PER_WINDOW)
+                for source_id in visited:
+                    self.__windowInfoSources.setdefault(source_id, set()).add(window_id)
+        return window_info, round_trips_saved
+
+    def __getFocusedWindow(self):
+        """
+        Return the window with the keyboard focus. If the window manager supports it, the focused toplevel window is
+        read from _NET_ACTIVE_WINDOW on the root window, which is tracked by the listener.
+
+        @return: Tuple (window, number of X round-trips saved)
+        """
+        with self.__windowInfoLock:
+            active_window_id = self.__activeWindowId
+            generation = self.__windowInfoGeneration
+        if active_window_id is None:
+            active_window_id = self.__readActiveWindow()
+            with self.__windowInfoLock:
+                if generation == self.__windowInfoGeneration:
+                    self.__activeWindowId = active_window_id
+        elif active_window_id:
+            return self.localDisplay.create_resource_object("window", active_window_id), 1
+
+        if active_window_id:
+            return self.localDisplay.create_resource_object("window", active_window_id), 0
+        return self.localDisplay.get_input_focus().focus, 0
+
+    def __readActiveWindow(self) -> int:
+        """
+        Read _NET_ACTIVE_WINDOW from the root window. Returns 0, if unsupported or no window is active.
+        """
+        if not self.__ActiveWindowAtom:
+            return 0
+        active = self.rootWindow.get_full_property(self.__ActiveWindowAtom, X.AnyPropertyType)
+        if active is None or not active.value:
+            return 0
+        return active.value[0]
+
+    def __watchWindows(self, window_ids: typing.Iterable[int]) -> bool:
+        """
+        Select the events needed to invalidate cached window information on the given windows.
+
+        @return: True, if any window was not watched before
+        """
+        with self.__windowInfoLock:
+            new_ids = [window_id for window_id in window_ids
+                       if window_id not in self.__watchedWindows and window_id != self.rootWindow.id]
+            self.__watchedWindows.update(new_ids)
+            if new_ids:
+                self.__watchCount += 1
+        for window_id in new_ids:
+            window = self.__eventDisplay.create_resource_object("window", window_id)
+            window.change_attributes(event_mask=WINDOW_INFO_EVENT_MASK, onerror=self.__ignoreBadWindow)
+        if new_ids:
+            self.__eventDisplay.flush()
+        return bool(new_ids)
+
+    def __invalidateWindowInfo(self, window_id: int, destroyed: bool=False):
+        """
+        Drop all cached window information read from the given window. Called by the listener thread.
+        """
+        self.windowManager.invalidate_window(window_id)
+        with self.__windowInfoLock:
+            self.__windowInfoGeneration += 1
+            for cached_id in self.__windowInfoSources.pop(window_id, ()):
+                self.__windowInfoCache.pop(cached_id, None)
+            self.__windowInfoCache.pop(window_id, None)
+            if destroyed:
+                self.__watchedWindows.discard(window_id)
+                if window_id == self.__activeWindowId:
+                    self.__activeWindowId = None
+
+    def __invalidateActiveWindow(self):
+        with self.__windowInfoLock:
+            self.__windowInfoGeneration += 1
+            self.__activeWindowId = None
+
+    def _get_window_info(self, window, traverse: bool, wm_title: str=None, wm_class: str=None,
+                         visited: typing.List[int]=None) -> WindowInfo:
+        if visited is not None:
+            visited.append(window.id)
         new_wm_title = self._try_get_window_title(window)
         new_wm_class = self._try_get_window_class(window)
 
@@ -1155,7 +1937,7 @@ class XInterfaceBase(threading.Thread):
         if traverse:
             # Recursive operation on the parent window
             if wm_title and wm_class:  # Both known, abort walking the tree and return the data.
-                return self._create_window_info(window, wm_title, wm_class)
+                return self._create_window_info(window, wm_title, wm_class, visited)
             else:  # At least one property is still not known. So walk the window tree up.
                 parent = window.query_tree().parent
                 # Stop traversal, if the parent is not a window. When querying the parent, at some point, an integer
@@ -1165,7 +1947,7 @@ class XInterfaceBase(threading.Thread):
                     # will replace any None with an empty string. See below.
                     return self._get_window_info(window, False, wm_title, wm_class)
                 else:
-                    return self._get_window_info(parent, traverse, wm_title, wm_class)
+                    return self._get_window_info(parent, traverse, wm_title, wm_class, visited)
 
         else:
             # No recursion, so fill unknown values with empty strings.
@@ -1173,9 +1955,9 @@ class XInterfaceBase(threading.Thread):
                 wm_title = ""
             if wm_class is None:
                 wm_class = ""
-            return self._create_window_info(window, wm_title, wm_class)
+            return self._create_window_info(window, wm_title, wm_class, visited)
 
-    def _create_window_info(self, window, wm_title: str, wm_class: str):
+    def _create_window_info(self, window, wm_title: str, wm_class: str, visited: typing.List[int]=None):
         """
         Creates a WindowInfo object from the window title and WM_CLASS.
         Also checks for the Java XFocusProxyWindow workaround and applies it if needed:
@@ -1187,7 +1969,7 @@ class XInterfaceBase(threading.Thread):
         if "FocusProxy" in wm_class:
             parent = window.query_tree().parent
             # Discard both the already known wm_class and window title, because both are known to be wrong.
-            return self._get_window_info(parent, False)
+            return self._get_window_info(parent, False, visited=visited)
         else:
             return WindowInfo(wm_title=wm_title, wm_class=wm_class)
 
@@ -1221,6 +2003,51 @@ class XInterfaceBase(threading.Thread):
         else:
             return None
 
+    def get_window_titles(self) -> typing.List[str]:
+        """
+        Returns the titles of all client windows. These are listed in _NET_CLIENT_LIST by EWMH compliant window
+        managers. Without one, the children of the root window are used instead.
+        """
+        window_ids = None
+        if self.__ClientListAtom:
+            clients = self.rootWindow.get_full_property(self.__ClientListAtom, Xatom.WINDOW)
+            if clients is not None:
+                window_ids = list(clients.value)
+        if window_ids is None:
+            window_ids = [child.id for child in self.rootWindow.query_tree().children]
+        titles = []
+        for window_id in window_ids:
+            window = self.localDisplay.create_resource_object("window", window_id)
+            titles.append(self.__lookupWindowInfo(window)[0].wm_title)
+        return titles
+
+    def wait_for_window(self, condition: typing.Callable[[], bool], timeout: float) -> bool:
+        """
+        Wait until condition, which checks some window state like the active window or the window titles, is true.
+        The condition is checked right away and again after every batch of window events seen by the listener, so
+        waiters wake up within one event delivery of the change.
+
+        @param condition: Callable checking the window state, using the methods of this interface
+        @param timeout: Maximum time to wait, in seconds. With 0, the condition is only checked once.
+        @return: True, if the condition became true, False if the timeout elapsed before
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.__windowChanged:
+                changeCount = self.__windowChangeCount
+                watchCount = self.__watchCount
+            if condition():
+                return True
+            with self.__windowChanged:
+                if watchCount != self.__watchCount:
+                    # The condition looked at windows which were not watched before. Changes made to them before
+                    # the watch started were not reported, so check again.
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.__windowChanged.wait_for(lambda: self.__windowChangeCount != changeCount, remaining)
+
     def get_window_title(self, window=None, traverse=True) -> str:
         return self.get_window_info(window, traverse).wm_title
 
@@ -1229,16 +2056,32 @@ class XInterfaceBase(threading.Thread):
 
     def cancel(self):
         logger.debug("XInterfaceBase: Try to exit event thread.")
-        self.queue.put_nowait((None, None))
+        self.queue.put_nowait((None, None, None))
         logger.debug("XInterfaceBase: Event thread exit marker enqueued.")
         self.shutdown = True
-        logger.debug("XInterfaceBase: self.shutdown set to True. This should stop the listener thread.")
+        os.write(self.__wakeupWrite, b"\0")
+        logger.debug("XInterfaceBase: self.shutdown set to True and listener woken up. This should stop the listener thread.")
         self.listenerThread.join()
         self.eventThread.join()
+        self.__cancelQueuedOperations()
+        self.__eventDisplay.close()
+        self.selectionOwner.cancel()
+        os.close(self.__wakeupRead)
+        os.close(self.__wakeupWrite)
         self.localDisplay.flush()
         self.localDisplay.close()
         self.join()
 
+    def __cancelQueuedOperations(self):
+        """Cancel the futures of operations enqueued after the exit marker, so that nobody waits for them forever."""
+        while True:
+            try:
+                method, args, future = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            if future is not None:
+                future.cancel()
+
 
 class XRecordInterface(XInterfaceBase):
 
@@ -1284,19 +2127,23 @@ class XRecordInterface(XInterfaceBase):
             return
         if reply.client_swapped:
             return
-        if not len(reply.data) or str_or_bytes_to_bytes(reply.data)[0] < 2:
+        data = reply.data
+        if isinstance(data, str):
+            data = str_or_bytes_to_bytes(data)
+        if not len(data) or data[0] < 2:
             # not an event
             return
 
-        data = reply.data
-        while len(data):
-            event, data = rq.EventField(None).parse_binary_value(data, self.recordDisplay.display, None, None)
-            if event.type == X.KeyPress:
-                self.handle_keypress(event.detail)
-            elif event.type == X.KeyRelease:
-                self.handle_keyrelease(event.detail)
-            elif event.type == X.ButtonPress:
-                self.handle_mouseclick(event.detail, event.root_x, event.root_y)
+        for event_type, detail, root_x, root_y in decode_record_events(data, self.recordDisplay.display):
+            if event_type in (X.KeyPress, X.KeyRelease) and self.injectedKeys.is_injected(event_type, detail):
+                # Typed by AutoKey using XTEST
+                continue
+            if event_type == X.KeyPress:
+                self.handle_keypress(detail)
+            elif event_type == X.KeyRelease:
+                self.handle_keyrelease(detail)
+            elif event_type == X.ButtonPress:
+                self.handle_mouseclick(detail, root_x, root_y)
 
 
 class AtSpiInterface(XInterfaceBase):
@@ -1334,6 +2181,14 @@ class AtSpiInterface(XInterfaceBase):
 from autokey.model.key import Key, MODIFIERS
 import autokey.configmanager.configmanager as cm
 
+# Modifier keys to hold while typing a keycode, by the keysym offset that produces the character
+OFFSET_MODIFIERS = {
+    0: (),
+    1: (Key.SHIFT,),
+    4: (Key.ALT_GR,),
+    5: (Key.ALT_GR, Key.SHIFT),
+}
+
 XK.load_keysym_group('xkb')
 
 XK_TO_AK_MAP = {
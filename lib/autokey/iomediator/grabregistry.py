@@ -0,0 +1,119 @@
+# Copyright (C) 2011 Chris Dekter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Book-keeping for passive key grabs.
+
+X key grabs are not reference counted: grabbing the same key twice in a window is a no-op and a single ungrab removes
+it. Several hotkeys can map to the same grab (for example two phrases using the same hotkey with different window
+filters), so the registry counts how many owners need each grab and only reports the transitions from and to zero.
+"""
+
+import collections
+import typing
+
+# A single passive grab: (window id, keycode, modifier mask)
+Grab = typing.Tuple[int, int, int]
+GrabSet = typing.Set[Grab]
+
+
+class GrabRegistry:
+    """
+    Records which (window, keycode, mask) grabs are active, and which owners (hotkey items) requested them.
+
+    The registry does not talk to the X server. All update methods return the grabs that have to be added and removed
+    on the server to reach the new state.
+    """
+
+    def __init__(self):
+        self._owner_grabs = {}  # type: typing.Dict[typing.Any, GrabSet]
+        self._refcounts = collections.Counter()  # type: typing.Counter[Grab]
+
+    def update(self, owner, desired: GrabSet, windows: typing.Optional[typing.Set[int]]=None
+               ) -> typing.Tuple[GrabSet, GrabSet]:
+        """
+        Set the grabs requested by owner.
+
+        @param owner: The item requesting the grabs
+        @param desired: All grabs the owner needs. If windows is given, only the grabs in those windows.
+        @param windows: Optional set of window ids. If given, only the grabs of the owner in these windows are
+        replaced, all other grabs of the owner are kept.
+        @return: Tuple (to_grab, to_ungrab) with the grabs to apply on the X server
+        """
+        current = self._owner_grabs.get(owner, set())
+        if windows is None:
+            kept = set()
+            replaced = current
+        else:
+            kept = {grab for grab in current if grab[0] not in windows}
+            replaced = current - kept
+        new = kept | desired
+
+        to_grab = {grab for grab in desired - replaced if self._acquire(grab)}
+        to_ungrab = {grab for grab in replaced - desired if self._release(grab)}
+
+        if new:
+            self._owner_grabs[owner] = new
+        else:
+            self._owner_grabs.pop(owner, None)
+        return to_grab, to_ungrab
+
+    def release(self, owner) -> GrabSet:
+        """
+        Drop all grabs requested by owner.
+
+        @return: The grabs that are no longer needed by any owner and have to be removed on the X server
+        """
+        current = self._owner_grabs.pop(owner, set())
+        return {grab for grab in current if self._release(grab)}
+
+    def forget_windows(self, window_ids: typing.Set[int]):
+        """
+        Drop all grabs in the given windows, without reporting them. Used for destroyed windows, as the X server
+        removes their grabs on its own.
+        """
+        for owner in list(self._owner_grabs):
+            grabs = self._owner_grabs[owner]
+            gone = {grab for grab in grabs if grab[0] in window_ids}
+            if gone:
+                grabs -= gone
+                if not grabs:
+                    del self._owner_grabs[owner]
+        for grab in [grab for grab in self._refcounts if grab[0] in window_ids]:
+            del self._refcounts[grab]
+
+    def owners(self) -> typing.List:
+        return list(self._owner_grabs)
+
+    def grabs_of(self, owner) -> GrabSet:
+        return set(self._owner_grabs.get(owner, ()))
+
+    def is_grabbed(self, grab: Grab) -> bool:
+        return grab in self._refcounts
+
+    def __len__(self):
+        """Number of distinct grabs active on the X server."""
+        return len(self._refcounts)
+
+    def _acquire(self, grab: Grab) -> bool:
+        self._refcounts[grab] += 1
+        return self._refcounts[grab] == 1
+
+    def _release(self, grab: Grab) -> bool:
+        self._refcounts[grab] -= 1
+        if self._refcounts[grab] <= 0:
+            del self._refcounts[grab]
+            return True
+        return False
@@ -13,9 +13,13 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import concurrent.futures
+import functools
 import threading
+import typing
 import queue
 
+from autokey import stats
 from autokey.configmanager.configmanager import ConfigManager
 from autokey.configmanager.configmanager_constants import INTERFACE_TYPE
 from autokey.interface import XRecordInterface, AtSpiInterface
@@ -23,6 +27,9 @@ from autokey.model.phrase import SendMode
 
 from autokey.model.key import Key, KEY_SPLIT_RE, MODIFIERS, HELD_MODIFIERS
 from .constants import X_RECORD_INTERFACE
+from .sendmode import SendModeSelector
+from .sendstream import SendHandle, StreamSource, ProgressCallback, iter_chunks, MAX_CHUNKS_IN_FLIGHT, \
+    CANCEL_POLL_INTERVAL
 from .waiter import Waiter
 
 CURRENT_INTERFACE = None
@@ -46,9 +53,13 @@ class IoMediator(threading.Thread):
         threading.Thread.__init__(self, name="KeypressHandler-thread")
 
         self.queue = queue.Queue()
+        self.service = service
         self.listeners.append(service)
         self.interfaceType = ConfigManager.SETTINGS[INTERFACE_TYPE]
         self.waiter = Waiter
+        self.send_mode_selector = SendModeSelector()
+        self._streams = set()  # type: typing.Set[SendHandle]
+        self._streams_lock = threading.Lock()
         
         # Modifier tracking
         self.modifiers = {
@@ -75,7 +86,7 @@ class IoMediator(threading.Thread):
     def shutdown(self):
         logger.debug("IoMediator shutting down")
         self.interface.cancel()
-        self.queue.put_nowait((None, None))
+        self.queue.put_nowait((None, None, False))
         logger.debug("Waiting for IoMediator thread to end")
         self.join()
         logger.debug("IoMediator shutdown completed")
@@ -108,16 +119,19 @@ class IoMediator(threading.Thread):
         if modifier not in (Key.CAPSLOCK, Key.NUMLOCK):
             self.modifiers[modifier] = False
 
-    def handle_keypress(self, key_code, window_info):
+    def handle_keypress(self, key_code, window_info, during_send: bool=False):
         """
         Looks up the character for the given key code, applying any 
         modifiers currently in effect, and passes it to the expansion service.
+
+        @param during_send: The key was typed while AutoKey sent keys. The interface replays it after the send, so it
+        is not used for abbreviations, waiters and recorders. Only the global hotkeys are checked.
         """
-        self.queue.put_nowait((key_code, window_info))
+        self.queue.put_nowait((key_code, window_info, during_send))
         
     def run(self):
         while True:
-            key_code, window_info = self.queue.get()
+            key_code, window_info, during_send = self.queue.get()
             if key_code is None and window_info is None:
                 break
             
@@ -127,10 +141,14 @@ class IoMediator(threading.Thread):
             key = self.interface.lookup_string(key_code, shifted, num_lock, self.modifiers[Key.ALT_GR])
             raw_key = self.interface.lookup_string(key_code, False, False, False)
 
-            # We make a copy here because the wait_for... functions modify the listeners,
-            # and we want this processing cycle to complete before changing what happens
-            for target in self.listeners.copy():
-                target.handle_keypress(raw_key, modifiers, key, window_info)
+            if during_send:
+                stats.increment("typeahead.keys_held_from_matching")
+                self.service.handle_keypress_during_send(raw_key, modifiers, key, window_info)
+            else:
+                # We make a copy here because the wait_for... functions modify the listeners,
+                # and we want this processing cycle to complete before changing what happens
+                for target in self.listeners.copy():
+                    target.handle_keypress(raw_key, modifiers, key, window_info)
 
             self.queue.task_done()
             
@@ -142,18 +160,41 @@ class IoMediator(threading.Thread):
         
     # Methods for expansion service ----
 
-    def send_string(self, string: str):
+    def resolve_send_mode(self, string: str, send_mode: SendMode) -> SendMode:
+        """
+        Returns the send mode to use for string. SendMode.AUTO is resolved for the active window, all other modes are
+        returned unchanged.
+        """
+        if send_mode is not SendMode.AUTO:
+            return send_mode
+        window_class = self.interface.get_window_info().wm_class
+        return self.send_mode_selector.choose(string, window_class)
+
+    def send_string(self, string: str, use_xtest: bool=False):
         """
         Sends the given string for output.
+
+        @param use_xtest: Type printable characters using the XTEST extension instead of synthetic key events
         """
         if not string:
             return
 
-        string = string.replace('\n', "<enter>")
-        string = string.replace('\t', "<tab>")
-        
         logger.debug("Send via event interface")
         self._clear_modifiers()
+        for method_name, args in self._string_operations(string, use_xtest):
+            getattr(self.interface, method_name)(*args)
+        self._reapply_modifiers()
+
+    def _string_operations(self, string: str, use_xtest: bool) -> typing.List[typing.Tuple[str, tuple]]:
+        """
+        Split the string into the interface calls needed to type it.
+
+        @return: List of (interface method name, arguments) tuples
+        """
+        string = string.replace('\n', "<enter>")
+        string = string.replace('\t', "<tab>")
+
+        operations = []
         modifiers = []
         for section in KEY_SPLIT_RE.split(string):
             if len(section) > 0:
@@ -165,22 +206,97 @@ class IoMediator(threading.Thread):
                     if len(modifiers) > 0:
                         # Modifiers ready for application - send modified key
                         if Key.is_key(section):
-                            self.interface.send_modified_key(section, modifiers)
+                            operations.append(("send_modified_key", (section, modifiers)))
                             modifiers = []
                         else:
-                            self.interface.send_modified_key(section[0], modifiers)
+                            operations.append(("send_modified_key", (section[0], modifiers)))
                             if len(section) > 1:
-                                self.interface.send_string(section[1:])
+                                operations.append(("send_string", (section[1:], use_xtest)))
                             modifiers = []
                     else:
                         # Normal string/key operation
                         if Key.is_key(section):
-                            self.interface.send_key(section)
+                            operations.append(("send_key", (section,)))
                         else:
-                            self.interface.send_string(section)
-                            
-        self._reapply_modifiers()
-        
+                            operations.append(("send_string", (section, use_xtest)))
+        return operations
+
+    def send_stream(self, source: StreamSource, use_xtest: bool=False,
+                    progress_callback: typing.Optional[ProgressCallback]=None) -> SendHandle:
+        """
+        Type a large string, or the strings produced by an iterable, in bounded chunks from a background thread.
+
+        Only a few chunks are queued at a time, so the X event thread stays responsive and the stream can be cancelled
+        using the returned handle, or using the global cancel hotkey. Cancelling releases the keyboard grab
+        immediately.
+
+        @param source: A string, or an iterable of strings, like a generator
+        @param use_xtest: Type printable characters using the XTEST extension instead of synthetic key events
+        @param progress_callback: Called from the streaming thread with the number of characters typed so far
+        @return: Handle to wait for or cancel the send
+        """
+        handle = SendHandle(progress_callback)
+        handle.on_cancel(self.interface.release_keyboard_grab)
+        with self._streams_lock:
+            self._streams.add(handle)
+        thread = threading.Thread(
+            target=self._run_stream, args=(handle, source, use_xtest), name="SendStream-thread", daemon=True)
+        thread.start()
+        return handle
+
+    def cancel_sends(self):
+        """Cancel all running streamed sends."""
+        with self._streams_lock:
+            streams = list(self._streams)
+        for handle in streams:
+            handle.cancel()
+
+    def _run_stream(self, handle: SendHandle, source: StreamSource, use_xtest: bool):
+        slots = threading.Semaphore(MAX_CHUNKS_IN_FLIGHT)
+
+        def chunk_done(length: int):
+            handle.add_sent(length)
+            slots.release()
+
+        self.interface.begin_send()
+        self._clear_modifiers()
+        released_modifiers = list(self.releasedModifiers)
+        try:
+            for chunk in iter_chunks(source):
+                if not self._acquire_slot(slots, handle):
+                    break
+                handle.report_progress()
+                stats.increment("send_stream.chunks")
+                self.interface.send_operations(
+                    self._string_operations(chunk, use_xtest),
+                    lambda: handle.cancelled,
+                    functools.partial(chunk_done, len(chunk)))
+        except Exception as e:
+            handle.error = e
+            logger.exception("Error in streamed send")
+        finally:
+            # Wait for the queued chunks, unless they are dropped anyway.
+            for _ in range(MAX_CHUNKS_IN_FLIGHT):
+                if not self._acquire_slot(slots, handle):
+                    break
+            handle.report_progress()
+            for modifier in released_modifiers:
+                self.interface.press_key(modifier)
+            self.interface.finish_send()
+            if handle.cancelled:
+                stats.increment("send_stream.cancelled")
+            with self._streams_lock:
+                self._streams.discard(handle)
+            handle.finish()
+
+    @staticmethod
+    def _acquire_slot(slots: threading.Semaphore, handle: SendHandle) -> bool:
+        """Wait for space in the event queue. Returns False, if the stream was cancelled while waiting."""
+        while not handle.cancelled:
+            if slots.acquire(timeout=CANCEL_POLL_INTERVAL):
+                return True
+        return False
+
     def paste_string(self, string, paste_command: SendMode):
         if len(string) > 0:
             logger.debug("Send via clipboard")
@@ -204,19 +320,19 @@ class IoMediator(threading.Thread):
 
     def send_key(self, key_name):
         key_name = key_name.replace('\n', "<enter>")
-        self.interface.send_key(key_name)
+        return self.interface.send_key(key_name)
 
     def press_key(self, key_name):
         key_name = key_name.replace('\n', "<enter>")
-        self.interface.fake_keydown(key_name)
+        return self.interface.fake_keydown(key_name)
 
     def release_key(self, key_name):
         key_name = key_name.replace('\n', "<enter>")
-        self.interface.fake_keyup(key_name)
+        return self.interface.fake_keyup(key_name)
 
     def fake_keypress(self, key_name):
         key_name = key_name.replace('\n', "<enter>")
-        self.interface.fake_keypress(key_name)
+        return self.interface.fake_keypress(key_name)
 
     def send_left(self, count):
         """
@@ -244,7 +360,13 @@ class IoMediator(threading.Thread):
             self.interface.send_key(Key.BACKSPACE)
 
     def flush(self):
-        self.interface.flush()
+        return self.interface.flush()
+
+    def barrier(self) -> concurrent.futures.Future:
+        """
+        Returns a future, that resolves once all output queued so far was sent to the X server.
+        """
+        return self.interface.barrier()
         
     # Utility methods ----
     
@@ -0,0 +1,178 @@
+# Copyright (C) 2011 Chris Dekter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Selection of the send mode for phrases using SendMode.AUTO.
+
+Typing is cheap for short strings, but each key event has to be processed by the target application, so long
+expansions are much faster to paste. Pasting has a fixed overhead, as the target application has to fetch the content
+from the clipboard. The selector estimates the time of each method with a linear model (overhead + cost per
+character), which is continuously calibrated from the send times measured by the interface.
+
+The choice is constrained by the content and the active window:
+ - Special keys like <enter> or <ctrl>+a can only be typed. Pasting would insert their literal representation.
+ - Rules in the SEND_MODE_RULES setting map WM_CLASS regular expressions to send modes. A keyboard mode (KEYBOARD,
+   XTEST) forces that mode for the window. A paste mode (clipboard or SELECTION) selects the paste command used for the
+   window when pasting is cheaper, for example <ctrl>+<shift>+v in terminal emulators. The first matching rule wins.
+"""
+
+import re
+import threading
+import typing
+
+from autokey import stats
+from autokey.configmanager.configmanager import ConfigManager
+from autokey.configmanager.configmanager_constants import SEND_MODE_RULES
+from autokey.model.key import KEY_FIND_RE
+from autokey.model.phrase import SendMode
+
+logger = __import__("autokey.logger").logger.get_logger(__name__)
+
+KEYSTROKE_MODES = (SendMode.KEYBOARD, SendMode.XTEST)
+DEFAULT_PASTE_MODE = SendMode.CB_CTRL_V
+# Time the target application needs to process a single typed key. The interface can only measure the time to emit
+# the key events, not the time until they are handled, so this part of the keystroke cost is assumed.
+KEYSTROKE_PROCESSING_TIME = 0.001
+# Initial model parameters (overhead in seconds, seconds per character), until enough sends were measured.
+DEFAULT_COSTS = {
+    SendMode.KEYBOARD: (0.0005, 0.0001),
+    SendMode.XTEST: (0.0005, 0.0002),
+    # Shared by all paste modes. Measured until the target application fetched the content.
+    DEFAULT_PASTE_MODE: (0.03, 0.000001),
+}
+# Weight of older samples is multiplied by this factor for each new sample, so the model follows changes.
+SAMPLE_DECAY = 0.95
+# The defaults enter the model as samples of these lengths, so that a single measurement does not dominate.
+PRIOR_SAMPLE_LENGTHS = (1, 100)
+
+
+class CostModel:
+    """
+    Estimated send time of a string as overhead + per_char * length, fitted with exponentially decaying weights to
+    the measured send times.
+    """
+
+    def __init__(self, overhead: float, per_char: float):
+        self.overhead = overhead
+        self.per_char = per_char
+        # Weighted sums: weight, length, seconds, length², length * seconds
+        self._sums = [0.0] * 5
+        for length in PRIOR_SAMPLE_LENGTHS:
+            self._add(length, overhead + per_char * length)
+
+    def estimate(self, length: int) -> float:
+        return self.overhead + self.per_char * length
+
+    def add_sample(self, length: int, seconds: float):
+        self._sums = [value * SAMPLE_DECAY for value in self._sums]
+        self._add(length, seconds)
+        self._fit()
+
+    def _add(self, length: int, seconds: float):
+        for index, value in enumerate((1.0, length, seconds, length * length, length * seconds)):
+            self._sums[index] += value
+
+    def _fit(self):
+        weight, sum_length, sum_seconds, sum_length_squared, sum_product = self._sums
+        mean_length = sum_length / weight
+        mean_seconds = sum_seconds / weight
+        variance = sum_length_squared / weight - mean_length * mean_length
+        if variance > 1e-9:
+            per_char = (sum_product / weight - mean_length * mean_seconds) / variance
+        else:
+            per_char = self.per_char
+        per_char = max(0.0, per_char)
+        self.per_char = per_char
+        self.overhead = max(0.0, mean_seconds - per_char * mean_length)
+
+
+class SendModeSelector:
+    """
+    Chooses the send mode for SendMode.AUTO and keeps the cost models up to date. Thread-safe.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models = {mode: CostModel(*costs) for mode, costs in DEFAULT_COSTS.items()}
+        self._compiled_rules = None  # type: typing.Optional[typing.List[typing.Tuple[typing.Pattern, SendMode]]]
+        self._rule_source = None
+
+    def choose(self, string: str, wm_class: str) -> SendMode:
+        """
+        Choose the send mode for string, which is going to be sent to a window of the given class.
+
+        @param string: The string to send, after processing the macros
+        @param wm_class: WM_CLASS of the window receiving the string
+        @return: The send mode to use. Never SendMode.AUTO.
+        """
+        rule_mode = self._match_rule(wm_class)
+        if rule_mode in KEYSTROKE_MODES:
+            mode = rule_mode
+        else:
+            paste_mode = DEFAULT_PASTE_MODE if rule_mode is None else rule_mode
+            candidates = list(KEYSTROKE_MODES)
+            if not KEY_FIND_RE.search(string.lower()):
+                candidates.append(paste_mode)
+            mode = min(candidates, key=lambda candidate: self.estimate(candidate, len(string)))
+        logger.debug("Automatic send mode for %d characters in window class %r: %s", len(string), wm_class, mode)
+        stats.increment("send_mode.auto.{}".format(mode.name.lower()))
+        return mode
+
+    def estimate(self, mode: SendMode, length: int) -> float:
+        """Estimated time in seconds to send a string of the given length using mode."""
+        with self._lock:
+            seconds = self._model(mode).estimate(length)
+        if mode in KEYSTROKE_MODES:
+            seconds += KEYSTROKE_PROCESSING_TIME * length
+        return seconds
+
+    def record(self, mode: SendMode, length: int, seconds: float):
+        """Add a measured send time to the cost model of mode."""
+        if length <= 0:
+            return
+        stats.record("send_mode.{}.seconds".format(mode.name.lower()), seconds)
+        stats.record("send_mode.{}.seconds_per_char".format(mode.name.lower()), seconds / length)
+        with self._lock:
+            self._model(mode).add_sample(length, seconds)
+
+    def _model(self, mode: SendMode) -> CostModel:
+        if mode in KEYSTROKE_MODES:
+            return self._models[mode]
+        return self._models[DEFAULT_PASTE_MODE]
+
+    def _match_rule(self, wm_class: str) -> typing.Optional[SendMode]:
+        for pattern, mode in self._rules():
+            if pattern.match(wm_class):
+                return mode
+        return None
+
+    def _rules(self) -> typing.List[typing.Tuple[typing.Pattern, SendMode]]:
+        source = ConfigManager.SETTINGS[SEND_MODE_RULES]
+        with self._lock:
+            if self._compiled_rules is not None and source == self._rule_source:
+                return self._compiled_rules
+        compiled = []
+        for regex, value in source:
+            try:
+                mode = SendMode(value)
+                if mode is SendMode.AUTO:
+                    raise ValueError("AUTO can not be used in a send mode rule")
+                compiled.append((re.compile(regex), mode))
+            except (re.error, ValueError) as e:
+                logger.error("Ignoring invalid send mode rule %r -> %r: %s", regex, value, e)
+        with self._lock:
+            self._compiled_rules = compiled
+            self._rule_source = [list(rule) for rule in source]
+        return compiled
@@ -0,0 +1,166 @@
+# Copyright (C) 2011 Chris Dekter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Chunked sending of large strings.
+
+Typing a large string used to occupy the X event thread with a single queue item, which could not be interrupted and
+delayed all other events (including the key presses of a hotkey meant to stop it) until the whole string was typed.
+Streams split the content into bounded chunks. Only a few chunks are queued at any time, so that other events are
+handled in between, and a cancelled stream drops the remaining chunks.
+"""
+
+import re
+import threading
+import typing
+
+logger = __import__("autokey.logger").logger.get_logger(__name__)
+
+# Number of source characters sent as a single event queue item.
+STREAM_CHUNK_SIZE = 256
+# Number of chunks waiting in the event queue. The producer blocks, until one of them was typed.
+MAX_CHUNKS_IN_FLIGHT = 2
+# Interval at which a producer waiting for queue space checks for cancellation.
+CANCEL_POLL_INTERVAL = 0.05
+# Unterminated "<" this close to the end of a chunk is assumed to start a key name, like <enter> or <code65>, and is
+# moved to the next chunk, instead of typing half of a key name.
+MAX_KEY_NAME_LENGTH = 32
+
+_TRAILING_MODIFIERS_RE = re.compile(r"(<[^<>]+>\+)+$")
+
+StreamSource = typing.Union[str, typing.Iterable[str]]
+ProgressCallback = typing.Callable[[int], None]
+
+
+class SendHandle:
+    """
+    Handle of a streamed send, used to follow its progress, to wait for it and to cancel it. Thread-safe.
+    """
+
+    def __init__(self, progress_callback: typing.Optional[ProgressCallback]=None):
+        self._progress_callback = progress_callback
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._done = threading.Event()
+        self._cancel_callbacks = []  # type: typing.List[typing.Callable[[], None]]
+        self._sent = 0
+        self._reported = 0
+        self.error = None  # type: typing.Optional[Exception]
+
+    @property
+    def sent(self) -> int:
+        """Number of characters of the source that were typed so far."""
+        with self._lock:
+            return self._sent
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def done(self) -> bool:
+        """True, when the send finished, either completely, cancelled or because of an error."""
+        return self._done.is_set()
+
+    def cancel(self):
+        """Stop sending. Content already typed can not be taken back. Queued chunks are dropped."""
+        with self._lock:
+            if self._cancelled.is_set() or self._done.is_set():
+                return
+            self._cancelled.set()
+            callbacks = list(self._cancel_callbacks)
+        logger.info("Cancelled streamed send after %d characters", self.sent)
+        for callback in callbacks:
+            callback()
+
+    def wait(self, timeout: typing.Optional[float]=None) -> bool:
+        """
+        Block until the send finished.
+
+        @return: True, if the send finished, False if the timeout expired
+        """
+        return self._done.wait(timeout)
+
+    def on_cancel(self, callback: typing.Callable[[], None]):
+        """Register a callable, that is called from the cancelling thread, when the send is cancelled."""
+        with self._lock:
+            self._cancel_callbacks.append(callback)
+
+    def add_sent(self, count: int):
+        with self._lock:
+            self._sent += count
+
+    def report_progress(self):
+        """Call the progress callback, if characters were sent since the last report."""
+        with self._lock:
+            sent = self._sent
+            if self._progress_callback is None or sent == self._reported:
+                return
+            self._reported = sent
+        try:
+            self._progress_callback(sent)
+        except Exception:
+            logger.exception("Error in the progress callback of a streamed send")
+
+    def finish(self):
+        self._done.set()
+
+
+def iter_chunks(source: StreamSource, chunk_size: int=STREAM_CHUNK_SIZE) -> typing.Iterator[str]:
+    """
+    Split the source into chunks of at most chunk_size characters, which can be sent one after another.
+
+    Chunks are not split inside of key names (<enter>), and modifier applications (<ctrl>+) stay in the same chunk as
+    the key they modify. Because of that, chunks can be slightly shorter than chunk_size.
+
+    @param source: A string, or an iterable of strings of any length, like a generator or a file opened in text mode
+    @raise TypeError: If the source produces something else than strings
+    """
+    if isinstance(source, str):
+        pieces = _slices(source, chunk_size)  # type: typing.Iterable[str]
+    else:
+        pieces = source
+    pending = ""
+    for piece in pieces:
+        if not isinstance(piece, str):
+            raise TypeError("Only strings can be sent, got {}".format(type(piece)))
+        pending += piece
+        start = 0
+        while len(pending) - start >= chunk_size:
+            end = _chunk_end(pending, start, chunk_size)
+            yield pending[start:end]
+            start = end
+        # Keep only the unsent remainder, so that long pieces are not copied once per chunk.
+        pending = pending[start:]
+    if pending:
+        yield pending
+
+
+def _slices(text: str, size: int) -> typing.Iterator[str]:
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
+
+
+def _chunk_end(text: str, start: int, chunk_size: int) -> int:
+    end = start + chunk_size
+    chunk = text[start:end]
+    key_start = chunk.rfind("<")
+    if 0 < key_start and ">" not in chunk[key_start:] and len(chunk) - key_start <= MAX_KEY_NAME_LENGTH:
+        end = start + key_start
+        chunk = chunk[:key_start]
+    modifiers = _TRAILING_MODIFIERS_RE.search(chunk)
+    if modifiers is not None and modifiers.start() > 0:
+        end = start + modifiers.start()
+    return end
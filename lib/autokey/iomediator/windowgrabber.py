@@ -18,6 +18,7 @@
 import time
 import threading
 
+from autokey.interface import WindowInfo
 from .iomediator import IoMediator
 
 SEND_LOCK = threading.Lock()  # TODO: This is never accessed anywhere. Does creating this lock do anything?
@@ -37,4 +38,5 @@ class WindowGrabber:
 
     def handle_mouseclick(self, root_x, root_y, rel_x, rel_y, button, window_info):
         IoMediator.listeners.remove(self)
-        self.dialog.receive_window_info(window_info)
+        # Read the window information now, while the clicked window still has the focus.
+        self.dialog.receive_window_info(WindowInfo(*window_info))
@@ -0,0 +1,114 @@
+# Copyright (C) 2021 BlueDrink9
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Phrase texts and script sources are not kept in memory after loading. They are read from their files on first use,
+and kept in a bounded least recently used cache. Only the metadata used for matching and for the menus stays resident.
+
+Cached contents are validated using the modification time and size of the file, so that a file changed or replaced
+on disk is read again, even if the change was not reported by the file monitor.
+"""
+
+import collections
+import os
+import threading
+import typing
+
+from autokey.model.helpers import read_file, decode_text
+
+# Total length of the cached texts, in characters
+CONTENT_CACHE_SIZE = 8 << 20
+# Texts longer than this are read from the file on every use, so that a single large phrase does not evict all others
+MAX_CACHED_LENGTH = CONTENT_CACHE_SIZE // 4
+
+# (modification time in ns, size, encoding, text)
+_Entry = typing.Tuple[int, int, typing.Optional[str], str]
+
+
+class ContentCache:
+    """
+    Least recently used cache of file contents, bounded by the total length of the texts. Thread-safe.
+
+    @param size: Maximum total length of the cached texts
+    @param max_length: Longer texts are not cached
+    """
+
+    def __init__(self, size: int=CONTENT_CACHE_SIZE, max_length: int=MAX_CACHED_LENGTH):
+        self.size = size
+        self.max_length = max_length
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()  # type: typing.MutableMapping[str, _Entry]
+        self._length = 0
+        self.hits = 0
+        self.misses = 0
+
+    def read(self, path: str, encoding: str=None) -> str:
+        """
+        Returns the text of the file, decoded like open(path, "r", encoding=encoding).read() does.
+
+        @raise OSError: If the file cannot be read
+        @raise UnicodeDecodeError: If the file is not valid in the encoding
+        """
+        stat = os.stat(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[:3] == (stat.st_mtime_ns, stat.st_size, encoding):
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[3]
+            self.misses += 1
+        text = decode_text(read_file(path), encoding)
+        self._store(path, stat, encoding, text)
+        return text
+
+    def written(self, path: str, encoding: str, text: str):
+        """Called after writing text to the file, so that the next read does not read it back."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.discard(path)
+        else:
+            self._store(path, stat, encoding, text)
+
+    def discard(self, path: str):
+        with self._lock:
+            entry = self._entries.pop(path, None)
+            if entry is not None:
+                self._length -= len(entry[3])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._length = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _store(self, path: str, stat: os.stat_result, encoding: str, text: str):
+        with self._lock:
+            entry = self._entries.pop(path, None)
+            if entry is not None:
+                self._length -= len(entry[3])
+            if len(text) > self.max_length:
+                return
+            self._entries[path] = (stat.st_mtime_ns, stat.st_size, encoding, text)
+            self._length += len(text)
+            while self._length > self.size:
+                _, evicted = self._entries.popitem(last=False)
+                self._length -= len(evicted[3])
+
+
+# Shared by all phrases and scripts
+content_cache = ContentCache()
@@ -0,0 +1,238 @@
+# Copyright (C) 2021 BlueDrink9
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Atomic writing of the configuration and metadata files, in a background thread.
+
+Each file is written to a temporary file in the same directory, synced to disk and renamed over the old file. A reader,
+like the file monitor, another AutoKey process or the user's editor, sees either the old or the new contents, never a
+truncated file, and a crash while writing keeps the old file.
+
+The JSON files are written by L{FileWriter}, off the thread that changed the configuration. Saves of the same file
+within a short window are merged into one write, and the files of one window are synced together.
+"""
+
+import atexit
+import collections
+import os
+import shutil
+import stat
+import threading
+import time
+import typing
+import uuid
+
+from autokey.model.own_writes import own_writes
+
+logger = __import__("autokey.logger").logger.get_logger(__name__)
+
+# Seconds without a new save, before the pending files are written
+WRITE_DELAY = 0.2
+# Longest delay of a write, while saves keep arriving
+MAX_DELAY = 2.0
+TEMPORARY_SUFFIX = ".autokey-tmp"
+
+_Write = typing.NamedTuple("_Write", [
+    ("text", str),
+    ("encoding", typing.Optional[str]),
+    ("backup_path", typing.Optional[str]),  # The old file is copied here before it is replaced
+])
+
+
+def is_temporary(path: str) -> bool:
+    """Returns True, if the path is a temporary file of an unfinished write."""
+    return path.endswith(TEMPORARY_SUFFIX)
+
+
+def write_atomic(path: str, text: str, encoding: str=None, backup_path: str=None):
+    """
+    Write the file at once, in the calling thread. Used for files that are read back directly after writing them.
+
+    @param encoding: The encoding, as used by open(). None uses the locale encoding.
+    @param backup_path: If given, an existing file is copied to this path before it is replaced.
+    @raise OSError: If the file cannot be written. The old file is not changed then.
+    """
+    _write_files({path: _Write(text, encoding, backup_path)}, raise_errors=True)
+
+
+def _write_files(writes: typing.Mapping[str, _Write], raise_errors: bool=False):
+    # Write and sync all temporary files first, then rename them and sync each directory once
+    staged = []
+    for path, write in writes.items():
+        try:
+            staged.append((path, _write_temporary(path, write), write))
+        except OSError:
+            if raise_errors:
+                raise
+            logger.exception("Cannot write {}".format(path))
+
+    directories = set()
+    for path, temporary_path, write in staged:
+        try:
+            if write.backup_path is not None and os.path.exists(path):
+                shutil.copy2(path, write.backup_path)
+            os.replace(temporary_path, path)
+        except OSError:
+            _remove_quietly(temporary_path)
+            if raise_errors:
+                raise
+            logger.exception("Cannot replace {}".format(path))
+            continue
+        if write.backup_path is not None:
+            own_writes.written(path, write.backup_path)
+        else:
+            own_writes.written(path)
+        directories.add(os.path.dirname(path))
+
+    for directory in directories:
+        _sync_directory(directory)
+
+
+def _write_temporary(path: str, write: _Write) -> str:
+    directory, base_name = os.path.split(path)
+    temporary_path = os.path.join(directory, ".{}.{}{}".format(base_name, uuid.uuid4().hex[:8], TEMPORARY_SUFFIX))
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except OSError:
+        mode = 0o666  # Like open(), limited by the umask
+    fd = os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, mode)
+    try:
+        with open(fd, "w", encoding=write.encoding) as temporary_file:
+            temporary_file.write(write.text)
+            temporary_file.flush()
+            os.fsync(temporary_file.fileno())
+    except (OSError, UnicodeError) as e:
+        _remove_quietly(temporary_path)
+        if isinstance(e, UnicodeError):
+            raise OSError("Cannot encode {}: {}".format(path, e)) from e
+        raise
+    return temporary_path
+
+
+def _sync_directory(directory: str):
+    # Makes the renames durable
+    try:
+        fd = os.open(directory or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class FileWriter:
+    """
+    Writes files in a background thread. Thread-safe.
+
+    Only the latest text given for a path is written. The pending files are written once no new save arrived for the
+    delay, or after max_delay since the first pending save. L{flush} writes them at once.
+
+    @param delay: Seconds without a new save, before the pending files are written
+    @param max_delay: Longest delay of a write, while saves keep arriving
+    """
+
+    def __init__(self, delay: float=WRITE_DELAY, max_delay: float=MAX_DELAY,
+                 clock: typing.Callable[[], float]=time.monotonic):
+        self.delay = delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self._condition = threading.Condition()
+        self._pending = collections.OrderedDict()  # type: typing.MutableMapping[str, _Write]
+        self._first_save = None  # type: typing.Optional[float]
+        self._last_save = None  # type: typing.Optional[float]
+        # Set while a batch is written, so that a flush does not overtake a write of older contents
+        self._writing = False
+        self._thread = None  # type: typing.Optional[threading.Thread]
+
+    def write(self, path: str, text: str, encoding: str=None, backup_path: str=None):
+        """
+        Queue the text to be written to the path. Returns immediately.
+
+        @param encoding: The encoding, as used by open(). None uses the locale encoding.
+        @param backup_path: If given, the existing file is copied to this path before it is replaced.
+        """
+        with self._condition:
+            self._pending.pop(path, None)
+            self._pending[path] = _Write(text, encoding, backup_path)
+            now = self.clock()
+            if self._first_save is None:
+                self._first_save = now
+            self._last_save = now
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="FileWriter", daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def pending(self) -> typing.List[str]:
+        """The paths waiting to be written."""
+        with self._condition:
+            return list(self._pending)
+
+    def flush(self):
+        """Write all pending files in the calling thread, and wait until a running write is finished."""
+        batch = self._take_batch(wait=False)
+        if batch is not None:
+            self._write_batch(batch)
+
+    def _timeout(self) -> float:
+        # Seconds until the pending files are due
+        now = self.clock()
+        return min(self._last_save + self.delay, self._first_save + self.max_delay) - now
+
+    def _take_batch(self, wait: bool) -> typing.Optional[typing.Dict[str, _Write]]:
+        with self._condition:
+            while True:
+                if self._writing:
+                    self._condition.wait()
+                elif not self._pending:
+                    if not wait:
+                        return None
+                    self._condition.wait()
+                elif wait and self._timeout() > 0:
+                    self._condition.wait(self._timeout())
+                else:
+                    break
+            batch = dict(self._pending)
+            self._pending.clear()
+            self._first_save = self._last_save = None
+            self._writing = True
+            return batch
+
+    def _write_batch(self, batch: typing.Dict[str, _Write]):
+        try:
+            _write_files(batch)
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+    def _run(self):
+        while True:
+            self._write_batch(self._take_batch(wait=True))
+
+
+# Used by the model and the ConfigManager. Pending files are written when AutoKey exits.
+file_writer = FileWriter()
+atexit.register(file_writer.flush)
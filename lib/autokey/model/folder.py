@@ -14,8 +14,8 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import concurrent.futures
 import errno
-import glob
 import json
 import os
 import typing
@@ -23,7 +23,9 @@ import typing
 from autokey.configmanager import configmanager_constants as cm_constants
 from autokey.model.phrase import Phrase
 from autokey.model.script import Script
-from autokey.model.helpers import get_safe_path, TriggerMode
+from autokey.model.helpers import get_safe_path, read_metadata_file, parse_metadata, TriggerMode
+from autokey.model.file_writer import file_writer
+from autokey.model.own_writes import own_writes
 from autokey.model.abstract_abbreviation import AbstractAbbreviation
 from autokey.model.abstract_window_filter import AbstractWindowFilter
 from autokey.model.abstract_hotkey import AbstractHotkey
@@ -31,6 +33,13 @@ from autokey.model.abstract_hotkey import AbstractHotkey
 
 logger = __import__("autokey.logger").logger.get_logger(__name__)
 
+# Threads reading the files of phrases, scripts and folders while loading a folder tree. Reading is I/O bound, so the
+# threads mostly help with cold caches and network file systems.
+LOAD_THREADS = 8
+# Files of a directory are read in chunks of this many items per thread pool job. A job per file costs more in
+# synchronisation than reading a small file.
+LOAD_CHUNK_SIZE = 64
+
 
 class Folder(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
     """
@@ -68,8 +77,8 @@ class Folder(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         if not os.path.exists(self.path):
             os.mkdir(self.path)
 
-        with open(self.path + "/folder.json", 'w') as outFile:
-            json.dump(self.get_serializable(), outFile, indent=4)
+        own_writes.written(self.path)
+        file_writer.write(self.get_json_path(), json.dumps(self.get_serializable(), indent=4))
 
     def get_serializable(self):
         d = {
@@ -85,43 +94,67 @@ class Folder(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         return d
 
     def load(self, parent=None):
-        self.parent = parent
-
-        if os.path.exists(self.get_json_path()):
-            self.load_from_serialized()
-        else:
-            self.title = os.path.basename(self.path)
-
-        self.load_children()
+        load_folders([self], parent)
 
     def load_children(self):
-        entries = glob.glob(self.path + "/*")
+        _load_trees([self], None, load_metadata=False)
+
+    def _scan(self, jobs: list, parent=None, load_metadata: bool=True):
+        """
+        Build the subtree of this folder from the directory listing. The files to read are appended to jobs, as
+        (model object, parent, has metadata file) tuples.
+        """
         self.folders = []
         self.items = []
-
-        for entryPath in entries:
-            #entryPath = self.path + '/' + entry
-            if os.path.isdir(entryPath):
+        try:
+            with os.scandir(self.path) as directory:
+                entries = list(directory)
+        except OSError:
+            entries = []
+        names = {entry.name: entry for entry in entries}
+
+        if load_metadata:
+            jobs.append((self, parent, _entry_exists(names.get("folder.json"))))
+
+        for entry in entries:
+            # Hidden entries are skipped, like the glob pattern used before.
+            if entry.name.startswith("."):
+                continue
+            entryPath = self.path + "/" + entry.name
+            if entry.is_dir():
                 f = Folder("", path=entryPath)
-                f.load(self)
+                f._scan(jobs, self)
                 self.folders.append(f)
 
-            if os.path.isfile(entryPath):
+            elif entry.is_file():
                 i = None
-                if entryPath.endswith(".txt"):
+                if entry.name.endswith(".txt"):
                     i = Phrase("", "", path=entryPath)
-                elif entryPath.endswith(".py"):
+                elif entry.name.endswith(".py"):
                     i = Script("", "", path=entryPath)
 
                 if i is not None:
-                    i.load(self)
+                    jobs.append((i, self, _entry_exists(names.get(os.path.basename(i.get_json_path())))))
                     self.items.append(i)
 
+    def read_files(self, has_json: bool) -> tuple:
+        """Read the folder metadata, without changing the folder. Called from worker threads."""
+        return read_metadata_file(self.get_json_path()) if has_json else None,
+
+    def load_contents(self, parent, metadata):
+        """Apply the results of L{read_files}. metadata is None, if there is no metadata file."""
+        self.parent = parent
+        if metadata is not None:
+            self.load_metadata(metadata)
+        else:
+            self.title = os.path.basename(self.path)
+
     def load_from_serialized(self):
+        self.load_metadata(read_metadata_file(self.get_json_path()))
+
+    def load_metadata(self, metadata):
         try:
-            with open(self.path + "/folder.json", 'r') as inFile:
-                data = json.load(inFile)
-                self.inject_json_data(data)
+            self.inject_json_data(parse_metadata(metadata))
         except Exception:
             logger.exception("Error while loading json data for " + self.title)
             logger.error("JSON data not loaded (or loaded incomplete)")
@@ -139,10 +172,13 @@ class Folder(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
 
     def rebuild_path(self):
         if self.path is not None:
+            # Pending metadata files must be written at the old path, before the directory is renamed
+            file_writer.flush()
             oldName = self.path
             self.path = get_safe_path(os.path.split(oldName)[0], self.title)
             self.update_children()
             os.rename(oldName, self.path)
+            own_writes.renamed(oldName, self.path)
         else:
             self.build_path()
 
@@ -156,6 +192,7 @@ class Folder(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
 
     def remove_data(self):
         if self.path is not None:
+            file_writer.flush()
             for child in self.items:
                 child.remove_data()
             for child in self.folders:
@@ -164,7 +201,9 @@ class Folder(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
                 # The json file must be removed first. Otherwise the rmdir will fail.
                 if os.path.exists(self.get_json_path()):
                     os.remove(self.get_json_path())
+                    own_writes.removed(self.get_json_path())
                 os.rmdir(self.path)
+                own_writes.removed(self.path)
             except OSError as err:
                 # There may be user data in the removed directory. Only swallow the error, if it is caused by
                 # residing user data. Other errors should propagate.
@@ -258,3 +297,43 @@ class Folder(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
 
     def __repr__(self):
         return str(self)
+
+
+def _entry_exists(entry: typing.Optional[os.DirEntry]) -> bool:
+    # Same as os.path.exists, using the file type from the directory listing. Only symbolic links need a stat call.
+    return entry is not None and (entry.is_file() or entry.is_dir())
+
+
+def _read_files(jobs: list) -> list:
+    return [model_object.read_files(has_json) for model_object, parent, has_json in jobs]
+
+
+def load_folders(folders: typing.List[Folder], parent: typing.Optional[Folder]=None):
+    """
+    Load the given folders, which have their path set, with all their subfolders, phrases and scripts.
+
+    The directories are listed using os.scandir, reusing the file types from the listing instead of a stat call per
+    entry. The metadata files are read by a thread pool. The model objects are updated in the calling thread, after all
+    files are read, so that the result is identical to loading the files one by one. Phrase texts and script sources
+    are read on first use.
+
+    @param folders: The folders to load
+    @param parent: The parent of the folders, None for top level folders
+    """
+    _load_trees(folders, parent, load_metadata=True)
+
+
+def _load_trees(folders: typing.List[Folder], parent: typing.Optional[Folder], load_metadata: bool):
+    jobs = []  # type: typing.List[typing.Tuple[typing.Any, typing.Optional[Folder], bool]]
+    for folder in folders:
+        folder._scan(jobs, parent, load_metadata)
+
+    # The files are read while this thread waits, and the contents applied only after all files are read. Python code
+    # running in this thread while the workers read delays each of their system calls until the GIL is released, which
+    # made loading slower than without threads.
+    chunks = [jobs[start:start + LOAD_CHUNK_SIZE] for start in range(0, len(jobs), LOAD_CHUNK_SIZE)]
+    with concurrent.futures.ThreadPoolExecutor(LOAD_THREADS, thread_name_prefix="FolderLoader") as executor:
+        contents = list(executor.map(_read_files, chunks))
+    for chunk, chunk_contents in zip(chunks, contents):
+        for (model_object, model_parent, has_json), files in zip(chunk, chunk_contents):
+            model_object.load_contents(model_parent, *files)
@@ -15,11 +15,16 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import enum
+import json
+import locale
 import os
 import re
+import typing
 
 DEFAULT_WORDCHAR_REGEX = '[\w]'
 JSON_FILE_PATTERN = "{}/{}.json"
+# Read size used by read_text_file. Phrase, script and metadata files usually fit into a single read.
+READ_SIZE = 1 << 16
 SPACES_RE = re.compile(r"^ | $")
 
 
@@ -52,6 +57,61 @@ def get_safe_path(base_path, name, ext=""):
     return path
 
 
+def read_file(path: str) -> bytes:
+    """
+    Read a whole file, using plain system calls. A file object costs more than the read itself, when loading thousands
+    of small files.
+
+    @raise OSError: If the file cannot be read
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        chunks = []
+        while True:
+            chunk = os.read(fd, READ_SIZE)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        os.close(fd)
+    return b"".join(chunks)
+
+
+def decode_text(data: bytes, encoding: str=None) -> str:
+    """
+    Decode file contents read by read_file. The result is the same as reading the file using open(path, "r",
+    encoding=encoding), including the newline translation.
+
+    @raise UnicodeDecodeError: If the data is not valid in the encoding
+    """
+    text = data.decode(encoding or locale.getpreferredencoding(False))
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+def read_metadata_file(path: str) -> typing.Union[bytes, Exception]:
+    """
+    Read a JSON metadata file. Errors are returned instead of raised, so that the file can be read in a worker thread
+    while the error is logged when the metadata is applied to the model, see load_metadata of the model classes.
+    """
+    try:
+        return read_file(path)
+    except Exception as e:
+        return e
+
+
+def parse_metadata(data: typing.Union[bytes, Exception]) -> dict:
+    """
+    Parse metadata read by read_metadata_file.
+
+    @raise Exception: The error returned by read_metadata_file, or the error raised while parsing
+    """
+    if isinstance(data, Exception):
+        raise data
+    return json.loads(decode_text(data))
+
+
 @enum.unique
 class TriggerMode(enum.Enum):
     """
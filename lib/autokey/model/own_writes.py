@@ -0,0 +1,107 @@
+# Copyright (C) 2021 BlueDrink9
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Record of the files and directories written, renamed and removed by AutoKey itself, so that the file monitor does not
+load them again.
+
+After each write, the state of the path is recorded: its inode, size, modification and change time, or that it does
+not exist. The monitor ignores a change only if the path is still in exactly this state. A change made by another
+program, even directly after AutoKey's own write, changes the state and is loaded as usual.
+"""
+
+import collections
+import os
+import stat
+import threading
+import time
+import typing
+
+# Recorded states are forgotten after this many seconds, if no file event matched them
+RECORD_LIFETIME = 60.0
+
+# (device, inode, size, modification time in ns, change time in ns). Directories only have device and inode, because
+# their times change when files inside are written.
+_State = typing.Optional[typing.Tuple[int, ...]]
+
+
+def path_state(path: str) -> _State:
+    """Returns the state of the path, or None if it does not exist."""
+    try:
+        status = os.lstat(path)
+    except OSError:
+        return None
+    if stat.S_ISDIR(status.st_mode):
+        return status.st_dev, status.st_ino
+    return status.st_dev, status.st_ino, status.st_size, status.st_mtime_ns, status.st_ctime_ns
+
+
+class OwnWrites:
+    """
+    The recorded states of the paths written by AutoKey. Thread-safe.
+
+    @param lifetime: Seconds after which an unmatched record is forgotten
+    """
+
+    def __init__(self, lifetime: float=RECORD_LIFETIME, clock: typing.Callable[[], float]=time.monotonic):
+        self.lifetime = lifetime
+        self.clock = clock
+        self._lock = threading.Lock()
+        # Path -> (time of the record, state), oldest first
+        self._records = collections.OrderedDict()  # type: typing.MutableMapping[str, typing.Tuple[float, _State]]
+
+    def written(self, *paths: str):
+        """Called after the files or directories were created or written."""
+        self._record(paths)
+
+    def removed(self, *paths: str):
+        """Called after the files or directories were removed."""
+        self._record(paths)
+
+    def renamed(self, old_path: str, new_path: str):
+        """Called after a file or directory was renamed."""
+        self._record((old_path, new_path))
+
+    def _record(self, paths: typing.Iterable[str]):
+        now = self.clock()
+        with self._lock:
+            for path in paths:
+                self._records.pop(path, None)
+                self._records[path] = (now, path_state(path))
+            while self._records:
+                path, (recorded, state) = next(iter(self._records.items()))
+                if now - recorded < self.lifetime:
+                    break
+                del self._records[path]
+
+    def is_own(self, path: str) -> bool:
+        """
+        Returns True, if the path is in the state recorded after AutoKey changed it. The record is consumed, so that
+        later changes of the path are reported.
+        """
+        with self._lock:
+            record = self._records.pop(path, None)
+        return record is not None and record[1] == path_state(path)
+
+    def __len__(self):
+        return len(self._records)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+
+# Used by the model and the ConfigManager, and checked by the file monitor
+own_writes = OwnWrites()
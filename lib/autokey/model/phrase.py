@@ -20,7 +20,10 @@ import os
 import typing
 
 from autokey.model.key import NAVIGATION_KEYS, Key, KEY_SPLIT_RE
-from autokey.model.helpers import JSON_FILE_PATTERN, get_safe_path, TriggerMode
+from autokey.model.helpers import JSON_FILE_PATTERN, get_safe_path, read_metadata_file, parse_metadata, TriggerMode
+from autokey.model.content_cache import content_cache
+from autokey.model.file_writer import file_writer, write_atomic
+from autokey.model.own_writes import own_writes
 from autokey.model.abstract_abbreviation import AbstractAbbreviation
 from autokey.model.abstract_window_filter import AbstractWindowFilter
 from autokey.model.abstract_hotkey import AbstractHotkey
@@ -50,6 +53,30 @@ class Phrase(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         self.sendMode = SendMode.KEYBOARD
         self.path = path
 
+    @property
+    def phrase(self) -> str:
+        """
+        The phrase text. Loaded phrases do not keep their text in memory, it is read from the file on first use and
+        kept in the content cache. Returns an empty string, if the file cannot be read.
+        """
+        if self._phrase is not None:
+            return self._phrase
+        try:
+            return content_cache.read(self.path)
+        except (OSError, UnicodeDecodeError):
+            logger.exception("Unable to read the text of phrase '{}'".format(self.description))
+            return ""
+
+    @phrase.setter
+    def phrase(self, phrase: str):
+        # Kept in memory until the phrase is persisted
+        self._phrase = phrase
+
+    def keep_phrase(self):
+        """Keep the text in memory, so that it is not lost when the file is removed or the path changed."""
+        if self._phrase is None:
+            self._phrase = self.phrase
+
     def build_path(self, base_name=None):
         if base_name is None:
             base_name = self.description
@@ -65,11 +92,13 @@ class Phrase(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         if self.path is None:
             self.build_path()
 
-        with open(self.get_json_path(), 'w') as json_file:
-            json.dump(self.get_serializable(), json_file, indent=4)
+        file_writer.write(self.get_json_path(), json.dumps(self.get_serializable(), indent=4))
 
-        with open(self.path, "w") as out_file:
-            out_file.write(self.phrase)
+        # The text is read back from the file when it is used next, so it is written at once
+        phrase = self.phrase
+        write_atomic(self.path, phrase)
+        content_cache.written(self.path, None, phrase)
+        self._phrase = None
 
     def get_serializable(self):
         d = {
@@ -89,21 +118,31 @@ class Phrase(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         return d
 
     def load(self, parent):
-        self.parent = parent
+        self.load_contents(parent, *self.read_files(os.path.exists(self.get_json_path())))
+
+    def read_files(self, has_json: bool) -> tuple:
+        """
+        Read the metadata, without changing the phrase. Called from worker threads when loading folders. The phrase
+        text is not read, see L{phrase}. Errors reading the metadata are handled by L{load_contents}.
+        """
+        return read_metadata_file(self.get_json_path()) if has_json else None,
 
-        with open(self.path, "r") as inFile:
-            self.phrase = inFile.read()
+    def load_contents(self, parent, metadata):
+        """Apply the results of L{read_files}. metadata is None, if there is no metadata file."""
+        self.parent = parent
+        self._phrase = None
 
-        if os.path.exists(self.get_json_path()):
-            self.load_from_serialized()
+        if metadata is not None:
+            self.load_metadata(metadata)
         else:
             self.description = os.path.basename(self.path)[:-4]
 
     def load_from_serialized(self):
+        self.load_metadata(read_metadata_file(self.get_json_path()))
+
+    def load_metadata(self, metadata):
         try:
-            with open(self.get_json_path(), "r") as json_file:
-                data = json.load(json_file)
-                self.inject_json_data(data)
+            self.inject_json_data(parse_metadata(metadata))
         except Exception:
             logger.exception("Error while loading json data for " + self.description)
             logger.error("JSON data not loaded (or loaded incomplete)")
@@ -123,20 +162,27 @@ class Phrase(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
 
     def rebuild_path(self):
         if self.path is not None:
+            file_writer.flush()
             old_name = self.path
             old_json = self.get_json_path()
             self.build_path()
             os.rename(old_name, self.path)
             os.rename(old_json, self.get_json_path())
+            own_writes.renamed(old_name, self.path)
+            own_writes.renamed(old_json, self.get_json_path())
         else:
             self.build_path()
 
     def remove_data(self):
         if self.path is not None:
+            file_writer.flush()
+            # Removed items are pasted again after cutting them, or persisted at a new path after moving them
+            self.keep_phrase()
             if os.path.exists(self.path):
                 os.remove(self.path)
             if os.path.exists(self.get_json_path()):
                 os.remove(self.get_json_path())
+            own_writes.removed(self.path, self.get_json_path())
 
     def copy(self, source_phrase):
         self.description = source_phrase.description
@@ -317,12 +363,16 @@ class SendMode(enum.Enum):
     CB_CTRL_V: Send via clipboard and paste with Ctrl+v
     CB_CTRL_SHIFT_V: Send via clipboard and paste with Ctrl+Shift+v
     SELECTION: Send via X selection and paste with middle mouse button
+    XTEST: Send using key events injected with the XTEST extension. Works in applications ignoring synthetic events
+    AUTO: Choose one of the modes above for each expansion, see L{autokey.iomediator.sendmode}
     """
     KEYBOARD = "kb"
     CB_CTRL_V = Key.CONTROL + "+v"
     CB_CTRL_SHIFT_V = Key.CONTROL + "+" + Key.SHIFT + "+v"
     CB_SHIFT_INSERT = Key.SHIFT + "+" + Key.INSERT
     SELECTION = None
+    XTEST = "xtest"
+    AUTO = "auto"
 
 
 SEND_MODES = {
@@ -330,5 +380,7 @@ SEND_MODES = {
     "Clipboard (Ctrl+V)": SendMode.CB_CTRL_V,
     "Clipboard (Ctrl+Shift+V)": SendMode.CB_CTRL_SHIFT_V,
     "Clipboard (Shift+Insert)": SendMode.CB_SHIFT_INSERT,
-    "Mouse Selection": SendMode.SELECTION
+    "Mouse Selection": SendMode.SELECTION,
+    "Keyboard (XTest)": SendMode.XTEST,
+    "Automatic": SendMode.AUTO
 }  # type: typing.Dict[str, SendMode]
@@ -21,7 +21,10 @@ import typing
 from pathlib import Path
 
 from autokey.model.store import Store
-from autokey.model.helpers import JSON_FILE_PATTERN, get_safe_path, TriggerMode
+from autokey.model.helpers import JSON_FILE_PATTERN, get_safe_path, read_metadata_file, parse_metadata, TriggerMode
+from autokey.model.content_cache import content_cache
+from autokey.model.file_writer import file_writer, write_atomic
+from autokey.model.own_writes import own_writes
 from autokey.model.abstract_abbreviation import AbstractAbbreviation
 from autokey.model.abstract_window_filter import AbstractWindowFilter
 from autokey.model.abstract_hotkey import AbstractHotkey
@@ -49,6 +52,30 @@ class Script(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         self.show_in_tray_menu = False
         self.path = path
 
+    @property
+    def code(self) -> str:
+        """
+        The source code. Loaded scripts do not keep their source in memory, it is read from the file on first use and
+        kept in the content cache. Returns an empty string, if the file cannot be read.
+        """
+        if self._code is not None:
+            return self._code
+        try:
+            return content_cache.read(self.path, "UTF-8")
+        except (OSError, UnicodeDecodeError):
+            logger.exception("Unable to read the source code of script '{}'".format(self.description))
+            return ""
+
+    @code.setter
+    def code(self, source_code: str):
+        # Kept in memory until the script is persisted
+        self._code = source_code
+
+    def keep_code(self):
+        """Keep the source code in memory, so that it is not lost when the file is removed or the path changed."""
+        if self._code is None:
+            self._code = self.code
+
     def build_path(self, base_name=None):
         if base_name is None:
             base_name = self.description
@@ -66,8 +93,11 @@ class Script(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
 
         self._persist_metadata()
 
-        with open(self.path, "w") as out_file:
-            out_file.write(self.code)
+        # The source code is read back from the file when it is used next, so it is written at once
+        code = self.code
+        write_atomic(self.path, code)
+        content_cache.written(self.path, "UTF-8", code)
+        self._code = None
 
     def get_serializable(self):
         d = {
@@ -87,7 +117,7 @@ class Script(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
 
     def _persist_metadata(self):
         """
-        Write all script meta-data, including the persistent script Store.
+        Queue all script meta-data for writing, including the persistent script Store.
         The Store instance might contain arbitrary user data, like function objects, OpenCL contexts, or whatever other
         non-serializable objects, both as keys or values.
         Try to serialize the data, and if it fails, fall back to checking the store and removing all non-serializable
@@ -98,12 +128,12 @@ class Script(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
             self._try_persist_metadata(serializable_data)
         except TypeError:
             # The user added non-serializable data to the store, so skip all non-serializable keys or values.
-            cleaned_data = Script._remove_non_serializable_store_entries(serializable_data["store"])
-            self._try_persist_metadata(cleaned_data)
+            serializable_data["store"] = Script._remove_non_serializable_store_entries(serializable_data["store"])
+            self._try_persist_metadata(serializable_data)
 
     def _try_persist_metadata(self, serializable_data: dict):
-        with open(self.get_json_path(), "w") as json_file:
-                json.dump(serializable_data, json_file, indent=4)
+        # Serialized here, because the store may be changed by the script while the file is written
+        file_writer.write(self.get_json_path(), json.dumps(serializable_data, indent=4))
 
     @staticmethod
     def _remove_non_serializable_store_entries(store: Store) -> dict:
@@ -134,21 +164,31 @@ class Script(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
             return True
 
     def load(self, parent):
-        self.parent = parent
+        self.load_contents(parent, *self.read_files(os.path.exists(self.get_json_path())))
+
+    def read_files(self, has_json: bool) -> tuple:
+        """
+        Read the metadata, without changing the script. Called from worker threads when loading folders. The source
+        code is not read, see L{code}. Errors reading the metadata are handled by L{load_contents}.
+        """
+        return read_metadata_file(self.get_json_path()) if has_json else None,
 
-        with open(self.path, "r", encoding="UTF-8") as in_file:
-            self.code = in_file.read()
+    def load_contents(self, parent, metadata):
+        """Apply the results of L{read_files}. metadata is None, if there is no metadata file."""
+        self.parent = parent
+        self._code = None
 
-        if os.path.exists(self.get_json_path()):
-            self.load_from_serialized()
+        if metadata is not None:
+            self.load_metadata(metadata)
         else:
             self.description = os.path.basename(self.path)[:-3]
 
     def load_from_serialized(self, **kwargs):
+        self.load_metadata(read_metadata_file(self.get_json_path()))
+
+    def load_metadata(self, metadata):
         try:
-            with open(self.get_json_path(), "r") as jsonFile:
-                data = json.load(jsonFile)
-                self.inject_json_data(data)
+            self.inject_json_data(parse_metadata(metadata))
         except Exception:
             logger.exception("Error while loading json data for " + self.description)
             logger.error("JSON data not loaded (or loaded incomplete)")
@@ -167,20 +207,27 @@ class Script(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
 
     def rebuild_path(self):
         if self.path is not None:
+            file_writer.flush()
             oldName = self.path
             oldJson = self.get_json_path()
             self.build_path()
             os.rename(oldName, self.path)
             os.rename(oldJson, self.get_json_path())
+            own_writes.renamed(oldName, self.path)
+            own_writes.renamed(oldJson, self.get_json_path())
         else:
             self.build_path()
 
     def remove_data(self):
         if self.path is not None:
+            file_writer.flush()
+            # Removed items are pasted again after cutting them, or persisted at a new path after moving them
+            self.keep_code()
             if os.path.exists(self.path):
                 os.remove(self.path)
             if os.path.exists(self.get_json_path()):
                 os.remove(self.get_json_path())
+            own_writes.removed(self.path, self.get_json_path())
 
     def copy(self, source_script):
         self.description = source_script.description
@@ -16,23 +16,218 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import math
 import threading
 import os.path
 import time
+import typing
 
 from pyinotify import WatchManager, Notifier, EventsCodes, ProcessEvent
 
+from autokey import common
+from autokey.model.file_writer import is_temporary
+from autokey.model.own_writes import own_writes
+
 
 logger = __import__("autokey.logger").logger.get_logger(__name__)
 m = EventsCodes.OP_FLAGS
 MASK = m["IN_CREATE"]|m["IN_MODIFY"]|m["IN_DELETE"]|m["IN_MOVED_TO"]|m["IN_MOVED_FROM"]
 
+# Changes reported to the listener
+MODIFIED = "modified"
+REMOVED = "removed"
+
+# Seconds without new events, before the collected changes are reported
+QUIET_WINDOW = 0.5
+# Longest delay of a change, while events keep arriving
+MAX_DELAY = 5.0
+# Seconds between two scans of the directories, which are polled because no inotify watch could be added
+POLL_INTERVAL = 5.0
+MAX_USER_WATCHES_FILE = "/proc/sys/fs/inotify/max_user_watches"
+
+WatchStatus = typing.NamedTuple("WatchStatus", [
+    ("watched", int),  # Directories watched using inotify
+    ("polled", int),  # Directories polled instead
+    ("max_user_watches", typing.Optional[int]),  # The inotify watch limit of the user, if known
+])
+
+
+class EventCoalescer:
+    """
+    Collects file events, until no new event arrived for a quiet window, and merges the events of each path into one
+    change. An editor saving a file, or a git pull, causes many events, which are then reported as one batch.
+
+    The last event of a path decides its change. A path created and removed within the batch is dropped.
+    """
+
+    def __init__(self, quiet_window: float=QUIET_WINDOW, max_delay: float=MAX_DELAY,
+                 clock: typing.Callable[[], float]=time.monotonic):
+        self.quiet_window = quiet_window
+        self.max_delay = max_delay
+        self.clock = clock
+        # Path -> (created within the batch, change), in the order of the last event of each path
+        self.__pending = {}  # type: typing.Dict[str, typing.Tuple[bool, str]]
+        self.__first_event = 0.0
+        self.__last_event = 0.0
+
+    def add(self, path: str, change: str, created: bool=False):
+        """
+        @param path: Path of the event
+        @param change: MODIFIED or REMOVED
+        @param created: The event created the path, so it did not exist before
+        """
+        now = self.clock()
+        if not self.__pending:
+            self.__first_event = now
+        self.__last_event = now
+        created = self.__pending.pop(path, (created, None))[0]
+        self.__pending[path] = (created, change)
+
+    def timeout(self) -> typing.Optional[float]:
+        """Returns the seconds until the collected changes are due, or None if there are none."""
+        if not self.__pending:
+            return None
+        due = min(self.__last_event + self.quiet_window, self.__first_event + self.max_delay)
+        return max(0.0, due - self.clock())
+
+    def take_batch(self) -> typing.List[typing.Tuple[str, str]]:
+        """
+        Returns the collected (path, change) pairs, if they are due, in the order of the last event of each path.
+        Otherwise, returns an empty list.
+        """
+        if self.timeout() != 0.0:
+            return []
+        batch = [(path, change) for path, (created, change) in self.__pending.items()
+                 if not (created and change == REMOVED)]
+        self.__pending.clear()
+        return batch
+
+
+class WatchRegistry:
+    """
+    The monitored directories, by path and by inotify watch descriptor. Directories without a watch descriptor are
+    polled. All operations take constant time, except for remove_tree, which is proportional to the size of the
+    removed tree.
+    """
+
+    def __init__(self):
+        self.__wds = {}  # type: typing.Dict[str, typing.Optional[int]]
+        self.__paths = {}  # type: typing.Dict[int, str]
+        self.__polled = set()  # type: typing.Set[str]
+        # Registered paths by their parent directory
+        self.__children = {}  # type: typing.Dict[str, typing.Set[str]]
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.__wds
+
+    def add(self, path: str, wd: typing.Optional[int]):
+        """Registers a watched directory, or a polled one if wd is None."""
+        self.discard(path)
+        if wd in self.__paths:
+            # The kernel returns the same watch descriptor for a directory that was renamed, forget the old path
+            self.discard(self.__paths[wd])
+        self.__wds[path] = wd
+        if wd is None:
+            self.__polled.add(path)
+        else:
+            self.__paths[wd] = path
+        self.__children.setdefault(os.path.dirname(path), set()).add(path)
+
+    def discard(self, path: str):
+        if path not in self.__wds:
+            return
+        wd = self.__wds.pop(path)
+        if wd is None:
+            self.__polled.discard(path)
+        else:
+            del self.__paths[wd]
+        siblings = self.__children[os.path.dirname(path)]
+        siblings.discard(path)
+        if not siblings:
+            del self.__children[os.path.dirname(path)]
+
+    def discard_wd(self, wd: int) -> typing.Optional[str]:
+        """Unregisters the directory of a watch removed by the kernel, and returns its path."""
+        path = self.__paths.get(wd)
+        if path is not None:
+            self.discard(path)
+        return path
+
+    def remove_tree(self, path: str) -> typing.List[int]:
+        """Unregisters the directory and all registered directories below it, and returns their watch descriptors."""
+        wds = []
+        pending = [path]
+        while pending:
+            directory = pending.pop()
+            pending.extend(self.__children.get(directory, ()))
+            wd = self.__wds.get(directory)
+            if wd is not None:
+                wds.append(wd)
+            self.discard(directory)
+        return wds
+
+    def polled(self) -> typing.List[str]:
+        return list(self.__polled)
+
+    def status(self) -> typing.Tuple[int, int]:
+        """The number of watched and of polled directories."""
+        return len(self.__paths), len(self.__polled)
+
+
+def scan_manifest(directory: str) -> typing.Optional[typing.Dict[str, typing.Optional[typing.Tuple[int, int]]]]:
+    """
+    Lists the entries of a polled directory, with the mtime and size of files. Directories have None, so that changes
+    inside them are not reported as changes of the directory. Returns None, if the directory does not exist any more.
+    """
+    manifest = {}
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        manifest[entry.path] = None
+                    else:
+                        stat = entry.stat()
+                        manifest[entry.path] = (stat.st_mtime_ns, stat.st_size)
+                except OSError:
+                    # Removed while scanning
+                    continue
+    except OSError:
+        return None
+    return manifest
+
+
+def read_max_user_watches() -> typing.Optional[int]:
+    try:
+        with open(MAX_USER_WATCHES_FILE) as limit_file:
+            return int(limit_file.read())
+    except (OSError, ValueError):
+        return None
+
+
+def _is_hidden(path: str) -> bool:
+    # Hidden directories, like .git, are not part of the configuration
+    return os.path.basename(path).startswith(".")
+
+
+def _hidden_below(root: str) -> typing.Callable[[str], bool]:
+    """
+    Returns the exclude filter for a watch on root. pyinotify also applies the filter to root itself, which is watched
+    regardless of its name, as it was added on purpose, like an external folder named .snippets. Below root, hidden
+    directories and all directories inside them are excluded.
+    """
+    def is_hidden(path: str) -> bool:
+        if path == root:
+            return False
+        return any(name.startswith(".") for name in os.path.relpath(path, root).split(os.sep))
+    return is_hidden
+
 
 class Processor(ProcessEvent):
     
-    def __init__(self, monitor, listener):
+    def __init__(self, monitor, coalescer):
         ProcessEvent.__init__(self)
-        self.listener = listener
+        self.coalescer = coalescer
         self.monitor = monitor
         
     def __getEventPath(self, event):
@@ -45,85 +240,176 @@ class Processor(ProcessEvent):
     
     def process_IN_MOVED_TO(self, event):
         path = self.__getEventPath(event)
-        if not self.monitor.is_suspended():
-            self.listener.path_created_or_modified(path)
+        if event.dir:
+            self.monitor.directory_added(event.path, path)
+        self.coalescer.add(path, MODIFIED)
     
     def process_IN_CREATE(self, event):
         path = self.__getEventPath(event)
-        if not self.monitor.is_suspended():
-            self.listener.path_created_or_modified(path)
+        if event.dir:
+            self.monitor.directory_added(event.path, path)
+        self.coalescer.add(path, MODIFIED, created=True)
         
     def process_IN_MODIFY(self, event):
         path = self.__getEventPath(event)
-        if not self.monitor.is_suspended():
-            self.listener.path_created_or_modified(path)
+        self.coalescer.add(path, MODIFIED)
         
     def process_IN_DELETE(self, event):
         path = self.__getEventPath(event)
-        if not self.monitor.is_suspended():        
-            self.listener.path_removed(path)
+        self.coalescer.add(path, REMOVED)
             
     def process_IN_MOVED_FROM(self, event):
         path = self.__getEventPath(event)
-        if not self.monitor.is_suspended():
-            self.listener.path_removed(path)
+        if event.dir:
+            # The watches follow the moved directory, so remove them
+            self.monitor.remove_watch(path)
+        self.coalescer.add(path, REMOVED)
+
+    def process_IN_IGNORED(self, event):
+        # The kernel removed the watch, because the directory was deleted
+        self.monitor.watch_ignored(event.wd)
 
 
 class FileMonitor(threading.Thread):
     
     def __init__(self, listener):
         threading.Thread.__init__(self)
-        self.__p = Processor(self, listener)
+        self.listener = listener
+        self.coalescer = EventCoalescer()
+        self.__p = Processor(self, self.coalescer)
         self.manager = WatchManager()
         self.notifier = Notifier(self.manager, self.__p)
         self.event = threading.Event()
         self.setDaemon(True)
-        self.watches = []
-        self.__isSuspended = False
-        
-    def suspend(self):
-        self.__isSuspended = True
-    
-    def unsuspend(self):
-        t = threading.Thread(target=self.__unsuspend)
-        t.start()
-        
-    def __unsuspend(self):
-        time.sleep(1.5)
-        self.__isSuspended = False
-        for watch in self.watches:
-            if not os.path.exists(watch):
-                logger.debug("Removed stale watch on %s", watch)
-                self.watches.remove(watch)
-        
-    def is_suspended(self):
-        return self.__isSuspended
+        self.watches = WatchRegistry()
+        # Guards the watches, which are added by the thread loading the configuration and changed by this thread
+        self.__lock = threading.Lock()
+        self.__manifests = {}  # type: typing.Dict[str, dict]
+        self.__next_poll = 0.0
         
     def has_watch(self, path):
-        return path in self.watches
+        with self.__lock:
+            return path in self.watches
     
-    def add_watch(self, path):
-        logger.debug("Adding watch for %s", path)
-        self.manager.add_watch(path, MASK, self.__p)
-        self.watches.append(path)
+    def add_watch(self, path, recursive=False):
+        """
+        Watch the directory for changes, if it is not watched already. If the inotify watch limit is reached, the
+        directory is polled instead.
+
+        @param path: The directory
+        @param recursive: Also watch all directories below it, for example after it was created or moved here
+        """
+        with self.__lock:
+            if path in self.watches and not recursive:
+                return
+            logger.debug("Adding watch for %s", path)
+            wds = self.manager.add_watch(path, MASK, self.__p, rec=recursive, exclude_filter=_hidden_below(path))
+            for watched_path, wd in wds.items():
+                if wd >= 0:
+                    self.watches.add(watched_path, wd)
+                    self.__manifests.pop(watched_path, None)
+                elif wd == -1 and watched_path not in self.watches and os.path.isdir(watched_path):
+                    self.__start_polling(watched_path)
+
+    def __start_polling(self, path):
+        watched, polled = self.watches.status()
+        if not polled:
+            logger.warning(
+                "Could not add an inotify watch for %s, after adding %d watches. The limit fs.inotify.max_user_watches "
+                "is probably reached, it is %s. Polling directories every %s seconds instead.",
+                path, watched, read_max_user_watches(), POLL_INTERVAL)
+        self.watches.add(path, None)
+        self.__manifests[path] = scan_manifest(path) or {}
+
+    def directory_added(self, parent, path):
+        """Called by the Processor for a new directory, to watch it before files are created inside."""
+        # Only folders below the top directory are part of the configuration
+        if parent != common.CONFIG_DIR and not _is_hidden(path):
+            self.add_watch(path, recursive=True)
+
+    def watch_ignored(self, wd):
+        with self.__lock:
+            path = self.watches.discard_wd(wd)
+        if path is not None:
+            logger.debug("Removed watch on deleted %s", path)
         
     def remove_watch(self, path):
+        """Stop watching or polling the directory and all directories below it."""
         logger.debug("Removing watch for %s", path)
-        wd = self.manager.get_wd(path)
-        self.manager.rm_watch(wd, True)
-        self.watches.remove(path)
-        for i in range(len(self.watches)):
-            try:
-                if self.watches[i].startswith(path):
-                    self.watches.remove(self.watches[i])
-            except IndexError:
-                break       
+        with self.__lock:
+            wds = self.watches.remove_tree(path)
+            if wds:
+                self.manager.rm_watch(wds)
+            for polled_path in [polled_path for polled_path in self.__manifests if polled_path not in self.watches]:
+                del self.__manifests[polled_path]
+
+    def status(self) -> WatchStatus:
+        """The number of watched and polled directories, for diagnostics."""
+        with self.__lock:
+            watched, polled = self.watches.status()
+        return WatchStatus(watched, polled, read_max_user_watches())
+
+    def is_polling(self) -> bool:
+        """True, if some directories are polled, because the inotify watch limit is reached."""
+        return self.status().polled > 0
+
+    def poll(self):
+        """Scans the polled directories, and reports their changes like inotify events."""
+        with self.__lock:
+            directories = self.watches.polled()
+        for directory in directories:
+            manifest = scan_manifest(directory)
+            with self.__lock:
+                if directory not in self.watches:
+                    continue
+                if manifest is None:
+                    # Deleted, the scan of the parent reports it
+                    self.watches.discard(directory)
+                    self.__manifests.pop(directory, None)
+                    continue
+                old_manifest = self.__manifests.get(directory, {})
+                self.__manifests[directory] = manifest
+            new_directories = []
+            for path, stamp in manifest.items():
+                if path not in old_manifest:
+                    if stamp is None:
+                        new_directories.append(path)
+                    self.coalescer.add(path, MODIFIED, created=True)
+                elif old_manifest[path] != stamp:
+                    self.coalescer.add(path, MODIFIED)
+            for path in old_manifest.keys() - manifest.keys():
+                if old_manifest[path] is None:
+                    self.remove_watch(path)
+                self.coalescer.add(path, REMOVED)
+            for path in new_directories:
+                self.directory_added(directory, path)
+
+    def report_changes(self):
+        """Reports the collected changes to the listener, if they are due."""
+        # Changes made by AutoKey itself are already in the model
+        batch = [(path, change) for path, change in self.coalescer.take_batch()
+                 if not (is_temporary(path) or own_writes.is_own(path))]
+        if batch:
+            logger.debug("Reporting %d changed paths", len(batch))
+            self.listener.paths_changed(batch)
+
+    def __timeout(self) -> float:
+        # Seconds until the next batch or poll is due
+        timeout = self.coalescer.timeout()
+        timeout = 1.0 if timeout is None else timeout
+        if self.__manifests:
+            timeout = min(timeout, max(0.0, self.__next_poll - time.monotonic()))
+        return timeout
         
     def run(self):        
         while not self.event.isSet():
-            self.notifier.process_events()
-            if self.notifier.check_events(1000):
+            if self.notifier.check_events(math.ceil(self.__timeout() * 1000)):
                 self.notifier.read_events()
+                self.notifier.process_events()
+            if self.__manifests and time.monotonic() >= self.__next_poll:
+                self.poll()
+                self.__next_poll = time.monotonic() + POLL_INTERVAL
+            self.report_changes()
         
         logger.info("Shutting down file monitor")
         self.notifier.stop()        
@@ -21,7 +21,6 @@ import sys
 import os.path
 import subprocess
 import queue
-import time
 import dbus
 from typing import NamedTuple, Iterable
 
@@ -215,9 +214,20 @@ class Application(QApplication):
         logger.info("Initialise global hotkeys")
         configManager.toggleServiceHotkey.set_closure(self.toggle_service)
         configManager.configHotkey.set_closure(self.show_configure_signal.emit)
+        configManager.cancelSendHotkey.set_closure(self.cancel_sends)
+
+    def cancel_sends(self):
+        """Stop all running streamed sends. Called by the global cancel hotkey."""
+        if self.service.mediator is not None:
+            self.service.mediator.cancel_sends()
 
     def config_altered(self, persistGlobal):
-        self.configManager.config_altered(persistGlobal)
+        """
+        Called by the configuration window after changing the configuration. The window updates the lists of
+        phrases/folders of the ConfigManager using its incremental change operations before.
+        """
+        if persistGlobal:
+            cm.save_config(self.configManager)
         self.notifier.create_assign_context_menu()
 
     def hotkey_created(self, item):
@@ -228,15 +238,8 @@ class Application(QApplication):
         logger.debug("Removed hotkey: %r %s", item.modifiers, item.hotKey)
         self.service.mediator.interface.ungrab_hotkey(item)
 
-    def path_created_or_modified(self, path):
-        time.sleep(0.5)
-        changed = self.configManager.path_created_or_modified(path)
-        if changed and self.configWindow is not None:
-            self.configWindow.config_modified()
-
-    def path_removed(self, path):
-        time.sleep(0.5)
-        changed = self.configManager.path_removed(path)
+    def paths_changed(self, changes):
+        changed = self.configManager.paths_changed(changes)
         if changed and self.configWindow is not None:
             self.configWindow.config_modified()
 
@@ -144,12 +144,15 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
                     "The name can't be empty.",
                     None,
                     self.window()):
-                self.window().app.monitor.suspend()
                 self.stack.currentWidget().set_item_title(newText)
                 self.stack.currentWidget().rebuild_item_path()
 
                 persistGlobal = self.stack.currentWidget().save()
-                self.window().app.monitor.unsuspend()
+                model_item = self.__extractData(item)
+                if isinstance(model_item, autokey.model.folder.Folder):
+                    self.configManager.folder_moved(model_item)
+                else:
+                    self.configManager.item_changed(model_item)
                 self.window().app.config_altered(persistGlobal)
 
                 self.treeWidget.sortItems(0, Qt.AscendingOrder)
@@ -193,8 +196,6 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
         message_box.button(QMessageBox.No).setText("Create elsewhere")  # TODO: i18n
         result = message_box.exec_()
 
-        self.window().app.monitor.suspend()
-
         if result == QMessageBox.Yes:
             logger.debug("User creates a new top-level folder.")
             self.__createFolder(None)
@@ -229,12 +230,11 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
                     new_item = ak_tree.FolderWidgetItem(None, folder)
                     self.treeWidget.addTopLevelItem(new_item)
                     self.configManager.folders.append(folder)
+                    self.configManager.folder_added(folder)
                     self.window().app.config_altered(True)
 
-            self.window().app.monitor.unsuspend()
         else:
             logger.debug("User canceled top-level folder creation.")
-            self.window().app.monitor.unsuspend()
 
     def on_new_folder(self):
         parent_item = self._get_current_treewidget_item()
@@ -243,7 +243,6 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
     def __createFolder(self, parent_item):
         folder = autokey.model.folder.Folder("New Folder")
         new_item = ak_tree.FolderWidgetItem(parent_item, folder)
-        self.window().app.monitor.suspend()
 
         if parent_item is not None:
             parentFolder = self.__extractData(parent_item)
@@ -253,7 +252,7 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
             self.configManager.folders.append(folder)
 
         folder.persist()
-        self.window().app.monitor.unsuspend()
+        self.configManager.folder_added(folder)
 
         self.treeWidget.sortItems(0, Qt.AscendingOrder)
         self.treeWidget.setCurrentItem(new_item)
@@ -261,7 +260,6 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
         self.on_rename()
 
     def on_new_phrase(self):
-        self.window().app.monitor.suspend()
         tree_widget = self.treeWidget  # type: ak_tree.AkTreeWidget
         parent_item = tree_widget.selectedItems()[0]  # type: ak_tree.ItemWidgetType
         parent = self.__extractData(parent_item)
@@ -271,7 +269,7 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
         parent.add_item(phrase)
         phrase.persist()
 
-        self.window().app.monitor.unsuspend()
+        self.configManager.item_added(phrase)
 
         tree_widget.sortItems(0, Qt.AscendingOrder)
         tree_widget.setCurrentItem(new_item)
@@ -280,7 +278,6 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
         self.on_rename()
 
     def on_new_script(self):
-        self.window().app.monitor.suspend()
         tree_widget = self.treeWidget  # type: ak_tree.AkTreeWidget
         parent_item = tree_widget.selectedItems()[0]  # type: ak_tree.ItemWidgetType
         parent = self.__extractData(parent_item)
@@ -290,7 +287,7 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
         parent.add_item(script)
         script.persist()
 
-        self.window().app.monitor.unsuspend()
+        self.configManager.item_added(script)
         tree_widget.sortItems(0, Qt.AscendingOrder)
         tree_widget.setCurrentItem(new_item)
         parent_item.setSelected(False)
@@ -330,10 +327,9 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
             new_item = ak_tree.ScriptWidgetItem(parent_item, new_obj)
 
         parent.add_item(new_obj)
-        self.window().app.monitor.suspend()
         new_obj.persist()
 
-        self.window().app.monitor.unsuspend()
+        self.configManager.item_added(new_obj)
         tree_widget.sortItems(0, Qt.AscendingOrder)
         tree_widget.setCurrentItem(new_item)
         parent_item.setSelected(False)
@@ -342,20 +338,17 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
 
     def on_cut(self):
         self.cutCopiedItems = self.__getSelection()
-        self.window().app.monitor.suspend()
 
         source_items = self.treeWidget.selectedItems()
         result = [f for f in source_items if f.parent() not in source_items]
         for item in result:
             self.__removeItem(item)
 
-        self.window().app.monitor.unsuspend()
         self.window().app.config_altered(False)
 
     def on_paste(self):
         parent_item = self._get_current_treewidget_item()
         parent = self.__extractData(parent_item)
-        self.window().app.monitor.suspend()
 
         new_items = []
         for item in self.cutCopiedItems:
@@ -371,6 +364,10 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
                 parent.add_item(item)
 
             item.persist()
+            if isinstance(item, autokey.model.folder.Folder):
+                self.configManager.folder_added(item)
+            else:
+                self.configManager.item_added(item)
 
             new_items.append(new_item)
 
@@ -380,12 +377,10 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
         self.cutCopiedItems = []
         for item in new_items:
             item.setSelected(True)
-        self.window().app.monitor.unsuspend()
         self.window().app.config_altered(False)
 
     def on_delete(self):
         widget_items = self.treeWidget.selectedItems()
-        self.window().app.monitor.suspend()
 
         if len(widget_items) == 1:
             widget_item = widget_items[0]
@@ -409,7 +404,6 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
             for widget_item in widget_items:
                 self.__removeItem(widget_item)
 
-        self.window().app.monitor.unsuspend()
         if result == QMessageBox.Yes:
             self.window().app.config_altered(False)
 
@@ -420,15 +414,18 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
     def on_save(self):
         logger.info("User requested file save.")
         if self.stack.currentWidget().validate():
-            self.window().app.monitor.suspend()
             persist_global = self.stack.currentWidget().save()
+            item = self._get_current_treewidget_item()
+            model_item = self.__extractData(item)
+            if isinstance(model_item, autokey.model.folder.Folder):
+                self.configManager.folder_changed(model_item)
+            else:
+                self.configManager.item_changed(model_item)
             self.window().save_completed(persist_global)
             self.set_dirty(False)
-            item = self._get_current_treewidget_item()
             item.update()
             self.treeWidget.update()
             self.treeWidget.sortItems(0, Qt.AscendingOrder)
-            self.window().app.monitor.unsuspend()
             return False
 
         return True
@@ -467,8 +464,6 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
         # Filter out any child objects that belong to a parent already in the list
         result = [f for f in sourceItems if f.parent() not in sourceItems]
 
-        self.window().app.monitor.suspend()
-
         for source in result:
             self.__removeItem(source)
             source_model_item = self.__extractData(source)
@@ -476,14 +471,15 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
             if isinstance(source_model_item, autokey.model.folder.Folder):
                 target_model_item.add_folder(source_model_item)
                 self.__moveRecurseUpdate(source_model_item)
+                self.configManager.folder_added(source_model_item)
             else:
                 target_model_item.add_item(source_model_item)
                 source_model_item.path = None
                 source_model_item.persist()
+                self.configManager.item_added(source_model_item)
 
             target.addChild(source)
 
-        self.window().app.monitor.unsuspend()
         self.treeWidget.sortItems(0, Qt.AscendingOrder)
         self.window().app.config_altered(True)
 
@@ -567,6 +563,10 @@ class CentralWidget(*ui_common.inherits_from_ui_file_with_name("centralwidget"))
             else:
                 item.parent.remove_item(item)
 
+        if isinstance(item, autokey.model.folder.Folder):
+            self.configManager.folder_removed(item)
+        else:
+            self.configManager.item_removed(item)
         item.remove_data()
         self.treeWidget.sortItems(0, Qt.AscendingOrder)
 
@@ -60,14 +60,11 @@ class Engine:
 
         Usage: C{engine.get_folder(title)}
 
-        Note that if more than one folder has the same title, only the first match will be
+        Note that if more than one folder has the same title, only one of them will be
         returned.
         """
         validateType(title, "title", str)
-        for folder in self.configManager.allFolders:
-            if folder.title == title:
-                return folder
-        return None
+        return self.configManager.foldersByTitle.get(title)
 
     def create_folder(self, title: str, parent_folder=None, temporary=False):
         """
@@ -106,7 +103,8 @@ class Engine:
             path = parent_folder.expanduser() / title
             path.mkdir(parents=True, exist_ok=True)
             new_folder = autokey.model.folder.Folder(title, path=str(path.resolve()))
-            self.configManager.allFolders.append(new_folder)
+            self.configManager.folders.append(new_folder)
+            self.configManager.folder_added(new_folder)
             return new_folder
         # TODO: Convert this to use get_folder, when we change to specifying
         # the exact folder by more than just title.
@@ -122,19 +120,20 @@ class Engine:
             if folder.title == title:
                 return folder
         else:
+            if parent_folder is not None and not temporary and parent_folder.temporary:
+                raise ValueError("Parameter 'temporary' is False, but parent folder is a temporary one. \
+Folders created within temporary folders must themselves be set temporary")
             new_folder = autokey.model.folder.Folder(title)
             if parent_folder is None:
-                self.configManager.allFolders.append(new_folder)
+                self.configManager.folders.append(new_folder)
             else:
                 parent_folder.add_folder(new_folder)
-                if not temporary and parent_folder.temporary:
-                    raise ValueError("Parameter 'temporary' is False, but parent folder is a temporary one. \
-Folders created within temporary folders must themselves be set temporary")
 
             if not temporary:
                 new_folder.persist()
             else:
                 new_folder.temporary = True
+            self.configManager.folder_added(new_folder)
             return new_folder
 
 
@@ -192,6 +191,10 @@ Folders created within temporary folders must themselves be set temporary")
             CB_CTRL_SHIFT_V
             CB_SHIFT_INSERT
             SELECTION
+            XTEST
+            AUTO
+        AUTO chooses the fastest suitable mode for each expansion, based on its length, contained special keys and
+        the active window.
         To paste the Phrase using "<shift>+<insert>, set send_mode=engine.SendMode.CB_SHIFT_INSERT
 
         window_filter: Accepts a string which will be used as a regular expression to match window titles or
@@ -242,30 +245,29 @@ Folders created within temporary folders must themselves be set temporary")
 
 
 
-        self.monitor.suspend()
+        p = autokey.model.phrase.Phrase(name, contents)
+        if send_mode in autokey.model.phrase.SendMode:
+            p.sendMode = send_mode
+        if abbreviations:
+            p.add_abbreviations(abbreviations)
+        if hotkey:
+            p.set_hotkey(*hotkey)
+        if window_filter:
+            p.set_window_titles(window_filter)
+        p.show_in_tray_menu = show_in_system_tray
+        p.prompt = always_prompt
+        p.temporary = temporary
+
+        folder.add_item(p)
         try:
-            p = autokey.model.phrase.Phrase(name, contents)
-            if send_mode in autokey.model.phrase.SendMode:
-                p.sendMode = send_mode
-            if abbreviations:
-                p.add_abbreviations(abbreviations)
-            if hotkey:
-                p.set_hotkey(*hotkey)
-            if window_filter:
-                p.set_window_titles(window_filter)
-            p.show_in_tray_menu = show_in_system_tray
-            p.prompt = always_prompt
-            p.temporary = temporary
-
-            folder.add_item(p)
             # Don't save a json if it is a temporary hotkey. Won't persist across
             # reloads.
             if not temporary:
                 p.persist()
-            return p
         finally:
-            self.monitor.unsuspend()
-            self.configManager.config_altered(False)
+            # After persisting, which sets the path
+            self.configManager.item_added(p)
+        return p
 
 
     def __clear_existing_hotkey(self, hotkey, window_filter):
@@ -273,6 +275,10 @@ Folders created within temporary folders must themselves be set temporary")
         if existing_item and not isinstance(existing_item, configmanager.configmanager.GlobalHotkey):
             if existing_item.filter_matches(window_filter):
                 existing_item.unset_hotkey()
+                if isinstance(existing_item, autokey.model.folder.Folder):
+                    self.configManager.folder_changed(existing_item)
+                else:
+                    self.configManager.item_changed(existing_item)
 
     def create_abbreviation(self, folder, description, abbr, contents):
         """
@@ -293,14 +299,12 @@ Folders created within temporary folders must themselves be set temporary")
         if not self.configManager.check_abbreviation_unique(abbr, None, None)[0]:
             raise Exception("The specified abbreviation is already in use")
 
-        self.monitor.suspend()
         p = autokey.model.phrase.Phrase(description, contents)
         p.modes.append(autokey.model.helpers.TriggerMode.ABBREVIATION)
         p.abbreviations = [abbr]
         folder.add_item(p)
         p.persist()
-        self.monitor.unsuspend()
-        self.configManager.config_altered(False)
+        self.configManager.item_added(p)
 
     def create_hotkey(self, folder, description, modifiers, key, contents):
         """
@@ -334,14 +338,12 @@ Folders created within temporary folders must themselves be set temporary")
         if not self.configManager.check_hotkey_unique(modifiers, key, None, None)[0]:
             raise Exception("The specified hotkey and modifier combination is already in use")
 
-        self.monitor.suspend()
         p = autokey.model.phrase.Phrase(description, contents)
         p.modes.append(autokey.model.helpers.TriggerMode.HOTKEY)
         p.set_hotkey(modifiers, key)
         folder.add_item(p)
         p.persist()
-        self.monitor.unsuspend()
-        self.configManager.config_altered(False)
+        self.configManager.item_added(p)
 
     def run_script(self, description, *args, **kwargs):
         """
@@ -362,8 +364,8 @@ Folders created within temporary folders must themselves be set temporary")
             self.runner.run_subscript(path)
         else:
             target_script = None
-            for item in self.configManager.allItems:
-                if item.description == description and isinstance(item, autokey.model.script.Script):
+            for item in self.configManager.itemsByDescription.get_all(description):
+                if isinstance(item, autokey.model.script.Script):
                     target_script = item
 
             if target_script is not None:
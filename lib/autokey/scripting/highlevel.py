@@ -1,5 +1,6 @@
 """
-Highlevel scripting API, requires xautomation to be installed
+Highlevel scripting API. Pattern search runs in-process if NumPy is installed, and requires xautomation otherwise.
+Mouse functions use the X connection of AutoKey when run from an AutoKey script, and xautomation otherwise.
 """
 
 import time
@@ -8,6 +9,15 @@ import subprocess
 import tempfile
 import imghdr
 import struct
+import typing
+
+from . import imagesearch
+
+if typing.TYPE_CHECKING:
+    import autokey.interface
+
+# The X interface of the running AutoKey instance, see set_interface
+_interface = None  # type: typing.Optional[autokey.interface.XInterfaceBase]
 
 
 class PatternNotFound(Exception):
@@ -29,7 +39,8 @@ def visgrep(scr: str, pat: str, tolerance: int = 0) -> int:
 
     Visual grep of scr for pattern pat.
 
-    Requires xautomation (http://hoopajoo.net/projects/xautomation.html).
+    Runs in-process, if NumPy is installed. Otherwise, requires xautomation
+    (http://hoopajoo.net/projects/xautomation.html).
 
     Usage: C{visgrep("screen.png", "pat.png")}
 
@@ -48,6 +59,12 @@ def visgrep(scr: str, pat: str, tolerance: int = 0) -> int:
         raise ValueError("tolerance must be ≥ 0.")
     with open(scr), open(pat):
         pass
+    if imagesearch.HAS_NUMPY:
+        matches = imagesearch.find_template(
+            imagesearch.read_png(scr), imagesearch.load_pattern(pat), tol, first_only=True)
+        if not matches:
+            raise PatternNotFound("{} not found in {}".format(pat, scr))
+        return list(matches[0])
     with tempfile.NamedTemporaryFile() as f:
         subprocess.call(['png2pat', pat], stdout=f)
         # don't use check_call, some versions (1.05) have a missing return statement in png2pat.c so the exit status ≠ 0
@@ -63,6 +80,39 @@ def visgrep(scr: str, pat: str, tolerance: int = 0) -> int:
     return coord
 
 
+def find_pattern(pat: str, tolerance: int = 0, region: (int, int, int, int) = None, first_only: bool = False,
+                 pyramid_levels: int = 0) -> typing.List[typing.Tuple[int, int]]:
+    """
+    Usage: C{find_pattern(pat: str, tolerance: int = 0, region=None, first_only=False, pyramid_levels=0) -> list}
+
+    Finds all occurrences of a pattern on the screen. Requires NumPy.
+
+    Decoded patterns are cached, so polling for a pattern in a loop is cheap. Restricting the search to a region
+    makes it faster still.
+
+    @param pat: path of pattern image (PNG) to look for.
+    @param tolerance: An integer ≥ 0 to specify the level of tolerance for 'fuzzy' matches.
+    @param region: Only search in the (x, y, width, height) area of the screen.
+    @param first_only: Stop the search at the first match, searching from the top.
+    @param pyramid_levels: If > 0, search a scaled down screen first. Faster for large patterns and fuzzy matches,
+    the result is the same. 1 or 2 are useful values.
+    @raise ValueError: Raised if tolerance is negative or not convertable to int
+    @raise ImportError: Raised if NumPy is not installed
+    @returns: Coordinates (x, y) of the topleft point of all matches, ordered from top to bottom. Empty, if not found.
+    """
+    tol = int(tolerance)
+    if tol < 0:
+        raise ValueError("tolerance must be ≥ 0.")
+    if not imagesearch.HAS_NUMPY:
+        raise ImportError("find_pattern requires NumPy")
+    matches = imagesearch.find_template(
+        imagesearch.capture_screen(region), imagesearch.load_pattern(pat), tol,
+        first_only=first_only, pyramid_levels=pyramid_levels)
+    if region is not None:
+        matches = [(x + region[0], y + region[1]) for x, y in matches]
+    return matches
+
+
 def get_png_dim(filepath: str) -> int:
     """
     Usage: C{get_png_dim(filepath:str) -> (int)}
@@ -78,51 +128,76 @@ def get_png_dim(filepath: str) -> int:
     return struct.unpack('!II', head[16:24])
 
 
+def set_interface(interface: "typing.Optional[autokey.interface.XInterfaceBase]"):
+    """
+    Called by the script runner, so that the mouse functions use the X connection of AutoKey instead of starting
+    C{xte} for every call. Without it, they require C{xautomation}.
+
+    @param interface: The XInterfaceBase of the running AutoKey instance, or None to use C{xautomation}
+    """
+    global _interface
+    _interface = interface
+
+
 def mouse_move(x: int, y: int, display: str=''):
     """
-    Moves the mouse using xte C{mousemove} from xautomation
+    Moves the mouse to a location on the screen. Returns once the mouse was moved.
 
     @param x: x location to move the mouse to
     @param y: y location to move the mouse to
-    @param display: X display to pass to C{xte}
+    @param display: X display to use. If given, C{xte} from xautomation is used.
     """
-    subprocess.call(['xte', '-x', display, "mousemove {} {}".format(int(x), int(y))])
+    if _interface is not None and not display:
+        _interface.move_cursor(int(x), int(y)).result()
+    else:
+        subprocess.call(['xte', '-x', display, "mousemove {} {}".format(int(x), int(y))])
 
 
 def mouse_rmove(x: int, y: int, display: str=''):
     """
-    Moves the mouse using xte C{mousermove} command from xautomation
+    Moves the mouse relative to its current location. Returns once the mouse was moved.
 
-    @param x: x location to move the mouse to
-    @param y: y location to move the mouse to
-    @param display: X display to pass to C{xte}
+    @param x: horizontal distance to move the mouse by
+    @param y: vertical distance to move the mouse by
+    @param display: X display to use. If given, C{xte} from xautomation is used.
     """
-    subprocess.call(['xte', '-x', display, "mousermove {} {}".format(int(x), int(y))])
+    if _interface is not None and not display:
+        _interface.move_cursor(int(x), int(y), relative_self=True).result()
+    else:
+        subprocess.call(['xte', '-x', display, "mousermove {} {}".format(int(x), int(y))])
 
 
 def mouse_click(button: int, display: str=''):
     """
-    Clicks the mouse in the current location using xte C{mouseclick} from xautomation
+    Clicks the mouse in the current location. Returns once the click was sent.
 
     @param button: Which button signal to send from the mouse
-    @param display: X display to pass to C{xte}
+    @param display: X display to use. If given, C{xte} from xautomation is used.
     """
-    subprocess.call(['xte', '-x', display, "mouseclick {}".format(int(button))])
+    if _interface is not None and not display:
+        _interface.send_mouse_click_relative(0, 0, int(button)).result()
+    else:
+        subprocess.call(['xte', '-x', display, "mouseclick {}".format(int(button))])
 
 
 def mouse_pos():
     """
-    Returns the current location of the mouse.
+    Returns the current location of the mouse, including the effect of preceding mouse functions.
 
     @returns: Returns the mouse location in a C{list}
     """
+    if _interface is not None:
+        _interface.barrier().result()
+        return list(_interface.mouse_location())
     tmp = subprocess.check_output("xmousepos").decode().split()
     return list(map(int, tmp))[:2]
 
 
-def click_on_pat(pat: str, mousebutton: int=1, offset: (float, float)=None, tolerance: int=0, restore_pos: bool=False) -> None:
+def click_on_pat(pat: str, mousebutton: int=1, offset: (float, float)=None, tolerance: int=0, restore_pos: bool=False,
+                 region: (int, int, int, int)=None) -> None:
     """
-    Requires C{imagemagick}, C{xautomation}, C{xwd}.
+    Without NumPy, requires C{xautomation}, C{imagemagick} and C{xwd}. Outside of AutoKey scripts, the mouse is moved
+    using C{xautomation}.
 
     Click on a pattern at a specified offset (x,y) in percent of the pattern dimension. x is the horizontal distance from the top left corner, y is the vertical distance from the top left corner. By default, the offset is (50,50), which means that the center of the pattern will be clicked at.
 
@@ -131,22 +206,35 @@ def click_on_pat(pat: str, mousebutton: int=1, offset: (float, float)=None, tole
     @param offset: offset from the top left point of the match. (float,float)
     @param tolerance: An integer ≥ 0 to specify the level of tolerance for 'fuzzy' matches. If negative or not convertible to int, raises ValueError.
     @param restore_pos: return to the initial mouse position after the click.
+    @param region: only search in the (x, y, width, height) area of the screen. Requires NumPy.
     @raises: L{PatternNotFound}: Raised when the pattern is not found on the screen
     """
     x0, y0 = mouse_pos()
-    move_to_pat(pat, offset, tolerance)
+    move_to_pat(pat, offset, tolerance, region)
     mouse_click(mousebutton)
     if restore_pos:
         mouse_move(x0, y0)
 
 
-def move_to_pat(pat: str, offset: (float, float)=None, tolerance: int=0) -> None:
+def move_to_pat(pat: str, offset: (float, float)=None, tolerance: int=0, region: (int, int, int, int)=None) -> None:
     """See L{click_on_pat}"""
-    with tempfile.NamedTemporaryFile() as f:
-        subprocess.call('''
-        xwd -root -silent -display :0 | 
-        convert xwd:- png:''' + f.name, shell=True)
-        loc = visgrep(f.name, pat, tolerance)
+    try:
+        matches = find_pattern(pat, tolerance, region, first_only=True)
+    except (ImportError, NotImplementedError):
+        if region is not None:
+            raise
+        # No NumPy, or a screen pixel format that the capture does not handle
+        matches = None
+    if matches is not None:
+        if not matches:
+            raise PatternNotFound("{} not found on the screen".format(pat))
+        loc = matches[0]
+    else:
+        with tempfile.NamedTemporaryFile() as f:
+            subprocess.call('''
+            xwd -root -silent -display :0 | 
+            convert xwd:- png:''' + f.name, shell=True)
+            loc = visgrep(f.name, pat, tolerance)
     pat_size = get_png_dim(pat)
     if offset is None:
         x, y = [l + ps//2 for l, ps in zip(loc, pat_size)]
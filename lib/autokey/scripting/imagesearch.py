@@ -0,0 +1,411 @@
+# Copyright (C) 2021 BlueDrink9
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+In-process screen capture and pattern search, used by L{highlevel} instead of the xautomation tools.
+
+Images are NumPy arrays of shape (height, width, channels) with 8 bit RGB or RGBA pixels. The search follows visgrep:
+a pattern matches at a position, if the sum of the absolute differences of all colour channels over all pattern
+pixels is at most the tolerance. Fully transparent pattern pixels are ignored.
+
+Requires NumPy. Without it, HAS_NUMPY is False and L{highlevel} uses the xautomation tools.
+"""
+
+import collections
+import os
+import struct
+import threading
+import typing
+import zlib
+
+try:
+    import numpy
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+from Xlib import X, display as xdisplay
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Channels per pixel by PNG colour type. Palette images (3) are expanded to RGB.
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+# Number of decoded patterns kept in memory
+PATTERN_CACHE_SIZE = 32
+# Maximum number of pixel values gathered at once, while narrowing down candidate positions
+PIXEL_GROUP_SIZE = 1 << 16
+# Candidates left, when they are checked one by one against the whole pattern
+FEW_CANDIDATES = 8
+# Rows of candidate positions searched at once, when only the first match is wanted
+EARLY_EXIT_BAND_HEIGHT = 64
+# Smallest pattern side length, in blocks, used at the coarsest pyramid level
+MIN_PYRAMID_PATTERN_SIZE = 4
+# With more coarse candidates, checking each at full resolution is slower than a full resolution search
+MAX_PYRAMID_CANDIDATES = 256
+
+Match = typing.Tuple[int, int]
+# x, y, width, height
+Region = typing.Optional[typing.Tuple[int, int, int, int]]
+
+logger = __import__("autokey.logger").logger.get_logger(__name__)
+
+_display = None
+_display_lock = threading.Lock()
+_pattern_cache = collections.OrderedDict()  # type: typing.Dict[typing.Tuple[str, int, int], Pattern]
+_pattern_cache_lock = threading.Lock()
+
+
+class ImageFormatError(ValueError):
+    """The image file is not a PNG image, or uses a PNG feature that is not supported."""
+
+
+def read_png(path: str) -> "numpy.ndarray":
+    """
+    Decode a non-interlaced 8 bit PNG image.
+
+    @param path: Path of the PNG file
+    @return: Array of shape (height, width, 3) for images without transparency, (height, width, 4) otherwise
+    @raise ImageFormatError: If the file is not a supported PNG image
+    """
+    with open(path, "rb") as png_file:
+        data = png_file.read()
+    if not data.startswith(PNG_SIGNATURE):
+        raise ImageFormatError("Not a PNG image: {}".format(path))
+    header = None
+    palette = transparency = None
+    compressed = []
+    offset = len(PNG_SIGNATURE)
+    while offset + 8 <= len(data):
+        length, chunk_type = struct.unpack("!I4s", data[offset:offset + 8])
+        chunk = data[offset + 8:offset + 8 + length]
+        offset += 12 + length
+        if chunk_type == b"IHDR":
+            header = struct.unpack("!IIBBBBB", chunk)
+        elif chunk_type == b"PLTE":
+            palette = numpy.frombuffer(chunk, numpy.uint8).reshape(-1, 3)
+        elif chunk_type == b"tRNS":
+            transparency = chunk
+        elif chunk_type == b"IDAT":
+            compressed.append(chunk)
+        elif chunk_type == b"IEND":
+            break
+    if header is None:
+        raise ImageFormatError("PNG image without header: {}".format(path))
+    width, height, bit_depth, colour_type, compression, png_filter, interlace = header
+    if bit_depth != 8 or interlace != 0 or colour_type not in PNG_CHANNELS:
+        raise ImageFormatError("Only non-interlaced PNG images with 8 bits per channel are supported: {}".format(path))
+    channels = PNG_CHANNELS[colour_type]
+    raw = _unfilter(zlib.decompress(b"".join(compressed)), width, height, channels)
+    image = raw.reshape(height, width, channels)
+
+    if colour_type == 3:
+        if palette is None:
+            raise ImageFormatError("Palette image without palette: {}".format(path))
+        indexes = image[:, :, 0]
+        image = palette[indexes]
+        if transparency is not None:
+            alpha = numpy.full(256, 255, numpy.uint8)
+            alpha[:len(transparency)] = numpy.frombuffer(transparency, numpy.uint8)
+            image = numpy.dstack((image, alpha[indexes]))
+    elif colour_type in (0, 4):
+        grey = numpy.repeat(image[:, :, :1], 3, axis=2)
+        image = numpy.dstack((grey, image[:, :, 1:])) if colour_type == 4 else grey
+    return image
+
+
+def _unfilter(data: bytes, width: int, height: int, bpp: int) -> "numpy.ndarray":
+    """Undo the PNG scanline filters. Returns the flat pixel data."""
+    stride = width * bpp
+    rows = numpy.frombuffer(data, numpy.uint8)[:height * (stride + 1)].reshape(height, stride + 1)
+    result = numpy.empty((height, stride), numpy.uint8)
+    previous = numpy.zeros(stride, numpy.uint8)
+    for index in range(height):
+        filter_type = rows[index, 0]
+        line = rows[index, 1:]
+        if filter_type == 0:
+            current = line
+        elif filter_type == 1:
+            # Sub: running sum of the pixels, modulo 256
+            current = numpy.cumsum(line.reshape(width, bpp), axis=0, dtype=numpy.uint8).reshape(stride)
+        elif filter_type == 2:
+            current = line + previous
+        elif filter_type in (3, 4):
+            current = numpy.frombuffer(_unfilter_sequential(filter_type, line.tobytes(), previous.tobytes(), bpp),
+                                       numpy.uint8)
+        else:
+            raise ImageFormatError("Invalid PNG filter type {}".format(filter_type))
+        result[index] = current
+        previous = result[index]
+    return result.reshape(-1)
+
+
+def _unfilter_sequential(filter_type: int, line: bytes, previous: bytes, bpp: int) -> bytearray:
+    """Average and Paeth filters depend on the decoded pixel to the left, so these are undone byte by byte."""
+    current = bytearray(line)
+    for index in range(len(current)):
+        left = current[index - bpp] if index >= bpp else 0
+        up = previous[index]
+        if filter_type == 3:
+            predictor = (left + up) >> 1
+        else:
+            upper_left = previous[index - bpp] if index >= bpp else 0
+            estimate = left + up - upper_left
+            distance_left = abs(estimate - left)
+            distance_up = abs(estimate - up)
+            distance_upper_left = abs(estimate - upper_left)
+            if distance_left <= distance_up and distance_left <= distance_upper_left:
+                predictor = left
+            elif distance_up <= distance_upper_left:
+                predictor = up
+            else:
+                predictor = upper_left
+        current[index] = (current[index] + predictor) & 0xFF
+    return current
+
+
+def capture_screen(region: Region=None) -> "numpy.ndarray":
+    """
+    Capture the screen content using GetImage on a dedicated X connection.
+
+    @param region: (x, y, width, height) of the captured area. The whole screen, if None.
+    @return: Array of shape (height, width, 3) with RGB pixels. It is a view into the received image data.
+    @raise NotImplementedError: If the X server uses a pixel format other than 32 bits per pixel in LSB first order
+    """
+    with _display_lock:
+        global _display
+        if _display is None:
+            _display = xdisplay.Display()
+        screen = _display.screen()
+        if region is None:
+            region = (0, 0, screen.width_in_pixels, screen.height_in_pixels)
+        x, y, width, height = region
+        reply = screen.root.get_image(x, y, width, height, X.ZPixmap, 0xFFFFFFFF)
+        info = _display.display.info
+    bits_per_pixel = [pixmap_format.bits_per_pixel for pixmap_format in info.pixmap_formats
+                      if pixmap_format.depth == reply.depth]
+    if bits_per_pixel != [32] or info.image_byte_order != X.LSBFirst:
+        raise NotImplementedError("Unsupported screen pixel format, depth {}".format(reply.depth))
+    data = reply.data
+    if isinstance(data, str):
+        data = data.encode("latin-1")
+    # Pixels are stored as B, G, R, unused. Reversing the first three channels gives RGB without copying.
+    return numpy.frombuffer(data, numpy.uint8).reshape(height, width, 4)[:, :, 2::-1]
+
+
+class Pattern:
+    """
+    A decoded pattern and the statistics used to search it. Patterns loaded from files are cached, see load_pattern.
+
+    @param image: RGB or RGBA pattern. Pixels with alpha 0 match anything.
+    """
+
+    def __init__(self, image: "numpy.ndarray"):
+        self.image = image
+        self.height, self.width = image.shape[:2]
+        rgb = image[:, :, :3].astype(numpy.int16)
+        if image.shape[2] == 4:
+            opaque = image[:, :, 3] > 0
+        else:
+            opaque = numpy.ones((self.height, self.width), bool)
+        pixels = numpy.argwhere(opaque)
+        colours = rgb[opaque]
+        # Compare the pixels least like the average colour first. These are the rarest on the screen, so they
+        # eliminate most candidates early.
+        if len(colours):
+            distinctness = numpy.abs(colours - colours.mean(axis=0)).sum(axis=1)
+            order = numpy.argsort(-distinctness, kind="stable")
+            pixels, colours = pixels[order], colours[order]
+        self.pixels = pixels
+        self.colours = colours
+        self.rgb = rgb
+        # None, if all pixels are compared
+        self.mask = None if opaque.all() else opaque
+        self._coarse = {}  # type: typing.Dict[int, typing.List[typing.Tuple[int, int, Pattern]]]
+
+    def coarse_patterns(self, scale: int) -> typing.List[typing.Tuple[int, int, "Pattern"]]:
+        """
+        The pattern reduced to sums of scale x scale blocks, as used by the pyramid search. A match can start at any
+        offset from the block grid of the image, so there is one reduced pattern per offset: the blocks of the
+        pattern starting at (offset_x, offset_y) line up with the image blocks. Blocks containing transparent pixels
+        are transparent.
+
+        @return: List of (offset_x, offset_y, reduced pattern)
+        """
+        coarse = self._coarse.get(scale)
+        if coarse is None:
+            coarse = []
+            alpha = self.image[:, :, 3] if self.image.shape[2] == 4 else numpy.full((self.height, self.width), 255)
+            for offset_y in range(scale):
+                for offset_x in range(scale):
+                    rgba = numpy.dstack((self.image[:, :, :3], alpha > 0))[offset_y:, offset_x:]
+                    sums = _block_sums(rgba, scale)
+                    # Opaque only if all pixels of the block are
+                    sums[:, :, 3] = (sums[:, :, 3] == scale * scale)
+                    coarse.append((offset_x, offset_y, Pattern(sums)))
+            self._coarse[scale] = coarse
+        return coarse
+
+
+def load_pattern(path: str) -> Pattern:
+    """
+    Return the pattern stored in the PNG file at path. Patterns are cached, keyed by path, modification time and
+    size, so that scripts searching the same patterns repeatedly decode each file only once.
+    """
+    file_stat = os.stat(path)
+    key = (os.path.abspath(path), file_stat.st_mtime_ns, file_stat.st_size)
+    with _pattern_cache_lock:
+        pattern = _pattern_cache.get(key)
+        if pattern is not None:
+            _pattern_cache.move_to_end(key)
+            return pattern
+    pattern = Pattern(read_png(path))
+    with _pattern_cache_lock:
+        _pattern_cache[key] = pattern
+        while len(_pattern_cache) > PATTERN_CACHE_SIZE:
+            _pattern_cache.popitem(last=False)
+    return pattern
+
+
+def find_template(image: "numpy.ndarray", template: typing.Union[Pattern, "numpy.ndarray"], tolerance: int=0,
+                  region: Region=None, first_only: bool=False, pyramid_levels: int=0) -> typing.List[Match]:
+    """
+    Find all positions of template in image.
+
+    Candidate positions are narrowed down pixel by pixel: each step compares a single pattern pixel against all
+    remaining candidates at once and drops the ones whose accumulated difference exceeds the tolerance. On real
+    screens, few candidates survive the first, most distinctive pattern pixels.
+
+    @param image: RGB or RGBA image to search. An alpha channel is ignored.
+    @param template: Pattern, or RGB or RGBA pattern image. Pixels with alpha 0 match anything.
+    @param tolerance: Maximum sum of absolute channel differences over the pattern
+    @param region: Only search matches inside the (x, y, width, height) area of the image
+    @param first_only: Stop at the first match. The image is searched in bands from the top, so the search ends early,
+    if the pattern is found near the top.
+    @param pyramid_levels: If > 0, first search the sums of 2 ** pyramid_levels sized square blocks of pixels, and
+    only check the candidates found there at full resolution. The results are the same, the coarse search is faster
+    for large patterns and fuzzy matches.
+    @return: (x, y) of the top left corner of all matches, ordered by y, then x
+    """
+    pattern = template if isinstance(template, Pattern) else Pattern(template)
+    image = image[:, :, :3]
+    offset_x = offset_y = 0
+    if region is not None:
+        offset_x, offset_y, width, height = region
+        image = image[offset_y:offset_y + height, offset_x:offset_x + width]
+    if pyramid_levels > 0:
+        matches = _pyramid_search(image, pattern, tolerance, pyramid_levels, first_only)
+    elif first_only:
+        matches = _banded_search(image, pattern, tolerance)
+    else:
+        matches = _search(image, pattern, tolerance)
+    return [(x + offset_x, y + offset_y) for x, y in matches]
+
+
+def _banded_search(image: "numpy.ndarray", pattern: Pattern, tolerance: int) -> typing.List[Match]:
+    """Search band after band from the top, returning the first match."""
+    rows = image.shape[0] - pattern.height + 1
+    for top in range(0, max(rows, 0), EARLY_EXIT_BAND_HEIGHT):
+        band = image[top:top + EARLY_EXIT_BAND_HEIGHT + pattern.height - 1]
+        matches = _search(band, pattern, tolerance)
+        if matches:
+            x, y = matches[0]
+            return [(x, y + top)]
+    return []
+
+
+def _pyramid_search(image: "numpy.ndarray", pattern: Pattern, tolerance: int, levels: int,
+                    first_only: bool) -> typing.List[Match]:
+    # Do not reduce the pattern below a few blocks, it would match almost everywhere.
+    while levels > 0 and (min(pattern.height, pattern.width) + 1 >> levels) - 1 < MIN_PYRAMID_PATTERN_SIZE:
+        levels -= 1
+    if levels == 0:
+        return _banded_search(image, pattern, tolerance) if first_only else _search(image, pattern, tolerance)
+    scale = 1 << levels
+    coarse_image = _block_sums(image, scale)
+    # The difference of two block sums is at most the summed differences of the pixels, so a match at full resolution
+    # is also a match of the block sums, using the same tolerance.
+    candidates = []
+    for offset_x, offset_y, coarse_pattern in pattern.coarse_patterns(scale):
+        for block_x, block_y in _search(coarse_image, coarse_pattern, tolerance):
+            candidates.append((block_x * scale - offset_x, block_y * scale - offset_y))
+        if len(candidates) > MAX_PYRAMID_CANDIDATES:
+            logger.debug("Pyramid search found too many coarse candidates, searching at full resolution")
+            return _banded_search(image, pattern, tolerance) if first_only else _search(image, pattern, tolerance)
+    matches = []
+    for x, y in sorted(candidates, key=lambda candidate: (candidate[1], candidate[0])):
+        if x < 0 or y < 0:
+            continue
+        if _search(image[y:y + pattern.height, x:x + pattern.width], pattern, tolerance):
+            matches.append((x, y))
+            if first_only:
+                break
+    return matches
+
+
+def _search(image: "numpy.ndarray", pattern: Pattern, tolerance: int) -> typing.List[Match]:
+    height, width = image.shape[:2]
+    rows = height - pattern.height + 1
+    columns = width - pattern.width + 1
+    if rows <= 0 or columns <= 0 or not pattern.height or not pattern.width:
+        return []
+    if not len(pattern.pixels):
+        return [(x, y) for y in range(rows) for x in range(columns)]
+
+    first_y, first_x = pattern.pixels[0]
+    window = image[first_y:first_y + rows, first_x:first_x + columns]
+    if tolerance == 0:
+        # Exact matches can be compared without widening the pixel values.
+        ys, xs = numpy.nonzero((window == pattern.colours[0]).all(axis=2))
+        costs = numpy.zeros(len(ys), numpy.int64)
+    else:
+        costs = numpy.abs(window.astype(numpy.int16) - pattern.colours[0]).sum(axis=2)
+        ys, xs = numpy.nonzero(costs <= tolerance)
+        costs = costs[ys, xs].astype(numpy.int64)
+    checked = 1
+    while len(ys) > FEW_CANDIDATES and checked < len(pattern.pixels):
+        # Compare a group of pixels at once. The group grows, as fewer candidates are left.
+        group = slice(checked, min(checked + max(1, PIXEL_GROUP_SIZE // len(ys)), len(pattern.pixels)))
+        pixel_ys, pixel_xs = pattern.pixels[group].T
+        values = image[ys[:, None] + pixel_ys, xs[:, None] + pixel_xs].astype(numpy.int16)
+        costs = costs + numpy.abs(values - pattern.colours[group]).sum(axis=(1, 2))
+        keep = costs <= tolerance
+        ys, xs, costs = ys[keep], xs[keep], costs[keep]
+        checked = group.stop
+    if checked < len(pattern.pixels):
+        # Check the last few candidates against the whole pattern.
+        found = []
+        for y, x in zip(ys, xs):
+            difference = numpy.abs(
+                image[y:y + pattern.height, x:x + pattern.width].astype(numpy.int16) - pattern.rgb).sum(axis=2)
+            if pattern.mask is not None:
+                difference = difference[pattern.mask]
+            if difference.sum() <= tolerance:
+                found.append((int(x), int(y)))
+        return found
+    return [(int(x), int(y)) for y, x in zip(ys, xs)]
+
+
+def _block_sums(image: "numpy.ndarray", scale: int) -> "numpy.ndarray":
+    """
+    Sum the pixel values of each scale x scale block, for scale a power of two. Incomplete blocks at the right and
+    bottom are dropped.
+    """
+    height, width = image.shape[0] // scale * scale, image.shape[1] // scale * scale
+    sums = image[:height, :width].astype(numpy.int16)
+    while scale > 1:
+        # Adding up 2x2 blocks in strided views is much faster than summing the axes of a reshaped array.
+        sums = sums[0::2, 0::2] + sums[1::2, 0::2] + sums[0::2, 1::2] + sums[1::2, 1::2]
+        scale //= 2
+    return sums
@@ -20,6 +20,9 @@ import autokey.model.phrase
 import autokey.iomediator.waiter
 from autokey import iomediator, model
 from typing import Callable
+from autokey.iomediator.sendstream import SendHandle, STREAM_CHUNK_SIZE
+
+_KEYSTROKE_MODES = (autokey.model.phrase.SendMode.KEYBOARD, autokey.model.phrase.SendMode.XTEST)
 
 class Keyboard:
     """
@@ -42,11 +45,14 @@ class Keyboard:
         Trying to send special keys using a clipboard pasting method will paste the literal representation
         (e.g. "<ctrl>+<f11>") instead of the actual special key or key combination.
 
+        Long strings are typed in chunks and this function returns after they were typed. Typing them can be stopped
+        using the global cancel hotkey. See L{stream_keys} to type in the background.
 
         Usage: C{keyboard.send_keys(keyString)}
 
         @param key_string: string of keys to send. Special keys are only possible in keyboard mode.
-        @param send_mode: Determines how the string is sent.
+        @param send_mode: Determines how the string is sent. C{keyboard.SendMode.AUTO} chooses the mode based on the
+            string and the active window.
         """
 
         if not isinstance(key_string, str):
@@ -54,13 +60,52 @@ class Keyboard:
         send_mode = _validate_send_mode(send_mode)
         self.mediator.interface.begin_send()
         try:
-            if send_mode is autokey.model.phrase.SendMode.KEYBOARD:
+            if send_mode is autokey.model.phrase.SendMode.AUTO:
+                send_mode = self.mediator.resolve_send_mode(key_string, send_mode)
+            if send_mode in _KEYSTROKE_MODES and len(key_string) > STREAM_CHUNK_SIZE:
+                # Typed in chunks, so that it can be cancelled using the cancel hotkey.
+                use_xtest = send_mode is autokey.model.phrase.SendMode.XTEST
+                self.mediator.send_stream(key_string, use_xtest=use_xtest).wait()
+            elif send_mode is autokey.model.phrase.SendMode.KEYBOARD:
                 self.mediator.send_string(key_string)
+            elif send_mode is autokey.model.phrase.SendMode.XTEST:
+                self.mediator.send_string(key_string, use_xtest=True)
             else:
                 self.mediator.paste_string(key_string, send_mode)
         finally:
             self.mediator.interface.finish_send()
 
+    def stream_keys(self, source, progress_callback: typing.Optional[Callable[[int], None]]=None,
+                    send_mode: typing.Union[autokey.model.phrase.SendMode, int]=autokey.model.phrase.SendMode.KEYBOARD
+                    ) -> SendHandle:
+        """
+        Type a very large string, or strings produced by an iterable like a generator, in the background.
+
+        The content is typed in small chunks, and only produced as fast as it is typed. Typing can be stopped at any
+        time using the returned handle or the global cancel hotkey (<super>+<shift>+<escape> by default).
+
+        Usage: C{handle = keyboard.stream_keys(source, progress_callback=None, send_mode=keyboard.SendMode.KEYBOARD)}
+
+        Example::
+
+            handle = keyboard.stream_keys(open("/tmp/long_text.txt"))
+            if not handle.wait(timeout=60):
+                handle.cancel()
+
+        @param source: string, or iterable of strings, to type. Special keys like <enter> are supported.
+        @param progress_callback: Optional callable, called with the number of characters typed so far
+        @param send_mode: C{keyboard.SendMode.KEYBOARD} or C{keyboard.SendMode.XTEST}
+        @return: Handle with the methods C{wait(timeout=None)} and C{cancel()}, and the attributes C{sent}, C{done}
+            and C{cancelled}
+        """
+        if isinstance(source, (bytes, bytearray)) or not isinstance(source, (str, typing.Iterable)):
+            raise TypeError("Only strings or iterables of strings can be sent using this function")
+        send_mode = _validate_send_mode(send_mode)
+        if send_mode not in _KEYSTROKE_MODES:
+            raise ValueError("Only the keyboard send modes can be used for streaming, got {}".format(send_mode))
+        return self.mediator.send_stream(
+            source, use_xtest=send_mode is autokey.model.phrase.SendMode.XTEST, progress_callback=progress_callback)
+
     def send_key(self, key, repeat=1):
         """
         Send a keyboard event
@@ -12,10 +12,10 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
-"""Mouse functions, see also L{highlevel} for mouse move and click functions using C{xte} from C{xautomation}"""
+"""Mouse functions, see also L{highlevel} for pattern based mouse functions"""
 
+import concurrent.futures
 import typing
-import time
 
 if typing.TYPE_CHECKING:
     import autokey.iomediator.iomediator
@@ -120,6 +120,22 @@ class Mouse:
         """
         self.interface.move_cursor(x, y, relative_self=True)
 
+    def move_path(self, points, duration=0.0):
+        """
+        Move the mouse cursor along a path, visiting each point in order, at constant speed
+
+        The motion is sent as real mouse motion events, so that it can be used to drag or draw, for example:
+        C{mouse.press_button(1)
+        mouse.move_path([(100, 100), (300, 100), (300, 250)], 1.5)
+        mouse.release_button(1)}
+
+        Usage: C{mouse.move_path(points, duration=0.0)}
+
+        @param points: list of (x, y) screen coordinates in pixels. The cursor is moved to the first one immediately.
+        @param duration: time in seconds to travel the whole path. If 0, the cursor jumps from point to point.
+        """
+        self.interface.move_path(points, duration)
+
     def press_button(self, button):
         """
         Send mouse button down signal at current  location
@@ -176,7 +192,9 @@ class Mouse:
     def get_location(self):
         """
         Returns the current location of the mouse.
-        Incorporates a tiny delay in order to make sure AutoKey executes any queued commands before checking the location.
+        Waits until AutoKey executed all queued commands before checking the location, so that the location
+        includes preceding moves. While AutoKey shuts down, queued commands are dropped, and the location is returned
+        without waiting.
         C{mouse.move_cursor(0,0)
         x,y = mouse.get_location()}
 
@@ -185,23 +203,29 @@ class Mouse:
         @return: x,y location of the mouse
         @rtype: C{tuple(int,int)}
         """
-        #minimal delay added to make sure location is correct
-        time.sleep(0.05)
+        self._wait_for_queued_commands()
         return self.interface.mouse_location()
 
     def get_relative_location(self):
         """
         Returns the relative location of the mouse in the window that has input focus
-        Incorporates a tiny delay in order to make sure AutoKey executes any queued commands
+        Waits until AutoKey executed all queued commands before checking the location, like L{get_location}.
 
         Usage: C{mouse.get_relative_location()}
         
         @return: x,y location of the mouse relative to the top left hand corner of the window that has input focus
         @rtype: C{tuple(int, int)}
         """
-        time.sleep(0.05)
+        self._wait_for_queued_commands()
         return self.interface.relative_mouse_location()
 
+    def _wait_for_queued_commands(self):
+        try:
+            self.interface.barrier().result()
+        except concurrent.futures.CancelledError:
+            # The event thread stopped, the queued commands will never run
+            pass
+
     def scroll_down(self, number):
         """
         Fires the mouse button 5 signal the specified number of times.
@@ -13,16 +13,22 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-"""Basic window management. Requies C{wmctrl} to be installed."""
+"""Basic window management. Uses the EWMH hints of the window manager, or C{wmctrl} as a fallback."""
 
 import re
 import subprocess
-import time
+import typing
+
+from Xlib import error
+
+from autokey.ewmh import ClientWindow, WindowManager, WindowManagerUnavailable
+
+logger = __import__("autokey.logger").logger.get_logger(__name__)
 
 
 class Window:
     """
-    Basic window management using wmctrl
+    Basic window management using the EWMH hints of the window manager, or wmctrl as a fallback
 
     Note: in all cases where a window title is required (with the exception of wait_for_focus()),
     two special values of window title are permitted:
@@ -48,18 +54,8 @@ class Window:
         @rtype: boolean
         """
         regex = re.compile(title)
-        waited = 0
-        while waited <= timeOut:
-            if regex.match(self.mediator.interface.get_window_title()):
-                return True
-
-            if timeOut == 0:
-                break  # zero length timeout, if not matched go straight to end
-
-            time.sleep(0.3)
-            waited += 0.3
-
-        return False
+        interface = self.mediator.interface
+        return interface.wait_for_window(lambda: regex.match(interface.get_window_title()) is not None, timeOut)
 
     def wait_for_exist(self, title, timeOut=5):
         """
@@ -75,20 +71,9 @@ class Window:
         @rtype: boolean
         """
         regex = re.compile(title)
-        waited = 0
-        while waited <= timeOut:
-            retCode, output = self._run_wmctrl(["-l"])
-            for line in output.split('\n'):
-                if regex.match(line[14:].split(' ', 1)[-1]):
-                    return True
-
-            if timeOut == 0:
-                break  # zero length timeout, if not matched go straight to end
-
-            time.sleep(0.3)
-            waited += 0.3
-
-        return False
+        interface = self.mediator.interface
+        return interface.wait_for_window(
+            lambda: any(regex.match(window_title) for window_title in interface.get_window_titles()), timeOut)
 
     def activate(self, title, switchDesktop=False, matchClass=False):
         """
@@ -109,7 +94,8 @@ class Window:
             args = ["-R", title]
         if matchClass:
             args += ["-x"]
-        self._run_wmctrl(args)
+        self._manage_window(
+            title, matchClass, lambda manager, window_id: manager.activate(window_id, switchDesktop), args)
 
     def close(self, title, matchClass=False):
         """
@@ -121,9 +107,10 @@ class Window:
         @param matchClass: if True, match on the window class instead of the title
         """
         if matchClass:
-            self._run_wmctrl(["-c", title, "-x"])
+            args = ["-c", title, "-x"]
         else:
-            self._run_wmctrl(["-c", title])
+            args = ["-c", title]
+        self._manage_window(title, matchClass, lambda manager, window_id: manager.close(window_id), args)
 
     def resize_move(self, title, xOrigin=-1, yOrigin=-1, width=-1, height=-1, matchClass=False):
         """
@@ -146,7 +133,10 @@ class Window:
             xArgs = ["-x"]
         else:
             xArgs = []
-        self._run_wmctrl(["-r", title, "-e", ','.join(mvArgs)] + xArgs)
+        self._manage_window(
+            title, matchClass,
+            lambda manager, window_id: manager.move_resize(window_id, xOrigin, yOrigin, width, height),
+            ["-r", title, "-e", ','.join(mvArgs)] + xArgs)
 
     def move_to_desktop(self, title, deskNum, matchClass=False):
         """
@@ -162,7 +152,9 @@ class Window:
             xArgs = ["-x"]
         else:
             xArgs = []
-        self._run_wmctrl(["-r", title, "-t", str(deskNum)] + xArgs)
+        self._manage_window(
+            title, matchClass, lambda manager, window_id: manager.move_to_desktop(window_id, deskNum),
+            ["-r", title, "-t", str(deskNum)] + xArgs)
 
     def switch_desktop(self, deskNum):
         """
@@ -172,7 +164,11 @@ class Window:
 
         @param deskNum: desktop to switch to (note: zero based)
         """
-        self._run_wmctrl(["-s", str(deskNum)])
+        try:
+            self.mediator.interface.windowManager.switch_desktop(deskNum)
+        except (WindowManagerUnavailable, error.XError) as e:
+            logger.debug("Switching the desktop using wmctrl: %s", e)
+            self._run_wmctrl(["-s", str(deskNum)])
 
     def set_property(self, title, action, prop, matchClass=False):
         """
@@ -193,7 +189,9 @@ class Window:
             xArgs = ["-x"]
         else:
             xArgs = []
-        self._run_wmctrl(["-r", title, "-b" + action + ',' + prop] + xArgs)
+        self._manage_window(
+            title, matchClass, lambda manager, window_id: manager.set_state(window_id, action, prop),
+            ["-r", title, "-b" + action + ',' + prop] + xArgs)
 
     def get_active_geometry(self):
         """
@@ -204,6 +202,13 @@ class Window:
         @return: a 4-tuple containing the x-origin, y-origin, width and height of the window (in pixels)
         @rtype: C{tuple(int, int, int, int)}
         """
+        manager = self.mediator.interface.windowManager
+        try:
+            window_id = manager.active_window()
+            if window_id is not None:
+                return list(manager.geometry(window_id))
+        except error.XError as e:
+            logger.debug("Reading the active window geometry using wmctrl: %s", e)
         active = self.mediator.interface.get_window_title()
         result, output = self._run_wmctrl(["-l", "-G"])
         matchingLine = None
@@ -218,6 +223,31 @@ class Window:
         else:
             return None
 
+    def list_windows(self) -> typing.List[ClientWindow]:
+        """
+        Get all windows managed by the window manager, with their desktop and geometry
+
+        Usage: C{window.list_windows()}
+
+        @return: a list of named tuples with the fields id, title, wm_class, desktop, x, y, width and height.
+        The desktop is -1 for windows shown on all desktops.
+        @rtype: C{list(ClientWindow)}
+        """
+        try:
+            return self.mediator.interface.windowManager.list_windows()
+        except (WindowManagerUnavailable, error.XError) as e:
+            logger.debug("Listing windows using wmctrl: %s", e)
+        result, output = self._run_wmctrl(["-l", "-G", "-x"])
+        windows = []
+        for line in output.split('\n'):
+            fields = line.split(None, 8)
+            if len(fields) < 8:
+                continue
+            title = fields[8] if len(fields) == 9 else ""
+            window_id, desktop, x, y, width, height = (int(value, 0) for value in fields[:6])
+            windows.append(ClientWindow(window_id, title, fields[6], desktop, x, y, width, height))
+        return windows
+
     def get_active_title(self):
         """
         Get the visible title of the currently active window
@@ -240,6 +270,23 @@ class Window:
         """
         return self.mediator.interface.get_window_class()
 
+    def _manage_window(self, title: str, matchClass: bool,
+                       operation: typing.Callable[[WindowManager, int], None], wmctrlArgs: typing.List[str]):
+        """
+        Apply operation to the first window matching title, using the EWMH window manager directly. Falls back to
+        running wmctrl with wmctrlArgs, if there is no EWMH window manager, or title is :SELECT:.
+        """
+        if title != ":SELECT:":
+            manager = self.mediator.interface.windowManager
+            try:
+                window_id = manager.find_window(title, matchClass)
+                if window_id is not None:
+                    operation(manager, window_id)
+                return
+            except (WindowManagerUnavailable, error.XError) as e:
+                logger.debug("Managing the window using wmctrl: %s", e)
+        self._run_wmctrl(wmctrlArgs)
+
     def _run_wmctrl(self, args):
         try:
             with subprocess.Popen(["wmctrl"] + args, stdout=subprocess.PIPE) as p:
@@ -31,11 +31,14 @@ import autokey.model.script
 import autokey.model.store
 from autokey.model.key import Key, KEY_FIND_RE
 from autokey.iomediator.iomediator import IoMediator
+from autokey.iomediator.sendstream import STREAM_CHUNK_SIZE
 
 from autokey.macro import MacroManager
+from autokey import stats
 
 import autokey.scripting
 from autokey.configmanager.configmanager import ConfigManager, save_config
+from autokey.model.file_writer import file_writer
 import autokey.configmanager.configmanager_constants as cm_constants
 
 logger = __import__("autokey.logger").logger.get_logger(__name__)
@@ -114,13 +117,17 @@ class Service:
         if self.mediator is not None: self.mediator.shutdown()
         if save:
             save_config(self.configManager)
+        file_writer.flush()
+        stats.log_report()
         logger.debug("Service shutdown completed.")
 
     def handle_mouseclick(self, rootX, rootY, relX, relY, button, windowTitle):
         # logger.debug("Received mouse click - resetting buffer")
         self.inputStack.clear()
 
-        logger.log(level=9, msg="Mouse click at root:("+str(rootX)+", "+str(rootY)+") Relative:("+str(relX)+","+str(relY)+") Button: "+str(button)+" In window: "+str(windowTitle))
+        # Arguments are only formatted if the level is enabled. They are resolved lazily by the interface.
+        logger.log(9, "Mouse click at root:(%s, %s) Relative:(%s,%s) Button: %s In window: %s",
+                   rootX, rootY, relX, relY, button, windowTitle)
         # If we had a menu and receive a mouse click, means we already
         # hid the menu. Don't need to do it again
         self.lastMenu = None
@@ -128,6 +135,15 @@ class Service:
         # Clear last to prevent undo of previous phrase in unexpected places
         self.phraseRunner.clear_last()
 
+    def handle_keypress_during_send(self, rawKey, modifiers, key, window_info):
+        """
+        Handle a key typed while AutoKey sends keys. The interface buffers these keys and types them after the send,
+        so they are not added to the abbreviation input. Global hotkeys, like the one cancelling the send, still work.
+        """
+        logger.debug("Raw key typed during send: %r, modifiers: %r", rawKey, modifiers)
+        for hotkey in self.configManager.globalHotkeys:
+            hotkey.check_hotkey(modifiers, rawKey, window_info)
+
     def handle_keypress(self, rawKey, modifiers, key, window_info):
         logger.debug("Raw key: %r, modifiers: %r, Key: %s", rawKey, modifiers, key)
         logger.debug("Window visible title: %r, Window class: %r" % window_info)
@@ -221,10 +237,7 @@ class Service:
             logger.exception("Ignored locking error in handle_keypress")
 
     def run_folder(self, name):
-        folder = None
-        for f in self.configManager.allFolders:
-            if f.title == name:
-                folder = f
+        folder = self.configManager.foldersByTitle.get(name)
 
         if folder is None:
             raise Exception("No folder found with name '%s'" % name)
@@ -246,8 +259,8 @@ class Service:
             self.scriptRunner.execute_script(script)
 
     def __findItem(self, name, objType, typeDescription):
-        for item in self.configManager.allItems:
-            if item.description == name and isinstance(item, objType):
+        for item in self.configManager.itemsByDescription.get_all(name):
+            if isinstance(item, objType):
                 return item
 
         raise Exception("No %s found with name '%s'" % (typeDescription, name))
@@ -412,10 +425,16 @@ class PhraseRunner:
 
             self.contains_special_keys = self.phrase_contains_special_keys(expansion)
             mediator.send_backspace(expansion.backspaces)
-            if phrase.sendMode == autokey.model.phrase.SendMode.KEYBOARD:
-                mediator.send_string(expansion.string)
+            send_mode = mediator.resolve_send_mode(expansion.string, phrase.sendMode)
+            use_xtest = send_mode == autokey.model.phrase.SendMode.XTEST
+            if send_mode in (autokey.model.phrase.SendMode.KEYBOARD, autokey.model.phrase.SendMode.XTEST):
+                if len(expansion.string) > STREAM_CHUNK_SIZE:
+                    # Typed in chunks, so that it can be cancelled using the cancel hotkey.
+                    mediator.send_stream(expansion.string, use_xtest=use_xtest).wait()
+                else:
+                    mediator.send_string(expansion.string, use_xtest=use_xtest)
             else:
-                mediator.paste_string(expansion.string, phrase.sendMode)
+                mediator.paste_string(expansion.string, send_mode)
 
             self.lastExpansion = expansion
             self.lastPhrase = phrase
@@ -472,6 +491,7 @@ class ScriptRunner:
         self.error_records = []  # type: typing.List[autokey.model.ScriptErrorRecord]
         self.scope = globals()
         self.scope["highlevel"] = autokey.scripting.highlevel
+        autokey.scripting.highlevel.set_interface(mediator.interface)
         self.scope["keyboard"] = autokey.scripting.Keyboard(mediator)
         self.scope["mouse"] = autokey.scripting.Mouse(mediator)
         self.scope["system"] = autokey.scripting.System()
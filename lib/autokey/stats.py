@@ -0,0 +1,124 @@
+# Copyright (C) 2021 BlueDrink9
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Run-time statistics, like cache hit rates, X round-trips and timings.
+
+Collecting is cheap and thread-safe, so it is always enabled. The report is written to the log when the service
+shuts down, and can be requested at any time using report().
+"""
+
+import collections
+import contextlib
+import threading
+import time
+import typing
+
+logger = __import__("autokey.logger").logger.get_logger(__name__)
+
+_lock = threading.Lock()
+_counters = collections.Counter()  # type: typing.Counter[str]
+_values = {}  # type: typing.Dict[str, _ValueSummary]
+
+
+class _ValueSummary:
+    """Running summary of a recorded value. Keeps constant memory, regardless of the number of samples."""
+
+    __slots__ = ("count", "total", "minimum", "maximum")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def as_dict(self) -> typing.Dict[str, float]:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count,
+            "min": self.minimum,
+            "max": self.maximum,
+        }
+
+
+def increment(name: str, amount: int=1):
+    """Increase the counter name by amount."""
+    with _lock:
+        _counters[name] += amount
+
+
+def record(name: str, value: float):
+    """Add a sample to the value summary name. The report shows count, mean, minimum and maximum."""
+    with _lock:
+        summary = _values.get(name)
+        if summary is None:
+            summary = _values[name] = _ValueSummary()
+        summary.add(value)
+
+
+@contextlib.contextmanager
+def timed(name: str):
+    """Context manager recording the run time of the enclosed block in seconds."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def snapshot() -> typing.Dict[str, typing.Dict]:
+    """
+    Return a copy of all statistics.
+
+    @return: Dict with the keys "counters", mapping names to counts, and "values", mapping names to dicts with the
+    keys count, total, mean, min and max.
+    """
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "values": {name: summary.as_dict() for name, summary in _values.items()},
+        }
+
+
+def reset():
+    """Clear all statistics."""
+    with _lock:
+        _counters.clear()
+        _values.clear()
+
+
+def report() -> str:
+    """Format all statistics as human readable text, one statistic per line, sorted by name."""
+    data = snapshot()
+    lines = ["{}: {}".format(name, count) for name, count in sorted(data["counters"].items())]
+    for name, summary in sorted(data["values"].items()):
+        lines.append("{}: mean {:.4g}, min {:.4g}, max {:.4g} ({} samples)".format(
+            name, summary["mean"], summary["min"], summary["max"], summary["count"]))
+    return "\n".join(lines)
+
+
+def log_report():
+    text = report()
+    if text:
+        logger.info("Run-time statistics:\n%s", text)
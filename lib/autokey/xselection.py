@@ -0,0 +1,359 @@
+# Copyright (C) 2021 BlueDrink9
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Direct ownership of the X selections (CLIPBOARD and PRIMARY), used to paste phrases.
+
+Pasting through the GUI toolkit clipboard has no way to know when the target application fetched the content, so the
+previous content had to be restored after a fixed delay. Owning the selection directly lets AutoKey see the
+SelectionRequest of the target application, and restore the previous content right after the data was delivered.
+Clipboard managers fetch the content as soon as the ownership changes, before the target application received the
+paste command. So only requests by the client of the target window, made after the paste command was sent, count as
+delivered.
+
+Only the simple, non-incremental (INCR) transfer is supported. Content too large for a single property, or a previous
+owner that answers with INCR, raises SelectionUnavailable, so that the caller can fall back to the toolkit clipboard.
+"""
+
+import os
+import select
+import threading
+import time
+import typing
+
+# Imported to enable threading in Xlib. Not an unused import statement.
+import Xlib.threaded as xlib_threaded
+del xlib_threaded
+
+from Xlib import X, Xatom, display, error
+from Xlib.protocol import event, request
+
+from autokey import stats
+
+logger = __import__("autokey.logger").logger.get_logger(__name__)
+
+# After the first text request of the target application, keep serving the pasted text a bit longer. Some applications fetch the content more
+# than once, for example first as UTF8_STRING and then as STRING.
+RESTORE_GRACE_TIME = 0.05
+# Time to wait for the previous owner to deliver the content that is restored after pasting.
+READ_TIMEOUT = 1.0
+# Fraction of the maximum request size usable for property data, leaving room for the request header.
+MAX_PROPERTY_FRACTION = 0.9
+
+
+class SelectionUnavailable(Exception):
+    """The selection can not be handled directly. The toolkit clipboard has to be used instead."""
+
+
+class _PendingRead:
+
+    def __init__(self, selection: int):
+        self.selection = selection
+        self.done = threading.Event()
+        self.content = None  # type: typing.Optional[bytes]
+        self.incremental = False
+
+
+class _SelectionState:
+    """Content served for one selection, and the pending restore."""
+
+    def __init__(self):
+        self.content = None  # type: typing.Optional[bytes]
+        # Set while pasted content is served. The content to restore and the time limits.
+        self.backup = None  # type: typing.Optional[bytes]
+        self.restore_pending = False
+        self.restore_deadline = 0.0
+        self.delivered = False
+        self.pasted_at = 0.0
+        # Set once the paste command was sent. Only then requests of the target client count as delivery.
+        self.paste_sent = False
+        self.target_client = None  # type: typing.Optional[int]
+        # Time the paste was requested, including reading the backup, and the length of the pasted text
+        self.requested_at = 0.0
+        self.length = 0
+
+
+class XSelectionOwner:
+    """
+    Owns X selections on a dedicated connection and serves their content from a background thread.
+    """
+
+    def __init__(self, on_delivered: typing.Optional[typing.Callable[[int, int, float], None]]=None):
+        """
+        @param on_delivered: Optional callback, called from the owner thread when pasted text was fetched the first
+        time. Arguments are the selection atom, the number of pasted characters and the seconds since paste_from()
+        was called.
+        """
+        self._on_delivered = on_delivered
+        self._display = display.Display()
+        screen = self._display.screen()
+        self._window = screen.root.create_window(
+            0, 0, 1, 1, 0, screen.root_depth, event_mask=X.PropertyChangeMask)
+        self._atoms = {
+            name: self._display.intern_atom(name)
+            for name in ("CLIPBOARD", "TARGETS", "UTF8_STRING", "TEXT", "text/plain;charset=utf-8",
+                         "INCR", "AUTOKEY_SELECTION")
+        }
+        self._text_targets = {
+            self._atoms["UTF8_STRING"], self._atoms["TEXT"], self._atoms["text/plain;charset=utf-8"], Xatom.STRING
+        }
+        # Windows of the same client share the bits of their id outside of this mask
+        self._resource_id_mask = self._display.display.info.resource_id_mask
+        self._max_property_size = int(self._display.display.info.max_request_length * 4 * MAX_PROPERTY_FRACTION)
+        self._ignore_bad_window = error.CatchError(error.BadWindow)
+        self._lock = threading.Lock()
+        self._states = {Xatom.PRIMARY: _SelectionState(), self._atoms["CLIPBOARD"]: _SelectionState()}
+        self._pending_read = None  # type: typing.Optional[_PendingRead]
+        self._shutdown = False
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        self._thread = threading.Thread(target=self._run, name="XSelectionOwner-thread", daemon=True)
+        self._thread.start()
+
+    @property
+    def clipboard(self) -> int:
+        """The atom of the CLIPBOARD selection."""
+        return self._atoms["CLIPBOARD"]
+
+    @property
+    def primary(self) -> int:
+        """The atom of the PRIMARY selection."""
+        return Xatom.PRIMARY
+
+    def paste_from(self, selection: int, text: str, restore_timeout: float):
+        """
+        Take ownership of the selection and serve text, until the target application fetched it. Then restore the
+        previous content. If the target does not fetch the content within restore_timeout seconds, restore it anyway.
+
+        Call this before sending the paste command, and L{paste_sent} after it. Does not block until the content is
+        fetched.
+
+        @raise SelectionUnavailable: If the text or the previous content is too large to be handled directly
+        """
+        requested_at = time.monotonic()
+        content = text.encode("utf-8")
+        if len(content) > self._max_property_size:
+            raise SelectionUnavailable("Content requires an incremental transfer")
+
+        state = self._states[selection]
+        with self._lock:
+            restore_pending = state.restore_pending
+            backup = state.backup
+        if not restore_pending:
+            # Not already pasting, so remember what the user had in the selection.
+            backup = self._read(selection)
+
+        with self._lock:
+            state.content = content
+            state.backup = backup
+            state.restore_pending = True
+            state.delivered = False
+            state.paste_sent = False
+            state.target_client = None
+            state.pasted_at = time.monotonic()
+            state.requested_at = requested_at
+            state.length = len(text)
+            state.restore_deadline = state.pasted_at + restore_timeout
+        self._window.set_selection_owner(selection, X.CurrentTime)
+        if not self._is_owner(selection):
+            with self._lock:
+                state.content = None
+                state.restore_pending = False
+            raise SelectionUnavailable("Could not acquire the selection")
+        self._wake()
+
+    def paste_sent(self, selection: int, target_window: typing.Optional[int]):
+        """
+        Called after the paste command was sent. From now on, the first text request of the client owning
+        target_window counts as delivery, and the previous content is restored shortly after it. Requests made before,
+        or by other clients like clipboard managers, are served without ending the paste.
+
+        @param target_window: Id of the window receiving the paste command, or None to accept any client
+        """
+        state = self._states[selection]
+        with self._lock:
+            if not state.restore_pending:
+                return
+            state.paste_sent = True
+            state.target_client = None if target_window is None else self._client(target_window)
+
+    def _client(self, window_id: int) -> int:
+        return window_id & ~self._resource_id_mask
+
+    def _is_owner(self, selection: int) -> bool:
+        owner = self._display.get_selection_owner(selection)
+        return owner != X.NONE and owner.id == self._window.id
+
+    def _read(self, selection: int) -> typing.Optional[bytes]:
+        """
+        Read the current content of the selection as UTF-8 text.
+
+        @raise SelectionUnavailable: If the owner sends it incrementally
+        """
+        state = self._states[selection]
+        owner = self._display.get_selection_owner(selection)
+        if owner == X.NONE:
+            return None
+        if owner.id == self._window.id:
+            with self._lock:
+                return state.content
+
+        pending = _PendingRead(selection)
+        with self._lock:
+            self._pending_read = pending
+        self._window.convert_selection(
+            selection, self._atoms["UTF8_STRING"], self._atoms["AUTOKEY_SELECTION"], X.CurrentTime)
+        self._display.flush()
+        if not pending.done.wait(READ_TIMEOUT):
+            logger.warning("Selection owner did not answer in time. Assuming empty content.")
+        with self._lock:
+            self._pending_read = None
+        if pending.incremental:
+            raise SelectionUnavailable("Previous content requires an incremental transfer")
+        return pending.content
+
+    def cancel(self):
+        self._shutdown = True
+        self._wake()
+        self._thread.join()
+        self._display.close()
+        os.close(self._wakeup_read)
+        os.close(self._wakeup_write)
+
+    def _wake(self):
+        os.write(self._wakeup_write, b"\0")
+
+    def _run(self):
+        logger.debug("Selection owner thread started")
+        while not self._shutdown:
+            try:
+                # Replies read by other threads may have queued events already, so do not block on the socket then.
+                timeout = 0 if self._display.pending_events() else self._next_timeout()
+                readable, w, e = select.select([self._display, self._wakeup_read], [], [], timeout)
+                if self._wakeup_read in readable:
+                    os.read(self._wakeup_read, 512)
+                if self._shutdown:
+                    break
+                for x in range(self._display.pending_events()):
+                    self._handle_event(self._display.next_event())
+                self._restore_due()
+            except error.ConnectionClosedError:
+                logger.error("Connection of the selection owner to the X server closed.")
+                break
+            except Exception:
+                logger.exception("Error in selection owner thread")
+        logger.debug("Selection owner thread finished")
+
+    def _next_timeout(self) -> typing.Optional[float]:
+        with self._lock:
+            deadlines = [state.restore_deadline for state in self._states.values() if state.restore_pending]
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines) - time.monotonic())
+
+    def _handle_event(self, x_event):
+        if x_event.type == X.SelectionRequest:
+            self._serve(x_event)
+        elif x_event.type == X.SelectionClear:
+            state = self._states.get(x_event.atom)
+            # Also sent when this client gives the selection up itself, possibly before pasting again.
+            if state is not None and not self._is_owner(x_event.atom):
+                # Someone else took over the selection. Do not overwrite their content with the backup.
+                with self._lock:
+                    state.content = None
+                    state.restore_pending = False
+        elif x_event.type == X.SelectionNotify:
+            self._receive(x_event)
+
+    def _serve(self, selection_request):
+        state = self._states.get(selection_request.selection)
+        with self._lock:
+            content = state.content if state is not None else None
+        target = selection_request.target
+        # Obsolete clients do not set a property and expect the data in the target property.
+        prop = selection_request.property if selection_request.property != X.NONE else target
+        requestor = self._display.create_resource_object("window", selection_request.requestor.id)
+
+        if content is None:
+            prop = X.NONE
+        elif target == self._atoms["TARGETS"]:
+            targets = [self._atoms["TARGETS"]] + sorted(self._text_targets)
+            requestor.change_property(prop, Xatom.ATOM, 32, targets, onerror=self._ignore_bad_window)
+        elif target in self._text_targets:
+            if target == Xatom.STRING:
+                data = content.decode("utf-8").encode("latin-1", "replace")
+                requestor.change_property(prop, Xatom.STRING, 8, data, onerror=self._ignore_bad_window)
+            else:
+                requestor.change_property(
+                    prop, self._atoms["UTF8_STRING"], 8, content, onerror=self._ignore_bad_window)
+            self._delivered(selection_request.selection, state, selection_request.requestor.id)
+        else:
+            prop = X.NONE
+
+        notify = event.SelectionNotify(
+            time=selection_request.time, requestor=selection_request.requestor.id,
+            selection=selection_request.selection, target=target, property=prop)
+        # The requestor may be gone already
+        requestor.send_event(notify, event_mask=0, onerror=self._ignore_bad_window)
+        self._display.flush()
+
+    def _delivered(self, selection: int, state: _SelectionState, requestor: int):
+        with self._lock:
+            if not state.restore_pending or state.delivered or not state.paste_sent:
+                return
+            if state.target_client is not None and self._client(requestor) != state.target_client:
+                # Another client, like a clipboard manager. Keep serving until the target fetched the content.
+                stats.increment("paste.selection_foreign_fetches")
+                return
+            now = time.monotonic()
+            state.delivered = True
+            state.restore_deadline = now + RESTORE_GRACE_TIME
+            stats.record("paste.selection_fetch_latency", now - state.pasted_at)
+            length, seconds = state.length, now - state.requested_at
+        if self._on_delivered is not None:
+            self._on_delivered(selection, length, seconds)
+
+    def _receive(self, notify):
+        with self._lock:
+            pending = self._pending_read
+        if pending is None or notify.selection != pending.selection:
+            return
+        if notify.property != X.NONE:
+            prop = self._window.get_full_property(notify.property, X.AnyPropertyType)
+            self._window.delete_property(notify.property)
+            if prop is not None:
+                if prop.property_type == self._atoms["INCR"]:
+                    pending.incremental = True
+                else:
+                    value = prop.value
+                    pending.content = value.encode("utf-8") if isinstance(value, str) else bytes(value)
+        pending.done.set()
+
+    def _restore_due(self):
+        now = time.monotonic()
+        for selection, state in self._states.items():
+            with self._lock:
+                if not state.restore_pending or now < state.restore_deadline:
+                    continue
+                state.restore_pending = False
+                if not state.delivered:
+                    stats.increment("paste.selection_restore_timeouts")
+                state.content = state.backup
+                state.backup = None
+                restore_empty = state.content is None
+            if restore_empty:
+                # There was nothing in the selection before pasting
+                request.SetSelectionOwner(
+                    display=self._display.display, window=X.NONE, selection=selection, time=X.CurrentTime)
+            self._display.flush()
@@ -307,7 +307,7 @@ def test_engine_create_folder_subfolder(create_engine):
     # Temporary: prevent persisting (which fails b/c folder doesn't exist).
     test_folder = engine.create_folder("New folder",
             parent_folder=folder, temporary=True)
-    assert_that(engine.configManager.allFolders, not_(has_item(test_folder)), "creates top-level folder instead of subfolder")
+    assert_that(engine.configManager.folders, not_(has_item(test_folder)), "creates top-level folder instead of subfolder")
     assert_that(folder, is_(equal_to(test_folder.parent)),
         "Doesn't add parent folder as parent of subfolder")
     assert_that(folder.folders,
@@ -315,7 +315,7 @@ def test_engine_create_folder_subfolder(create_engine):
             "Doesn't create subfolder in correct folder")
     test_folder = engine.create_folder("New folder",
             parent_folder=folder, temporary=True)
-    assert_that(engine.configManager.allFolders, not_(has_item(test_folder)), "creates top-level folder instead of subfolder")
+    assert_that(engine.configManager.folders, not_(has_item(test_folder)), "creates top-level folder instead of subfolder")
 
 def test_engine_create_nontemp_subfolder_with_temp_parent_raises_value_error(create_engine):
     engine, folder = create_engine
@@ -0,0 +1,54 @@
+# Copyright (C) 2021 BlueDrink9
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from unittest.mock import MagicMock, patch
+
+import pytest
+from hamcrest import *
+
+from autokey.scripting import highlevel
+
+
+@pytest.fixture
+def interface():
+    interface = MagicMock()
+    interface.mouse_location.return_value = (12, 34)
+    highlevel.set_interface(interface)
+    yield interface
+    highlevel.set_interface(None)
+
+
+def test_mouse_functions_use_the_interface_without_subprocesses(interface):
+    with patch("autokey.scripting.highlevel.subprocess") as subprocess:
+        highlevel.mouse_move(10.6, 20)
+        highlevel.mouse_rmove(-5, 0)
+        highlevel.mouse_click(highlevel.RIGHT)
+        assert_that(highlevel.mouse_pos(), is_(equal_to([12, 34])))
+    subprocess.call.assert_not_called()
+    subprocess.check_output.assert_not_called()
+    interface.move_cursor.assert_any_call(10, 20)
+    interface.move_cursor.assert_any_call(-5, 0, relative_self=True)
+    interface.send_mouse_click_relative.assert_called_once_with(0, 0, 3)
+    # Each call waits until the operation was sent.
+    interface.move_cursor.return_value.result.assert_called_with()
+    interface.send_mouse_click_relative.return_value.result.assert_called_once_with()
+    interface.barrier.return_value.result.assert_called_once_with()
+
+
+def test_mouse_functions_use_xte_for_another_display(interface):
+    with patch("autokey.scripting.highlevel.subprocess") as subprocess:
+        highlevel.mouse_move(1, 2, display=":1")
+    subprocess.call.assert_called_once_with(["xte", "-x", ":1", "mousemove 1 2"])
+    interface.move_cursor.assert_not_called()
@@ -0,0 +1,145 @@
+# Copyright (C) 2021 BlueDrink9
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import struct
+import zlib
+
+import pytest
+from hamcrest import *
+
+numpy = pytest.importorskip("numpy")
+
+from autokey.scripting import highlevel
+from autokey.scripting.imagesearch import find_template, load_pattern, read_png, ImageFormatError
+
+
+def paeth(left: int, up: int, upper_left: int) -> int:
+    estimate = left + up - upper_left
+    distances = [abs(estimate - left), abs(estimate - up), abs(estimate - upper_left)]
+    return (left, up, upper_left)[distances.index(min(distances))]
+
+
+def write_png(path, image: "numpy.ndarray", filter_type: int=0):
+    """Encode an RGB or RGBA image, applying the given scanline filter to all rows."""
+    height, width, channels = image.shape
+    raw = bytearray()
+    previous = bytes(width * channels)
+    for row in image.reshape(height, width * channels):
+        line = bytes(row)
+        encoded = bytearray()
+        for index, value in enumerate(line):
+            left = line[index - channels] if index >= channels else 0
+            up = previous[index]
+            upper_left = previous[index - channels] if index >= channels else 0
+            predictor = (0, left, up, (left + up) >> 1, paeth(left, up, upper_left))[filter_type]
+            encoded.append((value - predictor) & 0xFF)
+        raw.append(filter_type)
+        raw += encoded
+        previous = line
+
+    def chunk(chunk_type: bytes, data: bytes) -> bytes:
+        return struct.pack("!I", len(data)) + chunk_type + data + struct.pack("!I", zlib.crc32(chunk_type + data))
+
+    colour_type = 6 if channels == 4 else 2
+    with open(str(path), "wb") as png_file:
+        png_file.write(b"\x89PNG\r\n\x1a\n")
+        png_file.write(chunk(b"IHDR", struct.pack("!IIBBBBB", width, height, 8, colour_type, 0, 0, 0)))
+        png_file.write(chunk(b"IDAT", zlib.compress(bytes(raw))))
+        png_file.write(chunk(b"IEND", b""))
+
+
+def random_image(height: int, width: int, channels: int=3, seed: int=0) -> "numpy.ndarray":
+    return numpy.random.RandomState(seed).randint(0, 256, (height, width, channels)).astype(numpy.uint8)
+
+
+@pytest.mark.parametrize("filter_type", range(5))
+def test_read_png_undoes_all_filters(tmp_path, filter_type):
+    image = random_image(7, 9, channels=4)
+    path = tmp_path / "image.png"
+    write_png(path, image, filter_type)
+    assert_that(numpy.array_equal(read_png(str(path)), image), is_(True))
+
+
+def test_read_png_rejects_other_files(tmp_path):
+    path = tmp_path / "image.png"
+    path.write_bytes(b"GIF89a")
+    assert_that(calling(read_png).with_args(str(path)), raises(ImageFormatError))
+
+
+def test_find_template_returns_all_matches():
+    image = random_image(60, 80)
+    template = image[10:15, 20:26].copy()
+    image[40:45, 5:11] = template
+    assert_that(find_template(image, template), is_(equal_to([(20, 10), (5, 40)])))
+
+
+def test_find_template_tolerance():
+    image = random_image(30, 30)
+    template = image[3:8, 4:9].copy()
+    template[2, 2, 0] ^= 0x10
+    assert_that(find_template(image, template), is_(empty()))
+    assert_that(find_template(image, template, tolerance=16), contains_exactly((4, 3)))
+
+
+def test_find_template_ignores_transparent_pixels():
+    image = random_image(30, 30)
+    template = numpy.dstack((image[3:8, 4:9], numpy.full((5, 5), 255, numpy.uint8)))
+    template[0, 0] = (1, 2, 3, 0)
+    assert_that(find_template(image, template), contains_exactly((4, 3)))
+
+
+def test_visgrep_in_process(tmp_path):
+    screen = random_image(50, 70)
+    write_png(tmp_path / "screen.png", screen)
+    write_png(tmp_path / "pattern.png", screen[30:40, 50:60])
+    assert_that(highlevel.visgrep(str(tmp_path / "screen.png"), str(tmp_path / "pattern.png")),
+                is_(equal_to([50, 30])))
+    write_png(tmp_path / "missing.png", random_image(5, 5, seed=1))
+    assert_that(
+        calling(highlevel.visgrep).with_args(str(tmp_path / "screen.png"), str(tmp_path / "missing.png")),
+        raises(highlevel.PatternNotFound))
+
+
+def test_load_pattern_is_cached_until_the_file_changes(tmp_path):
+    path = tmp_path / "pattern.png"
+    write_png(path, random_image(4, 4))
+    pattern = load_pattern(str(path))
+    assert_that(load_pattern(str(path)), is_(same_instance(pattern)))
+    write_png(path, random_image(4, 5, seed=1))
+    os.utime(str(path), ns=(0, os.stat(str(path)).st_mtime_ns + 10 ** 9))
+    assert_that(load_pattern(str(path)).width, is_(equal_to(5)))
+
+
+def test_find_template_region_and_first_only():
+    image = random_image(60, 80)
+    template = image[10:15, 20:26].copy()
+    image[40:45, 5:11] = template
+    assert_that(find_template(image, template, region=(0, 30, 40, 30)), contains_exactly((5, 40)))
+    assert_that(find_template(image, template, region=(0, 0, 25, 40)), is_(empty()))
+    assert_that(find_template(image, template, first_only=True), contains_exactly((20, 10)))
+
+
+@pytest.mark.parametrize("tolerance", [0, 300])
+@pytest.mark.parametrize("levels", [1, 2])
+def test_pyramid_search_finds_the_same_matches(tolerance, levels):
+    image = random_image(120, 150)
+    template = numpy.dstack((image[33:57, 45:82], numpy.full((24, 37), 255, numpy.uint8)))
+    template[5, 7, 3] = 0
+    image[70:94, 101:138] = template[:, :, :3]
+    image[71, 102, 1] ^= 0x40
+    expected = find_template(image, template, tolerance)
+    assert_that(expected, has_item((45, 33)))
+    assert_that(find_template(image, template, tolerance, pyramid_levels=levels), is_(equal_to(expected)))
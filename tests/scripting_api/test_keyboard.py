@@ -118,12 +118,12 @@ def test_send_keys_send_mode_keyboard_index(cause_error: bool):
                              (mode.value for mode in Keyboard.SendMode)),
                          [False, True]))
 def test_send_keys_send_mode_clipboard(send_mode: Union[Keyboard.SendMode, int], cause_error: bool):
-    kb_mode = Keyboard.SendMode.KEYBOARD
+    non_paste_modes = (Keyboard.SendMode.KEYBOARD, Keyboard.SendMode.XTEST, Keyboard.SendMode.AUTO)
     mode_list = list(Keyboard.SendMode)
-    if send_mode is kb_mode \
-            or (isinstance(send_mode, int) and send_mode == mode_list.index(kb_mode)) \
-            or send_mode == kb_mode.value:
-        # Skip keyboard mode for both value- and index-based access
+    if send_mode in non_paste_modes \
+            or (isinstance(send_mode, int) and mode_list[send_mode] in non_paste_modes) \
+            or send_mode in (mode.value for mode in non_paste_modes):
+        # Skip the keyboard and automatic modes for both value- and index-based access
         return
     print(type(send_mode), send_mode)
     keyboard = create_keyboard(cause_error)
@@ -147,3 +147,24 @@ def test_send_keys_send_mode_clipboard(send_mode: Union[Keyboard.SendMode, int],
 
     mock_mediator.paste_string.assert_called_once_with(sent_string, send_mode)
     mock_mediator.interface.finish_send.assert_called_once()
+
+
+def test_send_keys_send_mode_xtest():
+    keyboard = create_keyboard(False)
+    keyboard.send_keys("ABC", send_mode=keyboard.SendMode.XTEST)
+    mock_mediator: MagicMock = keyboard.mediator
+    mock_mediator.send_string.assert_called_once_with("ABC", use_xtest=True)
+    mock_mediator.paste_string.assert_not_called()
+
+
+@pytest.mark.parametrize("chosen_mode", [Keyboard.SendMode.KEYBOARD, Keyboard.SendMode.CB_CTRL_SHIFT_V])
+def test_send_keys_send_mode_auto_uses_resolved_mode(chosen_mode: Keyboard.SendMode):
+    keyboard = create_keyboard(False)
+    mock_mediator: MagicMock = keyboard.mediator
+    mock_mediator.resolve_send_mode.return_value = chosen_mode
+    keyboard.send_keys("ABC", send_mode=keyboard.SendMode.AUTO)
+    mock_mediator.resolve_send_mode.assert_called_once_with("ABC", keyboard.SendMode.AUTO)
+    if chosen_mode is Keyboard.SendMode.KEYBOARD:
+        mock_mediator.send_string.assert_called_once_with("ABC")
+    else:
+        mock_mediator.paste_string.assert_called_once_with("ABC", chosen_mode)
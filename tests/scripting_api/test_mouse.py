@@ -0,0 +1,47 @@
+# Copyright (C) 2021 BlueDrink9
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import concurrent.futures
+from unittest.mock import MagicMock
+
+from hamcrest import *
+
+from autokey.scripting import Mouse
+
+
+def create_mouse(barrier: concurrent.futures.Future) -> Mouse:
+    mouse = Mouse(MagicMock())
+    mouse.interface.barrier.return_value = barrier
+    mouse.interface.mouse_location.return_value = (12, 34)
+    mouse.interface.relative_mouse_location.return_value = (2, 4)
+    return mouse
+
+
+def test_location_waits_for_queued_commands():
+    barrier = concurrent.futures.Future()
+    barrier.set_result(None)
+    mouse = create_mouse(barrier)
+    assert_that(mouse.get_location(), is_(equal_to((12, 34))))
+    assert_that(mouse.get_relative_location(), is_(equal_to((2, 4))))
+    assert_that(mouse.interface.barrier.call_count, is_(equal_to(2)))
+
+
+def test_location_is_returned_after_queued_commands_were_cancelled():
+    # The event thread cancels queued commands while AutoKey shuts down
+    barrier = concurrent.futures.Future()
+    barrier.cancel()
+    mouse = create_mouse(barrier)
+    assert_that(mouse.get_location(), is_(equal_to((12, 34))))
+    assert_that(mouse.get_relative_location(), is_(equal_to((2, 4))))
@@ -13,6 +13,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
+import json
 import typing
 import sys
 import os
@@ -24,7 +25,11 @@ from hamcrest import *
 from tests.engine_helpers import *
 
 import autokey.model.folder
+import autokey.model.helpers
+import autokey.model.phrase
+import autokey.monitor
 from autokey.configmanager.configmanager import ConfigManager
+from autokey.configmanager.indexes import ItemList, KeyIndex, MultiKeyIndex
 from autokey.service import PhraseRunner
 import autokey.service
 from autokey.scripting import Engine
@@ -33,6 +38,11 @@ from autokey.scripting import Engine
 # If we can do it a better way, we probably should, to reduce dependencies for
 # these tests.
 
+@pytest.fixture(autouse=True)
+def check_indexes_after_changes(monkeypatch):
+    monkeypatch.setattr(ConfigManager, "CHECK_INDEXES_AFTER_CHANGES", True)
+
+
 def get_autokey_dir():
     return os.path.dirname(os.path.realpath(sys.argv[0]))
 
@@ -56,3 +66,245 @@ def test_item_has_same_hotkey(create_engine):
     hotkey=(modifiers, key)
     testHK = create_test_hotkey(engine, folder, hotkey)
     assert ConfigManager.item_has_same_hotkey(testHK, modifiers, key, None)
+
+
+def test_item_list_removal_keeps_the_index_consistent():
+    objects = [object() for _ in range(4)]
+    items = ItemList(objects)
+    items.discard(objects[1])
+    items.add(objects[2])
+    items.remove(objects[3])
+    assert_that(items, contains_exactly(objects[0], objects[2]))
+    assert_that(objects[3] in items, is_(False))
+    assert_that(calling(items.remove).with_args(objects[3]), raises(ValueError))
+    items.append(objects[1])
+    assert_that(items, contains_exactly(objects[0], objects[2], objects[1]))
+
+
+def test_item_list_removal_keeps_the_order():
+    objects = [object() for _ in range(200)]
+    items = ItemList(objects)
+    expected = list(objects)
+    # Enough removals to renumber the positions
+    for model_object in objects[::2] + objects[1::4]:
+        items.discard(model_object)
+        expected.remove(model_object)
+        assert_that(items, contains_exactly(*expected))
+    added = object()
+    items.add(added)
+    items.discard(objects[3])
+    expected.remove(objects[3])
+    assert_that(items, contains_exactly(*(expected + [added])))
+
+
+def test_incremental_changes_match_a_rebuild(create_engine):
+    engine, folder = create_engine
+    config_manager = engine.configManager
+    subfolder = engine.create_folder("sub", parent_folder=folder, temporary=True)
+    abbreviation = engine.create_phrase(subfolder, "abbr", "contents", abbreviations="abc", temporary=True)
+    hotkey = engine.create_phrase(folder, "hotkey", "contents", hotkey=(["<ctrl>"], "b"), temporary=True)
+    assert_that(config_manager.allFolders, has_items(folder, subfolder))
+    assert_that(config_manager.abbreviations, contains_exactly(abbreviation))
+    assert_that(config_manager.hotKeys, contains_exactly(hotkey))
+    assert_that(config_manager.check_indexes(), is_(True))
+
+    engine.remove_all_temporary()
+    assert_that(config_manager.allFolders, contains_exactly(folder))
+    assert_that(config_manager.allItems, is_(empty()))
+    assert_that(config_manager.check_indexes(), is_(True))
+
+
+def test_item_changed_updates_the_trigger_lists(create_engine):
+    engine, folder = create_engine
+    config_manager = engine.configManager
+    phrase = engine.create_phrase(folder, "phrase", "contents", abbreviations="abc", temporary=True)
+    phrase.set_modes([autokey.model.helpers.TriggerMode.HOTKEY])
+    config_manager.item_changed(phrase)
+    assert_that(config_manager.abbreviations, is_(empty()))
+    assert_that(config_manager.hotKeys, contains_exactly(phrase))
+    assert_that(config_manager.check_indexes(), is_(True))
+
+
+def test_check_indexes_repairs_missed_changes(create_engine):
+    engine, folder = create_engine
+    config_manager = engine.configManager
+    phrase = autokey.model.phrase.Phrase("phrase", "contents")
+    folder.add_item(phrase)
+    assert_that(config_manager.check_indexes(), is_(False))
+    assert_that(config_manager.allItems, has_item(phrase))
+    assert_that(config_manager.check_indexes(), is_(True))
+
+
+def test_changes_are_checked_against_a_rebuild_in_tests(create_engine, monkeypatch):
+    engine, folder = create_engine
+    config_manager = engine.configManager
+    folder.add_item(autokey.model.phrase.Phrase("phrase", "contents"))
+    assert_that(calling(config_manager.folder_changed).with_args(folder), raises(AssertionError))
+    # Not checked outside of the tests
+    monkeypatch.setattr(ConfigManager, "CHECK_INDEXES_AFTER_CHANGES", False)
+    folder.add_item(autokey.model.phrase.Phrase("other", "contents"))
+    config_manager.folder_changed(folder)
+    assert_that(config_manager.check_indexes(), is_(False))
+
+
+def test_file_events_update_the_lists(create_engine, tmp_path):
+    engine, folder = create_engine
+    config_manager = engine.configManager
+    library = autokey.model.folder.Folder("library", path=str(tmp_path))
+    config_manager.folders.append(library)
+    config_manager.folder_added(library)
+
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "a.txt").write_text("contents")
+    assert_that(config_manager.path_created_or_modified(str(tmp_path / "sub")), is_(True))
+    assert_that(config_manager.path_created_or_modified(str(tmp_path / "sub")), is_(True))
+    sub, = library.folders
+    phrase, = sub.items
+    assert_that(config_manager.allItems, has_item(phrase))
+    assert_that(config_manager.check_indexes(), is_(True))
+
+    assert_that(config_manager.path_removed(str(tmp_path / "sub")), is_(True))
+    assert_that(config_manager.allFolders, not_(has_item(sub)))
+    assert_that(config_manager.allItems, not_(has_item(phrase)))
+    assert_that(config_manager.check_indexes(), is_(True))
+
+
+def test_key_index_moves_objects_to_their_new_key():
+    phrase, other = autokey.model.phrase.Phrase("a", ""), autokey.model.phrase.Phrase("a", "")
+    index = KeyIndex(lambda item: item.description)
+    index.update(phrase)
+    index.update(other)
+    phrase.description = "b"
+    index.update(phrase)
+    assert_that(index.get("b"), is_(same_instance(phrase)))
+    assert_that(index.get_all("a"), contains_exactly(other))
+    index.discard(other)
+    assert_that(index.get("a"), is_(none()))
+    assert_that(index.as_sets(), is_(equal_to({"b": {id(phrase)}})))
+
+
+def test_lookups_follow_renames(create_engine):
+    engine, folder = create_engine
+    config_manager = engine.configManager
+    assert_that(engine.get_folder("Test folder"), is_(same_instance(folder)))
+    folder.title = "Renamed"
+    config_manager.folder_changed(folder)
+    assert_that(engine.get_folder("Test folder"), is_(none()))
+    assert_that(engine.get_folder("Renamed"), is_(same_instance(folder)))
+
+    phrase = engine.create_phrase(folder, "phrase", "contents", temporary=True)
+    assert_that(config_manager.itemsByDescription.get("phrase"), is_(same_instance(phrase)))
+    phrase.description = "renamed phrase"
+    config_manager.item_changed(phrase)
+    assert_that(config_manager.itemsByDescription.get_all("phrase"), is_(empty()))
+    assert_that(config_manager.check_indexes(), is_(True))
+
+
+def test_metadata_events_reload_the_item(create_engine, tmp_path):
+    engine, folder = create_engine
+    config_manager = engine.configManager
+    library = autokey.model.folder.Folder("library", path=str(tmp_path))
+    config_manager.folders.append(library)
+    config_manager.folder_added(library)
+    (tmp_path / "a.txt").write_text("contents")
+    config_manager.path_created_or_modified(str(tmp_path / "a.txt"))
+    phrase = config_manager.itemsByPath.get(str(tmp_path / "a.txt"))
+    assert_that(phrase.description, is_(equal_to("a")))
+
+    phrase.description = "From metadata"
+    (tmp_path / "a.json").write_text(json.dumps(phrase.get_serializable()))
+    phrase.description = "a"
+    assert_that(config_manager.path_created_or_modified(str(tmp_path / "a.json")), is_(True))
+    assert_that(phrase.description, is_(equal_to("From metadata")))
+    assert_that(config_manager.itemsByDescription.get("From metadata"), is_(same_instance(phrase)))
+    assert_that(config_manager.check_indexes(), is_(True))
+
+
+def test_conflict_checks_use_the_trigger_index(create_engine):
+    engine, folder = create_engine
+    config_manager = engine.configManager
+    phrase = engine.create_phrase(folder, "phrase", "contents", abbreviations=["Abbr", "other"],
+                                  hotkey=(["<ctrl>"], "k"), temporary=True)
+    assert_that(config_manager.check_abbreviation_unique("Abbr", None, None), is_(equal_to((False, phrase))))
+    assert_that(config_manager.check_abbreviation_unique("Abbr", None, phrase), is_(equal_to((True, phrase))))
+    assert_that(config_manager.check_abbreviation_unique("abbr", None, None), is_(equal_to((True, None))))
+    assert_that(config_manager.get_item_with_hotkey(["<ctrl>"], "k"), is_(same_instance(phrase)))
+    assert_that(config_manager.get_item_with_hotkey(["<alt>"], "k"), is_(none()))
+
+    folder.set_hotkey(["<ctrl>"], "k")
+    config_manager.folder_changed(folder)
+    assert_that(config_manager.get_item_with_hotkey(["<ctrl>"], "k"), is_(same_instance(folder)))
+    phrase.set_window_titles("Editor")
+    assert_that(config_manager.check_abbreviation_unique("other", "Browser", None), is_(equal_to((True, None))))
+    assert_that(config_manager.check_abbreviation_unique("other", "Editor", None), is_(equal_to((False, phrase))))
+
+    phrase.clear_abbreviations()
+    config_manager.item_changed(phrase)
+    assert_that(config_manager.triggersByAbbreviation.get_all("abbr"), is_(empty()))
+    assert_that(config_manager.check_indexes(), is_(True))
+
+
+def test_multi_key_index_finds_objects_under_each_key():
+    phrase = autokey.model.phrase.Phrase("a", "")
+    phrase.abbreviations = ["x", "y"]
+    index = MultiKeyIndex(lambda item: item.abbreviations)
+    index.update(phrase)
+    assert_that(index.get("x"), is_(same_instance(phrase)))
+    phrase.abbreviations = ["y", "z"]
+    index.update(phrase)
+    assert_that(sorted(index.keys()), is_(equal_to(["y", "z"])))
+    index.discard(phrase)
+    assert_that(index.as_sets(), is_(equal_to({})))
+
+
+def test_find_abbreviation_conflicts(create_engine):
+    engine, folder = create_engine
+    config_manager = engine.configManager
+
+    def phrase(name, abbreviation, **options):
+        created = engine.create_phrase(folder, name, name, abbreviations=[abbreviation], temporary=True)
+        for option, value in options.items():
+            setattr(created, option, value)
+        return created
+
+    phrase("brb", "brb")
+    phrase("br immediate", "br", immediate=True)
+    phrase("b", "b")
+    phrase("rb inside", "rb", triggerInside=True)
+    phrase("b dot x", "b.x")
+    phrase("upper case", "BR", immediate=True)
+    phrase("ignored case", "BRB", ignoreCase=True)
+    conflicts = [(conflict.kind,) + tuple(sorted((conflict.item.description, conflict.other_item.description))
+                                          if conflict.kind == "duplicate" else
+                                          (conflict.item.description, conflict.other_item.description))
+                 for conflict in config_manager.find_abbreviation_conflicts()]
+    assert_that(conflicts, contains_inanyorder(
+        ("duplicate", "brb", "ignored case"),
+        ("prefix", "br immediate", "brb"),
+        ("prefix", "b", "b dot x"),
+        ("prefix", "upper case", "ignored case"),
+        ("suffix", "rb inside", "brb"),
+    ))
+
+
+def test_batched_file_changes_are_applied_in_order(create_engine, tmp_path):
+    engine, folder = create_engine
+    config_manager = engine.configManager
+    library = autokey.model.folder.Folder("library", path=str(tmp_path))
+    config_manager.folders.append(library)
+    config_manager.folder_added(library)
+    for i in range(50):
+        (tmp_path / "phrase{}.txt".format(i)).write_text("contents")
+    changes = [(str(tmp_path / "phrase{}.txt".format(i)), autokey.monitor.MODIFIED) for i in range(50)]
+    assert_that(config_manager.paths_changed(changes), is_(True))
+    assert_that(library.items, has_length(50))
+
+    (tmp_path / "phrase0.txt").unlink()
+    assert_that(config_manager.paths_changed([
+        (str(tmp_path / "phrase0.txt"), autokey.monitor.REMOVED),
+        (str(tmp_path / "unknown.txt~"), autokey.monitor.REMOVED),
+    ]), is_(True))
+    assert_that(library.items, has_length(49))
+    assert_that(config_manager.paths_changed([(str(tmp_path / "unknown.txt~"), autokey.monitor.REMOVED)]),
+                is_(False))
+    assert_that(config_manager.check_indexes(), is_(True))
@@ -0,0 +1,80 @@
+# Copyright (C) 2021 BlueDrink9
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+import pytest
+from hamcrest import *
+
+from autokey.model.content_cache import ContentCache
+
+
+def write(path, text, mtime_ns=None):
+    path.write_text(text)
+    if mtime_ns is not None:
+        os.utime(str(path), ns=(mtime_ns, mtime_ns))
+    return str(path)
+
+
+def test_read_caches_the_text(tmp_path):
+    cache = ContentCache()
+    path = write(tmp_path / "a.txt", "text")
+    assert_that(cache.read(path), is_(equal_to("text")))
+    assert_that(cache.read(path), is_(equal_to("text")))
+    assert_that((cache.hits, cache.misses), is_(equal_to((1, 1))))
+
+
+def test_changed_files_are_read_again(tmp_path):
+    cache = ContentCache()
+    path = write(tmp_path / "a.txt", "old", 10**18)
+    cache.read(path)
+    # Same size and the same modification time would not be noticed, so change the time
+    write(tmp_path / "a.txt", "new", 10**18 + 1)
+    assert_that(cache.read(path), is_(equal_to("new")))
+
+
+def test_least_recently_used_texts_are_evicted(tmp_path):
+    cache = ContentCache(size=10, max_length=10)
+    paths = [write(tmp_path / "{}.txt".format(index), "1234") for index in range(3)]
+    cache.read(paths[0])
+    cache.read(paths[1])
+    cache.read(paths[0])
+    cache.read(paths[2])
+    assert_that(len(cache), is_(equal_to(2)))
+    cache.read(paths[0])
+    assert_that(cache.hits, is_(equal_to(2)))
+    cache.read(paths[1])
+    assert_that(cache.misses, is_(equal_to(4)))
+
+
+def test_long_texts_are_not_cached(tmp_path):
+    cache = ContentCache(size=100, max_length=5)
+    path = write(tmp_path / "a.txt", "123456")
+    assert_that(cache.read(path), is_(equal_to("123456")))
+    assert_that(len(cache), is_(equal_to(0)))
+
+
+def test_written_texts_are_not_read_back(tmp_path):
+    cache = ContentCache()
+    path = write(tmp_path / "a.txt", "written")
+    cache.written(path, None, "written")
+    assert_that(cache.read(path), is_(equal_to("written")))
+    assert_that(cache.misses, is_(equal_to(0)))
+
+
+def test_missing_files_raise(tmp_path):
+    cache = ContentCache()
+    with pytest.raises(OSError):
+        cache.read(str(tmp_path / "missing.txt"))
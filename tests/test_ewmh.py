@@ -0,0 +1,60 @@
+# Copyright (C) 2021 BlueDrink9
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from unittest.mock import MagicMock
+
+import pytest
+from hamcrest import *
+
+from autokey.ewmh import moveresize_data, parse_state_names, WindowManagerUnavailable, MOVERESIZE_X, \
+    MOVERESIZE_HEIGHT, MOVERESIZE_SOURCE_PAGER
+from autokey.scripting import Window
+
+
+def test_moveresize_data_leaves_unset_values_unchanged():
+    assert_that(moveresize_data(10, -1, -1, 300), is_(equal_to(
+        [MOVERESIZE_SOURCE_PAGER | MOVERESIZE_X | MOVERESIZE_HEIGHT, 10, 0, 0, 300])))
+
+
+@pytest.mark.parametrize("prop, expected", [
+    ("fullscreen", ["_NET_WM_STATE_FULLSCREEN"]),
+    ("maximized_vert,maximized_horz", ["_NET_WM_STATE_MAXIMIZED_VERT", "_NET_WM_STATE_MAXIMIZED_HORZ"]),
+])
+def test_parse_state_names(prop, expected):
+    assert_that(parse_state_names(prop), is_(equal_to(expected)))
+
+
+@pytest.mark.parametrize("prop", ["no_such_state", "above,below,sticky"])
+def test_parse_state_names_rejects_invalid_states(prop):
+    assert_that(calling(parse_state_names).with_args(prop), raises(ValueError))
+
+
+def test_window_falls_back_to_wmctrl_without_window_manager():
+    window = Window(MagicMock())
+    window.mediator.interface.windowManager.find_window.side_effect = WindowManagerUnavailable()
+    window._run_wmctrl = MagicMock(return_value=(0, ""))
+    window.close("Some title")
+    window._run_wmctrl.assert_called_once_with(["-c", "Some title"])
+
+
+def test_window_uses_window_manager_directly():
+    window = Window(MagicMock())
+    manager = window.mediator.interface.windowManager
+    manager.find_window.return_value = 1234
+    window._run_wmctrl = MagicMock()
+    window.resize_move("Some title", 10, 20, matchClass=True)
+    manager.find_window.assert_called_once_with("Some title", True)
+    manager.move_resize.assert_called_once_with(1234, 10, 20, -1, -1)
+    window._run_wmctrl.assert_not_called()
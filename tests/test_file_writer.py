@@ -0,0 +1,74 @@
+# Copyright (C) 2021 BlueDrink9
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+import json
+import os
+import time
+
+from hamcrest import *
+
+from autokey.model.file_writer import FileWriter, write_atomic, is_temporary, WRITE_DELAY, MAX_DELAY
+
+
+def test_saves_within_the_delay_are_written_once(tmp_path):
+    now = [0.0]
+    writer = FileWriter(clock=lambda: now[0])
+    path = str(tmp_path / "a.json")
+    for version in range(3):
+        writer.write(path, json.dumps({"version": version}))
+        now[0] += WRITE_DELAY / 2
+    assert_that(os.path.exists(path), is_(False))
+    assert_that(writer.pending(), is_(equal_to([path])))
+    assert_that(writer._timeout(), is_(close_to(WRITE_DELAY / 2, 1e-9)))
+
+    # Saves arriving without a pause are written after the maximum delay
+    now[0] = MAX_DELAY
+    writer.write(path, json.dumps({"version": 3}))
+    assert_that(writer._timeout(), is_(less_than_or_equal_to(0)))
+
+    writer.flush()
+    assert_that(writer.pending(), is_(empty()))
+    assert_that(json.loads((tmp_path / "a.json").read_text()), is_(equal_to({"version": 3})))
+    assert_that(os.listdir(str(tmp_path)), is_(equal_to(["a.json"])))
+
+
+def test_background_thread_writes_pending_files(tmp_path):
+    writer = FileWriter(delay=0.01)
+    writer.write(str(tmp_path / "a.json"), "{}")
+    writer.write(str(tmp_path / "b.json"), "[]")
+    deadline = time.monotonic() + 5
+    while writer.pending() or writer._writing:
+        assert_that(time.monotonic(), is_(less_than(deadline)))
+        time.sleep(0.01)
+    assert_that((tmp_path / "a.json").read_text(), is_(equal_to("{}")))
+    assert_that((tmp_path / "b.json").read_text(), is_(equal_to("[]")))
+
+
+def test_replace_keeps_the_old_file_intact_and_the_mode(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text("old")
+    path.chmod(0o600)
+    old_inode = path.stat().st_ino
+    write_atomic(str(path), "new", backup_path=str(tmp_path / "config.json~"))
+
+    assert_that(path.read_text(), is_(equal_to("new")))
+    assert_that(path.stat().st_ino, is_not(equal_to(old_inode)))
+    assert_that(path.stat().st_mode & 0o777, is_(equal_to(0o600)))
+    assert_that((tmp_path / "config.json~").read_text(), is_(equal_to("old")))
+
+    # A failed write does not touch the file, and leaves no temporary file
+    assert_that(calling(write_atomic).with_args(str(path), "\udc80", "UTF-8"), raises(OSError))
+    assert_that(path.read_text(), is_(equal_to("new")))
+    assert_that(sorted(os.listdir(str(tmp_path))), is_(equal_to(["config.json", "config.json~"])))
+    assert_that(is_temporary(str(tmp_path / ".config.json.0123abcd.autokey-tmp")), is_(True))
@@ -0,0 +1,159 @@
+# Copyright (C) 2021 BlueDrink9
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import json
+
+from hamcrest import *
+
+from autokey.model.folder import Folder, load_folders
+from autokey.model.helpers import TriggerMode
+from autokey.model.phrase import Phrase
+from autokey.model.script import Script
+
+
+def write_json(path, model_object):
+    path.write_text(json.dumps(model_object.get_serializable()))
+
+
+def create_library(root):
+    root.mkdir()
+    folder = Folder("Root title")
+    folder.set_modes([TriggerMode.HOTKEY])
+    folder.set_hotkey(["<ctrl>"], "f")
+    write_json(root / "folder.json", folder)
+
+    phrase = Phrase("Phrase A", "")
+    phrase.set_modes([TriggerMode.ABBREVIATION])
+    phrase.add_abbreviation("abc")
+    (root / "a.txt").write_text("Body A")
+    write_json(root / "a.json", phrase)
+
+    (root / "b.py").write_text("print('b')")
+    (root / ".hidden.txt").write_text("hidden")
+    (root / "notes.md").write_text("not an item")
+
+    sub = root / "sub"
+    sub.mkdir()
+    (sub / "c.txt").write_text("Body C")
+    (sub / "c.json").write_text("{broken")
+    (sub / "deeper").mkdir()
+
+
+def test_load_folders_builds_the_model_from_the_files(tmp_path):
+    create_library(tmp_path / "root")
+    root = Folder("", path=str(tmp_path / "root"))
+    load_folders([root])
+
+    assert_that(root.title, is_(equal_to("Root title")))
+    assert_that(root.parent, is_(none()))
+    assert_that(root.modes, is_(equal_to([TriggerMode.HOTKEY])))
+    assert_that(root.get_hotkey_string(), is_(equal_to("<ctrl>+f")))
+    items = {item.path.rsplit("/", 1)[1]: item for item in root.items}
+    assert_that(sorted(items), is_(equal_to(["a.txt", "b.py"])))
+
+    phrase = items["a.txt"]
+    assert_that(phrase, is_(instance_of(Phrase)))
+    assert_that(phrase.description, is_(equal_to("Phrase A")))
+    assert_that(phrase.phrase, is_(equal_to("Body A")))
+    assert_that(phrase.abbreviations, is_(equal_to(["abc"])))
+    assert_that(phrase.parent, is_(same_instance(root)))
+
+    script = items["b.py"]
+    assert_that(script, is_(instance_of(Script)))
+    assert_that(script.description, is_(equal_to("b")))
+    assert_that(script.code, is_(equal_to("print('b')")))
+
+    sub, = root.folders
+    assert_that(sub.title, is_(equal_to("sub")))
+    assert_that(sub.parent, is_(same_instance(root)))
+    assert_that([folder.title for folder in sub.folders], is_(equal_to(["deeper"])))
+    # Broken metadata is logged and skipped, the text is loaded anyway.
+    broken, = sub.items
+    assert_that(broken.description, is_(equal_to("")))
+    assert_that(broken.phrase, is_(equal_to("Body C")))
+    assert_that(broken.parent, is_(same_instance(sub)))
+
+
+def test_load_folders_matches_loading_items_one_by_one(tmp_path):
+    create_library(tmp_path / "root")
+    root = Folder("", path=str(tmp_path / "root"))
+    load_folders([root])
+
+    for item in root.items + root.folders[0].items:
+        single = type(item)("", "", path=item.path)
+        single.load(item.parent)
+        assert_that(single.get_serializable(), is_(equal_to(item.get_serializable())))
+        assert_that(single.get_tuple()[1], is_(equal_to(item.get_tuple()[1])))
+
+
+def test_load_children_keeps_the_folder_metadata(tmp_path):
+    create_library(tmp_path / "root")
+    root = Folder("Renamed", path=str(tmp_path / "root"))
+    root.load_children()
+    assert_that(root.title, is_(equal_to("Renamed")))
+    assert_that(root.items, has_length(2))
+
+
+def test_load_folders_of_a_missing_directory_is_empty(tmp_path):
+    folder = Folder("", path=str(tmp_path / "missing"))
+    load_folders([folder])
+    assert_that(folder.title, is_(equal_to("missing")))
+    assert_that(folder.items, is_(empty()))
+    assert_that(folder.folders, is_(empty()))
+
+
+def test_load_folders_translates_newlines_like_text_files(tmp_path):
+    (tmp_path / "root").mkdir()
+    body = "line 1\r\nline 2\rline 3\n"
+    (tmp_path / "root" / "p.txt").write_bytes(body.encode("ascii"))
+    root = Folder("", path=str(tmp_path / "root"))
+    load_folders([root])
+    with open(str(tmp_path / "root" / "p.txt"), "r") as text_file:
+        assert_that(root.items[0].phrase, is_(equal_to(text_file.read())))
+
+
+def test_phrase_texts_are_read_on_first_use(tmp_path):
+    create_library(tmp_path / "root")
+    root = Folder("", path=str(tmp_path / "root"))
+    load_folders([root])
+    phrase = next(item for item in root.items if isinstance(item, Phrase))
+    assert_that(phrase._phrase, is_(none()))
+
+    (tmp_path / "root" / "a.txt").write_text("Changed on disk")
+    assert_that(phrase.phrase, is_(equal_to("Changed on disk")))
+
+
+def test_persist_writes_the_text_and_drops_it_from_memory(tmp_path):
+    create_library(tmp_path / "root")
+    root = Folder("", path=str(tmp_path / "root"))
+    load_folders([root])
+    script = next(item for item in root.items if isinstance(item, Script))
+    script.code = "print('edited')"
+    script.persist()
+
+    assert_that(script._code, is_(none()))
+    assert_that(script.code, is_(equal_to("print('edited')")))
+    assert_that((tmp_path / "root" / "b.py").read_text(), is_(equal_to("print('edited')")))
+
+
+def test_removed_items_keep_their_text(tmp_path):
+    create_library(tmp_path / "root")
+    root = Folder("", path=str(tmp_path / "root"))
+    load_folders([root])
+    sub = root.folders[0]
+    sub.remove_data()
+
+    assert_that((tmp_path / "root" / "sub").exists(), is_(False))
+    assert_that(sub.items[0].phrase, is_(equal_to("Body C")))
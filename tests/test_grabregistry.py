@@ -0,0 +1,88 @@
+# Copyright (C) 2021 BlueDrink9
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from hamcrest import *
+
+from autokey.iomediator.grabregistry import GrabRegistry
+
+ROOT = 1
+WINDOW_A = 10
+WINDOW_B = 11
+KEYCODE = 45
+OTHER_KEYCODE = 46
+
+
+def grabs(windows, keycode=KEYCODE, masks=(4, 20)):
+    return {(window, keycode, mask) for window in windows for mask in masks}
+
+
+def test_initial_update_grabs_everything():
+    registry = GrabRegistry()
+    to_grab, to_ungrab = registry.update("phrase", grabs([ROOT]))
+    assert_that(to_grab, is_(equal_to(grabs([ROOT]))))
+    assert_that(to_ungrab, is_(empty()))
+    assert_that(len(registry), is_(equal_to(2)))
+
+
+def test_unchanged_update_is_a_no_op():
+    registry = GrabRegistry()
+    registry.update("phrase", grabs([ROOT, WINDOW_A]))
+    to_grab, to_ungrab = registry.update("phrase", grabs([ROOT, WINDOW_A]))
+    assert_that(to_grab, is_(empty()))
+    assert_that(to_ungrab, is_(empty()))
+
+
+def test_keycode_change_only_moves_the_difference():
+    registry = GrabRegistry()
+    registry.update("phrase", grabs([WINDOW_A]))
+    to_grab, to_ungrab = registry.update("phrase", grabs([WINDOW_A], keycode=OTHER_KEYCODE))
+    assert_that(to_grab, is_(equal_to(grabs([WINDOW_A], keycode=OTHER_KEYCODE))))
+    assert_that(to_ungrab, is_(equal_to(grabs([WINDOW_A]))))
+
+
+def test_shared_grab_is_kept_until_last_owner_releases_it():
+    registry = GrabRegistry()
+    registry.update("phrase", grabs([ROOT]))
+    to_grab, _ = registry.update("script", grabs([ROOT]))
+    assert_that(to_grab, is_(empty()))
+    assert_that(registry.release("phrase"), is_(empty()))
+    assert_that(registry.release("script"), is_(equal_to(grabs([ROOT]))))
+    assert_that(len(registry), is_(equal_to(0)))
+
+
+def test_scoped_update_keeps_grabs_in_other_windows():
+    registry = GrabRegistry()
+    registry.update("phrase", grabs([WINDOW_A]))
+    to_grab, to_ungrab = registry.update("phrase", grabs([WINDOW_B]), windows={WINDOW_B})
+    assert_that(to_grab, is_(equal_to(grabs([WINDOW_B]))))
+    assert_that(to_ungrab, is_(empty()))
+    assert_that(registry.grabs_of("phrase"), is_(equal_to(grabs([WINDOW_A, WINDOW_B]))))
+
+    to_grab, to_ungrab = registry.update("phrase", set(), windows={WINDOW_A})
+    assert_that(to_grab, is_(empty()))
+    assert_that(to_ungrab, is_(equal_to(grabs([WINDOW_A]))))
+
+
+def test_forget_windows_drops_grabs_silently():
+    registry = GrabRegistry()
+    registry.update("phrase", grabs([WINDOW_A, WINDOW_B]))
+    registry.forget_windows({WINDOW_A})
+    assert_that(registry.grabs_of("phrase"), is_(equal_to(grabs([WINDOW_B]))))
+    assert_that(registry.release("phrase"), is_(equal_to(grabs([WINDOW_B]))))
+
+
+def test_release_of_unknown_owner():
+    registry = GrabRegistry()
+    assert_that(registry.release("phrase"), is_(empty()))
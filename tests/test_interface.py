@@ -0,0 +1,128 @@
+# Copyright (C) 2021 BlueDrink9
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from unittest.mock import MagicMock
+
+from hamcrest import *
+from Xlib import X
+from Xlib.protocol import event
+
+from autokey.interface import WindowInfo, LazyWindowInfo, LazyCoordinate, _Lazy, decode_record_events, interpolate_path, \
+    InjectedKeys, INJECTED_KEY_LIFETIME
+
+
+def pointer_event(event_class, detail: int, root_x: int, root_y: int) -> bytes:
+    return event_class(
+        detail=detail, time=1234, root=0x2a3, window=0x3c00007, child=X.NONE,
+        root_x=root_x, root_y=root_y, event_x=1, event_y=2, state=X.ControlMask, same_screen=1
+    )._binary
+
+
+def test_lazy_window_info_is_not_resolved_until_read():
+    compute = MagicMock(return_value=WindowInfo(wm_title="title", wm_class="class.Class"))
+    window_info = LazyWindowInfo(compute)
+    compute.assert_not_called()
+
+    assert_that(window_info.wm_title, is_(equal_to("title")))
+    assert_that(window_info[1], is_(equal_to("class.Class")))
+    assert_that(tuple(window_info), is_(equal_to(("title", "class.Class"))))
+    assert_that(window_info, is_(equal_to(WindowInfo("title", "class.Class"))))
+    compute.assert_called_once_with()
+
+
+def test_lazy_coordinates_share_a_single_query():
+    compute = MagicMock(return_value=(10, 20))
+    point = _Lazy(compute)
+    x, y = LazyCoordinate(point, 0), LazyCoordinate(point, 1)
+    compute.assert_not_called()
+
+    assert_that("%d, %d" % (x, y), is_(equal_to("10, 20")))
+    assert_that("{}".format(x), is_(equal_to("10")))
+    assert_that(x + 1, is_(equal_to(11)))
+    assert_that(y, is_(equal_to(20)))
+    compute.assert_called_once_with()
+
+
+def test_lazy_coordinates_compare_like_integers():
+    point = _Lazy(MagicMock(return_value=(10, 20)))
+    x, y = LazyCoordinate(point, 0), LazyCoordinate(point, 1)
+    assert_that(x < y and y > x and x <= 10 and 20 >= y and 5 < x, is_(True))
+    assert_that(x > 10, is_(False))
+    assert_that(sorted([y, x, 15]), is_(equal_to([10, 15, 20])))
+    assert_that(max(x, y), is_(equal_to(20)))
+    assert_that((x * 2, y // 3, -x, abs(x)), is_(equal_to((20, 6, -10, 10))))
+
+
+def test_injected_keys_are_recognised_when_recorded_after_the_send():
+    now = [0.0]
+    injected_keys = InjectedKeys(clock=lambda: now[0])
+    # Shift+a, typed using XTEST
+    for event_type, key_code in ((X.KeyPress, 50), (X.KeyPress, 38), (X.KeyRelease, 38), (X.KeyRelease, 50)):
+        injected_keys.injected(event_type, key_code)
+
+    # The user typed "b" while the injected keys were recorded
+    assert_that(injected_keys.is_injected(X.KeyPress, 50), is_(True))
+    assert_that(injected_keys.is_injected(X.KeyPress, 56), is_(False))
+    assert_that(injected_keys.is_injected(X.KeyPress, 38), is_(True))
+    assert_that(injected_keys.is_injected(X.KeyRelease, 38), is_(True))
+    assert_that(len(injected_keys), is_(equal_to(1)))
+
+    # An expected event, that was never recorded, does not hide keys typed much later
+    now[0] += INJECTED_KEY_LIFETIME
+    assert_that(injected_keys.is_injected(X.KeyRelease, 50), is_(False))
+    assert_that(len(injected_keys), is_(equal_to(0)))
+
+
+def test_decode_record_events_reads_input_events():
+    data = pointer_event(event.KeyPress, 38, 10, 20) + pointer_event(event.KeyRelease, 38, 10, 20) + \
+        pointer_event(event.ButtonPress, 3, -5, 1080)
+    assert_that(
+        list(decode_record_events(data, None)),
+        contains_exactly((X.KeyPress, 38, 10, 20), (X.KeyRelease, 38, 10, 20), (X.ButtonPress, 3, -5, 1080))
+    )
+
+
+def test_decode_record_events_accepts_memoryview_and_sent_events():
+    data = bytearray(pointer_event(event.KeyPress, 24, 0, 0))
+    data[0] |= 0x80
+    assert_that(list(decode_record_events(memoryview(data), None)), contains_exactly((X.KeyPress, 24, 0, 0)))
+
+
+def test_decode_record_events_falls_back_to_python_xlib():
+    display = MagicMock()
+    display.event_classes = event.event_class
+    data = pointer_event(event.MotionNotify, 0, 7, 8) + pointer_event(event.KeyPress, 38, 0, 0)
+    assert_that(
+        list(decode_record_events(data, display)),
+        contains_exactly((X.MotionNotify, 0, 7, 8), (X.KeyPress, 38, 0, 0))
+    )
+
+
+def test_interpolate_path_keeps_corners_at_constant_speed():
+    path = interpolate_path([(0, 0), (100, 0), (100, 100)], 1.0, interval=0.1)
+    assert_that(path[0], is_(equal_to((0.0, 0, 0))))
+    assert_that(path[-1], is_(equal_to((1.0, 100, 100))))
+    assert_that(path, has_item((0.5, 100, 0)))
+    assert_that(path, has_item(contains_exactly(close_to(0.3, 1e-9), 60, 0)))
+    assert_that(len(path), is_(equal_to(11)))
+    offsets = [offset for offset, x, y in path]
+    assert_that(offsets, is_(equal_to(sorted(offsets))))
+
+
+def test_interpolate_path_without_duration_visits_the_points():
+    assert_that(interpolate_path([(1.4, 2.6), (1, 3), (10, 20)], 0),
+                is_(equal_to([(0.0, 1, 3), (0.0, 10, 20)])))
+    assert_that(interpolate_path([(5, 5), (5, 5)], 2.0), is_(equal_to([(0.0, 5, 5)])))
+    assert_that(interpolate_path([], 1.0), is_(empty()))
@@ -0,0 +1,518 @@
+# Copyright (C) 2021 BlueDrink9
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Tests of the X interface against a real (virtual) X server. These are skipped, if Xvfb is not installed.
+"""
+
+import os
+import shutil
+import subprocess
+import threading
+import time
+import typing
+
+from unittest.mock import MagicMock, patch
+
+import pytest
+from hamcrest import *
+
+import autokey.model.phrase
+
+pytestmark = pytest.mark.skipif(shutil.which("Xvfb") is None, reason="Requires Xvfb")
+
+
+@pytest.fixture
+def xvfb_display():
+    display_number = 99
+    while os.path.exists("/tmp/.X11-unix/X{}".format(display_number)):
+        display_number += 1
+    display_name = ":{}".format(display_number)
+    server = subprocess.Popen(
+        ["Xvfb", display_name, "-screen", "0", "1024x768x24", "-nolisten", "tcp"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    socket_path = "/tmp/.X11-unix/X{}".format(display_number)
+    for _ in range(100):
+        if os.path.exists(socket_path):
+            break
+        time.sleep(0.05)
+    old_display = os.environ.get("DISPLAY")
+    os.environ["DISPLAY"] = display_name
+    yield display_name
+    if old_display is None:
+        del os.environ["DISPLAY"]
+    else:
+        os.environ["DISPLAY"] = old_display
+    server.terminate()
+    server.wait()
+
+
+def create_filtered_hotkey_phrase(window_filter: str) -> autokey.model.phrase.Phrase:
+    phrase = autokey.model.phrase.Phrase("xvfb test phrase", "ABC")
+    phrase.set_hotkey(["<ctrl>"], "k")
+    phrase.set_window_titles(window_filter)
+    return phrase
+
+
+@pytest.fixture
+def x_interface(xvfb_display):
+    import autokey.interface
+    phrase = create_filtered_hotkey_phrase("latency-test.*")
+    app = MagicMock()
+    app.configManager.hotKeys = [phrase]
+    app.configManager.hotKeyFolders = []
+    app.configManager.globalHotkeys = []
+    with patch("autokey.interface.Clipboard"):
+        interface = autokey.interface.XRecordInterface(MagicMock(), app)
+    interface.initialise()
+    interface.start()
+    yield interface
+    interface.cancel()
+
+
+def test_new_window_hotkey_ready_latency(x_interface):
+    from Xlib import display
+    grabbed_windows = {}
+    window_grabbed = threading.Event()
+    original_apply = x_interface._XInterfaceBase__applyGrabs
+
+    def spy_apply(to_grab, to_ungrab):
+        original_apply(to_grab, to_ungrab)
+        for window_id, keycode, mask in to_grab:
+            grabbed_windows.setdefault(window_id, time.monotonic())
+        window_grabbed.set()
+
+    x_interface._XInterfaceBase__applyGrabs = spy_apply
+
+    client = display.Display()
+    root = client.screen().root
+    start = time.monotonic()
+    window = root.create_window(0, 0, 100, 100, 0, client.screen().root_depth)
+    window.set_wm_class("latency-test", "LatencyTest")
+    window.set_wm_name("latency-test window")
+    window.map()
+    client.flush()
+
+    deadline = time.monotonic() + 2
+    while window.id not in grabbed_windows and time.monotonic() < deadline:
+        window_grabbed.wait(0.05)
+        window_grabbed.clear()
+    assert_that(grabbed_windows, has_key(window.id), "Hotkey was not grabbed in the newly created window")
+    latency = grabbed_windows[window.id] - start
+    print("New window to hotkey ready latency: {:.1f} ms".format(latency * 1000))
+    # The listener used to poll once every two seconds.
+    assert_that(latency, is_(less_than(0.5)))
+    client.close()
+
+
+def set_net_wm_name(client, window, title: str):
+    window.change_property(
+        client.intern_atom("_NET_WM_NAME"), client.intern_atom("UTF8_STRING"), 8, title.encode("utf-8"))
+
+
+def test_window_info_cache_invalidated_by_title_change(x_interface):
+    from Xlib import display
+    from autokey import stats
+    client = display.Display()
+    window = client.screen().root.create_window(0, 0, 100, 100, 0, client.screen().root_depth)
+    window.set_wm_class("cache-test", "CacheTest")
+    set_net_wm_name(client, window, "first title")
+    window.map()
+    client.sync()
+    local_window = x_interface.localDisplay.create_resource_object("window", window.id)
+
+    stats.reset()
+    # The first lookup starts watching the window, the second one fills the cache, the third one is served from it.
+    for _ in range(3):
+        assert_that(x_interface.get_window_title(local_window), is_(equal_to("first title")))
+    assert_that(stats.snapshot()["counters"], has_entry("window_info.cache_hits", 1))
+
+    set_net_wm_name(client, window, "second title")
+    client.sync()
+    deadline = time.monotonic() + 2
+    while x_interface.get_window_title(local_window) != "second title" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert_that(x_interface.get_window_title(local_window), is_(equal_to("second title")))
+    client.close()
+
+
+def read_selection(client, selection: int, timeout: float=2) -> typing.Optional[bytes]:
+    from Xlib import X
+    screen = client.screen()
+    window = screen.root.create_window(0, 0, 1, 1, 0, screen.root_depth)
+    target = client.intern_atom("UTF8_STRING")
+    prop = client.intern_atom("XVFB_TEST_SELECTION")
+    window.convert_selection(selection, target, prop, X.CurrentTime)
+    client.flush()
+    deadline = time.monotonic() + timeout
+    try:
+        while time.monotonic() < deadline:
+            while client.pending_events():
+                notify = client.next_event()
+                if notify.type == X.SelectionNotify:
+                    if notify.property == X.NONE:
+                        return None
+                    return bytes(window.get_full_property(prop, X.AnyPropertyType).value)
+            time.sleep(0.005)
+        raise AssertionError("No SelectionNotify received")
+    finally:
+        window.destroy()
+
+
+@pytest.fixture
+def selection_owner(xvfb_display):
+    from autokey.xselection import XSelectionOwner
+    owner = XSelectionOwner()
+    yield owner
+    owner.cancel()
+
+
+def wait_for_owner(client, selection: int, expected_owner: int, timeout: float=2) -> int:
+    deadline = time.monotonic() + timeout
+    owner = client.get_selection_owner(selection)
+    while owner != expected_owner and time.monotonic() < deadline:
+        time.sleep(0.01)
+        owner = client.get_selection_owner(selection)
+    return owner
+
+
+def test_selection_paste_is_served_once_then_released(selection_owner):
+    from Xlib import X, display
+    client = display.Display()
+    selection = selection_owner.clipboard
+    selection_owner.paste_from(selection, "pasted text", restore_timeout=5)
+    selection_owner.paste_sent(selection, client.screen().root.create_window(0, 0, 1, 1, 0, 0).id)
+
+    assert_that(read_selection(client, selection), is_(equal_to(b"pasted text")))
+    # Nothing was in the clipboard before, so the selection is given up right after the fetch.
+    assert_that(wait_for_owner(client, selection, X.NONE, timeout=1), is_(equal_to(X.NONE)))
+    client.close()
+
+
+def test_selection_restores_previous_content(xvfb_display, selection_owner):
+    from Xlib import display
+    from autokey.xselection import XSelectionOwner
+    client = display.Display()
+    previous_owner = XSelectionOwner()
+    try:
+        selection = selection_owner.clipboard
+        previous_owner.paste_from(selection, "previous content", restore_timeout=60)
+        selection_owner.paste_from(selection, "pasted text", restore_timeout=5)
+        selection_owner.paste_sent(selection, None)
+
+        assert_that(read_selection(client, selection), is_(equal_to(b"pasted text")))
+        deadline = time.monotonic() + 1
+        content = read_selection(client, selection)
+        while content != b"previous content" and time.monotonic() < deadline:
+            time.sleep(0.01)
+            content = read_selection(client, selection)
+        assert_that(content, is_(equal_to(b"previous content")))
+    finally:
+        previous_owner.cancel()
+        client.close()
+
+
+def test_selection_fetched_by_a_clipboard_manager_is_kept_for_the_target(selection_owner):
+    from Xlib import X, display
+    clipboard_manager = display.Display()
+    target = display.Display()
+    target_window = target.screen().root.create_window(0, 0, 1, 1, 0, 0)
+    target.flush()
+    selection = selection_owner.clipboard
+    selection_owner.paste_from(selection, "pasted text", restore_timeout=5)
+
+    # The clipboard manager fetches the content as soon as the ownership changed, before and after the paste command
+    assert_that(read_selection(clipboard_manager, selection), is_(equal_to(b"pasted text")))
+    selection_owner.paste_sent(selection, target_window.id)
+    assert_that(read_selection(clipboard_manager, selection), is_(equal_to(b"pasted text")))
+    time.sleep(0.2)
+    assert_that(read_selection(target, selection), is_(equal_to(b"pasted text")))
+    # Only the fetch of the target ends the paste
+    assert_that(wait_for_owner(target, selection, X.NONE, timeout=1), is_(equal_to(X.NONE)))
+    clipboard_manager.close()
+    target.close()
+
+
+def test_selection_restored_after_timeout_without_fetch(selection_owner):
+    from Xlib import X, display
+    client = display.Display()
+    selection = selection_owner.primary
+    selection_owner.paste_from(selection, "never fetched", restore_timeout=0.1)
+    assert_that(wait_for_owner(client, selection, X.NONE, timeout=1), is_(equal_to(X.NONE)))
+    client.close()
+
+
+def test_keys_typed_during_send_are_replayed_after_it(x_interface):
+    from Xlib import X, XK, display
+    from Xlib.ext import xtest
+    from autokey import stats
+    client = display.Display()
+    screen = client.screen()
+    window = screen.root.create_window(0, 0, 100, 100, 0, screen.root_depth, event_mask=X.KeyPressMask)
+    window.map()
+    client.sync()
+    window.set_input_focus(X.RevertToParent, X.CurrentTime)
+    client.sync()
+    keycode_a = client.keysym_to_keycode(XK.string_to_keysym("a"))
+    keycode_b = client.keysym_to_keycode(XK.string_to_keysym("b"))
+    stats.reset()
+
+    x_interface.begin_send()
+    x_interface.queue.join()
+    x_interface.send_string("a" * 2000)
+    # The user types while the event thread is still busy typing the long string.
+    user = display.Display()
+    for _ in range(3):
+        xtest.fake_input(user, X.KeyPress, keycode_b)
+        xtest.fake_input(user, X.KeyRelease, keycode_b)
+    user.sync()
+    x_interface.finish_send()
+    x_interface.queue.join()
+
+    deadline = time.monotonic() + 2
+    received = []
+    while len(received) < 2003 and time.monotonic() < deadline:
+        while client.pending_events():
+            received_event = client.next_event()
+            if received_event.type == X.KeyPress:
+                received.append(received_event.detail)
+        time.sleep(0.01)
+    assert_that(received, is_(equal_to([keycode_a] * 2000 + [keycode_b] * 3)))
+    assert_that(stats.snapshot()["counters"], has_entry("typeahead.replayed", 3))
+    # The keys were not used for abbreviations.
+    for call in x_interface.mediator.handle_keypress.call_args_list:
+        if call[0][0] == keycode_b:
+            assert_that(call[1], has_entry("during_send", True))
+    user.close()
+    client.close()
+
+
+def test_queued_operations_resolve_futures_in_order(x_interface):
+    move = x_interface.move_cursor(123, 234)
+    barrier = x_interface.barrier()
+    assert_that(barrier.result(timeout=2), is_(none()))
+    assert_that(move.done(), is_(True))
+    assert_that(x_interface.mouse_location(), is_(equal_to((123, 234))))
+
+
+def test_failing_operation_sets_future_exception(x_interface):
+    future = x_interface.send_key("<no such key>")
+    assert_that(calling(future.result).with_args(timeout=2), raises(Exception))
+    # The event thread keeps running.
+    assert_that(x_interface.barrier().result(timeout=2), is_(none()))
+
+
+def test_move_path_sends_motion_events_on_schedule(x_interface, xvfb_display):
+    from Xlib import X, display
+    client = display.Display(xvfb_display)
+    root = client.screen().root
+    root.change_attributes(event_mask=X.PointerMotionMask)
+    client.sync()
+    start = time.monotonic()
+    future = x_interface.move_path([(10, 10), (210, 10), (210, 110)], 0.3)
+    assert_that(future.result(timeout=2), is_(none()))
+    assert_that(time.monotonic() - start, is_(greater_than_or_equal_to(0.3)))
+    assert_that(x_interface.mouse_location(), is_(equal_to((210, 110))))
+    positions = []
+    while client.pending_events():
+        motion = client.next_event()
+        if motion.type == X.MotionNotify:
+            positions.append((motion.root_x, motion.root_y))
+    # Interpolated positions between the corners, and the corner itself
+    assert_that(len(positions), is_(greater_than(10)))
+    assert_that(positions, has_item((210, 10)))
+    client.close()
+
+
+def create_titled_window(client, title: str):
+    window = client.screen().root.create_window(0, 0, 100, 100, 0, client.screen().root_depth)
+    set_net_wm_name(client, window, title)
+    window.map()
+    client.sync()
+    return window
+
+
+def test_wait_for_window_wakes_up_on_new_window(x_interface):
+    from Xlib import display
+    client = display.Display()
+    created_at = []
+
+    def create_later():
+        time.sleep(0.2)
+        created_at.append(time.monotonic())
+        create_titled_window(client, "waited for window")
+
+    creator = threading.Thread(target=create_later)
+    creator.start()
+    found = x_interface.wait_for_window(
+        lambda: "waited for window" in x_interface.get_window_titles(), timeout=2)
+    woken_at = time.monotonic()
+    creator.join()
+    assert_that(found, is_(True))
+    print("New window to waiter wake-up latency: {:.1f} ms".format((woken_at - created_at[0]) * 1000))
+    # The old implementation polled every 300 ms.
+    assert_that(woken_at - created_at[0], is_(less_than(0.1)))
+    client.close()
+
+
+def test_wait_for_window_wakes_up_on_title_change(x_interface):
+    from Xlib import display
+    client = display.Display()
+    window = create_titled_window(client, "old title")
+    # Looked at once, before the title changes.
+    assert_that(x_interface.get_window_titles(), has_item("old title"))
+
+    def rename_later():
+        time.sleep(0.1)
+        set_net_wm_name(client, window, "new title")
+        client.sync()
+
+    renamer = threading.Thread(target=rename_later)
+    renamer.start()
+    found = x_interface.wait_for_window(lambda: "new title" in x_interface.get_window_titles(), timeout=2)
+    renamer.join()
+    assert_that(found, is_(True))
+    client.close()
+
+
+def test_wait_for_window_follows_active_window(x_interface):
+    from Xlib import Xatom, display
+    client = display.Display()
+    window = create_titled_window(client, "to be focused")
+    root = client.screen().root
+
+    def activate_later():
+        time.sleep(0.1)
+        root.change_property(client.intern_atom("_NET_ACTIVE_WINDOW"), Xatom.WINDOW, 32, [window.id])
+        client.sync()
+
+    activator = threading.Thread(target=activate_later)
+    activator.start()
+    found = x_interface.wait_for_window(lambda: x_interface.get_window_title() == "to be focused", timeout=2)
+    activator.join()
+    assert_that(found, is_(True))
+    client.close()
+
+
+def test_wait_for_window_times_out(x_interface):
+    start = time.monotonic()
+    assert_that(x_interface.wait_for_window(lambda: False, timeout=0.2), is_(False))
+    assert_that(time.monotonic() - start, is_(close_to(0.2, 0.1)))
+    assert_that(x_interface.wait_for_window(lambda: False, timeout=0), is_(False))
+
+
+@pytest.fixture
+def fake_window_manager(x_interface):
+    """A client acting as minimal EWMH window manager. It announces itself and records client messages."""
+    from Xlib import X, Xatom, display
+    wm = display.Display()
+    root = wm.screen().root
+    check = root.create_window(0, 0, 1, 1, 0, wm.screen().root_depth)
+    root.change_property(wm.intern_atom("_NET_SUPPORTING_WM_CHECK"), Xatom.WINDOW, 32, [check.id])
+    root.change_property(wm.intern_atom("_NET_CLIENT_LIST"), Xatom.WINDOW, 32, [])
+    root.change_attributes(event_mask=X.SubstructureRedirectMask)
+    wm.sync()
+    yield wm
+    wm.close()
+
+
+def set_client_list(wm, windows):
+    from Xlib import Xatom
+    wm.screen().root.change_property(wm.intern_atom("_NET_CLIENT_LIST"), Xatom.WINDOW, 32, [w.id for w in windows])
+    wm.sync()
+
+
+def next_client_message(wm, timeout: float=2):
+    from Xlib import X
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        while wm.pending_events():
+            received = wm.next_event()
+            if received.type == X.ClientMessage:
+                return received
+        time.sleep(0.005)
+    raise AssertionError("No ClientMessage received")
+
+
+def test_window_manager_index_follows_client_list(x_interface, fake_window_manager):
+    wm = fake_window_manager
+    manager = x_interface.windowManager
+    first = create_titled_window(wm, "First Window")
+    set_client_list(wm, [first])
+    assert_that(manager.find_window("first"), is_(equal_to(first.id)))
+
+    second = create_titled_window(wm, "Second Window")
+    set_client_list(wm, [first, second])
+    deadline = time.monotonic() + 2
+    while manager.find_window("second") is None and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert_that(manager.find_window("second"), is_(equal_to(second.id)))
+
+    set_net_wm_name(wm, first, "Renamed")
+    wm.sync()
+    while manager.find_window("renamed") is None and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert_that(manager.find_window("renamed"), is_(equal_to(first.id)))
+    assert_that(manager.find_window("first"), is_(none()))
+
+
+def test_window_manager_sends_client_messages(x_interface, fake_window_manager):
+    wm = fake_window_manager
+    manager = x_interface.windowManager
+    window = create_titled_window(wm, "Managed Window")
+    set_client_list(wm, [window])
+
+    manager.close(manager.find_window("managed"))
+    message = next_client_message(wm)
+    assert_that(message.window.id, is_(equal_to(window.id)))
+    assert_that(wm.get_atom_name(message.client_type), is_(equal_to("_NET_CLOSE_WINDOW")))
+
+    manager.set_state(window.id, "add", "maximized_vert,maximized_horz")
+    message = next_client_message(wm)
+    assert_that(wm.get_atom_name(message.client_type), is_(equal_to("_NET_WM_STATE")))
+    action, first_state, second_state = message.data[1][:3]
+    assert_that(action, is_(equal_to(1)))
+    assert_that(wm.get_atom_name(second_state), is_(equal_to("_NET_WM_STATE_MAXIMIZED_HORZ")))
+
+
+def test_window_manager_lists_windows_with_geometry(x_interface, fake_window_manager):
+    wm = fake_window_manager
+    window = wm.screen().root.create_window(12, 34, 56, 78, 0, wm.screen().root_depth)
+    window.set_wm_class("listed", "Listed")
+    set_net_wm_name(wm, window, "Listed Window")
+    window.map()
+    set_client_list(wm, [window])
+    windows = x_interface.windowManager.list_windows()
+    assert_that(windows, has_length(1))
+    assert_that(windows[0], has_properties(
+        id=window.id, title="Listed Window", wm_class="listed.Listed", x=12, y=34, width=56, height=78))
+
+
+def test_capture_screen_region(xvfb_display):
+    numpy = pytest.importorskip("numpy")
+    from Xlib import display
+    from autokey.scripting.imagesearch import capture_screen
+    client = display.Display()
+    screen = client.screen()
+    colormap = screen.default_colormap
+    pixel = colormap.alloc_color(0x1200, 0x3400, 0x5600).pixel
+    window = screen.root.create_window(100, 50, 40, 30, 0, screen.root_depth, background_pixel=pixel)
+    window.map()
+    client.sync()
+    time.sleep(0.1)
+    image = capture_screen((100, 50, 40, 30))
+    assert_that(image.shape, is_(equal_to((30, 40, 3))))
+    assert_that(numpy.all(image == (0x12, 0x34, 0x56)), is_(True))
+    client.close()
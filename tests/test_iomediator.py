@@ -14,12 +14,14 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 import typing
+from unittest.mock import MagicMock, patch
 
 import pytest
 from hamcrest import *
 
 import autokey.iomediator.constants as iomediator_constants
 import autokey.model.key
+from autokey.iomediator.iomediator import IoMediator
 
 
 def generate_tests_for_key_split_re():
@@ -39,3 +41,29 @@ def test_key_split_re(input_string: str, expected_split: typing.List[str]):
         autokey.model.key.KEY_SPLIT_RE.split(input_string),
         has_items(*expected_split)
     )
+
+
+@pytest.fixture
+def running_mediator():
+    service = MagicMock()
+    listener = MagicMock()
+    with patch("autokey.iomediator.iomediator.XRecordInterface"):
+        mediator = IoMediator(service)
+    mediator.interface.lookup_string.side_effect = lambda key_code, *args: chr(key_code)
+    IoMediator.listeners.append(listener)
+    mediator.start()
+    yield mediator, service, listener
+    IoMediator.listeners.remove(listener)
+    IoMediator.listeners.remove(service)
+    mediator.shutdown()
+
+
+def test_keys_typed_during_send_only_reach_global_hotkeys(running_mediator):
+    mediator, service, listener = running_mediator
+    mediator.handle_keypress(ord("a"), ("title", "class"), during_send=True)
+    mediator.handle_keypress(ord("b"), ("title", "class"))
+    mediator.queue.join()
+
+    service.handle_keypress_during_send.assert_called_once_with("a", [], "a", ("title", "class"))
+    service.handle_keypress.assert_called_once_with("b", [], "b", ("title", "class"))
+    listener.handle_keypress.assert_called_once_with("b", [], "b", ("title", "class"))
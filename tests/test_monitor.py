@@ -0,0 +1,237 @@
+# Copyright (C) 2021 BlueDrink9
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from unittest.mock import MagicMock
+
+import pyinotify
+from hamcrest import *
+
+import autokey.model.folder
+import autokey.model.phrase
+from autokey.model.file_writer import file_writer
+from autokey.monitor import EventCoalescer, FileMonitor, Processor, WatchRegistry, MODIFIED, REMOVED, QUIET_WINDOW, \
+    MAX_DELAY
+
+FOLDER = "/home/user/.config/autokey/data/My Phrases"
+
+# Recorded event storms: (seconds since the first event, event, file name)
+VIM_SAVE = [
+    (0.000, "IN_MOVED_FROM", "a.txt"),
+    (0.000, "IN_MOVED_TO", "a.txt~"),
+    (0.001, "IN_CREATE", "a.txt"),
+    (0.001, "IN_MODIFY", "a.txt"),
+    (0.002, "IN_MODIFY", "a.txt"),
+    (0.003, "IN_DELETE", "a.txt~"),
+    (0.010, "IN_CREATE", ".a.json.swp"),
+    (0.011, "IN_MODIFY", "a.json"),
+    (0.012, "IN_DELETE", ".a.json.swp"),
+]
+GIT_PULL = [(i * 0.0002, mask, "phrase{}.{}".format(i // 4, extension))
+            for i, (mask, extension) in enumerate([("IN_CREATE", "txt"), ("IN_MODIFY", "txt"),
+                                                   ("IN_CREATE", "json"), ("IN_MODIFY", "json")] * 1000)]
+
+
+def replay(storm, coalescer=None):
+    """Feeds the events to a Processor like the FileMonitor thread, and returns the reported batches."""
+    now = [0.0]
+    if coalescer is None:
+        coalescer = EventCoalescer(clock=lambda: now[0])
+    processor = Processor(MagicMock(), coalescer)
+    batches = []
+    for time, mask, name in storm:
+        now[0] = time
+        batches.append(coalescer.take_batch())
+        processor(pyinotify.Event({"wd": 1, "mask": pyinotify.EventsCodes.ALL_FLAGS[mask], "cookie": 0,
+                                   "path": FOLDER, "name": name, "dir": False}))
+    now[0] += QUIET_WINDOW
+    batches.append(coalescer.take_batch())
+    return [batch for batch in batches if batch]
+
+
+def path(name):
+    return "{}/{}".format(FOLDER, name)
+
+
+def test_editor_save_is_one_batch():
+    assert_that(replay(VIM_SAVE), is_(equal_to([[
+        (path("a.txt"), MODIFIED),
+        (path("a.txt~"), REMOVED),
+        (path("a.json"), MODIFIED),
+    ]])))
+
+
+def test_git_pull_is_one_batch_with_one_change_per_path():
+    batches = replay(GIT_PULL)
+    assert_that(batches, has_length(1))
+    assert_that(batches[0], has_length(2000))
+    assert_that(batches[0][:2], is_(equal_to([(path("phrase0.txt"), MODIFIED), (path("phrase0.json"), MODIFIED)])))
+
+
+def test_separate_saves_are_separate_batches():
+    later = [(time + 2 * QUIET_WINDOW, mask, name) for time, mask, name in VIM_SAVE]
+    assert_that(replay(VIM_SAVE + later), has_length(2))
+
+
+def test_continuous_events_are_reported_after_the_maximum_delay():
+    step = QUIET_WINDOW / 2
+    storm = [(i * step, "IN_MODIFY", "a.txt") for i in range(int(3 * MAX_DELAY / step))]
+    batches = replay(storm)
+    assert_that(len(batches), is_(greater_than_or_equal_to(3)))
+    assert_that(batches, only_contains([(path("a.txt"), MODIFIED)]))
+
+
+def test_timeout_counts_down_the_quiet_window():
+    now = [10.0]
+    coalescer = EventCoalescer(clock=lambda: now[0])
+    assert_that(coalescer.timeout(), is_(none()))
+    coalescer.add("/a", MODIFIED)
+    now[0] += QUIET_WINDOW / 2
+    assert_that(coalescer.timeout(), is_(close_to(QUIET_WINDOW / 2, 1e-9)))
+    assert_that(coalescer.take_batch(), is_(empty()))
+    coalescer.add("/a", REMOVED)
+    now[0] += QUIET_WINDOW
+    assert_that(coalescer.take_batch(), is_(equal_to([("/a", REMOVED)])))
+    assert_that(coalescer.timeout(), is_(none()))
+
+
+def test_watch_registry_removes_trees():
+    registry = WatchRegistry()
+    registry.add("/data", 1)
+    registry.add("/data/a", 2)
+    registry.add("/data/a/b", None)
+    registry.add("/data/ab", 3)
+    assert_that(registry.status(), is_(equal_to((3, 1))))
+    assert_that(sorted(registry.remove_tree("/data/a")), is_(equal_to([2])))
+    assert_that("/data/a/b", is_not(is_in(registry)))
+    assert_that("/data/ab", is_in(registry))
+    assert_that(registry.discard_wd(3), is_(equal_to("/data/ab")))
+    assert_that(registry.discard_wd(3), is_(none()))
+    assert_that(registry.status(), is_(equal_to((1, 0))))
+    registry.add("/renamed", 1)
+    assert_that(registry.remove_tree("/data"), is_(empty()))
+
+
+def read_events(monitor):
+    while monitor.notifier.check_events(100):
+        monitor.notifier.read_events()
+        monitor.notifier.process_events()
+
+
+def test_new_directories_are_watched_recursively(tmp_path):
+    monitor = FileMonitor(MagicMock())
+    monitor.add_watch(str(tmp_path))
+    (tmp_path / "sub").mkdir()
+    read_events(monitor)
+    assert_that(monitor.has_watch(str(tmp_path / "sub")), is_(True))
+    (tmp_path / "sub" / "nested" / ".git").mkdir(parents=True)
+    read_events(monitor)
+    assert_that(monitor.has_watch(str(tmp_path / "sub" / "nested")), is_(True))
+    assert_that(monitor.has_watch(str(tmp_path / "sub" / "nested" / ".git")), is_(False))
+
+    (tmp_path / "sub" / "nested" / ".git").rmdir()
+    (tmp_path / "sub" / "nested").rmdir()
+    read_events(monitor)
+    assert_that(monitor.has_watch(str(tmp_path / "sub" / "nested")), is_(False))
+    assert_that(monitor.status().watched, is_(equal_to(2)))
+    monitor.notifier.stop()
+
+
+def test_hidden_root_directories_are_watched(tmp_path):
+    root = tmp_path / ".snippets"
+    (root / "sub").mkdir(parents=True)
+    (root / ".git" / "objects").mkdir(parents=True)
+    monitor = FileMonitor(MagicMock())
+    monitor.add_watch(str(root), recursive=True)
+    assert_that(monitor.has_watch(str(root)), is_(True))
+    assert_that(monitor.has_watch(str(root / "sub")), is_(True))
+    assert_that(monitor.has_watch(str(root / ".git")), is_(False))
+    assert_that(monitor.has_watch(str(root / ".git" / "objects")), is_(False))
+
+    (root / ".cache").mkdir()
+    read_events(monitor)
+    assert_that(monitor.has_watch(str(root / ".cache")), is_(False))
+    assert_that(monitor.status().watched, is_(equal_to(2)))
+    monitor.notifier.stop()
+
+
+def test_renamed_directories_stay_watched(tmp_path):
+    monitor = FileMonitor(MagicMock())
+    monitor.add_watch(str(tmp_path))
+    (tmp_path / "old").mkdir()
+    monitor.add_watch(str(tmp_path / "old"))
+    (tmp_path / "old").rename(tmp_path / "new")
+    # Like the configuration window, which updates the folder before the events of the rename arrive
+    monitor.add_watch(str(tmp_path / "new"))
+    read_events(monitor)
+    assert_that(monitor.has_watch(str(tmp_path / "old")), is_(False))
+    assert_that(monitor.has_watch(str(tmp_path / "new")), is_(True))
+    (tmp_path / "new" / "a.txt").write_text("a")
+    read_events(monitor)
+    monitor.coalescer.quiet_window = 0
+    assert_that(monitor.coalescer.take_batch(), has_item((str(tmp_path / "new" / "a.txt"), MODIFIED)))
+    monitor.notifier.stop()
+
+
+def test_directories_are_polled_when_watches_run_out(tmp_path):
+    monitor = FileMonitor(MagicMock())
+    monitor.coalescer = EventCoalescer(quiet_window=0)
+    monitor.manager.add_watch = lambda path, *args, **kwargs: {path: -1}
+    (tmp_path / "a.txt").write_text("a")
+    monitor.add_watch(str(tmp_path))
+    assert_that(monitor.is_polling(), is_(True))
+    assert_that(monitor.status()[:2], is_(equal_to((0, 1))))
+
+    (tmp_path / "a.txt").write_text("changed")
+    (tmp_path / "b.txt").write_text("b")
+    (tmp_path / "sub").mkdir()
+    monitor.poll()
+    assert_that(monitor.coalescer.take_batch(), contains_inanyorder(
+        (str(tmp_path / "a.txt"), MODIFIED), (str(tmp_path / "b.txt"), MODIFIED), (str(tmp_path / "sub"), MODIFIED)))
+    assert_that(monitor.has_watch(str(tmp_path / "sub")), is_(True))
+
+    (tmp_path / "b.txt").unlink()
+    (tmp_path / "sub").rmdir()
+    monitor.poll()
+    assert_that(monitor.coalescer.take_batch(), contains_inanyorder(
+        (str(tmp_path / "b.txt"), REMOVED), (str(tmp_path / "sub"), REMOVED)))
+    assert_that(monitor.status()[:2], is_(equal_to((0, 1))))
+    monitor.notifier.stop()
+
+
+def test_own_writes_are_not_reported(tmp_path):
+    listener = MagicMock()
+    monitor = FileMonitor(listener)
+    monitor.coalescer.quiet_window = 0
+    monitor.add_watch(str(tmp_path))
+    folder = autokey.model.folder.Folder("folder", path=str(tmp_path / "folder"))
+    folder.persist()
+    phrase = autokey.model.phrase.Phrase("phrase", "contents")
+    folder.add_item(phrase)
+    phrase.persist()
+    file_writer.flush()
+    read_events(monitor)
+    monitor.report_changes()
+    listener.paths_changed.assert_not_called()
+
+    # Changed by another program, directly after AutoKey wrote it
+    phrase.phrase = "changed"
+    phrase.persist()
+    file_writer.flush()
+    with open(phrase.path, "a") as phrase_file:
+        phrase_file.write(" elsewhere")
+    read_events(monitor)
+    monitor.report_changes()
+    listener.paths_changed.assert_called_once_with([(phrase.path, MODIFIED)])
+    monitor.notifier.stop()
@@ -0,0 +1,55 @@
+# Copyright (C) 2021 BlueDrink9
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from hamcrest import *
+
+from autokey.model.own_writes import OwnWrites, RECORD_LIFETIME
+
+
+def test_only_the_recorded_state_is_own(tmp_path):
+    own_writes = OwnWrites()
+    path = tmp_path / "a.txt"
+    path.write_text("own")
+    own_writes.written(str(path))
+    assert_that(own_writes.is_own(str(path)), is_(True))
+    # Consumed by the first check
+    assert_that(own_writes.is_own(str(path)), is_(False))
+
+    own_writes.written(str(path))
+    path.write_text("foreign")
+    assert_that(own_writes.is_own(str(path)), is_(False))
+
+
+def test_removals_and_renames(tmp_path):
+    own_writes = OwnWrites()
+    (tmp_path / "old").mkdir()
+    (tmp_path / "old").rename(tmp_path / "new")
+    own_writes.renamed(str(tmp_path / "old"), str(tmp_path / "new"))
+    (tmp_path / "new" / "a.txt").write_text("a")
+    assert_that(own_writes.is_own(str(tmp_path / "new")), is_(True))
+    assert_that(own_writes.is_own(str(tmp_path / "old")), is_(True))
+
+    own_writes.removed(str(tmp_path / "gone"))
+    (tmp_path / "gone").write_text("created by another program")
+    assert_that(own_writes.is_own(str(tmp_path / "gone")), is_(False))
+
+
+def test_old_records_are_forgotten(tmp_path):
+    now = [0.0]
+    own_writes = OwnWrites(clock=lambda: now[0])
+    own_writes.written(str(tmp_path / "a"))
+    now[0] += RECORD_LIFETIME
+    own_writes.written(str(tmp_path / "b"))
+    assert_that(len(own_writes), is_(equal_to(1)))
@@ -0,0 +1,90 @@
+# Copyright (C) 2021 BlueDrink9
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from unittest.mock import patch
+
+import pytest
+from hamcrest import *
+
+from autokey import stats
+from autokey.configmanager.configmanager import ConfigManager
+from autokey.configmanager.configmanager_constants import SEND_MODE_RULES
+from autokey.iomediator.sendmode import CostModel, SendModeSelector
+from autokey.model.phrase import SendMode
+
+TERMINAL_CLASS = "gnome-terminal-server.Gnome-terminal"
+EDITOR_CLASS = "gedit.Gedit"
+LONG_TEXT = "Lorem ipsum dolor sit amet. " * 20
+
+
+@pytest.fixture
+def selector():
+    stats.reset()
+    with patch.dict(ConfigManager.SETTINGS, {SEND_MODE_RULES: [[".*[Tt]erminal.*", SendMode.CB_CTRL_SHIFT_V.value]]}):
+        yield SendModeSelector()
+
+
+def test_short_text_is_typed(selector: SendModeSelector):
+    assert_that(selector.choose("hi", EDITOR_CLASS), is_(SendMode.KEYBOARD))
+
+
+def test_long_text_is_pasted(selector: SendModeSelector):
+    assert_that(selector.choose(LONG_TEXT, EDITOR_CLASS), is_(SendMode.CB_CTRL_V))
+
+
+def test_special_keys_are_never_pasted(selector: SendModeSelector):
+    assert_that(selector.choose(LONG_TEXT + "<enter>", EDITOR_CLASS), is_(SendMode.KEYBOARD))
+
+
+def test_window_class_rule_selects_paste_command(selector: SendModeSelector):
+    assert_that(selector.choose(LONG_TEXT, TERMINAL_CLASS), is_(SendMode.CB_CTRL_SHIFT_V))
+    assert_that(selector.choose("hi", TERMINAL_CLASS), is_(SendMode.KEYBOARD))
+
+
+def test_window_class_rule_forces_keystroke_mode(selector: SendModeSelector):
+    rules = [["xfreerdp.*", SendMode.XTEST.value]]
+    with patch.dict(ConfigManager.SETTINGS, {SEND_MODE_RULES: rules}):
+        assert_that(selector.choose(LONG_TEXT, "xfreerdp.xfreerdp"), is_(SendMode.XTEST))
+
+
+def test_invalid_rules_are_ignored(selector: SendModeSelector):
+    rules = [["(unbalanced", SendMode.XTEST.value], [".*", "no such mode"], [".*", SendMode.AUTO.value]]
+    with patch.dict(ConfigManager.SETTINGS, {SEND_MODE_RULES: rules}):
+        assert_that(selector.choose(LONG_TEXT, EDITOR_CLASS), is_(SendMode.CB_CTRL_V))
+
+
+def test_slow_measured_paste_prefers_typing(selector: SendModeSelector):
+    text = "x" * 60
+    assert_that(selector.choose(text, EDITOR_CLASS), is_(SendMode.CB_CTRL_V))
+    for _ in range(30):
+        selector.record(SendMode.CB_CTRL_V, 60, 0.5)
+    assert_that(selector.choose(text, EDITOR_CLASS), is_(SendMode.KEYBOARD))
+
+
+def test_choices_and_timings_are_recorded_in_stats(selector: SendModeSelector):
+    selector.choose("hi", EDITOR_CLASS)
+    selector.record(SendMode.KEYBOARD, 2, 0.001)
+    snapshot = stats.snapshot()
+    assert_that(snapshot["counters"], has_entry("send_mode.auto.keyboard", 1))
+    assert_that(snapshot["values"], has_key("send_mode.keyboard.seconds_per_char"))
+
+
+def test_cost_model_converges_to_measured_rates():
+    model = CostModel(overhead=0.1, per_char=0.01)
+    for _ in range(30):
+        for length in (10, 50, 200):
+            model.add_sample(length, 0.02 + 0.001 * length)
+    assert_that(model.overhead, is_(close_to(0.02, 0.005)))
+    assert_that(model.per_char, is_(close_to(0.001, 0.0002)))
@@ -0,0 +1,150 @@
+# Copyright (C) 2021 BlueDrink9
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import queue
+import threading
+import typing
+from unittest.mock import MagicMock, patch
+
+import pytest
+from hamcrest import *
+
+from autokey.iomediator.iomediator import IoMediator
+from autokey.iomediator.sendstream import iter_chunks, MAX_CHUNKS_IN_FLIGHT, STREAM_CHUNK_SIZE
+
+
+@pytest.mark.parametrize("source", [
+    "a" * 1000,
+    ["ab" * 100, "c" * 300, "", "d" * 5],
+    ("x" * 7 for _ in range(100)),
+])
+def test_iter_chunks_keeps_content_and_bounds_chunk_size(source):
+    if not isinstance(source, typing.Generator):
+        expected = source if isinstance(source, str) else "".join(source)
+    else:
+        expected = "x" * 700
+    chunks = list(iter_chunks(source, chunk_size=64))
+    assert_that("".join(chunks), is_(equal_to(expected)))
+    assert_that(max(len(chunk) for chunk in chunks), is_(less_than_or_equal_to(64)))
+
+
+def test_iter_chunks_does_not_split_key_names():
+    source = "a" * 60 + "<enter>" + "b" * 60
+    chunks = list(iter_chunks(source, chunk_size=64))
+    assert_that(chunks[0], is_(equal_to("a" * 60)))
+    assert_that(chunks[1], starts_with("<enter>"))
+
+
+def test_iter_chunks_keeps_modifiers_with_their_key():
+    source = "a" * 57 + "<ctrl>+c" + "b" * 60
+    chunks = list(iter_chunks(source, chunk_size=64))
+    assert_that(chunks[0], is_(equal_to("a" * 57)))
+    assert_that(chunks[1], starts_with("<ctrl>+c"))
+
+
+def test_iter_chunks_rejects_non_strings():
+    assert_that(calling(list).with_args(iter_chunks([b"bytes"])), raises(TypeError))
+
+
+class FakeInterface:
+    """Runs queued send operations in a worker thread, which can be paused."""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.typed = []
+        self.calls = []
+        self.max_queued = 0
+        self.running = threading.Event()
+        self.running.set()
+        self.grab_released = threading.Event()
+        self.worker = threading.Thread(target=self._work, daemon=True)
+        self.worker.start()
+
+    def send_operations(self, operations, is_cancelled, on_done):
+        self.queue.put((operations, is_cancelled, on_done))
+        self.max_queued = max(self.max_queued, self.queue.qsize())
+
+    def _work(self):
+        while True:
+            operations, is_cancelled, on_done = self.queue.get()
+            self.running.wait()
+            for method_name, args in operations:
+                if is_cancelled():
+                    break
+                # The typed text, or the key name
+                self.typed.append(args[0])
+            on_done()
+
+    def release_keyboard_grab(self):
+        self.grab_released.set()
+
+    def __getattr__(self, name):
+        def record(*args):
+            self.calls.append(name)
+        return record
+
+
+@pytest.fixture
+def mediator() -> IoMediator:
+    interface = FakeInterface()
+    with patch("autokey.iomediator.iomediator.XRecordInterface", return_value=interface):
+        yield IoMediator(MagicMock())
+
+
+def test_stream_types_everything_and_reports_progress(mediator: IoMediator):
+    progress = []
+    source = ("word{} ".format(number) for number in range(500))
+    expected = "".join("word{} ".format(number) for number in range(500))
+    handle = mediator.send_stream(source, progress_callback=progress.append)
+    assert_that(handle.wait(5), is_(True))
+
+    assert_that("".join(mediator.interface.typed), is_(equal_to(expected)))
+    assert_that(progress, is_(equal_to(sorted(progress))))
+    assert_that(progress[-1], is_(equal_to(len(expected))))
+    assert_that(handle.sent, is_(equal_to(len(expected))))
+    assert_that(mediator.interface.calls, contains_exactly("begin_send", "finish_send"))
+
+
+def test_stream_applies_backpressure(mediator: IoMediator):
+    interface = mediator.interface  # type: FakeInterface
+    interface.running.clear()
+    produced = []
+
+    def source():
+        for number in range(20):
+            produced.append(number)
+            yield "x" * STREAM_CHUNK_SIZE
+
+    handle = mediator.send_stream(source())
+    assert_that(handle.wait(0.3), is_(False))
+    # The producer is blocked, while the interface does not type anything.
+    assert_that(len(produced), is_(less_than_or_equal_to(MAX_CHUNKS_IN_FLIGHT + 2)))
+    interface.running.set()
+    assert_that(handle.wait(5), is_(True))
+    assert_that(interface.max_queued, is_(less_than_or_equal_to(MAX_CHUNKS_IN_FLIGHT)))
+    assert_that(len(produced), is_(equal_to(20)))
+
+
+def test_cancel_releases_grab_and_drops_queued_chunks(mediator: IoMediator):
+    interface = mediator.interface  # type: FakeInterface
+    interface.running.clear()
+    handle = mediator.send_stream("y" * STREAM_CHUNK_SIZE * 50)
+    mediator.cancel_sends()
+
+    assert_that(interface.grab_released.is_set(), is_(True))
+    assert_that(handle.wait(1), is_(True))
+    assert_that(handle.cancelled, is_(True))
+    interface.running.set()
+    assert_that("".join(interface.typed), is_(equal_to("")))
@@ -0,0 +1,148 @@
+# Copyright (C) 2021 BlueDrink9
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+from unittest.mock import patch
+
+import pytest
+from hamcrest import *
+
+import autokey.model.folder
+from autokey.configmanager import snapshot
+from autokey.model.folder import Folder
+from tests.test_folder import create_library
+
+
+def describe(folders) -> list:
+    """Everything loaded from the files, in a comparable form."""
+    result = []
+    for folder in folders:
+        result.append((folder.path, folder.get_serializable(), folder.parent.path if folder.parent else None))
+        for item in folder.items:
+            result.append((item.path, item.get_serializable(), getattr(item, "phrase", None),
+                           getattr(item, "code", None), item.parent.path))
+        result.extend(describe(folder.folders))
+    return result
+
+
+def full_load(paths) -> list:
+    folders = [Folder("", path=path) for path in paths]
+    autokey.model.folder.load_folders(folders)
+    return folders
+
+
+@pytest.fixture
+def library(tmp_path):
+    (tmp_path / "data").mkdir()
+    create_library(tmp_path / "data" / "root")
+    (tmp_path / "data" / "other").mkdir()
+    (tmp_path / "data" / "other" / "x.txt").write_text("X")
+    paths = [str(tmp_path / "data" / "root"), str(tmp_path / "data" / "other")]
+    return paths, str(tmp_path / "cache" / "snapshot.pickle")
+
+
+def load_counting_full_loads(paths, snapshot_path):
+    with patch("autokey.model.folder.load_folders", wraps=autokey.model.folder.load_folders) as load:
+        folders = snapshot.load_folders(paths, snapshot_path)
+    return folders, load.call_count
+
+
+def test_unchanged_folders_are_loaded_from_the_snapshot(library):
+    paths, snapshot_path = library
+    folders, full_loads = load_counting_full_loads(paths, snapshot_path)
+    assert_that(full_loads, is_(equal_to(1)))
+    assert_that(os.path.exists(snapshot_path), is_(True))
+    assert_that(os.stat(snapshot_path).st_mode & 0o777, is_(equal_to(0o600)))
+
+    with patch("autokey.model.phrase.Phrase.load") as load_phrase:
+        cached, full_loads = load_counting_full_loads(paths, snapshot_path)
+    assert_that(full_loads, is_(equal_to(0)))
+    load_phrase.assert_not_called()
+    assert_that(describe(cached), is_(equal_to(describe(full_load(paths)))))
+    assert_that(cached[0].folders[0].parent, is_(same_instance(cached[0])))
+
+
+def test_changed_files_are_read_again(library):
+    paths, snapshot_path = library
+    snapshot.load_folders(paths, snapshot_path)
+    phrase_path = paths[0] + "/a.txt"
+    with open(phrase_path, "w") as phrase_file:
+        phrase_file.write("Changed body")
+    os.utime(phrase_path, ns=(0, 10 ** 9))
+    with open(paths[0] + "/folder.json") as folder_file:
+        folder_json = folder_file.read().replace("Root title", "New title")
+    with open(paths[0] + "/folder.json", "w") as folder_file:
+        folder_file.write(folder_json)
+    os.utime(paths[0] + "/folder.json", ns=(0, 10 ** 9))
+
+    with patch("autokey.model.script.Script.load") as load_script:
+        folders, full_loads = load_counting_full_loads(paths, snapshot_path)
+    assert_that(full_loads, is_(equal_to(0)))
+    load_script.assert_not_called()
+    assert_that(folders[0].title, is_(equal_to("New title")))
+    assert_that(describe(folders), is_(equal_to(describe(full_load(paths)))))
+
+    # The snapshot was updated
+    folders, full_loads = load_counting_full_loads(paths, snapshot_path)
+    assert_that(describe(folders), is_(equal_to(describe(full_load(paths)))))
+
+
+@pytest.mark.parametrize("change", ["added file", "removed file", "added folder", "other roots"])
+def test_structural_changes_cause_a_full_load(library, change):
+    paths, snapshot_path = library
+    snapshot.load_folders(paths, snapshot_path)
+    if change == "added file":
+        with open(paths[1] + "/y.py", "w") as script_file:
+            script_file.write("pass")
+    elif change == "removed file":
+        os.remove(paths[1] + "/x.txt")
+    elif change == "added folder":
+        os.mkdir(paths[0] + "/sub/new")
+    else:
+        paths = paths[:1]
+
+    folders, full_loads = load_counting_full_loads(paths, snapshot_path)
+    assert_that(full_loads, is_(equal_to(1)))
+    assert_that(describe(folders), is_(equal_to(describe(full_load(paths)))))
+
+
+def test_changed_files_missing_in_the_snapshot_cause_a_full_load(library):
+    paths, snapshot_path = library
+    snapshot.load_folders(paths, snapshot_path)
+    read_snapshot = snapshot._read_snapshot
+
+    def read_with_unknown_change(*args):
+        folders, changed = read_snapshot(*args)
+        return folders, changed + [paths[1] + "/unknown.txt"]
+
+    with patch("autokey.configmanager.snapshot._read_snapshot", side_effect=read_with_unknown_change):
+        folders, full_loads = load_counting_full_loads(paths, snapshot_path)
+    assert_that(full_loads, is_(equal_to(1)))
+    assert_that(describe(folders), is_(equal_to(describe(full_load(paths)))))
+
+
+def test_unusable_snapshots_cause_a_full_load(library):
+    paths, snapshot_path = library
+    snapshot.load_folders(paths, snapshot_path)
+    with open(snapshot_path, "r+b") as snapshot_file:
+        snapshot_file.seek(20)
+        snapshot_file.write(b"garbage")
+    folders, full_loads = load_counting_full_loads(paths, snapshot_path)
+    assert_that(full_loads, is_(equal_to(1)))
+    assert_that(describe(folders), is_(equal_to(describe(full_load(paths)))))
+
+    with patch("autokey.common.VERSION", "0.0.1"):
+        folders, full_loads = load_counting_full_loads(paths, snapshot_path)
+    assert_that(full_loads, is_(equal_to(1)))
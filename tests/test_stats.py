@@ -0,0 +1,58 @@
+# Copyright (C) 2021 BlueDrink9
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+from hamcrest import *
+
+from autokey import stats
+
+
+@pytest.fixture(autouse=True)
+def clean_stats():
+    stats.reset()
+    yield
+    stats.reset()
+
+
+def test_counters():
+    stats.increment("test.counter")
+    stats.increment("test.counter", 2)
+    assert_that(stats.snapshot()["counters"], has_entry("test.counter", 3))
+
+
+def test_recorded_values_are_summarised():
+    for value in (1, 2, 6):
+        stats.record("test.value", value)
+    assert_that(stats.snapshot()["values"]["test.value"], has_entries(count=3, total=9, mean=3, min=1, max=6))
+
+
+def test_timed_records_duration():
+    with stats.timed("test.duration"):
+        pass
+    summary = stats.snapshot()["values"]["test.duration"]
+    assert_that(summary["count"], is_(equal_to(1)))
+    assert_that(summary["min"], is_(greater_than_or_equal_to(0)))
+
+
+def test_report_lists_all_statistics():
+    stats.increment("test.counter")
+    stats.record("test.value", 0.5)
+    report = stats.report()
+    assert_that(report, contains_string("test.counter: 1"))
+    assert_that(report, contains_string("test.value: mean 0.5"))
+
+
+def test_empty_report():
+    assert_that(stats.report(), is_(equal_to("")))